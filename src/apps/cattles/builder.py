@@ -25,6 +25,6 @@ def direct(start_date=None, end_date=None, *args, **kwargs):
                 start_date, end_date, DELTA_DAYS
         ):
             response = api.request(date=delta_start_date)
-            api.load(response)
+            api.load_if_changed(response, date=delta_start_date)
 
     return data
@@ -35,6 +35,10 @@ def direct(start_date=None, end_date=None, *args, **kwargs):
                     start_date=delta_start_date,
                     end_date=delta_end_date
                     )
-                api.load(response)
+                api.load_if_changed(
+                    response,
+                    start_date=delta_start_date,
+                    end_date=delta_end_date
+                    )
 
     return data
@@ -30,16 +30,10 @@ def direct_wholesale_05(start_date, end_date, *args, **kwargs):
 
     for model in MODELS:
         wholesale_api = WholeSaleApi05(model=model, **data._asdict())
-        date_diff = end_date - start_date
 
-        for delta in range(date_diff.days + 1):
-            # tc_type=N04 -> 蔬菜
-            response = wholesale_api.request(
-                start_date=start_date + datetime.timedelta(days=delta),
-                end_date=start_date + datetime.timedelta(days=delta),
-                tc_type="N04",
-            )
-            wholesale_api.load(response)
+        # 以整個日期區間請求，回應失敗時自動切分區間
+        # tc_type=N04 -> 蔬菜
+        wholesale_api.fetch_range_and_load(start_date, end_date, tc_type="N04")
 
     return data
 
@@ -54,19 +48,11 @@ def direct_origin(start_date, end_date, *args, **kwargs):
 
     for model in MODELS:
         origin_api = OriginApi(model=model, **data._asdict())
-        date_diff = end_date - start_date
-        for delta in range(date_diff.days + 1):
-            response = origin_api.request(
-                start_date=start_date + datetime.timedelta(days=delta),
-                end_date=start_date + datetime.timedelta(days=delta),
-                *args,
-                **kwargs,
-            )
-            origin_api.load(response)
-            # response_garlic = origin_api.request(start_date=start_date + datetime.timedelta(days=delta),
-            #                                      end_date=start_date + datetime.timedelta(days=delta),
-            #                                      name='蒜頭(蒜球)(旬價)')
-            # origin_api.load(response_garlic)
+        origin_api.fetch_range_and_load(start_date, end_date, **kwargs)
+        # response_garlic = origin_api.request(start_date=start_date + datetime.timedelta(days=delta),
+        #                                      end_date=start_date + datetime.timedelta(days=delta),
+        #                                      name='蒜頭(蒜球)(旬價)')
+        # origin_api.load(response_garlic)
     return data
 
 
@@ -84,6 +70,6 @@ def direct_wholesale_02(start_date, end_date, *args, **kwargs):
         # This api only provide one day filter
         for delta_start_date, delta_end_date in date_generator(start_date, end_date, 1):
             response = wholesale_api.request(date=delta_start_date)
-            wholesale_api.load(response)
+            wholesale_api.load_if_changed(response, date=delta_start_date)
 
     return data
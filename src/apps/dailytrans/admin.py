@@ -5,7 +5,7 @@ from django.utils.translation import ugettext_lazy as _
 from rangefilter.filter import DateRangeFilter
 
 from apps.configs.models import AbstractProduct, Source
-from .models import DailyTran, DailyReport, FestivalReport
+from .models import CompletenessProfile, DailyAggregate, DailyTran, DailyReport, FestivalReport, IngestionWatermark
 
 
 class DailyTranModelForm(ModelForm):
@@ -119,7 +119,54 @@ class FestivalReportAdmin(admin.ModelAdmin):
         'update_time',
         'create_time',
     )
+
+
+class IngestionWatermarkAdmin(admin.ModelAdmin):
+    list_display = (
+        'api_name',
+        'config',
+        'type',
+        'source',
+        'complete_date',
+        'update_time',
+    )
+    list_filter = ('api_name', 'config', 'type')
+
+
+class CompletenessProfileAdmin(admin.ModelAdmin):
+    list_display = (
+        'product',
+        'source',
+        'year',
+        'rows',
+        'volume_rows',
+        'weight_rows',
+        'update_time',
+    )
+    list_filter = ('year',)
+
+
+class DailyAggregateAdmin(admin.ModelAdmin):
+    list_display = (
+        'date',
+        'product',
+        'type',
+        'source',
+        'rows',
+        'total_price',
+        'total_weight',
+        'total_volume',
+        'sum_volume',
+        'positive',
+        'update_time',
+    )
+    list_filter = (('date', DateRangeFilter), 'type')
+    search_fields = ['product__name', 'product__code']
+
     
 admin.site.register(DailyTran, DailyTranAdmin)
 admin.site.register(DailyReport, DailyReportAdmin)
 admin.site.register(FestivalReport, FestivalReportAdmin)
+admin.site.register(IngestionWatermark, IngestionWatermarkAdmin)
+admin.site.register(CompletenessProfile, CompletenessProfileAdmin)
+admin.site.register(DailyAggregate, DailyAggregateAdmin)
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class DailytransConfig(AppConfig):
     name = 'apps.dailytrans'
+
+    def ready(self):
+        from apps.dailytrans.models import connect_product_signals
+
+        connect_product_signals()
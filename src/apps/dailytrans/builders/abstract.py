@@ -1,15 +1,22 @@
 import abc
+import datetime
 import logging
 import time
 
 import requests
 from django.conf import settings
+from requests.adapters import HTTPAdapter
 
 from apps.configs.models import (
     Source,
     Config,
     Type,
 )
+from .archive import ResponseArchive, get_request_url, is_replaying
+from .fetch import AsyncFetcher, get_host, get_limit
+from .fingerprint import PayloadFingerprint, digest
+from .resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, incr_metric
+from .resolver import Resolver
 
 
 class AbstractApi(object):
@@ -20,6 +27,9 @@ class AbstractApi(object):
 
     _metaclass__ = abc.ABCMeta
 
+    # 以日期區間一次請求多日資料(`fetch_range_and_load`)時，單次請求的最多天數
+    MAX_RANGE_DAYS = 31
+
     def __init__(self, model, config_code=None, type_id=None, logger=None, logger_type_code=None):
         if self.API_NAME is None:
             raise NotImplementedError('Class attribute API_NAME not advised at AbstractApi inheritance')
@@ -32,6 +42,20 @@ class AbstractApi(object):
         except KeyError:
             raise NotImplementedError('Can not find key for API name %s in DAILYTRAN_BUILDER_API' % self.API_NAME)
 
+        # 同時請求數與每秒請求數上限: settings.DAILYTRAN_BUILDER_API_LIMITS
+        self.LIMIT = get_limit(self.API_NAME, self.API_URL)
+        self._session = None
+
+        # 重試策略與斷路器: settings.DAILYTRAN_BUILDER_RETRY、DAILYTRAN_BUILDER_BREAKER
+        self.RETRY_POLICY = RetryPolicy()
+        self.breaker = CircuitBreaker(self.API_NAME)
+
+        # 原始回應的封存目錄: settings.DAILYTRAN_BUILDER_ARCHIVE；重播模式下以封存的回應取代網路請求
+        self.archive = ResponseArchive()
+        self.replay = is_replaying()
+        if self.replay and not self.archive.enabled:
+            raise NotImplementedError('Replay mode requires DAILYTRAN_BUILDER_ARCHIVE root in settings')
+
         if self.ZFILL is None:
             raise NotImplementedError('Class attribute ZFILL not advised at AbstractApi inheritance')
 
@@ -62,9 +86,20 @@ class AbstractApi(object):
             self.SOURCE_QS = self.SOURCE_QS.filter(type__id=type_id)
             self.PRODUCT_QS = self.PRODUCT_QS.filter(type__id=type_id, track_item=True)
             
+        # 品項與來源對照表，每次執行只查詢一次，hook 與資料比對皆在記憶體中完成
+        self.resolver = Resolver(self.PRODUCT_QS, self.SOURCE_QS)
+
         # 將不重複的品項 code 欄位取出來(code 若無對應代碼則可能與品項名稱相同(或是空): 柿子-甜柿(Z4), 柳橙(柳橙) etc.)
-        # 需注意 obj type 為 Tuple
-        self.target_items = {obj[0] for obj in self.PRODUCT_QS.values_list('code')}
+        self.target_items = self.resolver.codes
+
+        # 回應內容的指紋，與上一次相同時略過 `load()`: settings.DAILYTRAN_BUILDER_FINGERPRINT
+        self.fingerprint = PayloadFingerprint(
+            self.API_NAME,
+            config_code=config_code,
+            type_id=type_id,
+            model_label=self.MODEL._meta.label,
+        )
+
         self.LOGGER = logging.getLogger(logger)
         self.LOGGER_EXTRA = {
             'type_code': logger_type_code,
@@ -81,33 +116,253 @@ class AbstractApi(object):
 
     @abc.abstractmethod
     def load(self, response):
+        """
+        解析回應並寫入資料庫，解析或寫入的錯誤於方法內記錄
+
+        :return: bool，是否成功寫入；False 時 `load_if_changed` 不記錄指紋，下次相同的回應仍會重新寫入
+        """
         return
 
+    @property
+    def session(self):
+        """共用連線池的 session，連線數與同時請求數上限相同"""
+
+        if self._session is None:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.LIMIT.concurrency)
+            self._session = requests.Session()
+            self._session.mount('http://', adapter)
+            self._session.mount('https://', adapter)
+
+        return self._session
+
+    def fetch(self, jobs):
+        """
+        以 `AsyncFetcher` 同時執行多個 `request(**kwargs)`，依完成順序回傳
+
+        Args:
+            jobs: `request()` 的參數(dict)，e.g. [{'start_date': date, 'end_date': date}, ...]
+
+        Yields:
+            Tuple[dict, Any, Optional[Exception]]: 請求參數、`request()` 的回傳值與請求失敗時的例外
+        """
+
+        if self.replay:
+            # 重播時只讀取本機封存，不受 API 的請求數限制
+            config = getattr(settings, 'DAILYTRAN_BUILDER_ARCHIVE', {})
+            fetcher = AsyncFetcher(self.request, concurrency=config.get('replay_concurrency', 8))
+        else:
+            fetcher = AsyncFetcher(
+                self.request,
+                concurrency=self.LIMIT.concurrency,
+                rate=self.LIMIT.rate,
+                host=get_host(self.API_URL),
+            )
+
+        return fetcher.fetch(jobs)
+
+    def fetch_and_load(self, jobs):
+        """
+        同時送出所有請求，回應完成後立即交給 `load()` 寫入資料庫；
+        單一請求失敗只記錄錯誤，不影響其他日期的資料
+
+        Raises:
+            CircuitOpenError: 有請求因斷路器開啟而未送出，由 `director` 將日期區間排入佇列稍後重新執行
+
+        Returns:
+            int: 失敗的請求數
+        """
+
+        failed = 0
+        circuit_error = None
+        for kwargs, response, exc in self.fetch(jobs):
+            if isinstance(exc, CircuitOpenError):
+                circuit_error = exc
+                continue
+
+            if exc is not None:
+                failed += 1
+                self.LOGGER.error(f'Request failed with {kwargs}: {exc}', extra=self.LOGGER_EXTRA)
+                continue
+
+            self.load_if_changed(response, **kwargs)
+
+        if circuit_error is not None:
+            raise circuit_error
+
+        return failed
+
+    def load_if_changed(self, response, **params):
+        """
+        回應內容與上一次相同請求(`params`)的回應相同時略過 `load()`，否則執行 `load()`，
+        成功寫入後才記錄回應的指紋
+
+        :param response: `request()` 的回傳值
+        :param params: `request()` 的參數，與 API、品項分類、供應階段共同組成指紋的 key
+        :return: bool，是否執行 `load()` 並成功寫入
+        """
+
+        value = digest(response)
+        if self.fingerprint.is_unchanged(params, value):
+            incr_metric(self.API_NAME, 'unchanged')
+            self.LOGGER.info(f'Response unchanged with {params}, skip loading', extra=self.LOGGER_EXTRA)
+            return False
+
+        if not self.load(response):
+            self.LOGGER.warning(f'Load failed with {params}, fingerprint not saved', extra=self.LOGGER_EXTRA)
+            return False
+
+        self.fingerprint.save(params, value)
+
+        return True
+
+    def is_complete_range(self, response):
+        """
+        多日請求的回應是否完整，不完整時 `fetch_range_and_load` 會將日期區間對半切分後重新請求
+
+        只以狀態碼判斷；目前使用的 API 沒有已知的回應筆數上限，若 API 會截斷回應，子類別需覆寫此方法
+
+        :param response: `request()` 的回傳值，Response 或 Response list
+        """
+
+        responses = response if isinstance(response, (list, tuple)) else [response]
+
+        return all(resp.status_code == 200 for resp in responses)
+
+    def fetch_range_and_load(self, start_date, end_date, **params):
+        """
+        適用於 `request()` 接受 start_date 與 end_date 的 API: 以整個日期區間(最多 `MAX_RANGE_DAYS` 天)請求，
+        取代逐日請求；回應失敗(`is_complete_range`)時，將區間對半切分後重新請求，直到單日為止。
+        回應中的多日資料由 `load()` 一次寫入，比對範圍為回應中出現的日期。
+
+        Raises:
+            CircuitOpenError: 有請求因斷路器開啟而未送出，由 `director` 將日期區間排入佇列稍後重新執行
+
+        Returns:
+            int: 請求次數
+        """
+
+        windows = []
+        window_start = start_date
+        while window_start <= end_date:
+            window_end = min(window_start + datetime.timedelta(days=self.MAX_RANGE_DAYS - 1), end_date)
+            windows.append((window_start, window_end))
+            window_start = window_end + datetime.timedelta(days=1)
+
+        request_count = 0
+        circuit_error = None
+        while windows:
+            jobs = [{**params, 'start_date': window[0], 'end_date': window[1]} for window in windows]
+            windows = []
+
+            for kwargs, response, exc in self.fetch(jobs):
+                request_count += 1
+                window_start, window_end = kwargs['start_date'], kwargs['end_date']
+
+                if isinstance(exc, CircuitOpenError):
+                    circuit_error = exc
+                    continue
+
+                if exc is None and (window_start == window_end or self.is_complete_range(response)):
+                    self.load_if_changed(response, **kwargs)
+                    continue
+
+                if window_start < window_end:
+                    middle = window_start + (window_end - window_start) // 2
+                    windows.extend([(window_start, middle), (middle + datetime.timedelta(days=1), window_end)])
+                    self.LOGGER.info(
+                        f'Incomplete response from {window_start} to {window_end}, split into two requests',
+                        extra=self.LOGGER_EXTRA,
+                    )
+                else:
+                    self.LOGGER.error(f'Request failed with {kwargs}: {exc}', extra=self.LOGGER_EXTRA)
+
+        if circuit_error is not None:
+            raise circuit_error
+
+        return request_count
+
     def get(self, url, *args, **kwargs):
         """
-        通用的 get 方法，當請求失敗時會根據狀況重試
+        通用的 get 方法，當請求失敗時依 `RETRY_POLICY` 以指數退避加上隨機抖動重試，並遵守 `Retry-After`；
+        重試用盡後計入斷路器的失敗次數
+
+        成功的回應封存於 `archive`；重播模式下不連線，直接回傳封存的回應
+
+        Raises:
+            CircuitOpenError: API 的斷路器為開啟狀態，不送出請求也不等待
         """
 
-        response = requests.Response()
-        retry_count = 0
+        request_url = get_request_url(url, kwargs.get('params'))
+        if self.replay:
+            return self.replay_response(request_url)
 
-        # max retry 5 times
-        while response.status_code != 200 and retry_count < 5:
+        self.breaker.allow()
+        incr_metric(self.API_NAME, 'requests')
+
+        # AsyncFetcher 的 worker 共用同一個 Api，每次請求使用各自的 extra，不修改 LOGGER_EXTRA
+        extra = {**self.LOGGER_EXTRA, 'request_url': request_url}
+        retry_count = 0
+        while True:
             try:
-                response = requests.get(url, *args, **kwargs)
-                self.LOGGER_EXTRA['request_url'] = response.request.url
-            except requests.exceptions.ConnectionError:
+                response = self.session.get(url, *args, **kwargs)
+                extra['request_url'] = response.request.url
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
                 response = requests.Response()
 
-            if response.status_code != 200:
-                retry_count += 1
-                self.LOGGER.error(
-                    f'Connection Refused, Retry {retry_count} Time',
-                    extra=self.LOGGER_EXTRA,
-                )
+            if response.status_code == 200:
+                self.breaker.record_success()
+                self.archive_response(request_url, response)
+                return response
 
-                # sleep 15 seconds before retry
-                time.sleep(15)
-                continue
+            retry_count += 1
+            delay = self.RETRY_POLICY.get_delay(retry_count, response)
+            if delay is None:
+                break
+
+            incr_metric(self.API_NAME, 'retries')
+            self.LOGGER.error(
+                f'Request failed with status {response.status_code}, retry {retry_count} time '
+                f'after {delay:.1f} seconds, circuit breaker: {self.breaker.state}',
+                extra=extra,
+            )
+            time.sleep(delay)
+
+            # 等待期間其他 worker 可能已開啟斷路器，剩下的請求直接失敗；探測請求仍可重試
+            self.breaker.allow(retry=True)
+
+        # 非暫時性的錯誤(e.g. 404)不計入斷路器
+        if self.RETRY_POLICY.should_retry(response):
+            incr_metric(self.API_NAME, 'failures')
+            self.breaker.record_failure()
+
+        return response
+
+    def archive_response(self, url, response):
+        if not self.archive.enabled:
+            return
+
+        try:
+            self.archive.store(self.API_NAME, url, response)
+        except OSError as e:
+            self.LOGGER.error(
+                f'Can not archive response of {url}: {e}', extra={**self.LOGGER_EXTRA, 'request_url': url}
+            )
+
+    def replay_response(self, url):
+        """
+        :return: 封存的回應，找不到時回傳 404 的 Response
+        """
+
+        response = self.archive.lookup(self.API_NAME, url)
+        if response is None:
+            self.LOGGER.warning(
+                f'No archived response of {url}', extra={**self.LOGGER_EXTRA, 'request_url': url}
+            )
+
+            response = requests.Response()
+            response.status_code = 404
+            response.url = url
+            response.request = requests.Request('GET', url).prepare()
+            response._content = b''
 
         return response
@@ -8,11 +8,60 @@ from apps.hogs.builder import direct as hogs_api
 from apps.rams.builder import direct as rams_api
 from apps.rices.builder import direct as rices_api
 from apps.seafoods.builder import direct as seafoods_api
+from apps.dailytrans.builders.orchestrator import BuildNode, run_dag
 from apps.dailytrans.builders.utils import director
 
 
+# 各 builder 的 `direct_*` function、請求的 API 與寫入的品項分類、供應階段，
+# 由 orchestrator 依 API 的 host 分配同時執行
+NODES = [
+    BuildNode('apps.cattles.builder.direct', 'cattle', 'COG14', 2),
+    BuildNode('apps.chickens.builder.direct', 'eir49', 'COG10', 2),
+    BuildNode('apps.ducks.builder.direct', 'eir51', 'COG11', 2),
+    BuildNode('apps.flowers.builder.direct_wholesale_07', 'amis', 'COG07', 1),
+    BuildNode('apps.flowers.builder.direct_wholesale_04', 'amis', 'COG04', 1),
+    BuildNode('apps.fruits.builder.direct_wholesale_06', 'eir030', 'COG06', 1),
+    BuildNode('apps.fruits.builder.direct_origin', 'apis', 'COG06', 2),
+    BuildNode('apps.fruits.builder.direct_wholesale_03', 'amis', 'COG03', 1),
+    BuildNode('apps.gooses.builder.direct', 'eir50', 'COG12', 2),
+    BuildNode('apps.hogs.builder.direct', 'eir019', 'COG08', 1),
+    BuildNode('apps.rams.builder.direct', 'eir107', 'COG09', 1),
+    BuildNode('apps.rices.builder.direct', 'rice_avg', 'COG01'),
+    BuildNode('apps.seafoods.builder.direct_generic_wholesale', 'eir032', 'COG13', 1),
+    BuildNode('apps.seafoods.builder.direct_origin', 'efish', 'COG13', 2),
+]
+
+# 依抓取計畫排程執行的 builder(`PlannedBuild`)，只請求 watermark 之後、缺漏與修正期間的日期
+PLANNED_NODES = [
+    BuildNode('apps.crops.builder.direct_wholesale_05', 'eir030', 'COG05', 1),
+    BuildNode('apps.crops.builder.direct_origin', 'apis', 'COG05', 2),
+    BuildNode('apps.crops.builder.direct_wholesale_02', 'amis', 'COG02', 1),
+    BuildNode('apps.fruits.builder.direct_wholesale_06', 'eir030', 'COG06', 1),
+    BuildNode('apps.fruits.builder.direct_origin', 'apis', 'COG06', 2),
+    BuildNode('apps.fruits.builder.direct_wholesale_03', 'amis', 'COG03', 1),
+    BuildNode('apps.seafoods.builder.direct_generic_wholesale', 'eir032', 'COG13', 1),
+]
+
+
+def get_planned_nodes(module=None):
+    """
+    :param module: builder 模組，e.g. 'apps.crops.builder'，未指定時回傳全部
+    """
+
+    return [node for node in PLANNED_NODES if module is None or node.func.startswith(f'{module}.')]
+
+
 @director
 def direct(start_date=None, end_date=None, *args, **kwargs):
+    """以 celery chord 同時執行所有 builder 並等待完成，需有執行中的 celery worker"""
+
+    return run_dag(NODES, start_date, end_date, **kwargs)
+
+
+@director
+def direct_sequential(start_date=None, end_date=None, *args, **kwargs):
+    """依序執行所有 builder，沒有 celery worker 時使用"""
+
     print('cattles_api')
     cattles_api(start_date, end_date, *args, **kwargs)
     print('chickens_api')
@@ -1,9 +1,12 @@
-from django.db.models import Q
 import datetime
 import json
 from xml.etree import ElementTree
+from requests import Response
+
 from .utils import date_transfer
 from .abstract import AbstractApi
+from .stream import REST_MARKERS, iter_json_items, iter_text
+from .upsert import DailyTranUpserter
 from apps.dailytrans.models import DailyTran
 
 
@@ -42,7 +45,7 @@ class Api(AbstractApi):
                 dic[key] = value.strip()
 
         source_code = dic.get('MarketNo')
-        source = self.SOURCE_QS.filter(code=source_code).first()
+        source = self.resolver.source_by_code(source_code)
         date = date_transfer(sep=self.SEP, string=dic.get('TransDate'), roc_format=self.ROC_FORMAT)
         products = dic.get('Detail')
         if source and products:
@@ -63,7 +66,7 @@ class Api(AbstractApi):
                     return sum_avg_price / sum_volume, sum_volume
 
                 product_code = self.sum_to_product
-                product = self.PRODUCT_QS.filter(code=product_code).first()
+                product = self.resolver.product(product_code)
                 if product:
                     avg_price, sum_volume = sum_details(products)
                     tran = DailyTran(
@@ -83,7 +86,7 @@ class Api(AbstractApi):
                 # translate detail objects to "multi" DailyTran
                 for dic in products:
                     product_code = dic.get('ProductNo')
-                    product = self.PRODUCT_QS.filter(code=product_code).first()
+                    product = self.resolver.product(product_code)
                     if product:
                         tran = DailyTran(
                             product=product,
@@ -127,40 +130,69 @@ class Api(AbstractApi):
         url = '&'.join((url, self.SOURCE_FILTER % source))
 
         response = self.get(url)
+        # 請求失敗或沒有內容(e.g. 重播時找不到封存的回應)時回傳 Response，由 `load()` 記錄後略過
+        if response.status_code != 200 or not response.content:
+            return response
+
         tree = ElementTree.fromstring(response.content)
 
         return tree
 
+    def iter_transactions(self, response):
+        """
+        逐筆解析 'DayTransInfo' 中每個市場的資料，未追蹤的品項與休市資料在轉換為 DailyTran 前捨棄(不再記錄無法對應品項的 warning)，
+        其餘結果同 `json.loads(response.text, object_hook=self.hook)['DayTransInfo']`
+        """
+
+        for item in iter_json_items(iter_text(response), key='DayTransInfo'):
+            details = []
+            for detail in item.get('Detail') or []:
+                detail = {key: value.strip() if isinstance(value, str) else value for key, value in detail.items()}
+                # 加總全部品項時需保留所有明細
+                if self.sum_to_product:
+                    details.append(detail)
+                elif detail.get('ProductNo') in self.target_items and detail.get('ProductName') not in REST_MARKERS:
+                    details.append(detail)
+
+            if item.get('Detail') is not None:
+                item['Detail'] = details
+            yield self.hook(item)
+
     def load(self, response):
-        data = []
-        if response.text:
-            data_set = json.loads(response.text, object_hook=self.hook)
-            data = data_set['DayTransInfo']
+        """
+        :param response: `request()` 回傳的 XML Element(內容為 JSON)或 Response
+        """
+
+        if isinstance(response, Response) and response.status_code != 200:
+            self.LOGGER.warning(f'Request failed with status {response.status_code}, url: {response.url}',
+                                extra=self.LOGGER_EXTRA)
+            return False
+
+        upserter = DailyTranUpserter(
+            update_fields=['avg_price', 'volume'], logger=self.LOGGER, logger_extra=self.LOGGER_EXTRA
+        )
+        try:
+            data = []
+            if isinstance(response, Response):
+                if response.content:
+                    data = self.iter_transactions(response)
+            elif response.text:
+                data_set = json.loads(response.text, object_hook=self.hook)
+                data = data_set['DayTransInfo']
 
-        if data:
             # data should look like [[A, B, C], [D, E], {}, [F], {}...] after loads
             for lst in data:
                 for obj in lst:
                     if isinstance(obj, DailyTran):
-                        try:
-                            # update if exists
-                            daily_tran_qs = DailyTran.objects.filter(Q(date__exact=obj.date)
-                                                                     & Q(product=obj.product))
-                            if obj.source:
-                                daily_tran_qs = daily_tran_qs.filter(source=obj.source)
-
-                            if daily_tran_qs.count() > 1:
-                                # log as duplicate
-                                items = str(daily_tran_qs.values_list('id', flat=True))
-                                self.LOGGER.warning('Find duplicate DailyTran item: %s' % items,
-                                                    extra=self.LOGGER_EXTRA)
-
-                            elif daily_tran_qs.count() == 1:
-                                daily_tran_qs.update(avg_price=obj.avg_price,
-                                                     volume=obj.volume)
-                            else:
-                                if obj.avg_price > 0:
-                                    obj.save()
-
-                        except Exception as e:
-                            self.LOGGER.exception(e, extra=self.LOGGER_EXTRA)
+                        upserter.add(obj, insert=obj.avg_price > 0)
+        except Exception as e:
+            self.LOGGER.exception(f'exception: {e}, response: {str(response.text)[:1000]}', extra=self.LOGGER_EXTRA)
+            return False
+
+        try:
+            upserter.save()
+        except Exception as e:
+            self.LOGGER.exception(e, extra=self.LOGGER_EXTRA)
+            return False
+
+        return True
@@ -5,11 +5,12 @@ from typing import List
 
 import pandas as pd
 import urllib3
-from pandas import Series
 from requests import Response
 
+from apps.dailytrans.codec import period_day, to_dates
 from apps.dailytrans.models import DailyTran
 from .abstract import AbstractApi
+from .upsert import DailyTranUpserter
 from .utils import date_transfer
 from apps.fruits.models import Fruit
 from apps.accounts.utils import mail_new_product_once_today
@@ -40,6 +41,7 @@ class Api(AbstractApi):
     def __init__(self, model, config_code, type_id, logger_type_code=None):
         super(Api, self).__init__(model=model, config_code=config_code, type_id=type_id,
                                   logger='aprp', logger_type_code=logger_type_code)
+        self._tracked_fruit_codes = None
 
     # TODO: to be removed after the API is fixed
     def hook(self, dic):
@@ -49,8 +51,8 @@ class Api(AbstractApi):
 
         product_name = dic.get('PRODUCTNAME')
         source_name = dic.get('ORGNAME')
-        product = self.PRODUCT_QS.filter(code=product_name).first()
-        source = self.SOURCE_QS.filter(name=source_name).first()
+        product = self.resolver.product(product_name)
+        source = self.resolver.source(source_name)
         if product and source:
             tran = DailyTran(
                 product=product,
@@ -76,8 +78,8 @@ class Api(AbstractApi):
 
         product_name = "青香蕉下品(內銷)"
         source_name = dic.get('ORGNAME')
-        product = self.PRODUCT_QS.filter(code=product_name).first()
-        source = self.SOURCE_QS.filter(name=source_name).first()
+        product = self.resolver.product(product_name)
+        source = self.resolver.source(source_name)
         if product and source:
             tran = DailyTran(
                 product=product,
@@ -106,22 +108,17 @@ class Api(AbstractApi):
         YEAR = dic.get('YEAR')
         MONTH = dic.get('MONTH')
         PERIOD = dic.get('PERIOD')
-        if PERIOD == None:
-            pass
-        elif '上旬' in PERIOD:
-            PERIOD = '05'
-        elif '中旬' in PERIOD:
-            PERIOD = '15'
-        elif '下旬' in PERIOD:
-            PERIOD = '25'
+        day = period_day(PERIOD)
+        if day is not None:
+            PERIOD = f'{day:02d}'
 
         if PERIOD == None:
             pass
         else:
             date = f'{YEAR}/{MONTH}/{PERIOD}'
 
-        product = self.PRODUCT_QS.filter(code=product_name).first()
-        source = self.SOURCE_QS.filter(name=source_name).first()
+        product = self.resolver.product(product_name)
+        source = self.resolver.source(source_name)
         if product and source:
             tran = DailyTran(
                 product=product,
@@ -141,11 +138,24 @@ class Api(AbstractApi):
 
     @property
     def sources(self):
-        return self.SOURCE_QS.values_list('name', flat=True)
+        return self.resolver.source_names
 
     @property
     def products(self):
-        return self.PRODUCT_QS.values_list('code', flat=True)
+        return self.resolver.codes
+
+    @property
+    def tracked_fruit_codes(self):
+        """同一供應階段中追蹤的水果品項 code(正規化為大寫)，每次執行只查詢一次"""
+
+        if self._tracked_fruit_codes is None:
+            if self.MODEL is Fruit:
+                codes = self.resolver.codes
+            else:
+                codes = Fruit.objects.filter(type=self.TYPE, track_item=True).values_list('code', flat=True)
+            self._tracked_fruit_codes = {('' if code is None else str(code)).strip().upper() for code in codes}
+
+        return self._tracked_fruit_codes
 
     @staticmethod
     def _access_garlic_data_from_api(data: dict):
@@ -154,8 +164,7 @@ class Api(AbstractApi):
         :param data: dict: API Response for "蒜頭(蒜球)"
         """
 
-        data['PERIOD'] = (f"{data['YEAR']}/{data['MONTH']}/"
-                          f"{(5 if data['PERIOD'] == '上旬' else 15 if data['PERIOD'] == '中旬' else 25)}")
+        data['PERIOD'] = f"{data['YEAR']}/{data['MONTH']}/{period_day(data['PERIOD'], default=25)}"
 
         data.pop('fun')
         data.pop('YEAR')
@@ -287,8 +296,10 @@ class Api(AbstractApi):
         Load data from the API response.
 
         :param responses: list of API responses
+        :return: bool，所有回應皆成功解析並寫入時為 True
         """
         data = []
+        success = True
 
         for response in responses:
             try:
@@ -299,6 +310,7 @@ class Api(AbstractApi):
                 if len(response.text) == 0:
                     self.LOGGER.warning(f'no data returned\nurl={response.request.url}', extra=self.LOGGER_EXTRA)
                 else:
+                    success = False
                     self.LOGGER.exception(
                         f'resp={response.text}\nurl={response.request.url}\nexc={e}',
                         extra=self.LOGGER_EXTRA
@@ -306,7 +318,7 @@ class Api(AbstractApi):
 
         # data should look like [D, B, {}, C, {}...] after loads
         if not data:
-            return
+            return success
         
         self._check_if_new_product_exist(data)
 
@@ -317,56 +329,37 @@ class Api(AbstractApi):
                 self._access_data_from_api(data_api)
         except Exception as e:
             self.LOGGER.exception(f'exception: {e}, data_api: {data_api}', extra=self.LOGGER_EXTRA)
+            return False
+
+        return success
 
     def _access_data_from_api(self, data: pd.DataFrame):
         """
-        Compare data from API with data in DB and update or delete records accordingly.
+        Compare data from API with data in DB and insert, update or delete records accordingly.
+
+        All records are written by `DailyTranUpserter` in a constant number of statements:
+        records only in API are inserted, records whose price changed are updated, and records of the
+        same dates only in DB are deleted. Records with `not_updated` < 0 are added manually and are never
+        updated or deleted by the system.
         """
-        # merge data from API with data in DB
-        data_merge = self._compare_data_from_api_and_db(data)
-
-        # filter out records that need to be updated or deleted
-        # due to merge two data with date, product id and source id, there are two average prices data that are from
-        # Api and DB respectively, we can compare these two and decide whether we should update or delete.
-        condition = (data_merge['avg_price_x'] != data_merge['avg_price_y'])
-
-        if not data_merge[condition].empty:
-            for _, value in data_merge[condition].fillna('').iterrows():
-                series: Series = value
-
-                try:
-                    # get the existed DailyTran record
-                    existed_tran = DailyTran.objects.get(id=int(series['id'] or 0))
-
-                    # We set the `not_updated` field to -999 to indicate that the record has been added manually
-                    # and should not be updated or deleted by the system.
-                    if series['avg_price_x'] and existed_tran.not_updated >= 0:
-                        # if the avg_price in API is not None, update the existed record
-                        self._update_data(series, existed_tran)
-                    else:
-                        if existed_tran.not_updated < 0:
-                            continue
-
-                        # if the avg_price in API is None, delete the existed record
-                        existed_tran.delete()
-                        self.LOGGER.warning(msg=f"The DailyTran data of the product: {series['product__code']} "
-                                                f"on {series['date'].strftime('%Y-%m-%d')} "
-                                                f"from source: {series['source__name']} with\n"
-                                                f"avg_price: {series['avg_price_y']}\n has been deleted.")
-                except Exception as e:
-                    # if no existed record is found, save the data as a new record
-                    self._save_new_data(series)
-
-    def _compare_data_from_api_and_db(self, data: pd.DataFrame) -> pd.DataFrame:
+        data = self._prepare_data_from_api(data)
+
+        upserter = DailyTranUpserter(update_fields=['avg_price'], logger=self.LOGGER, logger_extra=self.LOGGER_EXTRA)
+        upserter.add_frame(data)
+        upserter.save(
+            delete_scope=DailyTran.objects.filter(
+                date__in=data['date'].unique().tolist(), product__type=self.TYPE, product__config=self.CONFIG
+            )
+        )
+
+    def _prepare_data_from_api(self, data: pd.DataFrame) -> pd.DataFrame:
         """
-        Compare data from API with data in DB and return a merged DataFrame.
+        Rename the columns of API data and map product codes and source names to their ids.
 
-        The DataFrame is merged on columns 'date', 'product__code', and 'source__name'.
-        The columns 'id', 'avg_price' are added from the DB data.
-        The columns 'avg_price_x' and 'avg_price_y' are added from the API and DB data.
-        The 'avg_price_x' is the value from API, and 'avg_price_y' is the value from DB.
+        A product code may match multiple products, each of them gets its own record.
+        Records whose source can not be matched are dropped.
         :param data: DataFrame: data from API
-        :return: DataFrame: merged DataFrame
+        :return: DataFrame: columns 'product_id', 'source_id', 'date', 'avg_price', 'product__code', 'source__name'
         """
 
         columns = {
@@ -375,62 +368,28 @@ class Api(AbstractApi):
             'PERIOD': 'date',
             'PRODUCTNAME': 'product__code',
         }
-        merged_by_columns = ['date', 'product__code', 'source__name']
-        use_columns = ['id', 'avg_price'] + merged_by_columns
-        data.rename(columns=columns, inplace=True)
-        data['date'] = data['date'].apply(lambda x: datetime.datetime.strptime(x, '%Y/%m/%d').date())
-
-        daily_tran_qs = DailyTran.objects.filter(
-            date=data['date'].iloc[0], product__type=self.TYPE, product__config=self.CONFIG
+        data = data.rename(columns=columns)
+        data['date'] = to_dates(data['date'], roc_format=self.ROC_FORMAT)
+
+        products = pd.DataFrame(
+            [
+                (product.id, code)
+                for code in data['product__code'].unique()
+                for product in self.resolver.products(code)
+            ],
+            columns=['product_id', 'product__code'],
         )
-        data_db = (
-            pd.DataFrame(list(daily_tran_qs.values(*use_columns)))
-            if daily_tran_qs
-            else pd.DataFrame(columns=use_columns)
+        sources = pd.DataFrame(
+            [
+                (name, source.id)
+                for name in data['source__name'].unique()
+                for source in [self.resolver.source(name)]
+                if source
+            ],
+            columns=['source__name', 'source_id'],
         )
 
-        return data.merge(data_db, on=merged_by_columns, how='outer')
-
-    def _update_data(self, series: Series, existed_tran: DailyTran):
-        """
-        Update the data in DB with the data from API.
-
-        :param series: data from API that convert to Pandas `Series`
-        :param existed_tran: the existed record in DB
-        """
-
-        # update the existed record with the new data
-        # the avg_price_x is the value from API, it's newer than the value in DB
-        existed_tran.avg_price = series['avg_price_x']
-
-        existed_tran.save()
-        self.LOGGER.info(
-            msg=f"The data of the product: {series['product__code']} on"
-                f" {series['date'].strftime('%Y-%m-%d')} has been updated.")
-
-    def _save_new_data(self, series: Series):
-        """
-        Save the data in DB.
-
-        :param series: data from API that convert to Pandas `Series`
-        """
-        # get the products from DB
-        products = self.MODEL.objects.filter(code=series['product__code'])
-
-        # get the source from DB
-        source = self.SOURCE_QS.get(name=series['source__name'])
-
-        # create a list of new records
-        new_trans_list = [DailyTran(
-            product=product,
-            source=source,
-            avg_price=series['avg_price_x'],
-            date=series['date']
-        ) for product in products]
-
-        # bulk create the new records
-        DailyTran.objects.bulk_create(new_trans_list)
-
+        return data.merge(products, on='product__code').merge(sources, on='source__name')
 
     def _check_if_new_product_exist(self, raw_data: list):
         """
@@ -450,11 +409,7 @@ class Api(AbstractApi):
         crop_codes = {
             _norm(code) for code in self.target_items
         }
-        fruit_codes = {
-            _norm(code) for code in
-            Fruit.objects.filter(type=self.TYPE, track_item=True)
-                        .values_list("code", flat=True)
-        }
+        fruit_codes = self.tracked_fruit_codes
         
         db_codes = crop_codes | fruit_codes
         # relative complement of DB's codes in API's codes  
@@ -0,0 +1,141 @@
+"""
+Builder 原始回應的封存與離線重播(replay)
+
+`AbstractApi.get` 取得的 200 回應以 gzip 壓縮後存放於 settings.DAILYTRAN_BUILDER_ARCHIVE['root']，
+可為本機或任何掛載的檔案系統路徑；未設定時不封存。
+
+目錄結構:
+    objects/<sha256[:2]>/<sha256>.gz      回應內容，以內容雜湊值為檔名，相同內容只存一份
+    index/<API_NAME>/<key[:2]>/<key>.json 請求索引，key 為完整請求網址(含日期與參數)的 sha1，
+                                          內容為網址、回應內容的雜湊值、編碼與抓取時間
+
+重播模式(`director` 的 `replay=True` 或 `with replaying():`)下建立的 API，`get` 不連線，
+改由封存的回應組成 Response 交給 `load()`；找不到封存時回傳 404。
+修正品項代碼或來源別名後可用來重新匯入歷史資料，不必再逐日請求政府 API。
+"""
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import requests
+from django.conf import settings
+
+
+_local = threading.local()
+
+
+@contextmanager
+def replaying(replay=True):
+    """區塊內建立的 API 以封存的回應取代網路請求"""
+
+    previous = getattr(_local, 'replay', False)
+    _local.replay = replay
+    try:
+        yield
+    finally:
+        _local.replay = previous
+
+
+def is_replaying():
+    return getattr(_local, 'replay', False)
+
+
+def get_request_url(url, params=None):
+    """`session.get(url, params=params)` 實際請求的網址"""
+
+    return requests.Request('GET', url, params=params).prepare().url
+
+
+class ResponseArchive:
+    def __init__(self, root=None):
+        """
+        Args:
+            root: 封存目錄，預設為 settings.DAILYTRAN_BUILDER_ARCHIVE['root']，未設定時不封存
+        """
+
+        if root is None:
+            root = getattr(settings, 'DAILYTRAN_BUILDER_ARCHIVE', {}).get('root')
+
+        self.root = root or None
+
+    @property
+    def enabled(self):
+        return self.root is not None
+
+    def object_path(self, sha):
+        return os.path.join(self.root, 'objects', sha[:2], f'{sha}.gz')
+
+    def index_path(self, api_name, url):
+        key = hashlib.sha1(url.encode()).hexdigest()
+        return os.path.join(self.root, 'index', api_name, key[:2], f'{key}.json')
+
+    @staticmethod
+    def _write(path, data):
+        """先寫入暫存檔再取代，同時執行的 worker 不會讀到寫到一半的檔案"""
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def store(self, api_name, url, response):
+        """
+        封存回應內容並更新索引，同一個網址只保留最新一次的回應
+
+        :return: 回應內容的 sha256
+        """
+
+        content = response.content or b''
+        sha = hashlib.sha256(content).hexdigest()
+
+        object_path = self.object_path(sha)
+        if not os.path.exists(object_path):
+            self._write(object_path, gzip.compress(content))
+
+        entry = {
+            'url': url,
+            'sha256': sha,
+            'encoding': response.encoding,
+            'content_type': response.headers.get('Content-Type'),
+            'fetched_at': datetime.datetime.now().isoformat(),
+        }
+        self._write(self.index_path(api_name, url), json.dumps(entry, ensure_ascii=False).encode())
+
+        return sha
+
+    def lookup(self, api_name, url):
+        """
+        :return: 封存的 Response，找不到時回傳 None
+        """
+
+        try:
+            with open(self.index_path(api_name, url), encoding='utf-8') as f:
+                entry = json.load(f)
+            with open(self.object_path(entry['sha256']), 'rb') as f:
+                content = gzip.decompress(f.read())
+        except FileNotFoundError:
+            return None
+
+        response = requests.Response()
+        response.status_code = 200
+        response._content = content
+        response.encoding = entry.get('encoding')
+        response.url = url
+        response.request = requests.Request('GET', url).prepare()
+        if entry.get('content_type'):
+            response.headers['Content-Type'] = entry['content_type']
+
+        return response
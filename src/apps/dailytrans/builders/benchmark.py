@@ -0,0 +1,322 @@
+"""
+Builder 的效能量測: 以本機的替身 API 伺服器(stub server)取代政府 API
+
+`StubApiServer` 在本機啟動一個 HTTP 伺服器，settings.DAILYTRAN_BUILDER_API 的每個 API 都對應到
+`http://127.0.0.1:<port>/<API_NAME>/<原網址的路徑>?<原網址的參數>`，回應內容依序為:
+    1. `payloads` 指定的檔案(錄製或自行產生的內容)，同一個 API 的所有請求都回傳此檔案
+    2. 原網址在 `archive`(ResponseArchive)中的封存回應
+    3. 空白內容(計入 `missing`)
+
+每個請求可加上固定延遲(latency)與依比例回傳錯誤(failure_rate)，用來量測重試與斷路器的影響。
+不在 DAILYTRAN_BUILDER_API 中的網址(e.g. 爬蟲直接寫在程式中的網址)經由 proxy 設定導向 stub server
+並回傳 502(計入 `blocked`)，量測期間不會連線到任何外部網站。
+
+`run_builder` 以 `director` 執行一個 `direct_*` function，回傳請求數、比對筆數、SQL 數量與 RSS 峰值。
+
+使用方式:
+    with StubApiServer(payloads={'eir030': 'eir030.json'}, latency=0.05) as server:
+        with server.activate():
+            result = run_builder('apps.crops.builder.direct_wholesale_05', start_date, end_date, server)
+"""
+import os
+import random
+import resource
+import socketserver
+import threading
+import time
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlsplit, urlunsplit
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils.module_loading import import_string
+
+from .upsert import listen_saves
+
+
+BenchmarkResult = namedtuple('BenchmarkResult', (
+    'func', 'success', 'duration', 'requests', 'failures', 'missing', 'blocked', 'rows', 'changed', 'queries',
+    'peak_rss',
+))
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.stub.handle(self)
+
+    def do_POST(self):
+        # 讀取 request body 後與 GET 相同處理(e.g. 中央畜產會的表單)
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        self.server.stub.handle(self)
+
+    def do_CONNECT(self):
+        self.server.stub.block(self)
+
+
+class StubApiServer:
+    def __init__(self, payloads=None, archive=None, latency=0.0, failure_rate=0.0, failure_status=503, seed=None,
+                 apis=None):
+        """
+        Args:
+            payloads: {API_NAME: 檔案路徑}，同一個 API 的所有請求都回傳此檔案內容
+            archive: ResponseArchive，以原網址查詢封存的回應
+            latency: 每個請求的延遲秒數
+            failure_rate: 回傳 failure_status 的比例，0 ~ 1
+            failure_status: 模擬失敗時的 HTTP status
+            seed: failure_rate 的亂數種子
+            apis: {API_NAME: 原網址}，預設為 settings.DAILYTRAN_BUILDER_API
+        """
+
+        self.apis = dict(apis if apis is not None else settings.DAILYTRAN_BUILDER_API)
+        self.payloads = {}
+        for api_name, path in (payloads or {}).items():
+            with open(path, 'rb') as f:
+                self.payloads[api_name] = f.read()
+
+        self.archive = archive
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.random = random.Random(seed)
+
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def url_for(self, api_name):
+        """
+        API 原網址對應的 stub 網址，保留原網址的路徑與參數；
+        builder 皆以 '&' 在網址後面接上參數，因此一律以 '?' 結尾(同原網址)
+        """
+
+        parts = urlsplit(self.apis.get(api_name) or '')
+        return f'{self.base_url}/{api_name}{parts.path or "/"}?{parts.query}'
+
+    @property
+    def urls(self):
+        return {api_name: self.url_for(api_name) for api_name in self.apis}
+
+    def original_url(self, api_name, path, query):
+        parts = urlsplit(self.apis.get(api_name) or '')
+        if not parts.netloc:
+            return None
+
+        return urlunsplit((parts.scheme, parts.netloc, path or '/', query, ''))
+
+    def snapshot(self):
+        with self._lock:
+            return Counter(self.stats)
+
+    def _count(self, api_name, field):
+        with self._lock:
+            self.stats[field] += 1
+            self.stats[f'{api_name}:{field}'] += 1
+
+    def lookup(self, api_name, path, query):
+        if api_name in self.payloads:
+            return self.payloads[api_name], None
+
+        url = self.original_url(api_name, path, query)
+        if self.archive is not None and self.archive.enabled and url:
+            response = self.archive.lookup(api_name, url)
+            if response is not None:
+                return response.content, response.headers.get('Content-Type')
+
+        return None, None
+
+    def handle(self, handler):
+        parts = urlsplit(handler.path)
+        if parts.netloc:
+            # 經由 proxy 送出的外部網址
+            self.block(handler)
+            return
+
+        api_name, _, path = parts.path.lstrip('/').partition('/')
+        if api_name not in self.apis:
+            self._count(api_name, 'blocked')
+            self._respond(handler, 404, b'')
+            return
+
+        self._count(api_name, 'requests')
+        if self.latency:
+            time.sleep(self.latency)
+
+        with self._lock:
+            failed = self.failure_rate and self.random.random() < self.failure_rate
+        if failed:
+            self._count(api_name, 'failures')
+            self._respond(handler, self.failure_status, b'')
+            return
+
+        content, content_type = self.lookup(api_name, f'/{path}', parts.query)
+        if content is None:
+            self._count(api_name, 'missing')
+            content = b''
+
+        self._respond(handler, 200, content, content_type)
+
+    def block(self, handler):
+        self._count('external', 'blocked')
+        self._respond(handler, 502, b'')
+
+    @staticmethod
+    def _respond(handler, status, content, content_type=None):
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type or 'application/octet-stream')
+        handler.send_header('Content-Length', str(len(content)))
+        handler.end_headers()
+        handler.wfile.write(content)
+
+    @contextmanager
+    def activate(self, retries=0, rate_limit=False):
+        """
+        區塊內建立的 builder 改為請求 stub server
+
+        Args:
+            retries: 失敗時的重試次數，預設不重試，避免退避等待計入執行時間
+            rate_limit: 是否保留 DAILYTRAN_BUILDER_API_LIMITS 的每秒請求數上限
+        """
+
+        limits = {
+            name: {**limit, 'rate': limit.get('rate') if rate_limit else None}
+            for name, limit in getattr(settings, 'DAILYTRAN_BUILDER_API_LIMITS', {}).items()
+        }
+        overrides = {
+            'DAILYTRAN_BUILDER_API': self.urls,
+            'DAILYTRAN_BUILDER_API_LIMITS': limits,
+            'DAILYTRAN_BUILDER_RETRY': {'max_retries': retries, 'base_delay': 0.1, 'max_delay': 1},
+            # 模擬的失敗不可開啟斷路器，也不封存 stub 的回應
+            'DAILYTRAN_BUILDER_BREAKER': {'failure_threshold': 10 ** 9, 'window': 1, 'cooldown': 1},
+            'DAILYTRAN_BUILDER_ARCHIVE': {'root': None},
+        }
+
+        proxy = {'HTTP_PROXY': self.base_url, 'HTTPS_PROXY': self.base_url, 'NO_PROXY': '127.0.0.1,localhost'}
+        previous = {key: os.environ.get(key) for key in proxy}
+        os.environ.update(proxy)
+        try:
+            with override_settings(**overrides):
+                yield self
+        finally:
+            for key, value in previous.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+
+
+def get_rss():
+    """目前的 RSS(bytes)，非 Linux 時以 ru_maxrss 代替"""
+
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler:
+    """在背景 thread 定期讀取 RSS，記錄區塊內的峰值(ru_maxrss 為整個 process 的峰值，無法區分每個 builder)"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = get_rss()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, get_rss())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, get_rss())
+
+
+def run_builder(func, start_date, end_date, server, **kwargs):
+    """
+    以 `director` 執行一個 builder(忽略指紋，一律比對寫入)並量測
+
+    Args:
+        func: `direct_*` function 或其完整路徑，e.g. 'apps.crops.builder.direct_wholesale_05'
+        server: 已啟動並 `activate()` 的 StubApiServer
+
+    Returns:
+        BenchmarkResult
+    """
+
+    func_path = func if isinstance(func, str) else f'{func.__module__}.{func.__name__}'
+    func = import_string(func) if isinstance(func, str) else func
+
+    saves = Counter()
+
+    def on_save(rows, result):
+        saves['rows'] += rows
+        saves['changed'] += sum(result)
+
+    before = server.snapshot()
+    with listen_saves(on_save), CaptureQueriesContext(connection) as queries, RssSampler() as sampler:
+        start = time.monotonic()
+        result = func(start_date=start_date, end_date=end_date, force=True, **kwargs)
+        duration = time.monotonic() - start
+    stats = server.snapshot() - before
+
+    return BenchmarkResult(
+        func=func_path,
+        success=bool(getattr(result, 'success', False)),
+        duration=duration,
+        requests=stats['requests'],
+        failures=stats['failures'],
+        missing=stats['missing'],
+        blocked=stats['blocked'],
+        rows=saves['rows'],
+        changed=saves['changed'],
+        queries=len(queries),
+        peak_rss=sampler.peak,
+    )
@@ -1,8 +1,8 @@
-from django.db.models import Q
 import datetime
 import json
 from .utils import date_transfer
 from .abstract import AbstractApi
+from .upsert import DailyTranUpserter
 from apps.dailytrans.models import DailyTran
 
 
@@ -29,7 +29,7 @@ class Api(AbstractApi):
                 dic[key] = value.strip()
 
         product_code = dic.get('item')
-        product = self.PRODUCT_QS.filter(code=product_code).first()
+        product = self.resolver.product(product_code)
 
         if product:
             tran = DailyTran(
@@ -70,24 +70,17 @@ class Api(AbstractApi):
             data = json.loads(response.text, object_hook=self.hook)
 
         # data should look like [D, B, {}, C, {}...] after loads
+        upserter = DailyTranUpserter(
+            update_fields=['avg_price'], logger=self.LOGGER, logger_extra=self.LOGGER_EXTRA
+        )
         for obj in data:
             if isinstance(obj, DailyTran):
-                try:
-                    # update if exists
-                    daily_tran_qs = DailyTran.objects.filter(Q(date__exact=obj.date)
-                                                             & Q(product=obj.product))
+                upserter.add(obj, insert=obj.avg_price > 0)
 
-                    if daily_tran_qs.count() > 1:
-                        # log as duplicate
-                        items = str(daily_tran_qs.values_list('id', flat=True))
+        try:
+            upserter.save()
+        except Exception as e:
+            self.LOGGER.exception(e, extra=self.LOGGER_EXTRA)
+            return False
 
-                        self.LOGGER.warning('Find duplicate DailyTran item: %s' % items, extra=self.LOGGER_EXTRA)
-
-                    elif daily_tran_qs.count() == 1:
-                        daily_tran_qs.update(avg_price=obj.avg_price)
-                    else:
-                        if obj.avg_price > 0:
-                            obj.save()
-
-                except Exception as e:
-                    self.LOGGER.exception(e, extra=self.LOGGER_EXTRA)
+        return True
@@ -1,13 +1,64 @@
 import datetime
+import hashlib
 import json
+import math
 
-from django.db.models import Q
+from django.conf import settings
 
 from apps.dailytrans.models import DailyTran
 from .abstract import AbstractApi
+from .fingerprint import digest
+from .resilience import CircuitOpenError, incr_metric
+from .upsert import DailyTranUpserter
 from .utils import date_transfer
 
 
+def get_efish_config():
+    config = getattr(settings, 'DAILYTRAN_BUILDER_EFISH', {})
+    return {
+        'batch_size': config.get('batch_size', 0),
+        'request_budget': config.get('request_budget', 12),
+    }
+
+
+def plan_batches(codes, windows, batch_size=0, request_budget=None):
+    """
+    將「品項 x 日期區間」的請求合併為批次請求
+
+    - batch_size 為 0: 每個日期區間只請求一次且不指定 pid，回應包含所有魚種，由 `load` 只保留追蹤中的品項
+    - batch_size 大於 0: 每次請求以逗號分隔最多 batch_size 個 pid；
+      請求數超過 request_budget 時加大每批的品項數，但每個日期區間至少一次請求
+
+    Args:
+        codes: 品項代碼
+        windows: (start_date, end_date) list
+        batch_size: 每次請求的品項數，0 代表不指定品項
+        request_budget: 單次執行的請求數上限，None 代表不限制
+
+    Returns:
+        List[dict]: `request()` 的參數
+    """
+
+    codes = sorted(set(codes))
+    if not codes or not windows:
+        return []
+
+    if batch_size and request_budget:
+        per_window = max(request_budget // len(windows), 1)
+        batch_size = max(batch_size, math.ceil(len(codes) / per_window))
+
+    if batch_size:
+        batches = [','.join(codes[i:i + batch_size]) for i in range(0, len(codes), batch_size)]
+    else:
+        batches = [None]
+
+    return [
+        {'start_date': start_date, 'end_date': end_date, 'code': code}
+        for start_date, end_date in windows
+        for code in batches
+    ]
+
+
 """ 漁-產地 """
 class Api(AbstractApi):
     # Settings
@@ -30,6 +81,18 @@ class Api(AbstractApi):
             logger_type_code=logger_type_code,
         )
 
+        # 批次請求時只寫入這些品項，None 代表所有追蹤中的品項
+        self.codes = None
+        # 每個品項的子品項只取一次，不再每筆資料呼叫一次 `children()`
+        self._children = {}
+        self._unmatched = set()
+
+    def children(self, product):
+        if product.id not in self._children:
+            self._children[product.id] = list(product.children())
+
+        return self._children[product.id]
+
     def hook(self, dic):
         def create_tran(obj):
             code = obj.code
@@ -47,11 +110,14 @@ class Api(AbstractApi):
                 dic[key] = value.strip()
 
         product_code = dic.get('fishId')
+        if product_code is not None and self.codes is not None and product_code not in self.codes:
+            return dic
+
         # It should get the right product "Origin" object, not "Wholesale"
         # Remember to provide type_id to Api initialization to limit PRODUCT_QS
-        product = self.PRODUCT_QS.filter(code=product_code).first()
+        product = self.resolver.product(product_code)
         if product:
-            children = product.children()
+            children = self.children(product)
             lst = []
             for child in children:
                 try:
@@ -64,9 +130,12 @@ class Api(AbstractApi):
                     )
             return lst
         else:
-            self.LOGGER.warning(
-                'Cannot Match Product: %s' % product_code, extra=self.LOGGER_EXTRA
-            )
+            # 不指定 pid 的回應包含未追蹤的魚種，同一個代碼只記錄一次
+            if product_code is not None and product_code not in self._unmatched:
+                self._unmatched.add(product_code)
+                self.LOGGER.warning(
+                    'Cannot Match Product: %s' % product_code, extra=self.LOGGER_EXTRA
+                )
             return dic
 
     def request(
@@ -104,6 +173,9 @@ class Api(AbstractApi):
                 raise AttributeError
 
         if code:
+            # 批次請求: 多個品項以逗號分隔, e.g. pid=1011,1011D
+            if isinstance(code, (list, tuple, set)):
+                code = ','.join(sorted(code))
             url = '&'.join((url, self.CODE_FILTER % code))
 
         headers = {
@@ -112,36 +184,107 @@ class Api(AbstractApi):
 
         return self.get(url, headers=headers, verify=False)
 
-    def load(self, response):
+    def add_to(self, upserter, response):
+        """解析回應並將資料加入 upserter"""
+
         data = []
         if response.text:
             data = json.loads(response.text, object_hook=self.hook)
 
         # data should look like [[A,B,C], [A,B,C], ..] after loads
         for lst in data:
+            if not isinstance(lst, list):
+                continue
             for obj in lst:
-                try:
-                    if isinstance(obj, DailyTran):
-                        # update if exists
-                        daily_tran_qs = DailyTran.objects.filter(
-                            Q(date__exact=obj.date) & Q(product=obj.product)
-                        )
-                        if obj.source:
-                            daily_tran_qs = daily_tran_qs.filter(source=obj.source)
-
-                        if daily_tran_qs.count() > 1:
-                            # log as duplicate
-                            items = str(daily_tran_qs.values_list("id", flat=True))
-                            self.LOGGER.warning(
-                                'API Warning: Find duplicate DailyTran item: %s'
-                                % items,
-                                extra=self.LOGGER_EXTRA,
-                            )
-
-                        elif daily_tran_qs.count() == 1:
-                            daily_tran_qs.update(avg_price=obj.avg_price)
-                        else:
-                            if obj.avg_price > 0:
-                                obj.save()
-                except Exception as e:
-                    self.LOGGER.exception(e, extra=self.LOGGER_EXTRA)
+                if isinstance(obj, DailyTran):
+                    upserter.add(obj, insert=obj.avg_price > 0)
+
+    def load(self, response):
+        upserter = DailyTranUpserter(
+            update_fields=['avg_price'], logger=self.LOGGER, logger_extra=self.LOGGER_EXTRA
+        )
+        self.add_to(upserter, response)
+
+        try:
+            upserter.save()
+        except Exception as e:
+            self.LOGGER.exception(e, extra=self.LOGGER_EXTRA)
+            return False
+
+        return True
+
+    def fingerprint_params(self, kwargs):
+        """不指定 pid 的回應依 `codes` 過濾，指紋需包含品項，避免只更新部分品項後其他品項被略過"""
+
+        if kwargs.get('code') is None and self.codes is not None:
+            codes = ','.join(sorted(self.codes))
+            return {**kwargs, 'codes': hashlib.sha1(codes.encode()).hexdigest()[:16]}
+
+        return kwargs
+
+    def fetch_batches_and_load(self, codes, windows, batch_size=None, request_budget=None):
+        """
+        以批次請求取代「每個品項、每個日期區間各一次請求」，所有回應合併後一次寫入資料庫
+
+        請求間隔由 settings.DAILYTRAN_BUILDER_API_LIMITS['efish'] 的每秒請求數控制(同一個 process 共用)，
+        不再固定 sleep；單次執行的請求數與每批品項數設定於 settings.DAILYTRAN_BUILDER_EFISH
+
+        Args:
+            codes: 要寫入的品項代碼
+            windows: (start_date, end_date) list
+
+        Raises:
+            CircuitOpenError: 有請求因斷路器開啟而未送出，由 `director` 將日期區間排入佇列稍後重新執行
+
+        Returns:
+            int: 失敗的請求數
+        """
+
+        config = get_efish_config()
+        batch_size = config['batch_size'] if batch_size is None else batch_size
+        request_budget = config['request_budget'] if request_budget is None else request_budget
+
+        self.codes = set(codes)
+        jobs = plan_batches(codes, windows, batch_size=batch_size, request_budget=request_budget)
+        if not jobs:
+            return 0
+
+        upserter = DailyTranUpserter(
+            update_fields=['avg_price'], logger=self.LOGGER, logger_extra=self.LOGGER_EXTRA
+        )
+        loaded = []
+        failed = 0
+        circuit_error = None
+        for kwargs, response, exc in self.fetch(jobs):
+            if isinstance(exc, CircuitOpenError):
+                circuit_error = exc
+                continue
+
+            if exc is not None:
+                failed += 1
+                self.LOGGER.error(f'Request failed with {kwargs}: {exc}', extra=self.LOGGER_EXTRA)
+                continue
+
+            params = self.fingerprint_params(kwargs)
+            value = digest(response)
+            if self.fingerprint.is_unchanged(params, value):
+                incr_metric(self.API_NAME, 'unchanged')
+                self.LOGGER.info(f'Response unchanged with {params}, skip loading', extra=self.LOGGER_EXTRA)
+                continue
+
+            self.add_to(upserter, response)
+            loaded.append((params, value))
+
+        try:
+            upserter.save()
+        except Exception as e:
+            self.LOGGER.exception(e, extra=self.LOGGER_EXTRA)
+        else:
+            # 寫入成功後才記錄指紋
+            for params, value in loaded:
+                self.fingerprint.save(params, value)
+
+        if circuit_error is not None:
+            raise circuit_error
+
+        return failed
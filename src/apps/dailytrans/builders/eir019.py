@@ -2,10 +2,9 @@ import datetime
 import json
 import math
 
-from django.db.models import Q
-
 from apps.dailytrans.models import DailyTran
 from .abstract import AbstractApi
+from .upsert import DailyTranUpserter
 from .utils import date_transfer
 
 
@@ -68,11 +67,11 @@ class Api(AbstractApi):
         source_name = dic.get('市場名稱')
         if source_name:
             source_name = source_name.strip()
-        source = self.SOURCE_QS.filter_by_name(source_name).first()
+        source = self.resolver.source_by_name(source_name)
 
         if source:
             lst = []
-            for obj in self.PRODUCT_QS.all():
+            for obj in self.resolver.all_products:
                 if obj.track_item:
                     try:
                         tran = create_tran(obj, source)
@@ -113,41 +112,32 @@ class Api(AbstractApi):
         if response.text:
             data = json.loads(response.text, object_hook=self.hook)
         # data should look like [[A,B,C], [A,B,C], ..] after loads
+        upserter = DailyTranUpserter(
+            update_fields=['avg_price', 'volume', 'avg_weight'], logger=self.LOGGER, logger_extra=self.LOGGER_EXTRA
+        )
         for lst in data:
             for obj in lst:
-                try:
-                    if isinstance(obj, DailyTran):
-                        # update if exists
-                        daily_tran_qs = DailyTran.objects.filter(
-                            Q(date__exact=obj.date) & Q(product=obj.product)
+                if not isinstance(obj, DailyTran):
+                    continue
+
+                # 宜蘭縣、新竹縣、苗栗縣、花蓮縣155公斤以上已納入規格豬，這裡不進以排除重複計算
+                if obj.product.id == 70005 and obj.source.id in [40007, 40009, 40010, 40017]:
+                    upserter.add(obj, insert=False)
+                elif (obj.volume or 0) + (obj.avg_price or 0) + (obj.avg_weight or 0) > 0:
+                    upserter.add(obj)
+                else:
+                    # 沒有價量的資料只更新既有資料，不新增
+                    upserter.add(obj, insert=False)
+                    if not math.isclose(obj.volume + obj.avg_price + obj.avg_weight, 0):
+                        self.LOGGER.warning(
+                            'Find not valid hog DailyTran item: %s' % str(obj),
+                            extra=self.LOGGER_EXTRA,
                         )
-                        if obj.source:
-                            daily_tran_qs = daily_tran_qs.filter(source=obj.source)
-
-                        if daily_tran_qs.count() > 1:
-                            # log as duplicate
-                            items = str(daily_tran_qs.values_list('id', flat=True))
-                            self.LOGGER.warning(
-                                'Find duplicate DailyTran item: %s' % items,
-                                extra=self.LOGGER_EXTRA,
-                            )
-
-                        elif daily_tran_qs.count() == 1:
-                            daily_tran_qs.update(
-                                avg_price=obj.avg_price,
-                                volume=obj.volume,
-                                avg_weight=obj.avg_weight,
-                            )
-                        else:
-                            # 宜蘭縣、新竹縣、苗栗縣、花蓮縣155公斤以上已納入規格豬，這裡不進以排除重複計算
-                            if obj.product.id == 70005 and obj.source.id in [40007, 40009, 40010, 40017]:
-                                pass
-                            elif (obj.volume or 0) + (obj.avg_price or 0) + (obj.avg_weight or 0) > 0:
-                                obj.save()
-                            elif not math.isclose(obj.volume + obj.avg_price + obj.avg_weight, 0):
-                                self.LOGGER.warning(
-                                    'Find not valid hog DailyTran item: %s' % str(obj),
-                                    extra=self.LOGGER_EXTRA,
-                                )
-                except Exception as e:
-                    self.LOGGER.exception(e, extra=self.LOGGER_EXTRA)
+
+        try:
+            upserter.save()
+        except Exception as e:
+            self.LOGGER.exception(e, extra=self.LOGGER_EXTRA)
+            return False
+
+        return True
@@ -1,11 +1,13 @@
 import datetime
-import json
 
 import pandas as pd
 
+from apps.dailytrans.codec import to_dates
 from apps.dailytrans.models import DailyTran
 from apps.accounts.utils import mail_new_product_once_today
 from .abstract import AbstractApi
+from .stream import RecordStream
+from .upsert import DailyTranUpserter
 from .utils import date_transfer
 
 
@@ -39,9 +41,9 @@ class Api(AbstractApi):
                 dic[key] = value.strip()
 
         product_code = dic.get('product__code')
-        products = self.PRODUCT_QS.filter(code=product_code).all()
+        products = self.resolver.products(product_code)
         source_name = dic.get('source__name')
-        source = self.SOURCE_QS.filter_by_name(source_name).first()
+        source = self.resolver.source_by_name(source_name)
         if products and source:
             trans = [
                 DailyTran(
@@ -113,57 +115,58 @@ class Api(AbstractApi):
         return self.get(url)
 
     def load(self, response):
-        data = []
-        if response.text:
-            try:
-                data = json.loads(response.text)
-            except Exception as e:
-                self.LOGGER.exception(
-                    f'exception: {e}, response: {response.text}', extra=self.LOGGER_EXTRA)
-        data = pd.DataFrame(
-            data,columns=[
-                '上價', '中價', '下價', '平均價', '交易量', '交易日期', '作物代號', '作物名稱', '市場名稱', '種類代碼'
-            ]
+        # 逐筆解析回應，未追蹤的品項與休市資料不會建立 DataFrame
+        stream = RecordStream(
+            ['上價', '中價', '下價', '平均價', '交易量', '交易日期', '作物代號', '作物名稱', '市場名稱', '種類代碼'],
+            code_field='作物代號',
+            codes=self.target_items,
+            name_field='作物名稱',
         )
+        # 每批解析完成即加入 upserter，不合併成完整的 DataFrame
+        try:
+            self._access_data_from_api(stream.iter_batches(response))
+            success = True
+        except Exception as e:
+            self.LOGGER.exception(
+                f'exception: {e}, url: {response.url}, response: {response.text[:1000]}',
+                extra=self.LOGGER_EXTRA
+            )
+            success = False
 
-        self._check_if_new_product_exist(data)
+        self._check_if_new_product_exist(stream.dropped_frame())
 
-        data = data[data['作物代號'].isin(self.target_items)]
+        return success
+
+    def _access_data_from_api(self, data):
+        """
+        將 API 資料以 `DailyTranUpserter` 批次寫入: 新增資料庫沒有的資料、更新價格或交易量有異動的資料，
+        並刪除同日期中已不存在的資料(人工修改的資料 not_updated < 0 不會被更動)
+
+        :param data: DataFrame，或 DataFrame 的 iterable(e.g. `RecordStream.iter_batches`)，
+                     每批轉換後即加入 upserter，全部加入後以單一交易寫入
+        """
+        batches = [data] if isinstance(data, pd.DataFrame) else data
+
+        upserter = DailyTranUpserter(
+            update_fields=['up_price', 'mid_price', 'low_price', 'avg_price', 'volume'],
+            logger=self.LOGGER,
+            logger_extra=self.LOGGER_EXTRA,
+        )
+        dates = set()
+        for batch in batches:
+            batch = self._prepare_data_from_api(batch)
+            upserter.add_frame(batch)
+            dates.update(batch['date'].unique().tolist())
+
+        upserter.save(
+            delete_scope=DailyTran.objects.filter(
+                date__in=sorted(dates), product__type=self.TYPE, product__config=self.CONFIG
+            )
+        )
+
+    def _prepare_data_from_api(self, data: pd.DataFrame) -> pd.DataFrame:
+        """將欄位更名、轉換民國日期，並將品項代碼與市場名稱對應為 product_id 與 source_id"""
 
-        try:
-            if not data.empty:
-                self._access_data_from_api(data)
-        except Exception as e:
-            self.LOGGER.exception(f'exception: {e}, response: {response.text}', extra=self.LOGGER_EXTRA)
-
-    def _access_data_from_api(self, data: pd.DataFrame):
-        data_merge = self._compare_data_from_api_and_db(data)
-        condition = ((data_merge['avg_price_x'] != data_merge['avg_price_y']) | (
-                data_merge['up_price_x'] != data_merge['up_price_y']) | (
-                data_merge['low_price_x'] != data_merge['low_price_y']) | (
-                data_merge['mid_price_x'] != data_merge['mid_price_y']) | (
-                data_merge['volume_x'] != data_merge['volume_y']))
-        if not data_merge[condition].empty:
-            for _, value in data_merge[condition].fillna('').iterrows():
-                try:
-                    existed_tran = DailyTran.objects.get(id=int(value['id'] or 0))
-                    if value['avg_price_x']:
-                        self._update_data(value, existed_tran)
-                    else:
-                        existed_tran.delete()
-                        self.LOGGER.warning(
-                            msg=f'The DailyTran data of the product: {value["product__code"]} '
-                                f'on {value["date"].strftime("%Y-%m-%d")} '
-                                f'from source: {value["source__name"]} with\n'
-                                f'up_price: {value["up_price_y"]}\n'
-                                f'mid_price: {value["mid_price_y"]}\n'
-                                f'low_price: {value["low_price_y"]}\n'
-                                f'avg_price: {value["avg_price_y"]}\n'
-                                f'volume: {value["volume_y"]} has been deleted.')
-                except Exception as e:
-                    self._save_new_data(value)
-
-    def _compare_data_from_api_and_db(self, data: pd.DataFrame):
         columns = {
             '上價': 'up_price',
             '中價': 'mid_price',
@@ -175,53 +178,31 @@ class Api(AbstractApi):
             '交易日期': 'date',
             '種類代碼': 'Tc_type'
         }
-        data.rename(columns=columns, inplace=True)
-        data['date'] = data['date'].apply(lambda x: datetime.datetime.strptime(
-            (str(int(x.split('.')[0]) + 1911) + x[len(str(x.split('.')[0])):])
-            .replace('.', '-'), '%Y-%m-%d').date())
+        data = data.rename(columns=columns)
+        data['date'] = to_dates(data['date'], roc_format=self.ROC_FORMAT)
         data['source__name'] = data['source__name'].str.replace('台', '臺')
         data['product__code'] = data['product__code'].astype(str)
 
-        data_db = DailyTran.objects.filter(
-            date=data['date'].iloc[0], product__type=1, product__config=self.CONFIG
+        # 同一個代碼可能對應多個品項，每個品項各自寫入一筆
+        products = pd.DataFrame(
+            [
+                (product.id, code)
+                for code in data['product__code'].unique()
+                for product in self.resolver.products(code)
+            ],
+            columns=['product_id', 'product__code'],
         )
-        data_db = pd.DataFrame(list(data_db.values(
-            'id', 'product__id', 'product__code', 'up_price', 'mid_price', 'low_price', 'avg_price', 'volume', 'date', 'source__name'
-        ))) \
-            if data_db else pd.DataFrame(
-            columns=['id', 'product__id', 'product__code', 'up_price', 'mid_price','low_price', 'avg_price', 'volume', 'date', 'source__name']
+        sources = pd.DataFrame(
+            [
+                (name, source.id)
+                for name in data['source__name'].unique()
+                for source in [self.resolver.source_by_name(name)]
+                if source
+            ],
+            columns=['source__name', 'source_id'],
         )
 
-        return data.merge(
-            data_db, on=['date', 'product__code', 'source__name'],
-            how='outer')
-
-    def _update_data(self, value, existed_tran):
-        existed_tran.up_price = value['up_price_x']
-        existed_tran.mid_price = value['mid_price_x']
-        existed_tran.low_price = value['low_price_x']
-        existed_tran.avg_price = value['avg_price_x']
-        existed_tran.volume = value['volume_x']
-        existed_tran.save()
-        self.LOGGER.info(
-            msg=f'The data of the product: {value["product__code"]} on'
-                f' {value["date"].strftime("%Y-%m-%d")} has been updated.')
-
-    def _save_new_data(self, value):
-        products = self.MODEL.objects.filter(code=value['product__code'])
-        source = self.SOURCE_QS.filter_by_name(value['source__name']).first()
-        new_trans = [DailyTran(
-            product=product,
-            source=source,
-            up_price=value['up_price_x'],
-            mid_price=value['mid_price_x'],
-            low_price=value['low_price_x'],
-            avg_price=value['avg_price_x'],
-            volume=value['volume_x'],
-            date=value['date']
-        ) for product in products]
-        DailyTran.objects.bulk_create(new_trans)
-        
+        return data.merge(products, on='product__code').merge(sources, on='source__name')
 
     def _check_if_new_product_exist(self, data: pd.DataFrame):
         """
@@ -1,5 +1,4 @@
 import datetime
-import json
 import time
 from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
@@ -9,10 +8,16 @@ from urllib.parse import urlparse, parse_qs
 import pandas as pd
 from bs4 import BeautifulSoup
 from bs4.element import ResultSet
+from django.conf import settings
 from requests import Response, post
 
+from apps.dailytrans.codec import to_dates
 from apps.dailytrans.models import DailyTran
 from .abstract import AbstractApi
+from .archive import get_request_url
+from .htmltable import extract_table, to_columns
+from .stream import RecordStream
+from .upsert import DailyTranUpserter
 from .utils import date_transfer
 
 
@@ -47,9 +52,9 @@ class Api(AbstractApi):
                 dic[key] = value.strip()
 
         product_code = dic.get('品種代碼')
-        product = self.PRODUCT_QS.filter(code=product_code).first()
+        product = self.resolver.product(product_code)
         source_name = dic.get('市場名稱')
-        source = self.SOURCE_QS.filter_by_name(source_name).first()
+        source = self.resolver.source_by_name(source_name)
         if product and source:
             tran = DailyTran(
                 product=product,
@@ -121,60 +126,56 @@ class Api(AbstractApi):
         return self.get(url)
 
     def load(self, response):
-        data = []
-        if response.text:
-            try:
-                data = json.loads(response.text)
-            except Exception as e:
-                self.LOGGER.exception(f'exception: {e}, response: {response.text}', extra=self.LOGGER_EXTRA)
-
-        data = pd.DataFrame(
-            data,columns=[
-                '上價', '中價', '下價', '平均價', '交易量', '交易日期', '品種代碼', '市場名稱', '魚貨名稱'
-            ]
+        # 逐筆解析回應，未追蹤的品項與休市資料不會建立 DataFrame
+        stream = RecordStream(
+            ['上價', '中價', '下價', '平均價', '交易量', '交易日期', '品種代碼', '市場名稱', '魚貨名稱'],
+            code_field='品種代碼',
+            codes=self.target_items,
+            name_field='魚貨名稱',
         )
-        data = data[data['品種代碼'].isin(self.target_items)]
+        # 每批解析完成即加入 upserter，不合併成完整的 DataFrame
         try:
-            if not data.empty:
-                self._access_data_from_api(data)
+            self._access_data_from_api(stream.iter_batches(response))
+            success = True
         except Exception as e:
-            self.LOGGER.exception(f'exception: {e}, response: {response.text}', extra=self.LOGGER_EXTRA)
-
-    def _access_data_from_api(self, data: pd.DataFrame):
-        data_merge = self._compare_data_from_api_and_db(data)
-        condition = (
-                (data_merge['avg_price_x'] != data_merge['avg_price_y']) |
-                (data_merge['up_price_x'] != data_merge['up_price_y']) |
-                (data_merge['low_price_x'] != data_merge['low_price_y']) |
-                (data_merge['mid_price_x'] != data_merge['mid_price_y']) |
-                (data_merge['volume_x'] != data_merge['volume_y'])
+            self.LOGGER.exception(
+                f'exception: {e}, url: {response.url}, response: {response.text[:1000]}',
+                extra=self.LOGGER_EXTRA
+            )
+            success = False
+
+        return success
+
+    def _access_data_from_api(self, data):
+        """
+        將 API 或爬蟲資料以 `DailyTranUpserter` 批次寫入: 新增資料庫沒有的資料、更新價格或交易量有異動的資料，
+        並刪除同日期中已不存在的資料(人工修改的資料 not_updated < 0 不會被更動)
+
+        :param data: DataFrame，或 DataFrame 的 iterable(e.g. `RecordStream.iter_batches`)，
+                     每批轉換後即加入 upserter，全部加入後以單一交易寫入
+        """
+        batches = [data] if isinstance(data, pd.DataFrame) else data
+
+        upserter = DailyTranUpserter(
+            update_fields=['up_price', 'mid_price', 'low_price', 'avg_price', 'volume'],
+            logger=self.LOGGER,
+            logger_extra=self.LOGGER_EXTRA,
+        )
+        dates = set()
+        for batch in batches:
+            batch = self._prepare_data_from_api(batch)
+            upserter.add_frame(batch)
+            dates.update(batch['date'].unique().tolist())
+
+        upserter.save(
+            delete_scope=DailyTran.objects.filter(
+                date__in=sorted(dates), product__type=self.TYPE, product__config=self.CONFIG
+            )
         )
 
-        if not data_merge[condition].empty:
-            for _, value in data_merge[condition].fillna('').iterrows():
-                try:
-                    existed_tran = DailyTran.objects.get(id=int(value['id'] or 0))
-
-                    if value['avg_price_x']:
-                        self._update_data(value, existed_tran)
-                    else:
-                        existed_tran.delete()
-                        self.LOGGER.warning(
-                            msg=f'The DailyTran data of the product: {value["product__code"]} '
-                                f'on {value["date"].strftime("%Y-%m-%d")} '
-                                f'from source: {value["source__name"]} with\n'
-                                f'up_price: {value["up_price_y"]}\n'
-                                f'mid_price: {value["mid_price_y"]}\n'
-                                f'low_price: {value["low_price_y"]}\n'
-                                f'avg_price: {value["avg_price_y"]}\n'
-                                f'volume: {value["volume_y"]} has been deleted.'
-                        )
-                except DailyTran.DoesNotExist:
-                    self._save_new_data(value)
-                except Exception as e:
-                    self.LOGGER.exception(f'exception: {e}', extra=self.LOGGER_EXTRA)
-
-    def _compare_data_from_api_and_db(self, data: pd.DataFrame):
+    def _prepare_data_from_api(self, data: pd.DataFrame) -> pd.DataFrame:
+        """將欄位更名、轉換民國日期，並將品種代碼與市場名稱對應為 product_id 與 source_id"""
+
         columns = {
             '上價': 'up_price',
             '中價': 'mid_price',
@@ -186,82 +187,77 @@ class Api(AbstractApi):
             '交易日期': 'date',
             '魚貨名稱': 'product__name'
         }
-        data.rename(columns=columns, inplace=True)
-        data['date'] = data['date'].apply(
-            lambda x: datetime.datetime.strptime(
-            f'{int(x) // 10000 + 1911}-{(int(x) // 100) % 100:02d}-{int(x) % 100:02d}', '%Y-%m-%d'
-            ).date()
-        )
+        data = data.rename(columns=columns)
+        data['date'] = to_dates(data['date'], roc_format=self.ROC_FORMAT)
         data['source__name'] = data['source__name'].str.replace('台', '臺')
         data['product__code'] = data['product__code'].astype(str)
 
-        data_db = DailyTran.objects.filter(
-            date=data['date'].iloc[0],
-            product__type=1,
-            product__config=self.CONFIG
-        )
-        data_db = pd.DataFrame(
-            list(data_db.values(
-                'id', 'product__id', 'product__code', 'up_price', 'mid_price',
-                'low_price', 'avg_price', 'volume', 'date', 'source__name'
-            )
-            )
-        ) \
-            if data_db else pd.DataFrame(
-            columns=[
-                'id', 'product__id', 'product__code', 'up_price', 'mid_price',
-                'low_price', 'avg_price', 'volume', 'date', 'source__name'
-            ]
+        products = pd.DataFrame(
+            [
+                (product.id, code)
+                for code in data['product__code'].unique()
+                for product in self.resolver.products(code)
+            ],
+            columns=['product_id', 'product__code'],
         )
-
-        return data.merge(data_db, on=['date', 'product__code', 'source__name'], how='outer')
-
-    def _update_data(self, value, existed_tran):
-        existed_tran.up_price = value['up_price_x']
-        existed_tran.mid_price = value['mid_price_x']
-        existed_tran.low_price = value['low_price_x']
-        existed_tran.avg_price = value['avg_price_x']
-        existed_tran.volume = value['volume_x']
-        existed_tran.save()
-        self.LOGGER.info(
-            msg=f"The data of the product: {value['product__code']} on"
-                f" {value['date'].strftime('%Y-%m-%d')} has been updated."
+        sources = pd.DataFrame(
+            [
+                (name, source.id)
+                for name in data['source__name'].unique()
+                for source in [self.resolver.source_by_name(name)]
+                if source
+            ],
+            columns=['source__name', 'source_id'],
         )
 
-    def _save_new_data(self, value):
-        products = self.MODEL.objects.filter(code=value['product__code'])
-        source = self.SOURCE_QS.filter_by_name(value['source__name']).first()
-        new_trans = [DailyTran(
-            product=product,
-            source=source,
-            up_price=value['up_price_x'],
-            mid_price=value['mid_price_x'],
-            low_price=value['low_price_x'],
-            avg_price=value['avg_price_x'],
-            volume=value['volume_x'],
-            date=value['date']
-        ) for product in products]
-        DailyTran.objects.bulk_create(new_trans)
+        return data.merge(products, on='product__code').merge(sources, on='source__name')
 
 
 class HTMLParser:
-    """ 此 class 用於解析 HTML 內容，並取出需要的資料所設計。(使用 BeautifulSoup4) """
+    """
+    此 class 用於解析 HTML 內容，並取出需要的資料所設計。
+
+    解析方式(backend):
+        - 'bs4': 以 BeautifulSoup4 建立整份文件的樹狀結構後搜尋 table
+        - 'stream': 以 `htmltable.extract_table` 逐一處理標籤，只擷取目標 table 的欄位(不建立樹狀結構)
+    兩者產生的資料相同，可用 `python manage.py benchmark_html_parser` 比較。
+    """
 
     TABLE_ID = 'ltable'
+    BACKENDS = ('bs4', 'stream')
 
-    def __init__(self, response: Response, api: 'ScrapperApi'):
+    def __init__(self, response: Response, api: 'ScrapperApi', backend: str = 'bs4'):
         """
         Args:
             response: 請求後的 response 物件
             api: 指向回 `ScrapperApi` 物件參照，方便取得相關資訊
+            backend: 'bs4' 或 'stream'
         """
 
+        if backend not in self.BACKENDS:
+            raise ValueError(f'Unknown HTML parser backend: {backend}')
+
         self.__data: List[OrderedDict] = []
+        self.__soup: Optional[BeautifulSoup] = None
+        self.__source_name = None
 
         self.response = response
-        self.soup = BeautifulSoup(response.text, 'html.parser')
+        self.backend = backend
         self.api = api
 
+    @property
+    def soup(self) -> BeautifulSoup:
+        """ 第一次使用時才建立，'stream' backend 不會建立 """
+
+        if self.__soup is None:
+            self.__soup = BeautifulSoup(self.response.text, 'html.parser')
+
+        return self.__soup
+
+    @soup.setter
+    def soup(self, value: BeautifulSoup):
+        self.__soup = value
+
     @property
     def data(self):
         return self.__data
@@ -279,6 +275,15 @@ class HTMLParser:
     def source_code(self) -> str:
         return self.params.get('mid')[0]
 
+    @property
+    def source_name(self) -> Optional[str]:
+        """ 同一頁面的資料皆為同一個市場，只解析一次網址 """
+
+        if self.__source_name is None:
+            self.__source_name = self.api.SOURCES.get(self.source_code)
+
+        return self.__source_name
+
     @property
     def table(self):
         """
@@ -400,7 +405,7 @@ class HTMLParser:
                 "交易日期": self.api.date_str,
                 "品種代碼": int(row_data.get("品種代碼")),
                 "魚貨名稱": row_data.get("魚貨名稱"),
-                "市場名稱": self.api.SOURCES.get(self.source_code),
+                "市場名稱": self.source_name,
                 "上價": self.convert_to_float(row_data.get("上價(元/公斤)")),
                 "中價": self.convert_to_float(row_data.get("中價(元/公斤)")),
                 "下價": self.convert_to_float(row_data.get("下價(元/公斤)")),
@@ -409,30 +414,53 @@ class HTMLParser:
             })
         except (ValueError, TypeError, AttributeError):
             self.api.LOGGER.exception(
-                f'ValueError: {row_data}, source: {self.api.SOURCES.get(self.source_code)}',
+                f'ValueError: {row_data}, source: {self.source_name}',
                 extra=self.api.LOGGER_EXTRA
             )
 
             return None
 
+    def extract_columns(self) -> OrderedDict:
+        """
+        將目標 table 的資料依欄位取出，並去除空白
+
+        Returns:
+            OrderedDict: {欄位名稱: [每一列的值, ...]}，沒有資料時為空 dict
+        """
+
+        if self.backend == 'stream':
+            headers, rows = extract_table(self.response.text, self.TABLE_ID)
+        else:
+            # headers 與 all_td_list 每次存取都會重新搜尋，只取一次
+            headers = self.headers
+            rows = [[td.text for td in td_list] for td_list in self.all_td_list or []]
+
+        if not rows:
+            return OrderedDict()
+
+        return OrderedDict(
+            (header, [value.strip().replace('\xa0', '') if value is not None else None for value in values])
+            for header, values in to_columns(headers, rows).items()
+        )
+
     def parse_table(self) -> Optional[List[OrderedDict]]:
         """ 將指定的 HTML table 解析後，取出需要的資料 """
 
+        columns = self.extract_columns()
+
         # 若沒有找到資料則直接返回
-        if not self.all_tr:
+        if not columns:
             self.api.LOGGER.warning(
-                f'No Table Found, source: {self.api.SOURCES.get(self.source_code)}', extra=self.api.LOGGER_EXTRA
+                f'No Table Found, source: {self.source_name}', extra=self.api.LOGGER_EXTRA
             )
 
             return
 
-        for td_list in self.all_td_list:
+        headers = list(columns)
+        for values in zip(*columns.values()):
             # 組成格式為 {header: value} 的 dict
             # e.g. {'品種代碼': '1071', '魚貨名稱': '金目鱸', '上價': '144.2', ...}
-            row_data = {
-                header: td_list[i].text.strip().replace('\xa0', '')
-                for i, header in enumerate(self.headers)
-            }
+            row_data = dict(zip(headers, values))
             self.data = self._extract_relevant_data(row_data)
 
         return self.data
@@ -495,6 +523,9 @@ class ScrapperApi(Api):
         self.__query_date: Optional[datetime.date] = None
         self.__df_list: List[pd.DataFrame] = []
 
+        # 解析頁面的方式，見 `HTMLParser`
+        self.html_backend = getattr(settings, 'DAILYTRAN_BUILDER_HTML_BACKEND', 'stream')
+
     @property
     def query_date(self) -> Optional[datetime.date]:
         return self.__query_date
@@ -577,35 +608,42 @@ class ScrapperApi(Api):
     def _make_request(self, url, params, headers) -> Response:
         """ 發送 POST 請求，並回傳 response 物件，若發生錯誤則嘗試重新連線 """
 
+        # 參數以 query string 傳送，完整網址即為封存的 key
+        request_url = get_request_url(url, params)
+        if self.replay:
+            return self.replay_response(request_url)
+
+        extra = {**self.LOGGER_EXTRA, 'request_url': request_url}
         retry_count = 0
 
         while retry_count < self.MAX_RETRY:
             try:
                 retry_count += 1
                 resp = post(url, params=params, headers=headers)
-                self.LOGGER_EXTRA['request_url'] = resp.request.url
+                extra['request_url'] = resp.request.url
 
                 if resp.status_code != 200:
                     self.LOGGER.warning(
                         f'Connection refused, retry {retry_count} time',
-                        extra=self.LOGGER_EXTRA
+                        extra=extra
                     )
                     time.sleep(self.SLEEP_TIME)
 
                     continue
 
+                self.archive_response(request_url, resp)
                 return resp
             except Exception as e:
                 self.LOGGER.exception(
                     f'exception: {e}, retry {retry_count} time',
-                    extra=self.LOGGER_EXTRA
+                    extra=extra
                 )
 
         return Response()
 
     def _convert_to_dataframe(self, responses: List[Response]) -> pd.DataFrame:
         for resp in responses:
-            parser = HTMLParser(response=resp, api=self)
+            parser = HTMLParser(response=resp, api=self, backend=self.html_backend)
 
             if resp.status_code == 200 and resp.request:
                 self.df_result = parser.parse_table()
@@ -2,10 +2,9 @@ import datetime
 import json
 import re
 
-from django.db.models import Q
-
 from apps.dailytrans.models import DailyTran
 from .abstract import AbstractApi
+from .upsert import DailyTranUpserter
 from .utils import date_transfer
 
 
@@ -35,8 +34,8 @@ class Api(AbstractApi):
 
         def create_tran(obj):
             if '公' in dic.get(obj.code):
-                obj_male = self.PRODUCT_QS.get(code=f'{obj.code}公')
-                obj_female = self.PRODUCT_QS.get(code=f'{obj.code}母')
+                obj_male = self.resolver.product(f'{obj.code}公')
+                obj_female = self.resolver.product(f'{obj.code}母')
                 matches = re.findall(
                     r'(?P<label>\w+)：(?P<value>\d+\.\d+)', dic.get(obj.code)
                 )
@@ -79,7 +78,7 @@ class Api(AbstractApi):
                 dic[key] = value.strip()
 
         lst = []
-        for obj in self.PRODUCT_QS.all():
+        for obj in self.resolver.all_products:
             if obj.track_item and dic.get(obj.code):
                 try:
                     trans = create_tran(obj)
@@ -130,29 +129,18 @@ class Api(AbstractApi):
         if response.text:
             data = json.loads(response.text, object_hook=self.hook)
         # data should look like [[A,B,C], [A,B,C], ..] after loads
+        upserter = DailyTranUpserter(
+            update_fields=['avg_price'], logger=self.LOGGER, logger_extra=self.LOGGER_EXTRA
+        )
         for lst in data:
             for obj in lst:
                 if isinstance(obj, DailyTran):
-                    try:
-                        # update if exists
-                        daily_tran_qs = DailyTran.objects.filter(
-                            Q(date__exact=obj.date) & Q(product=obj.product)
-                        )
-                        if obj.source:
-                            daily_tran_qs = daily_tran_qs.filter(source=obj.source)
-
-                        if daily_tran_qs.count() > 1:
-                            # log as duplicate
-                            items = str(daily_tran_qs.values_list('id', flat=True))
-                            self.LOGGER.warning(
-                                'Find duplicate DailyTran item: %s' % items,
-                                extra=self.LOGGER_EXTRA
-                            )
-
-                        elif daily_tran_qs.count() == 1:
-                            daily_tran_qs.update(avg_price=obj.avg_price)
-                        else:
-                            obj.save()
-
-                    except Exception as e:
-                        self.LOGGER.exception(e, extra=self.LOGGER_EXTRA)
+                    upserter.add(obj)
+
+        try:
+            upserter.save()
+        except Exception as e:
+            self.LOGGER.exception(e, extra=self.LOGGER_EXTRA)
+            return False
+
+        return True
@@ -1,10 +1,9 @@
 import datetime
 import json
 
-from django.db.models import Q
-
 from apps.dailytrans.models import DailyTran
 from .abstract import AbstractApi
+from .upsert import DailyTranUpserter
 from .utils import date_transfer
 
 
@@ -58,9 +57,9 @@ class Api(AbstractApi):
         source_name = dic.get('name')
 
         lst = []
-        for obj in self.PRODUCT_QS.all():
+        for obj in self.resolver.all_products:
             if obj.track_item and dic.get(obj.code):
-                source = self.SOURCE_QS.filter(type=obj.type).filter_by_name(source_name).first()
+                source = self.resolver.source_by_name(source_name, type_id=obj.type_id)
                 if source:
                     tran = create_tran(obj, source)
                     lst.append(tran)
@@ -115,28 +114,18 @@ class Api(AbstractApi):
         if response.text:
             data = json.loads(response.text, object_hook=self.hook)
         # data should look like [[A,B,C], [A,B,C], ..] after loads
+        upserter = DailyTranUpserter(
+            update_fields=['avg_price'], logger=self.LOGGER, logger_extra=self.LOGGER_EXTRA
+        )
         for lst in data:
             for obj in lst:
                 if isinstance(obj, DailyTran):
-                    try:
-                        # update if exists
-                        daily_tran_qs = DailyTran.objects.filter(
-                            Q(date__exact=obj.date) & Q(product=obj.product)
-                        )
-                        if obj.source:
-                            daily_tran_qs = daily_tran_qs.filter(source=obj.source)
-
-                        if daily_tran_qs.count() > 1:
-                            # log as duplicate
-                            items = str(daily_tran_qs.values_list('id', flat=True))
-                            self.LOGGER.warning(
-                                'Find duplicate DailyTran item: %s' % items,
-                                extra=self.LOGGER_EXTRA
-                            )
-
-                        elif daily_tran_qs.count() == 1:
-                            daily_tran_qs.update(avg_price=obj.avg_price)
-                        else:
-                            obj.save()
-                    except Exception as e:
-                        self.LOGGER.exception(e, extra=self.LOGGER_EXTRA)
+                    upserter.add(obj)
+
+        try:
+            upserter.save()
+        except Exception as e:
+            self.LOGGER.exception(e, extra=self.LOGGER_EXTRA)
+            return False
+
+        return True
@@ -1,10 +1,9 @@
 import datetime
 import json
 
-from django.db.models import Q
-
 from apps.dailytrans.models import DailyTran
 from .abstract import AbstractApi
+from .upsert import DailyTranUpserter
 from .utils import date_transfer
 
 
@@ -43,9 +42,9 @@ class Api(AbstractApi):
                 dic[key] = value.strip()
 
         product_code = dic.get('productID')
-        product = self.PRODUCT_QS.filter(code=product_code).first()
+        product = self.resolver.product(product_code)
         source_name = dic.get('shortName')
-        source = self.SOURCE_QS.filter_by_name(source_name).first()
+        source = self.resolver.source_by_name(source_name)
         if product and source:
             tran = DailyTran(
                 product=product,
@@ -117,31 +116,17 @@ class Api(AbstractApi):
         if response.text:
             data = json.loads(response.text, object_hook=self.hook)
         # data should look like [D, B, {}, C, {}...] after loads
+        upserter = DailyTranUpserter(
+            update_fields=['avg_weight', 'avg_price', 'volume'], logger=self.LOGGER, logger_extra=self.LOGGER_EXTRA
+        )
         for obj in data:
             if isinstance(obj, DailyTran):
-                try:
-                    # update if exists
-                    daily_tran_qs = DailyTran.objects.filter(
-                        Q(date__exact=obj.date) & Q(product=obj.product)
-                    )
-                    if obj.source:
-                        daily_tran_qs = daily_tran_qs.filter(source=obj.source)
-
-                    if daily_tran_qs.count() > 1:
-                        # log as duplicate
-                        items = str(daily_tran_qs.values_list('id', flat=True))
-                        self.LOGGER.warning(
-                            'Find duplicate DailyTran item: %s' % items,
-                            extra=self.LOGGER_EXTRA
-                        )
-
-                    elif daily_tran_qs.count() == 1:
-                        daily_tran_qs.update(
-                            avg_weight=obj.avg_weight,
-                            avg_price=obj.avg_price,
-                            volume=obj.volume
-                        )
-                    else:
-                        obj.save()
-                except Exception as e:
-                    self.LOGGER.exception(e, extra=self.LOGGER_EXTRA)
+                upserter.add(obj)
+
+        try:
+            upserter.save()
+        except Exception as e:
+            self.LOGGER.exception(e, extra=self.LOGGER_EXTRA)
+            return False
+
+        return True
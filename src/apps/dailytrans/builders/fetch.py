@@ -0,0 +1,150 @@
+"""
+Builder 的非同步抓取層
+
+以 asyncio 同時送出一個區間內所有日期的請求，實際的 HTTP 請求在 thread pool 中以共用連線池的
+`requests.Session` 執行(builder 的 `request()` 皆為同步函式)。每個 host 的同時連線數與每秒請求數
+上限設定於 settings.DAILYTRAN_BUILDER_API_LIMITS，回應依完成順序交給呼叫端，
+讓 `load()` 可以在其他請求還在等待回應時先行寫入資料庫。
+
+使用方式:
+    fetcher = AsyncFetcher(api.request, concurrency=4, rate=5, host='data.moa.gov.tw')
+    for kwargs, response, exc in fetcher.fetch([{'start_date': d, 'end_date': d} for d in days]):
+        ...
+"""
+import asyncio
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from django.conf import settings
+
+
+HostLimit = namedtuple('HostLimit', ('concurrency', 'rate'))
+
+DEFAULT_LIMIT = HostLimit(concurrency=4, rate=None)
+
+
+def get_host(url):
+    return urlparse(url).netloc
+
+
+def get_limit(api_name=None, url=None):
+    """
+    依序以 API 名稱、host 查詢 settings.DAILYTRAN_BUILDER_API_LIMITS，皆無設定時使用 'default'
+
+    Returns:
+        HostLimit: concurrency 為同時請求數，rate 為每秒請求數(None 代表不限制)
+    """
+
+    limits = getattr(settings, 'DAILYTRAN_BUILDER_API_LIMITS', {})
+    default = {**DEFAULT_LIMIT._asdict(), **limits.get('default', {})}
+
+    for key in (api_name, get_host(url) if url else None):
+        if key and key in limits:
+            return HostLimit(**{**default, **limits[key]})
+
+    return HostLimit(**default)
+
+
+class RateThrottle:
+    """
+    每個 host 共用一個 throttle，讓同一個 process 中的所有 builder 合計不超過每秒請求數上限;
+    以時間排程下一個可用的時間點，thread safe
+    """
+
+    _throttles = {}
+    _throttles_lock = threading.Lock()
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_host(cls, host, rate):
+        with cls._throttles_lock:
+            if (host, rate) not in cls._throttles:
+                cls._throttles[(host, rate)] = cls(rate)
+
+            return cls._throttles[(host, rate)]
+
+    def reserve(self):
+        """保留下一個請求的時間點，回傳需等待的秒數"""
+
+        if not self.interval:
+            return 0
+
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+
+            return start - now
+
+
+class AsyncFetcher:
+    def __init__(self, func, concurrency=None, rate=None, host=None):
+        """
+        Args:
+            func: 實際送出請求的同步函式，通常為 builder 的 `request`
+            concurrency: 同時執行的請求數
+            rate: 每秒請求數上限，None 代表不限制
+            host: 共用 rate 上限的 host 名稱
+        """
+
+        self.func = func
+        self.concurrency = concurrency or DEFAULT_LIMIT.concurrency
+        self.throttle = RateThrottle.for_host(host, rate) if host else RateThrottle(rate)
+
+    async def _fetch(self, loop, executor, semaphore, kwargs):
+        async with semaphore:
+            delay = self.throttle.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+
+            try:
+                response = await loop.run_in_executor(executor, lambda: self.func(**kwargs))
+            except Exception as e:
+                return kwargs, None, e
+
+        return kwargs, response, None
+
+    def fetch(self, jobs):
+        """
+        同時送出所有請求，並依完成順序逐一回傳
+
+        Args:
+            jobs: 每個請求的參數(dict)，會以 `func(**kwargs)` 呼叫
+
+        Yields:
+            Tuple[dict, Any, Optional[Exception]]: 請求參數、回應與請求失敗時的例外
+        """
+
+        jobs = list(jobs)
+        if not jobs:
+            return
+
+        # 每次抓取使用獨立的 event loop，結束後還原，避免影響 celery worker 或呼叫端既有的 loop
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        tasks = []
+        try:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            tasks = [loop.create_task(self._fetch(loop, executor, semaphore, kwargs)) for kwargs in jobs]
+
+            for future in asyncio.as_completed(tasks):
+                yield loop.run_until_complete(future)
+        finally:
+            # 呼叫端提前中止時取消尚未完成的請求
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+
+            executor.shutdown(wait=True)
+            asyncio.set_event_loop(None)
+            loop.close()
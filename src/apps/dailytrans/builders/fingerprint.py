@@ -0,0 +1,114 @@
+"""
+Builder 回應內容的指紋(content hash)
+
+排程每小時重新抓取近三天的資料，多數回應與上一次完全相同；
+`load()` 成功後以 (API_NAME, 品項分類, 供應階段, model, 請求參數) 為 key 將回應內容的雜湊值存入 Redis，
+下一次相同請求的回應雜湊值相同時，略過 DataFrame 建立、資料庫比對與寫入。
+
+- 指紋保留 `ttl` 秒(settings.DAILYTRAN_BUILDER_FINGERPRINT)，過期後即使回應相同也會重新比對一次，
+  避免 `load()` 內部吞掉的錯誤或資料庫被其他來源修改後一直被略過
+- 手動執行時以 `director` 的 `force=True`(或 `with forced():`)忽略指紋，一律重新比對
+- 無法計算雜湊值的回應(非 200、已解析的物件 e.g. amis 的 ElementTree)一律執行 `load()`
+"""
+import hashlib
+import json
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from .resilience import KEY_PREFIX, _get_redis
+
+
+_local = threading.local()
+
+
+@contextmanager
+def forced(force=True):
+    """區塊內的 builder 忽略指紋，一律執行 `load()`"""
+
+    previous = getattr(_local, 'force', False)
+    _local.force = force
+    try:
+        yield
+    finally:
+        _local.force = previous
+
+
+def is_forced():
+    return getattr(_local, 'force', False)
+
+
+def digest(response):
+    """
+    :param response: `request()` 的回傳值，Response 或 Response list
+    :return: 回應內容的 sha256，無法計算時回傳 None
+    """
+
+    responses = response if isinstance(response, (list, tuple)) else [response]
+    if not responses:
+        return None
+
+    sha = hashlib.sha256()
+    for resp in responses:
+        content = getattr(resp, 'content', None)
+        if getattr(resp, 'status_code', None) != 200 or not isinstance(content, bytes):
+            return None
+
+        # 以長度分隔每個回應，避免不同切分方式的內容串接後相同
+        sha.update(str(len(content)).encode())
+        sha.update(b':')
+        sha.update(content)
+
+    return sha.hexdigest()
+
+
+class PayloadFingerprint:
+    def __init__(self, api_name, config_code=None, type_id=None, model_label=None, ttl=None, redis=None):
+        """
+        Args:
+            api_name: API 名稱，即 DAILYTRAN_BUILDER_API 的 key
+            config_code: 品項分類代碼
+            type_id: 供應階段
+            model_label: 寫入的 model，同一個 API 可能寫入不同 model
+            ttl: 指紋保留秒數
+            redis: redis client，預設為 django_redis 的連線
+        """
+
+        config = getattr(settings, 'DAILYTRAN_BUILDER_FINGERPRINT', {})
+        self.ttl = ttl or config.get('ttl', 6 * 60 * 60)
+        self._redis = redis
+        self.prefix = f'{KEY_PREFIX}:fingerprint:{api_name}:{config_code}:{type_id}:{model_label}'
+
+    @property
+    def redis(self):
+        return self._redis or _get_redis()
+
+    def key(self, params):
+        """請求參數中的日期以 ISO 格式表示，e.g. {"end_date": "2024-11-03", "start_date": "2024-11-01"}"""
+
+        return f'{self.prefix}:{json.dumps(params, sort_keys=True, default=str, ensure_ascii=False)}'
+
+    def is_unchanged(self, params, value):
+        if value is None or is_forced():
+            return False
+
+        try:
+            stored = self.redis.get(self.key(params))
+        except RedisError:
+            return False
+
+        if isinstance(stored, bytes):
+            stored = stored.decode()
+
+        return stored == value
+
+    def save(self, params, value):
+        if value is None:
+            return
+
+        try:
+            self.redis.set(self.key(params), value, ex=self.ttl)
+        except RedisError:
+            pass
@@ -0,0 +1,133 @@
+"""
+逐一處理 HTML 標籤(streaming)擷取指定 table 的內容
+
+BeautifulSoup 會先建立整份文件的樹狀結構，再以 find/find_all 搜尋；
+行情站頁面大部分為表單與 script，目標 table 只占一小部分。
+`TableRowsParser` 以標準函式庫的 `html.parser.HTMLParser` 逐一處理標籤，不建立樹狀結構，
+只保留目標 table 中 <th> 的文字與第一個 <tbody> 中每個 <tr> 的 <td> 文字
+(同 `table.find('tbody').find_all('tr')`)，table 結束後即停止解析。
+
+文字的取法與 BeautifulSoup 的 `.text` 相同: 包含子標籤內的文字、不含註解，
+HTML entity 會轉換為字元(e.g. &nbsp; -> '\\xa0')。
+
+使用方式:
+    headers, rows = extract_table(response.text, 'ltable')
+    columns = to_columns(headers, rows)
+"""
+from collections import OrderedDict
+from html.parser import HTMLParser as BaseHTMLParser
+
+
+CHUNK_SIZE = 16 * 1024
+
+
+class TableRowsParser(BaseHTMLParser):
+    def __init__(self, table_id):
+        super().__init__(convert_charrefs=True)
+
+        self.table_id = table_id
+        self.headers = []
+        self.rows = []
+        self.found = False
+        self.done = False
+
+        # 目標 table 內的巢狀 table 層數，0 代表不在目標 table 內
+        self._depth = 0
+        self._in_tbody = False
+        self._tbody_seen = False
+        self._row = None
+        self._cell = None
+        self._cell_tag = None
+
+    def _close_cell(self):
+        if self._cell is None:
+            return
+
+        text = ''.join(self._cell)
+        if self._cell_tag == 'th':
+            self.headers.append(text.replace('\n', ''))
+        elif self._row is not None:
+            self._row.append(text)
+        self._cell = self._cell_tag = None
+
+    def _close_row(self):
+        self._close_cell()
+        if self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+
+        if not self._depth:
+            if tag == 'table' and dict(attrs).get('id') == self.table_id:
+                self._depth = 1
+                self.found = True
+            return
+
+        if tag == 'table':
+            self._depth += 1
+        elif tag == 'tbody' and not self._tbody_seen:
+            self._in_tbody = self._tbody_seen = True
+        elif tag == 'tr':
+            # 未結束的 <tr>、<td> 視為已結束，同 BeautifulSoup
+            self._close_row()
+            if self._in_tbody:
+                self._row = []
+        elif tag in ('th', 'td'):
+            self._close_cell()
+            if tag == 'th' or self._row is not None:
+                self._cell = []
+                self._cell_tag = tag
+
+    def handle_endtag(self, tag):
+        if self.done or not self._depth:
+            return
+
+        if tag == 'table':
+            self._depth -= 1
+            if not self._depth:
+                self._close_row()
+                self.done = True
+        elif tag == 'tbody':
+            self._close_row()
+            self._in_tbody = False
+        elif tag == 'tr':
+            self._close_row()
+        elif tag in ('th', 'td'):
+            self._close_cell()
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+def extract_table(html, table_id, chunk_size=CHUNK_SIZE):
+    """
+    :return: Tuple[List[str], List[List[str]]]: 欄位名稱與每一列 <td> 的文字；找不到 table 時皆為空 list
+    """
+
+    parser = TableRowsParser(table_id)
+    for start in range(0, len(html), chunk_size):
+        parser.feed(html[start:start + chunk_size])
+        if parser.done:
+            break
+    else:
+        parser.close()
+
+    return parser.headers, parser.rows
+
+
+def to_columns(headers, rows):
+    """
+    將每一列的資料轉換為以欄位為單位的 list，欄位數不足的列補上 None
+
+    :return: OrderedDict: {header: [value, ...]}，欄位名稱重複時以後者為準
+    """
+
+    columns = OrderedDict()
+    for i, header in enumerate(headers):
+        columns[header] = [row[i] if i < len(row) else None for row in rows]
+
+    return columns
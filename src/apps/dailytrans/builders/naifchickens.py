@@ -1,20 +1,237 @@
+import io
 import json
-import os
-import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
 import pandas as pd
 import pytesseract
 import requests
 from bs4 import BeautifulSoup as bs
 from django.conf import settings
-from django.db.models import Q
 from PIL import Image
 
 from apps.dailytrans.models import DailyTran
 from .abstract import AbstractApi
+from .fetch import AsyncFetcher, get_limit
+from .session import SessionCache
+from .upsert import DailyTranUpserter
 from .utils import date_transfer
 
 
+LOGIN_URL = 'https://www.naif.org.tw/memberLogin.aspx'
+CAPTCHA_URL = 'https://www.naif.org.tw/libs/numToPic.aspx'
+LOGIN_REQUIRED = '請先登入會員!!'
+
+# 台北市環南家禽批發市場交易行情表頁面，每頁為一整個月份的數據: {frontMenuID: (品項, 網址)}
+MARKET_PAGES = OrderedDict([
+    ('120', (
+        '環南-白肉雞',
+        'https://www.naif.org.tw/infoWhiteChicken.aspx?sYear={year}&sMonth={month}'
+        '&btnSearch=%E6%90%9C%E5%B0%8B&frontMenuID=120&frontTitleMenuID=37',
+    )),
+    ('137', (
+        '環南-土雞',
+        'https://www.naif.org.tw/infoEndemicChicken.aspx?sYear={year}&sMonth={month}'
+        '&btnSearch=%E6%90%9C%E5%B0%8B&frontMenuID=137&frontTitleMenuID=37',
+    )),
+])
+
+# 家禽行情(白肉雞總貨/紅羽土雞總貨)，每頁為一天的數據
+TOTAL_URL = 'https://ppg.naif.org.tw/naif/MarketInformation/Poultry/Product.aspx'
+TOTAL_ITEMS = ('白肉雞總貨', '紅羽土雞總貨')
+THIS_DATE_FIELD = 'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$TextBox_Content1_ThisDate'
+LAST_DATE_FIELD = 'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$TextBox_Content1_LastDate'
+VIEWSTATE_FIELDS = ('__VIEWSTATE', '__VIEWSTATEGENERATOR', '__EVENTVALIDATION')
+
+TOTAL_FORM = {
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$CheckBoxList_Market$6': '1',
+    # 肉品市場,台灣地區
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$CheckBoxList_Product$6': 'ON31',
+    # 白肉雞總貨
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$CheckBoxList_Product$8': 'ON41',
+    # 紅羽土雞雞總貨
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$TextBox_Content1_ThisDate': None,
+    # 日行情比較,本期
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$TextBox_Content1_LastDate': None,
+    # 日行情比較,上期
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$Button_Content1_Submit': '查詢',
+    #
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content2_ThisDate_Year': '2022',
+    # 旬行情比較
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content2_ThisDate_Month': '1',
+    # 旬行情比較
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content2_ThisDate_TenDays': '1',
+    # 旬行情比較
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content2_LastDate_Year': '2022',
+    # 旬行情比較
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content2_LastDate_Month': '1',
+    # 旬行情比較
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content2_LastDate_TenDays': '1',
+    # 旬行情比較
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content3_ThisDate_Year': '2022',
+    # 月行情比較
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content3_ThisDate_Month': '1',
+    # 月行情比較
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content3_LastDate_Year': '2022',
+    # 月行情比較
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content3_LastDate_Month': '1',
+    # 月行情比較
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content4_ThisDate_Year': '2022',
+    # 年行情比較
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content4_LastDate_Year': '2022',
+    # 年行情比較
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$TextBox_Content5_ThisDate_BegDate': '2022-01-20',
+    # 指定期間行情比較
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$TextBox_Content5_ThisDate_EndDate': '2022-01-26',
+    # 指定期間行情比較
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$TextBox_Content5_LastDate_BegDate': '2022-01-20',
+    # 指定期間行情比較
+    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$TextBox_Content5_LastDate_EndDate': '2022-01-26'
+    # 指定期間行情比較
+}
+
+# 頁面解析與抓取分開，解析函式只接收 HTML 字串並回傳結果，可在 process pool 中執行；
+# warning 訊息隨結果回傳，由主程序記錄
+PageResult = namedtuple('PageResult', ('records', 'warnings', 'login_required'))
+
+
+def iter_months(start_date, end_date):
+    """
+    Yields:
+        Tuple[int, str]: 年份與兩位數的月份，e.g. (2024, '03')
+    """
+
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (end_date.year, end_date.month):
+        yield year, str(month).zfill(2)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def to_float(text, label, warnings):
+    value = text.replace(',', '').strip()
+    if not value:
+        return value
+
+    try:
+        return float(value)
+    except ValueError:
+        warnings.append(f'{label} Value Error : {value}')
+        return None
+
+
+def parse_market_page(html, item, year, month):
+    """解析環南市場一個月份的交易行情表"""
+
+    records = []
+    warnings = []
+    soup = bs(html, 'html.parser')
+    table = soup.find('table', {'cellspacing': '1'})
+    script = soup.find('script')
+    alert = script.string if script else None
+
+    # 登入失敗或 session 已過期
+    if alert and LOGIN_REQUIRED in alert:
+        return PageResult(records, warnings, True)
+
+    if not alert and table:
+        for tr in table.find_all('tr')[1:]:
+            d = tr.find('th').getText()
+            tds = tr.find_all('td')
+
+            avg_price = to_float(tds[4].getText(), f'{year}/{month}/{d} {item} price', warnings)
+            volume = to_float(tds[6].getText(), f'{year}/{month}/{d} {item} volume', warnings)
+            weight = to_float(tds[7].getText(), f'{year}/{month}/{d} {item} weight', warnings)
+
+            # 組合成API可用的格式
+            if avg_price and volume and weight:
+                records.append({
+                    'date': f'{year}/{month}/{d}',
+                    'item': item,
+                    'price': avg_price,
+                    'weight': weight,
+                    'volume': volume,
+                    'priceUnit': '元/公斤',
+                })
+
+    return PageResult(records, warnings, False)
+
+
+def parse_total_page(html, date):
+    """
+    解析家禽行情一天的白肉雞總貨與紅羽土雞總貨
+
+    :param date: '%Y-%m-%d'
+    """
+
+    records = []
+    warnings = []
+    table = bs(html, 'html.parser').find('table', {'cellspacing': '0'})
+
+    # 查詢特定日期網站出現錯誤頁面異常,例如查詢 2012/10/15, 2012/10/24 這兩天, 網站會出現"發現除以零的錯誤"錯誤頁面
+    if not table:
+        warnings.append(f'{date} 網站發生異常！')
+        return PageResult(records, warnings, False)
+
+    not_data_msg = table.find_all('tr')[3].getText().strip()  # 特殊日期沒有交易會顯示"查無交易資料!"
+    if '查無交易資料！' in not_data_msg:
+        warnings.append(f'{date} 查無交易資料！')
+        return PageResult(records, warnings, False)
+
+    for tr in table.find_all('tr')[5:7]:
+        tds = tr.find_all('td')
+        name = tds[0].getText() + tds[1].getText()  # 將"白肉雞"/"紅羽土雞"和"總貨"字串連接
+        this_avg_price = tds[2].getText()
+        this_volume = tds[5].getText()
+        this_weight = tds[8].getText()
+
+        # 如果當天沒有數據
+        if this_avg_price == '-':
+            warnings.append(f'{date} {name} 無交易數據')
+            continue
+
+        # 白肉雞總貨和紅羽土雞總貨數據在同一頁面,判斷品項分開存資料
+        for item in TOTAL_ITEMS:
+            if name in item:
+                records.append({
+                    'date': date.replace('-', '/'),
+                    'item': item,
+                    'price': float(this_avg_price),
+                    'volume': float(this_volume),
+                    'weight': float(this_weight),
+                    'priceUnit': '元/公斤',
+                })
+
+    return PageResult(records, warnings, False)
+
+
+def parse_pages(parser, pages, workers=None):
+    """
+    以 process pool 解析頁面，無法建立 process 時(e.g. 在 daemon process 中)改為依序解析
+
+    :param parser: `parse_market_page` 或 `parse_total_page`
+    :param pages: 每個頁面的 parser 參數(tuple)
+    :return: List[PageResult]，順序同 pages
+    """
+
+    workers = get_naif_config()['parse_workers'] if workers is None else workers
+    if workers > 1 and len(pages) > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=min(workers, len(pages))) as executor:
+                return list(executor.map(parser, *zip(*pages)))
+        except (AssertionError, OSError, RuntimeError):
+            pass
+
+    return [parser(*page) for page in pages]
+
+
+def get_naif_config():
+    config = getattr(settings, 'DAILYTRAN_BUILDER_NAIF', {})
+    return {
+        'session_ttl': config.get('session_ttl', 30 * 60),
+        'parse_workers': config.get('parse_workers', 2),
+    }
+
+
 # 環南市場雞隻等數據是從中央畜產會登入帳號爬蟲取得
 class Api(AbstractApi):
     # Settings
@@ -33,6 +250,11 @@ class Api(AbstractApi):
             logger_type_code=logger_type_code
         )
 
+        limit = get_limit(self.API_NAME)
+        self.concurrency = limit.concurrency
+        self.rate = limit.rate
+        self.session_cache = SessionCache(self.API_NAME, ttl=get_naif_config()['session_ttl'])
+
     def hook(self, dic):
 
         for key, value in dic.items():
@@ -40,7 +262,7 @@ class Api(AbstractApi):
                 dic[key] = value.strip()
 
         product_code = dic.get('item')
-        product = self.PRODUCT_QS.filter(code=product_code).first()
+        product = self.resolver.product(product_code)
 
         if product:
             tran = DailyTran(
@@ -72,302 +294,131 @@ class Api(AbstractApi):
             code=None,
             name=None
     ):
+        """
+        爬取網頁數據後組合成 json 格式以便後續流程
+
+        :return: list of dict，欄位為 date、item、price、weight、volume、priceUnit
+        """
 
         if 150001 <= id <= 150002:  # 環南市場:環南-白肉雞/環南-土雞
-            login_fail_flag = False
-            # 畜產會環南家禽批發市場交易行情表為一整個月份的數據,因此爬取網頁數據後組合成 json 格式以便後續流程
-            data_list = []
-
-            # 中央畜產會會員登入頁面
-            naif_login_url = settings.DAILYTRAN_BUILDER_API['naifchickens']
-            ss = requests.Session()
-            r1 = ss.get(naif_login_url, headers=self.headers)
-
-            # 儲存驗證碼圖片
-            r2 = ss.get('https://www.naif.org.tw/libs/numToPic.aspx', headers=self.headers)
-            with open('captcha.jpg', 'wb') as f:
-                for chunk in r2:
-                    f.write(chunk)
-
-            # OCR自動識別驗證碼
-            captcha = Image.open('captcha.jpg')
-            captcha_code = pytesseract.image_to_string(captcha).strip()
-            if len(captcha_code) > 4:
-                captcha_code = captcha_code[:4]
-
-            # 登入會員系統
-            post_url = 'https://www.naif.org.tw/memberLogin.aspx'
-
-            postdata = {
-                'url': '/memberLogin.aspx',
-                'myAccount': settings.NAIF_ACCOUNT,
-                'myPassword': settings.NAIF_PASSWORD,
-                'code': captcha_code,
-                'btnSend': '登入會員',
-                'frontTitleMenuID': 105,
-                'frontMenuID': 148,
-            }
-
-            r3 = ss.post(post_url, headers=self.headers, data=postdata)
-
-            if start_date:
-                start_year = start_date.year
-                start_month = start_date.month
-            if end_date:
-                end_year = end_date.year
-                end_month = end_date.month
-
-            chickens_dict = {
-                '120': '環南-白肉雞',
-                '137': '環南-土雞',
-            }
-
-            for k, v in chickens_dict.items():
-
-                for y in range(start_year, end_year + 1):
-                    if y == start_year and y == end_year:
-                        s_month = start_month
-                        e_month = end_month
-                    elif y == start_year:
-                        s_month = start_month
-                        e_month = 12
-                    elif y == end_year:
-                        s_month = 1
-                        e_month = end_month
-                    else:
-                        s_month = 1
-                        e_month = 12
-                    for m in range(s_month, e_month + 1):
-                        if len(str(m)) == 1:
-                            m = '0' + str(m)
-
-                        # 台北市環南家禽批發市場交易行情表頁面
-                        if k == '120':  # 環南-白肉雞
-                            r4 = ss.get(
-                                f'https://www.naif.org.tw/infoWhiteChicken.aspx?sYear={y}&sMonth={m}&btnSearch=%E6%90%9C%E5%B0%8B&frontMenuID=120&frontTitleMenuID=37',
-                                headers=self.headers
-                            )
-                        if k == '137':  # 環南-土雞
-                            r4 = ss.get(
-                                f'https://www.naif.org.tw/infoEndemicChicken.aspx?sYear={y}&sMonth={m}&btnSearch=%E6%90%9C%E5%B0%8B&frontMenuID=137&frontTitleMenuID=37',
-                                headers=self.headers
-                            )
-                        soup = bs(r4.text, 'html.parser')
-                        table = soup.find('table', {'cellspacing': '1'})
-                        alert = soup.find('script').string
-
-                        # 登入失敗
-                        if alert and '請先登入會員!!' in alert:
-                            self.LOGGER.warning(
-                                f'Login failed for naif, captcha : {captcha_code}',
-                                extra=self.LOGGER_EXTRA
-                            )
-                            login_fail_flag = True
-                            break
-
-                        # 登入成功
-                        if not alert and table:
-                            trs = table.find_all('tr')[1:]
-                            for tr in trs:
-
-                                # 組合json格式用預設格式的
-                                default_dict1 = {
-                                    "date": "",
-                                    "item": v,
-                                    "price": 0,
-                                    "weight": 0,
-                                    "volume": 0,
-                                    "priceUnit": "元/公斤"
-                                }
-
-                                d = tr.find('th').getText()
-                                tds = tr.find_all('td')
-
-                                avg_price = tds[4].getText().replace(",", "").strip()
-                                volume = tds[6].getText().replace(",", "").strip()
-                                weight = tds[7].getText().replace(",", "").strip()
-                                if avg_price:
-                                    try:
-                                        avg_price = float(avg_price)
-                                    except ValueError:
-                                        self.LOGGER.warning(
-                                            f'{y}/{m}/{d} {v} price Value Error : {tds[4].getText().replace(",", "").strip()}',
-                                            extra=self.LOGGER_EXTRA)
-                                        avg_price = None
-
-                                if volume:
-                                    try:
-                                        volume = float(volume)
-                                    except ValueError:
-                                        self.LOGGER.warning(
-                                            f'{y}/{m}/{d} {v} volume Value Error : {tds[6].getText().replace(",", "").strip()}',
-                                            extra=self.LOGGER_EXTRA)
-                                        volume = None
-
-                                if weight:
-                                    try:
-                                        weight = float(weight)
-                                    except ValueError:
-                                        self.LOGGER.warning(
-                                            f'{y}/{m}/{d} {v} weight Value Error : {tds[7].getText().replace(",", "").strip()}',
-                                            extra=self.LOGGER_EXTRA)
-                                        weight = None
-
-                                # 組合成API可用的格式
-                                if avg_price and volume and weight:
-                                    default_dict1['date'] = f'{y}/{m}/{d}'
-                                    default_dict1['price'] = avg_price
-                                    default_dict1['volume'] = volume
-                                    default_dict1['weight'] = weight
-                                    data_list.append(default_dict1)
-
-                        time.sleep(5)
-
-                    # 登入失敗時離開
-                    else:
-                        continue
-                    break
-
-            # 刪除驗證碼圖片檔案
-            os.remove('captcha.jpg')
-
-            return data_list
-
-        elif id >= 150003 and id <= 150004:  # 家禽行情:白肉雞總貨/紅羽土雞總貨
-            data_list = []
-            # 將輸入的指定日期區間換成 list
-            date_range = pd.Series(pd.date_range(start=start_date, end=end_date))
-            for d in date_range:
-                date = d.strftime('%Y-%m-%d')
-
-                naif_url = 'https://ppg.naif.org.tw/naif/MarketInformation/Poultry/Product.aspx'
-
-                postdata = {
-                    '__VIEWSTATE:': None,
-                    '__VIEWSTATEGENERATOR': None,
-                    '__EVENTVALIDATION': None,
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$CheckBoxList_Market$6': '1',
-                    # 肉品市場,台灣地區
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$CheckBoxList_Product$6': 'ON31',
-                    # 白肉雞總貨
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$CheckBoxList_Product$8': 'ON41',
-                    # 紅羽土雞雞總貨
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$TextBox_Content1_ThisDate': date,
-                    # 日行情比較,本期
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$TextBox_Content1_LastDate': date,
-                    # 日行情比較,上期
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$Button_Content1_Submit': '查詢',
-                    #
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content2_ThisDate_Year': '2022',
-                    # 旬行情比較
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content2_ThisDate_Month': '1',
-                    # 旬行情比較
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content2_ThisDate_TenDays': '1',
-                    # 旬行情比較
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content2_LastDate_Year': '2022',
-                    # 旬行情比較
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content2_LastDate_Month': '1',
-                    # 旬行情比較
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content2_LastDate_TenDays': '1',
-                    # 旬行情比較
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content3_ThisDate_Year': '2022',
-                    # 月行情比較
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content3_ThisDate_Month': '1',
-                    # 月行情比較
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content3_LastDate_Year': '2022',
-                    # 月行情比較
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content3_LastDate_Month': '1',
-                    # 月行情比較
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content4_ThisDate_Year': '2022',
-                    # 年行情比較
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$DropDownList_Content4_LastDate_Year': '2022',
-                    # 年行情比較
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$TextBox_Content5_ThisDate_BegDate': '2022-01-20',
-                    # 指定期間行情比較
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$TextBox_Content5_ThisDate_EndDate': '2022-01-26',
-                    # 指定期間行情比較
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$TextBox_Content5_LastDate_BegDate': '2022-01-20',
-                    # 指定期間行情比較
-                    'ctl00$ctl00$ContentPlaceHolder_contant$ContentPlaceHolder_contant$TextBox_Content5_LastDate_EndDate': '2022-01-26'
-                    # 指定期間行情比較
-                }
-
-                # 組合json格式用預設格式
-                dict1 = {
-                    "date": "",
-                    "item": "白肉雞總貨",
-                    "price": 0,
-                    "volume": 0,
-                    "weight": 0,
-                    "priceUnit": "元/公斤"
-                }
-                dict2 = {
-                    "date": "",
-                    "item": "紅羽土雞總貨",
-                    "price": 0,
-                    "volume": 0,
-                    "weight": 0,
-                    "priceUnit": "元/公斤"
-                }
-
-                ss = requests.Session()
-                r3 = ss.get(naif_url, headers=self.headers)
-                soup = bs(r3.text, 'html.parser')
-
-                postdata['__VIEWSTATE'] = soup.find(id='__VIEWSTATE').attrs['value']
-                postdata['__VIEWSTATEGENERATOR'] = soup.find(id='__VIEWSTATEGENERATOR').attrs['value']
-                postdata['__EVENTVALIDATION'] = soup.find(id='__EVENTVALIDATION').attrs['value']
-
-                r4 = ss.post(naif_url, headers=self.headers, data=postdata)
-                soup2 = bs(r4.text, 'html.parser')
-
-                table = soup2.find('table', {'cellspacing': '0'})
-
-                # 查詢特定日期網站出現錯誤頁面異常,例如查詢 2012/10/15, 2012/10/24 這兩天, 網站會出現"發現除以零的錯誤"錯誤頁面
-                if table:
-                    not_data_msg = table.find_all('tr')[3].getText().strip()  # 特殊日期沒有交易會顯示"查無交易資料!"
-                    if '查無交易資料！' in not_data_msg:
-                        self.LOGGER.warning(f'{date} 查無交易資料！', extra=self.LOGGER_EXTRA)
-                        continue
-
-                    trs = table.find_all('tr')[5:7]
-                    for tr in trs:
-                        tds = tr.find_all('td')
-                        name = tds[0].getText() + tds[1].getText()  # 將"白肉雞"/"紅羽土雞"和"總貨"字串連接
-                        this_avg_price = tds[2].getText()
-                        # last_avg_price = tds[3].getText()
-                        this_volume = tds[5].getText()
-                        # last_volume = tds[6].getText()
-                        this_weight = tds[8].getText()
-                        # last_weight = tds[9].getText()
-
-                        # 如果當天沒有數據
-                        if this_avg_price == '-':
-                            self.LOGGER.warning(f'{date} {name} 無交易數據', extra=self.LOGGER_EXTRA)
-                            continue
-
-                        # 白肉雞總貨和紅羽土雞總貨數據在同一頁面,判斷品項分開存資料
-                        if name in dict1['item']:
-                            dict1['date'] = date.replace('-', '/')
-                            dict1['price'] = float(this_avg_price)
-                            dict1['volume'] = float(this_volume)
-                            dict1['weight'] = float(this_weight)
-                            data_list.append(dict1)
-                        if name in dict2['item']:
-                            dict2['date'] = date.replace('-', '/')
-                            dict2['price'] = float(this_avg_price)
-                            dict2['volume'] = float(this_volume)
-                            dict2['weight'] = float(this_weight)
-                            data_list.append(dict2)
-
-                    time.sleep(3)
-
-                # 網站出現錯誤頁面時略過,查下一個日期
-                else:
-                    self.LOGGER.warning(f'{date} 網站發生異常！', extra=self.LOGGER_EXTRA)
-                    continue
-
-            return data_list
+            return self.request_market(start_date, end_date)
+
+        elif 150003 <= id <= 150004:  # 家禽行情:白肉雞總貨/紅羽土雞總貨
+            return self.request_total(start_date, end_date)
+
+    def fetch_pages(self, func, jobs):
+        """
+        在 politeness budget(settings.DAILYTRAN_BUILDER_API_LIMITS['naifchickens'])內同時抓取頁面
+
+        :return: List[str]，順序同 jobs，抓取失敗的頁面為 None
+        """
+
+        fetcher = AsyncFetcher(func, concurrency=self.concurrency, rate=self.rate, host=self.API_NAME)
+        pages = [None] * len(jobs)
+        for kwargs, html, exc in fetcher.fetch([{**job, 'index': i} for i, job in enumerate(jobs)]):
+            if exc:
+                self.LOGGER.warning(f'Fetch failed: {kwargs}, exc: {exc}', extra=self.LOGGER_EXTRA)
+            else:
+                pages[kwargs['index']] = html
+
+        return pages
+
+    def log_warnings(self, results):
+        for result in results:
+            for warning in result.warnings:
+                self.LOGGER.warning(warning, extra=self.LOGGER_EXTRA)
+
+    def login(self, session):
+        """中央畜產會會員登入，以 OCR 自動識別驗證碼，回傳辨識的驗證碼"""
+
+        session.get(settings.DAILYTRAN_BUILDER_API['naifchickens'], headers=self.headers)
+
+        captcha = session.get(CAPTCHA_URL, headers=self.headers)
+        captcha_code = pytesseract.image_to_string(Image.open(io.BytesIO(captcha.content))).strip()[:4]
+
+        session.post(LOGIN_URL, headers=self.headers, data={
+            'url': '/memberLogin.aspx',
+            'myAccount': settings.NAIF_ACCOUNT,
+            'myPassword': settings.NAIF_PASSWORD,
+            'code': captcha_code,
+            'btnSend': '登入會員',
+            'frontTitleMenuID': 105,
+            'frontMenuID': 148,
+        })
+
+        return captcha_code
+
+    def request_market(self, start_date, end_date):
+        """
+        環南市場的交易行情表需登入會員，已登入的 session 保存於 Redis(SessionCache)，過期或被登出時才重新登入
+        """
+
+        session = requests.Session()
+        captcha_code = None
+        if not self.session_cache.restore(session):
+            captcha_code = self.login(session)
+
+        jobs = [
+            {'url': url.format(year=year, month=month), 'item': item, 'year': year, 'month': month}
+            for item, url in MARKET_PAGES.values()
+            for year, month in iter_months(start_date, end_date)
+        ]
+
+        def fetch(url, **kwargs):
+            return session.get(url, headers=self.headers).text
+
+        results = self.parse_market_pages(jobs, self.fetch_pages(fetch, jobs))
+
+        # 保存的 session 已過期，重新登入後再抓取一次
+        if captcha_code is None and any(result.login_required for result in results):
+            self.session_cache.clear()
+            session.cookies.clear()
+            captcha_code = self.login(session)
+            results = self.parse_market_pages(jobs, self.fetch_pages(fetch, jobs))
+
+        if any(result.login_required for result in results):
+            self.LOGGER.warning(f'Login failed for naif, captcha : {captcha_code}', extra=self.LOGGER_EXTRA)
+            self.session_cache.clear()
+        else:
+            self.session_cache.save(session)
+
+        self.log_warnings(results)
+        return [record for result in results for record in result.records]
+
+    def parse_market_pages(self, jobs, pages):
+        pages = [
+            (html, job['item'], job['year'], job['month'])
+            for job, html in zip(jobs, pages) if html is not None
+        ]
+        return parse_pages(parse_market_page, pages)
+
+    def fetch_total_page(self, date, **kwargs):
+        """每個日期以獨立的 session 取得表單的 __VIEWSTATE 後送出查詢"""
+
+        session = requests.Session()
+        soup = bs(session.get(TOTAL_URL, headers=self.headers).text, 'html.parser')
+
+        data = {**TOTAL_FORM, THIS_DATE_FIELD: date, LAST_DATE_FIELD: date}
+        for field in VIEWSTATE_FIELDS:
+            data[field] = soup.find(id=field).attrs['value']
+
+        return session.post(TOTAL_URL, headers=self.headers, data=data).text
+
+    def request_total(self, start_date, end_date):
+        # 將輸入的指定日期區間換成 list
+        jobs = [
+            {'date': d.strftime('%Y-%m-%d')}
+            for d in pd.date_range(start=start_date, end=end_date)
+        ]
+        pages = self.fetch_pages(self.fetch_total_page, jobs)
+
+        results = parse_pages(
+            parse_total_page,
+            [(html, job['date']) for job, html in zip(jobs, pages) if html is not None],
+        )
+        self.log_warnings(results)
+
+        return [record for result in results for record in result.records]
 
     def load(self, response):
         data = []
@@ -377,29 +428,17 @@ class Api(AbstractApi):
             data = json.loads(response, object_hook=self.hook)
 
         # data should look like [D, B, {}, C, {}...] after loads
+        upserter = DailyTranUpserter(
+            update_fields=['avg_price'], logger=self.LOGGER, logger_extra=self.LOGGER_EXTRA
+        )
         for obj in data:
             if isinstance(obj, DailyTran):
-                try:
-                    # update if exists
-                    daily_tran_qs = DailyTran.objects.filter(
-                        Q(date__exact=obj.date)
-                        & Q(product=obj.product)
-                    )
-
-                    if daily_tran_qs.count() > 1:
-                        # log as duplicate
-                        items = str(daily_tran_qs.values_list('id', flat=True))
-
-                        self.LOGGER.warning(
-                            'Find duplicate DailyTran item: %s' % items,
-                            extra=self.LOGGER_EXTRA
-                        )
-
-                    elif daily_tran_qs.count() == 1:
-                        daily_tran_qs.update(avg_price=obj.avg_price)
-                    else:
-                        if obj.avg_price > 0:
-                            obj.save()
-
-                except Exception as e:
-                    self.LOGGER.exception(e, extra=self.LOGGER_EXTRA)
+                upserter.add(obj, insert=obj.avg_price > 0)
+
+        try:
+            upserter.save()
+        except Exception as e:
+            self.LOGGER.exception(e, extra=self.LOGGER_EXTRA)
+            return False
+
+        return True
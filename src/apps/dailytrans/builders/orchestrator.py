@@ -0,0 +1,161 @@
+"""
+以 Celery group/chord 同時執行多個 builder
+
+每個節點(`BuildNode`)為一個 `direct_*` function 與其請求的 API。節點依 API 的 host 分組，
+同一個 host 最多同時執行 settings.DAILYTRAN_BUILDER_HOST_TASKS 個節點(lane)，lane 內的節點依序執行；
+不同 host 的 lane 以 group 同時執行，全部完成後由 chord 的 callback 彙整為一個結果:
+
+    chord([
+        chain(cattles, chickens, ...),      # data.moa.gov.tw lane 1
+        chain(hogs, rams, ...),             # data.moa.gov.tw lane 2
+        chain(flowers_07, fruits_03, ...),  # amis
+        chain(fruits_origin),               # apis
+        chain(seafoods_origin),             # efish
+    ], aggregate_builder_results)
+
+整體執行時間約為最慢的 lane，而非所有 builder 的總和。
+
+使用方式:
+    run_dag(NODES, start_date, end_date)    # 等待完成並回傳 DirectResult，不可在 celery task 中呼叫
+    orchestrate(NODES, start_date, end_date)  # 只送出 chord，回傳 AsyncResult
+"""
+import datetime
+import time
+from collections import OrderedDict, namedtuple
+
+from celery import chain, chord
+from django.conf import settings
+
+from .archive import is_replaying
+from .fetch import get_host
+from .fingerprint import is_forced
+from .utils import DirectResult
+
+
+DATE_FORMAT = '%Y-%m-%d'
+
+# config_code 與 type_id 為 func 寫入的品項分類與供應階段，用來計算抓取計畫(plan.build_plan)
+BuildNode = namedtuple('BuildNode', ('func', 'api_name', 'config_code', 'type_id'))
+BuildNode.__new__.__defaults__ = (None, None)
+
+
+def get_node_host(node):
+    """API 網址未設定時以 API 名稱分組"""
+
+    url = settings.DAILYTRAN_BUILDER_API.get(node.api_name)
+    return get_host(url) if url else node.api_name
+
+
+def get_host_concurrency(host):
+    config = getattr(settings, 'DAILYTRAN_BUILDER_HOST_TASKS', {})
+    return max(int(config.get(host, config.get('default', 1))), 1)
+
+
+def plan_lanes(nodes):
+    """
+    將節點依 host 分配到 lane，每個 host 最多 `get_host_concurrency(host)` 條 lane
+
+    Returns:
+        List[List[BuildNode]]: lane 內的節點依序執行
+    """
+
+    nodes_by_host = OrderedDict()
+    for node in nodes:
+        nodes_by_host.setdefault(get_node_host(node), []).append(node)
+
+    lanes = []
+    for host, host_nodes in nodes_by_host.items():
+        host_lanes = [[] for _ in range(min(get_host_concurrency(host), len(host_nodes)))]
+        for i, node in enumerate(host_nodes):
+            host_lanes[i % len(host_lanes)].append(node)
+        lanes.extend(host_lanes)
+
+    return lanes
+
+
+def serialize_result(func, result):
+    """將 DirectResult 轉換為可 JSON 序列化的 dict，作為 celery task 的回傳值"""
+
+    def to_str(value):
+        return value.strftime(DATE_FORMAT) if isinstance(value, datetime.date) else value
+
+    return {
+        'func': func,
+        'start_date': to_str(result.start_date),
+        'end_date': to_str(result.end_date),
+        'duration': result.duration.total_seconds() if result.duration is not None else None,
+        'success': result.success,
+        'msg': str(result.msg) if result.msg else '',
+    }
+
+
+def aggregate(results, start_date, end_date, started_at):
+    """
+    :param results: 每條 lane 的節點結果 list
+    :param started_at: 送出 chord 的 timestamp，用來計算整體執行時間
+    """
+
+    results = [result for lane_results in results for result in lane_results]
+    failures = [result for result in results if not result['success']]
+
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'duration': time.time() - started_at,
+        'success': not failures,
+        'msg': '; '.join(f'{result["func"]}: {result["msg"]}' for result in failures),
+        'results': results,
+    }
+
+
+def to_direct_result(summary):
+    return DirectResult(
+        datetime.datetime.strptime(summary['start_date'], DATE_FORMAT),
+        datetime.datetime.strptime(summary['end_date'], DATE_FORMAT),
+        duration=datetime.timedelta(seconds=summary['duration']),
+        success=summary['success'],
+        msg=summary['msg'],
+    )
+
+
+def build_canvas(nodes, start_date, end_date, **kwargs):
+    """
+    :param start_date: datetime.date 或 '%Y-%m-%d' 字串
+    :param kwargs: 傳給每個 `direct_*` function 的參數，e.g. code, force, replay
+    """
+
+    # 避免 celery 與 tasks 模組互相 import
+    from apps.dailytrans.tasks import aggregate_builder_results, run_builder_node
+
+    if isinstance(start_date, datetime.date):
+        start_date, end_date = start_date.strftime(DATE_FORMAT), end_date.strftime(DATE_FORMAT)
+
+    # director 的 force、replay 只作用於目前的 thread，需傳給各個 task
+    if is_forced():
+        kwargs.setdefault('force', True)
+    if is_replaying():
+        kwargs.setdefault('replay', True)
+
+    header = []
+    for lane in plan_lanes(nodes):
+        signatures = [run_builder_node.s([], lane[0].func, start_date, end_date, kwargs)]
+        signatures.extend(run_builder_node.s(node.func, start_date, end_date, kwargs) for node in lane[1:])
+        header.append(chain(*signatures))
+
+    return chord(header, aggregate_builder_results.s(start_date, end_date, time.time()))
+
+
+def orchestrate(nodes, start_date, end_date, **kwargs):
+    """送出 chord，回傳 AsyncResult，結果為 `aggregate` 的 dict"""
+
+    return build_canvas(nodes, start_date, end_date, **kwargs).apply_async()
+
+
+def run_dag(nodes, start_date, end_date, timeout=None, **kwargs):
+    """
+    等待所有節點完成，回傳彙整的 DirectResult；所有節點皆成功時 success 為 True，
+    msg 為失敗節點的錯誤訊息。會阻塞等待結果，不可在 celery task 中呼叫，task 中請使用 `orchestrate`
+    """
+
+    summary = orchestrate(nodes, start_date, end_date, **kwargs).get(timeout=timeout)
+    return to_direct_result(summary)
@@ -0,0 +1,232 @@
+"""
+Builder 的抓取計畫(fetch plan)
+
+排程原本固定重新抓取近 3 天(每小時)與近 30 天(每週)的資料，不論資料是否缺漏。
+改為依據以下資訊計算每次需要請求的日期:
+    - watermark: `IngestionWatermark` 記錄每個 (API, 品項分類, 供應階段, 來源) 已確認完整的最後日期，
+      之後的日期為尚未完整(open)的日期
+    - 缺漏: `find_gaps` 以 generate_series 展開日期，與 DailyTran 做 anti-join，列出缺少資料的 (品項, 來源, 日期)
+    - 修正期間(revision horizon): 近幾天的資料 API 仍可能修正，一律重新請求
+
+使用方式:
+    plan = build_plan(BuildNode('apps.crops.builder.direct_wholesale_05', 'eir030', 'COG05', 1))
+    direct_wholesale_05(plan=plan)      # director 依 plan.windows 逐段執行
+    advance_watermarks(plan)            # 執行成功後更新 watermark
+
+設定值: settings.DAILYTRAN_BUILDER_PLAN
+"""
+import datetime
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Max, Min
+
+from apps.configs.models import AbstractProduct, Config, Source
+from apps.dailytrans.models import DailyTran, IngestionWatermark
+
+
+GapCell = namedtuple('GapCell', ('product_id', 'source_id', 'date'))
+
+# 追蹤的 (品項, 來源) 為回溯期間內曾有資料的組合；
+# 日期只展開該品項分類與供應階段有任何資料的日期(排除休市日)，再排除已有資料的 (品項, 來源, 日期)
+GAPS_SQL = """
+    WITH trans AS (
+        SELECT t.product_id, t.source_id, t.date
+        FROM {dailytran} t
+        JOIN {product} p ON p.id = t.product_id
+        WHERE p.config_id = %(config_id)s AND p.type_id = %(type_id)s
+          AND t.date BETWEEN %(lookback_date)s AND %(end_date)s
+    ),
+    pairs AS (
+        SELECT DISTINCT product_id, source_id FROM trans
+    ),
+    days AS (
+        SELECT d::date AS date
+        FROM generate_series(%(start_date)s::date, %(end_date)s::date, interval '1 day') d
+        WHERE EXISTS (SELECT 1 FROM trans WHERE trans.date = d::date)
+    )
+    SELECT pairs.product_id, pairs.source_id, days.date
+    FROM pairs
+    CROSS JOIN days
+    WHERE NOT EXISTS (
+        SELECT 1 FROM trans
+        WHERE trans.product_id = pairs.product_id
+          AND trans.source_id IS NOT DISTINCT FROM pairs.source_id
+          AND trans.date = days.date
+    )
+    ORDER BY days.date, pairs.product_id, pairs.source_id
+""".format(dailytran=DailyTran._meta.db_table, product=AbstractProduct._meta.db_table)
+
+
+def get_plan_config():
+    config = getattr(settings, 'DAILYTRAN_BUILDER_PLAN', {})
+    return config.get('revision_days', 1), config.get('lookback_days', 30)
+
+
+def find_gaps(config_code, type_id, start_date, end_date, lookback_date=None, using='default'):
+    """
+    列出 start_date 至 end_date 間缺少的日交易資料
+
+    :param lookback_date: 以此日期起曾有資料的 (品項, 來源) 作為追蹤對象，預設為 start_date
+    :return: List[GapCell]
+    """
+
+    params = {
+        'config_id': Config.objects.get(code=config_code).id,
+        'type_id': type_id,
+        'start_date': start_date,
+        'end_date': end_date,
+        'lookback_date': lookback_date or start_date,
+    }
+    with connections[using].cursor() as cursor:
+        cursor.execute(GAPS_SQL, params)
+        return [GapCell(*row) for row in cursor.fetchall()]
+
+
+def to_windows(dates):
+    """將日期合併為連續的日期區間 [(start_date, end_date), ...]"""
+
+    windows = []
+    for date in sorted(set(dates)):
+        if windows and windows[-1][1] + datetime.timedelta(days=1) == date:
+            windows[-1][1] = date
+        else:
+            windows.append([date, date])
+
+    return [tuple(window) for window in windows]
+
+
+class FetchPlan:
+    def __init__(self, node, dates, watermark=None, open_dates=(), revision_dates=(), gaps=()):
+        """
+        Args:
+            node: BuildNode，需有 api_name、config_code 與 type_id
+            dates: 需要請求的日期
+            watermark: 各來源中最早的完整日期，None 代表尚無紀錄
+            open_dates: watermark 之後的日期
+            revision_dates: 修正期間的日期
+            gaps: 缺漏的 GapCell
+        """
+
+        self.node = node
+        self.dates = sorted(set(dates))
+        self.watermark = watermark
+        self.open_dates = sorted(set(open_dates))
+        self.revision_dates = sorted(set(revision_dates))
+        self.gaps = list(gaps)
+
+    def __bool__(self):
+        return bool(self.dates)
+
+    @property
+    def start_date(self):
+        return self.dates[0] if self.dates else None
+
+    @property
+    def end_date(self):
+        return self.dates[-1] if self.dates else None
+
+    @property
+    def windows(self):
+        return to_windows(self.dates)
+
+    def as_dict(self):
+        """供 `builder_plan` 指令或 log 顯示"""
+
+        return {
+            'func': self.node.func,
+            'api_name': self.node.api_name,
+            'config_code': self.node.config_code,
+            'type_id': self.node.type_id,
+            'watermark': self.watermark,
+            'windows': self.windows,
+            'open_days': len(self.open_dates),
+            'revision_days': len(self.revision_dates),
+            'gap_days': len({gap.date for gap in self.gaps}),
+            'gap_cells': len(self.gaps),
+        }
+
+
+def get_watermarks(node):
+    return IngestionWatermark.objects.filter(
+        api_name=node.api_name, config__code=node.config_code, type__id=node.type_id
+    )
+
+
+def build_plan(node, today=None, revision_days=None, lookback_days=None):
+    """
+    計算 `node` 需要請求的日期: watermark 之後的日期、修正期間與回溯期間內的缺漏日期，皆不超過今天
+
+    :param node: BuildNode
+    :param today: 計畫的最後一天，預設為今天
+    :param revision_days: 修正期間天數，預設為 settings.DAILYTRAN_BUILDER_PLAN['revision_days']
+    :param lookback_days: 回溯天數，watermark 與缺漏只檢查此期間內，
+                          預設為 settings.DAILYTRAN_BUILDER_PLAN['lookback_days']
+    :return: FetchPlan
+    """
+
+    default_revision_days, default_lookback_days = get_plan_config()
+    revision_days = default_revision_days if revision_days is None else revision_days
+    lookback_days = default_lookback_days if lookback_days is None else lookback_days
+
+    today = today or datetime.date.today()
+    lookback_date = today - datetime.timedelta(days=lookback_days)
+
+    def date_range(start_date):
+        return [start_date + datetime.timedelta(days=i) for i in range((today - start_date).days + 1)]
+
+    # 回溯期間前就停止更新的來源視為已停用，不納入 watermark，避免計畫一直涵蓋整個回溯期間
+    watermark = get_watermarks(node).filter(
+        complete_date__gte=lookback_date,
+    ).aggregate(watermark=Min('complete_date'))['watermark']
+    open_start = max(watermark + datetime.timedelta(days=1), lookback_date) if watermark else lookback_date
+    open_dates = date_range(open_start) if open_start <= today else []
+    revision_dates = date_range(today - datetime.timedelta(days=revision_days))
+    gaps = find_gaps(node.config_code, node.type_id, lookback_date, today)
+
+    return FetchPlan(
+        node,
+        open_dates + revision_dates + [gap.date for gap in gaps],
+        watermark=watermark,
+        open_dates=open_dates,
+        revision_dates=revision_dates,
+        gaps=gaps,
+    )
+
+
+def advance_watermarks(plan):
+    """
+    plan 執行成功後，將每個來源的 watermark 更新為 plan 結束日前(含)該來源最後有資料的日期，只往後推進
+
+    :return: 更新的 watermark 數
+    """
+
+    node = plan.node
+    if not plan or node.config_code is None or node.type_id is None:
+        return 0
+
+    _, lookback_days = get_plan_config()
+    config = Config.objects.get(code=node.config_code)
+    latest_dates = DailyTran.objects.filter(
+        product__config=config,
+        product__type__id=node.type_id,
+        date__range=(plan.start_date - datetime.timedelta(days=lookback_days), plan.end_date),
+    ).values('source_id').annotate(latest_date=Max('date'))
+
+    sources = Source.objects.in_bulk([row['source_id'] for row in latest_dates if row['source_id']])
+    count = 0
+    for row in latest_dates:
+        watermark, created = IngestionWatermark.objects.get_or_create(
+            api_name=node.api_name,
+            config=config,
+            type_id=node.type_id,
+            source=sources.get(row['source_id']),
+            defaults={'complete_date': row['latest_date']},
+        )
+        if not created and watermark.complete_date < row['latest_date']:
+            watermark.complete_date = row['latest_date']
+            watermark.save(update_fields=['complete_date', 'update_time'])
+        count += 1
+
+    return count
@@ -0,0 +1,263 @@
+"""
+Builder 請求的重試策略與斷路器(circuit breaker)
+
+- RetryPolicy: 指數退避(exponential backoff)加上隨機抖動(full jitter)，並遵守回應的 `Retry-After`
+- CircuitBreaker: 以 API 名稱為單位，狀態存放於 Redis，所有 celery worker 共用；
+  連續失敗達門檻後開啟(open)，冷卻期間內的請求直接以 `CircuitOpenError` 失敗，不再等待重試，
+  冷卻結束後只放行一個探測請求(half-open)，成功才關閉
+- defer/pop_deferred: 斷路器開啟時，`director` 將整個日期區間排入 Redis 佇列，
+  由 `RetryDeferredBuilds` 排程在斷路器關閉後重新執行
+- 重試、失敗與略過的請求數記錄於 Redis hash，可由 `get_metrics` 或 `builder_breakers` 指令查詢
+
+設定值: settings.DAILYTRAN_BUILDER_RETRY、settings.DAILYTRAN_BUILDER_BREAKER
+"""
+import datetime
+import email.utils
+import json
+import logging
+import random
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from dashboard.caches import redis_instance
+
+
+logger = logging.getLogger('aprp')
+
+KEY_PREFIX = 'builder'
+DEFERRED_KEY = f'{KEY_PREFIX}:deferred'
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitOpenError(Exception):
+    """API 的斷路器為開啟狀態，請求直接失敗"""
+
+    def __init__(self, api_name, retry_in=None):
+        self.api_name = api_name
+        self.retry_in = retry_in
+        super().__init__(f'Circuit breaker of API {api_name} is open, retry in {retry_in} seconds')
+
+
+def _get_redis():
+    return redis_instance.redis
+
+
+def incr_metric(api_name, field, amount=1, redis=None):
+    try:
+        (redis or _get_redis()).hincrby(f'{KEY_PREFIX}:metrics:{api_name}', field, amount)
+    except RedisError:
+        pass
+
+
+def get_metrics(api_name, redis=None):
+    """
+    Returns:
+        dict: requests, retries, failures, short_circuits, opened 等累計次數
+    """
+
+    try:
+        raw = (redis or _get_redis()).hgetall(f'{KEY_PREFIX}:metrics:{api_name}')
+    except RedisError:
+        return {}
+
+    return {
+        (key.decode() if isinstance(key, bytes) else key): int(value)
+        for key, value in raw.items()
+    }
+
+
+class RetryPolicy:
+    # 連線失敗(status_code 為 None)、逾時、請求過多與伺服器錯誤才重試，其餘 4xx 直接回傳
+    RETRY_STATUSES = frozenset({None, 408, 429, 500, 502, 503, 504})
+
+    def __init__(self, max_retries=None, base_delay=None, max_delay=None):
+        """
+        Args:
+            max_retries: 最多重試次數
+            base_delay: 第一次重試的等待秒數上限，之後每次加倍
+            max_delay: 單次等待秒數上限；`Retry-After` 超過此值時不再重試，交由斷路器處理
+        """
+
+        config = getattr(settings, 'DAILYTRAN_BUILDER_RETRY', {})
+        self.max_retries = max_retries if max_retries is not None else config.get('max_retries', 5)
+        self.base_delay = base_delay if base_delay is not None else config.get('base_delay', 2)
+        self.max_delay = max_delay if max_delay is not None else config.get('max_delay', 60)
+
+    def should_retry(self, response):
+        return response.status_code in self.RETRY_STATUSES
+
+    @staticmethod
+    def parse_retry_after(response):
+        """`Retry-After` 可為秒數或 HTTP 日期，無法解析時回傳 None"""
+
+        value = response.headers.get('Retry-After') if response.headers else None
+        if not value:
+            return None
+
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+
+        return max((retry_at - datetime.datetime.now(retry_at.tzinfo)).total_seconds(), 0)
+
+    def backoff(self, retry_count):
+        """第 retry_count 次重試的等待秒數: full jitter，介於 0 與 base_delay * 2^(n-1) 之間"""
+
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (retry_count - 1)))
+
+    def get_delay(self, retry_count, response):
+        """
+        Returns:
+            Optional[float]: 重試前的等待秒數，None 代表不應再重試
+        """
+
+        if retry_count > self.max_retries or not self.should_retry(response):
+            return None
+
+        retry_after = self.parse_retry_after(response)
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_delay else None
+
+        return self.backoff(retry_count)
+
+
+class CircuitBreaker:
+    def __init__(self, api_name, failure_threshold=None, window=None, cooldown=None, redis=None):
+        """
+        Args:
+            api_name: API 名稱，即 DAILYTRAN_BUILDER_API 的 key
+            failure_threshold: window 秒內失敗幾次後開啟斷路器
+            window: 計算失敗次數的時間區間(秒)
+            cooldown: 斷路器開啟後的冷卻時間(秒)
+            redis: redis client，預設為 django_redis 的連線
+        """
+
+        config = getattr(settings, 'DAILYTRAN_BUILDER_BREAKER', {})
+        self.api_name = api_name
+        self.failure_threshold = failure_threshold or config.get('failure_threshold', 3)
+        self.window = window or config.get('window', 300)
+        self.cooldown = cooldown or config.get('cooldown', 600)
+        self._redis = redis
+
+        prefix = f'{KEY_PREFIX}:breaker:{api_name}'
+        self.failures_key = f'{prefix}:failures'
+        self.open_key = f'{prefix}:open'
+        self.probe_key = f'{prefix}:probe'
+
+    @property
+    def redis(self):
+        return self._redis or _get_redis()
+
+    @property
+    def state(self):
+        try:
+            if self.redis.exists(self.open_key):
+                return OPEN
+            if self.redis.exists(self.probe_key):
+                return HALF_OPEN
+        except RedisError:
+            pass
+
+        return CLOSED
+
+    def retry_in(self):
+        """斷路器關閉前的剩餘秒數"""
+
+        try:
+            return max(self.redis.ttl(self.open_key) or 0, 0)
+        except RedisError:
+            return 0
+
+    def allow(self, retry=False):
+        """
+        是否放行請求；Redis 無法連線時一律放行，避免影響資料抓取
+
+        Args:
+            retry: 已放行的請求重試時為 True，只檢查斷路器是否開啟；
+                   探測請求本身的重試不會因探測鎖而被拒絕
+
+        Raises:
+            CircuitOpenError: 斷路器為開啟狀態，或冷卻結束後已有其他 worker 正在探測
+        """
+
+        try:
+            if self.redis.exists(self.open_key):
+                retry_in = self.retry_in()
+            # 冷卻結束後曾經失敗過，只放行一個探測請求
+            elif (not retry and int(self.redis.get(self.failures_key) or 0) >= self.failure_threshold
+                  and not self.redis.set(self.probe_key, 1, nx=True, ex=self.window)):
+                retry_in = self.redis.ttl(self.probe_key)
+            else:
+                return True
+        except RedisError:
+            return True
+
+        incr_metric(self.api_name, 'short_circuits', redis=self._redis)
+        raise CircuitOpenError(self.api_name, retry_in)
+
+    def record_success(self):
+        try:
+            self.redis.delete(self.failures_key, self.probe_key)
+        except RedisError:
+            pass
+
+    def record_failure(self):
+        try:
+            failures = self.redis.incr(self.failures_key)
+            if failures == 1 or self.redis.ttl(self.failures_key) < 0:
+                self.redis.expire(self.failures_key, self.window + self.cooldown)
+
+            if failures >= self.failure_threshold:
+                self.redis.set(self.open_key, 1, ex=self.cooldown)
+                self.redis.delete(self.probe_key)
+                incr_metric(self.api_name, 'opened', redis=self._redis)
+                logger.error(
+                    f'Circuit breaker of API {self.api_name} is open for {self.cooldown} seconds '
+                    f'after {failures} failures',
+                    extra={'type_code': 'LOT-dailytrans'},
+                )
+        except RedisError:
+            pass
+
+
+def defer(func_path, start_date, end_date, api_name=None, redis=None, **kwargs):
+    """將 director 的日期區間排入佇列，待斷路器關閉後重新執行"""
+
+    item = json.dumps({
+        'func': func_path,
+        'start_date': start_date.strftime('%Y-%m-%d'),
+        'end_date': end_date.strftime('%Y-%m-%d'),
+        'api_name': api_name,
+        'kwargs': kwargs,
+    })
+    try:
+        (redis or _get_redis()).rpush(DEFERRED_KEY, item)
+    except RedisError:
+        logger.exception(f'Can not defer {item}', extra={'type_code': 'LOT-dailytrans'})
+
+
+def pop_deferred(redis=None):
+    """取出佇列中所有待重新執行的項目，重複的 (func, 日期區間) 只保留一筆"""
+
+    redis = redis or _get_redis()
+    items = []
+    while True:
+        item = redis.lpop(DEFERRED_KEY)
+        if item is None:
+            break
+
+        item = json.loads(item)
+        if item not in items:
+            items.append(item)
+
+    return items
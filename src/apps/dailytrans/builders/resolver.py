@@ -0,0 +1,103 @@
+from collections import OrderedDict
+
+
+def normalize_source_name(name):
+    """與 `SourceQuerySet.filter_by_name` 相同，將「台」統一為「臺」"""
+
+    return name.replace('台', '臺')
+
+
+class Resolver:
+    """
+    builder 每次執行時建立一次的品項與來源對照表
+
+    builder 的 hook 原本對每一筆 API 資料各查詢一次品項與來源(每筆兩次 SQL)，
+    改為建立時一次取出 PRODUCT_QS 與 SOURCE_QS，之後都在記憶體中比對:
+        - 品項: code -> products(同一個 code 可能對應多個品項，依 id 排序)
+        - 來源: name、code -> source；`source_by_name` 套用 `filter_by_name` 的「台/臺」與 alias 規則
+
+    使用方式:
+        resolver = Resolver(api.PRODUCT_QS, api.SOURCE_QS)
+        resolver.product('FA0'), resolver.source_by_name('台北一')
+    """
+
+    def __init__(self, product_qs, source_qs):
+        self.products_by_code = OrderedDict()
+        for product in product_qs.order_by('id'):
+            self.products_by_code.setdefault(product.code, []).append(product)
+
+        self.all_sources = list(source_qs.order_by('id'))
+        self._sources_by_alias = {}
+        self.sources_by_name = OrderedDict()
+        self.sources_by_code = OrderedDict()
+        for source in self.all_sources:
+            self.sources_by_name.setdefault(source.name, source)
+            if source.code:
+                self.sources_by_code.setdefault(source.code, source)
+
+    @property
+    def codes(self):
+        return set(self.products_by_code)
+
+    @property
+    def all_products(self):
+        return [product for products in self.products_by_code.values() for product in products]
+
+    @property
+    def source_names(self):
+        return set(self.sources_by_name)
+
+    def products(self, code):
+        """等同 `PRODUCT_QS.filter(code=code)`"""
+
+        return self.products_by_code.get(code, [])
+
+    def product(self, code):
+        """等同 `PRODUCT_QS.filter(code=code).first()`"""
+
+        products = self.products(code)
+        return products[0] if products else None
+
+    def source(self, name):
+        """等同 `SOURCE_QS.filter(name=name).first()`"""
+
+        return self.sources_by_name.get(name)
+
+    def source_by_code(self, code):
+        """等同 `SOURCE_QS.filter(code=code).first()`"""
+
+        return self.sources_by_code.get(code)
+
+    def source_by_name(self, name, type_id=None):
+        """
+        等同 `SOURCE_QS.filter_by_name(name).first()`: 先比對完整名稱，找不到時再以 alias 包含名稱(不分大小寫)比對
+
+        :param name: 來源名稱
+        :param type_id: 僅比對此供應階段的來源，等同 `SOURCE_QS.filter(type=type).filter_by_name(name)`
+        """
+
+        if not isinstance(name, str):
+            raise TypeError
+
+        key = (name, type_id)
+        if key not in self._sources_by_alias:
+            self._sources_by_alias[key] = self._match_source(normalize_source_name(name), type_id)
+
+        return self._sources_by_alias[key]
+
+    def _match_source(self, name, type_id):
+        sources = [
+            source for source in self.all_sources
+            if type_id is None or source.type_id == type_id
+        ]
+
+        for source in sources:
+            if source.name == name:
+                return source
+
+        lower_name = name.lower()
+        for source in sources:
+            if source.alias and lower_name in source.alias.lower():
+                return source
+
+        return None
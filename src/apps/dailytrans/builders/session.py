@@ -0,0 +1,70 @@
+"""
+需要登入的爬蟲以 Redis 保存已登入 session 的 cookies
+
+e.g. 中央畜產會(naifchickens)每次執行都需辨識驗證碼並登入；登入成功後將 cookies 存入 Redis，
+之後的執行(包含其他 celery worker)直接沿用，直到 `ttl` 秒後過期或網站要求重新登入時清除。
+
+使用方式:
+    cache = SessionCache('naifchickens', ttl=30 * 60)
+    session = requests.Session()
+    if not cache.restore(session):
+        login(session)
+    ...                     # 確認已登入後
+    cache.save(session)
+"""
+import json
+
+from redis.exceptions import RedisError
+from requests.utils import add_dict_to_cookiejar, dict_from_cookiejar
+
+from .resilience import KEY_PREFIX, _get_redis
+
+
+class SessionCache:
+    def __init__(self, name, ttl, redis=None):
+        """
+        Args:
+            name: session 名稱，通常為 API 名稱
+            ttl: cookies 保留秒數，應短於網站的 session 逾時時間
+            redis: redis client，預設為 django_redis 的連線
+        """
+
+        self.key = f'{KEY_PREFIX}:session:{name}'
+        self.ttl = ttl
+        self._redis = redis
+
+    @property
+    def redis(self):
+        return self._redis or _get_redis()
+
+    def restore(self, session):
+        """
+        將保存的 cookies 加入 session
+
+        :return: 是否有保存的 cookies
+        """
+
+        try:
+            stored = self.redis.get(self.key)
+        except RedisError:
+            return False
+
+        if not stored:
+            return False
+
+        if isinstance(stored, bytes):
+            stored = stored.decode()
+        add_dict_to_cookiejar(session.cookies, json.loads(stored))
+        return True
+
+    def save(self, session):
+        try:
+            self.redis.set(self.key, json.dumps(dict_from_cookiejar(session.cookies)), ex=self.ttl)
+        except RedisError:
+            pass
+
+    def clear(self):
+        try:
+            self.redis.delete(self.key)
+        except RedisError:
+            pass
@@ -0,0 +1,215 @@
+"""
+逐筆解析 JSON 回應(streaming)
+
+eir030、eir032 以整個日期區間請求全部品項與市場，回應可達數十 MB，其中多數為未追蹤的品項；
+原本以 `json.loads(response.text)` 一次解析成 list of dict 再建立 DataFrame，最後才以 `isin(target_items)` 篩選，
+解析後的物件與 DataFrame 約為回應大小的數倍。
+
+改為以 `json.JSONDecoder.raw_decode` 逐筆解析回應中的陣列元素:
+    - 未追蹤的品項與休市(`REST_MARKERS`)在解析後立即捨棄，只記錄未追蹤品項的代碼與名稱，供新品項通知使用
+    - 保留的資料以欄位為單位累積，每 `batch_size` 筆輸出一個 DataFrame(columnar batch)
+
+eir030、eir032 將每個 batch 直接交給 `DailyTranUpserter`，不合併成完整的 DataFrame。
+回應的 bytes 仍由 requests 完整讀入記憶體(指紋與封存皆需要完整內容)，upserter 暫存的資料也隨保留的筆數增加，
+因此記憶體用量仍與日期區間長度相關；此處只避免建立全部品項的 list of dict 與未篩選的 DataFrame。
+
+設定值: settings.DAILYTRAN_BUILDER_STREAM
+"""
+import codecs
+import json
+
+import pandas as pd
+from django.conf import settings
+
+
+REST_MARKERS = frozenset({'休市', 'REST'})
+
+WHITESPACE = ' \t\n\r'
+
+
+def get_stream_config():
+    config = getattr(settings, 'DAILYTRAN_BUILDER_STREAM', {})
+    return config.get('chunk_size', 64 * 1024), config.get('batch_size', 5000)
+
+
+def iter_text(response, chunk_size=None):
+    """將回應內容以 `chunk_size` bytes 為單位解碼為字串，多位元組字元跨越 chunk 時由 incremental decoder 處理"""
+
+    chunk_size = chunk_size or get_stream_config()[0]
+    content = response.content or b''
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+
+    view = memoryview(content)
+    for start in range(0, len(content), chunk_size):
+        text = decoder.decode(view[start:start + chunk_size].tobytes())
+        if text:
+            yield text
+
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+def iter_json_items(chunks, key=None):
+    """
+    逐筆產生 JSON 陣列的元素
+
+    :param chunks: iterable of str
+    :param key: 陣列位於最外層物件的欄位，e.g. amis 的 'DayTransInfo'；None 代表最外層即為陣列
+    :raise ValueError: 找不到陣列或內容不是合法的 JSON
+    """
+
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer = ''
+    pos = 0
+    exhausted = False
+
+    def read():
+        nonlocal buffer, pos, exhausted
+        # 已解析的部分累積超過一定長度才捨棄，避免每筆都複製 buffer
+        if pos > 64 * 1024:
+            buffer, pos = buffer[pos:], 0
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+        else:
+            buffer += chunk
+        return not exhausted
+
+    def skip(chars):
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in chars:
+                pos += 1
+            if pos < len(buffer) or not read():
+                return
+
+    # 找到陣列的開頭
+    if key is not None:
+        token = json.dumps(key, ensure_ascii=False)
+        while token not in buffer[pos:] and read():
+            pass
+        index = buffer.find(token, pos)
+        if index < 0:
+            raise ValueError(f'Key {key} not found')
+        pos = index + len(token)
+        skip(WHITESPACE + ':')
+    else:
+        skip(WHITESPACE)
+
+    if pos >= len(buffer):
+        return
+    if buffer[pos] != '[':
+        raise ValueError(f'Expecting an array at {pos}: {buffer[pos:pos + 50]!r}')
+    pos += 1
+
+    while True:
+        skip(WHITESPACE + ',')
+        if pos >= len(buffer):
+            raise ValueError('Unterminated array')
+        if buffer[pos] == ']':
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            if read():
+                continue
+            raise
+
+        # 數值等元素可能在 chunk 的結尾被截斷，需讀取下一個 chunk 確認
+        if end >= len(buffer) and read():
+            continue
+
+        pos = end
+        yield item
+
+
+class RecordStream:
+    """
+    從回應中逐筆讀取資料，只保留追蹤的品項，以 DataFrame 分批輸出
+
+    stream = RecordStream(columns, code_field='作物代號', codes=api.target_items, name_field='作物名稱')
+    batches = stream.iter_batches(response)   # 或 data = stream.read_frame(response)
+    stream.dropped                       # {未追蹤的代碼: 名稱}
+    """
+
+    def __init__(self, columns, code_field, codes, name_field=None, key=None, batch_size=None):
+        """
+        Args:
+            columns: 輸出的欄位
+            code_field: 品項代碼的欄位
+            codes: 追蹤的品項代碼
+            name_field: 品項名稱的欄位，記錄於 `dropped`
+            key: 資料陣列位於最外層物件的欄位
+            batch_size: 每個 DataFrame 的筆數，預設為 settings.DAILYTRAN_BUILDER_STREAM['batch_size']
+        """
+
+        self.columns = list(columns)
+        self.code_field = code_field
+        self.codes = set(codes)
+        self.name_field = name_field
+        self.key = key
+        self.batch_size = batch_size or get_stream_config()[1]
+
+        self.dropped = {}
+        self.total = 0
+        self.kept = 0
+
+    def is_rest(self, record):
+        return any(
+            str(record.get(field, '')).strip().upper() in REST_MARKERS
+            for field in (self.code_field, self.name_field) if field
+        )
+
+    def keep(self, record):
+        code = record.get(self.code_field)
+        if code in self.codes:
+            return True
+
+        if not self.is_rest(record):
+            self.dropped.setdefault(code, record.get(self.name_field, '') if self.name_field else '')
+        return False
+
+    def iter_records(self, response):
+        for record in iter_json_items(iter_text(response), key=self.key):
+            self.total += 1
+            if isinstance(record, dict) and self.keep(record):
+                self.kept += 1
+                yield record
+
+    def iter_batches(self, response):
+        batch = {column: [] for column in self.columns}
+        size = 0
+
+        for record in self.iter_records(response):
+            for column in self.columns:
+                batch[column].append(record.get(column))
+            size += 1
+
+            if size >= self.batch_size:
+                yield pd.DataFrame(batch, columns=self.columns)
+                batch = {column: [] for column in self.columns}
+                size = 0
+
+        if size:
+            yield pd.DataFrame(batch, columns=self.columns)
+
+    def read_frame(self, response):
+        """讀取全部保留的資料並合併為單一 DataFrame，沒有資料時回傳只有欄位的空 DataFrame"""
+
+        batches = list(self.iter_batches(response))
+        if not batches:
+            return pd.DataFrame(columns=self.columns)
+
+        return pd.concat(batches, ignore_index=True)
+
+    def dropped_frame(self):
+        """未追蹤的品項，欄位同 `columns`，供 `_check_if_new_product_exist` 使用"""
+
+        return pd.DataFrame(
+            [{self.code_field: code, self.name_field: name} for code, name in self.dropped.items()]
+            if self.name_field else [{self.code_field: code} for code in self.dropped],
+            columns=self.columns,
+        )
@@ -0,0 +1,374 @@
+import csv
+import io
+import logging
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+import pandas as pd
+from django.db import connections, transaction
+
+from apps.configs.models import AbstractProduct
+from apps.dailytrans.models import CompletenessProfile, DailyAggregate, DailyTran
+
+
+UpsertResult = namedtuple('UpsertResult', ('inserted', 'updated', 'deleted'))
+UpsertResult.__new__.__defaults__ = (0, 0, 0)
+
+_listeners = []
+_listeners_lock = threading.Lock()
+
+
+@contextmanager
+def listen_saves(callback):
+    """
+    區塊內每次 `DailyTranUpserter.save()` 完成後呼叫 `callback(rows, result)`，用於效能量測
+
+    :param callback: rows 為這次比對的筆數，result 為 UpsertResult
+    """
+
+    with _listeners_lock:
+        _listeners.append(callback)
+    try:
+        yield
+    finally:
+        with _listeners_lock:
+            _listeners.remove(callback)
+
+
+class DailyTranUpserter:
+    """
+    日交易(DailyTran)批次寫入工具，所有 builder 共用
+
+    先將一批資料以 COPY 寫入暫存表，再以固定數量的 SQL 完成比對與寫入:
+        1. 刪除 `delete_scope` 範圍內、但這批資料中已不存在的資料(選用)
+        2. 僅更新不新增的資料，以 UPDATE ... FROM 更新既有資料
+        3. 其餘資料以 INSERT ... ON CONFLICT (product_id, source_id, date) DO UPDATE 新增或更新
+        4. 有異動時，重新計算這批資料與被刪除資料所屬 (品項, 來源, 年度) 的 `CompletenessProfile` 筆數，
+           以及所屬 (品項, 來源, 日期) 的 `DailyAggregate` 部分合計
+
+    `not_updated < 0` 代表資料為人工修改，不會被更新或刪除；價格沒有異動的資料也不會被寫入。
+
+    使用方式:
+        upserter = DailyTranUpserter(update_fields=['avg_price', 'volume'], logger=..., logger_extra=...)
+        upserter.add(DailyTran(product=product, source=source, avg_price=..., date=...))
+        upserter.save(delete_scope=DailyTran.objects.filter(date=date, product__config=config))
+    """
+
+    TABLE = DailyTran._meta.db_table
+    STAGE_TABLE = '_dailytran_stage'
+    PROFILE_TABLE = CompletenessProfile._meta.db_table
+    AGGREGATE_TABLE = DailyAggregate._meta.db_table
+    KEYS_TABLE = '_dailytran_touched_keys'
+    PRICE_FIELDS = ('up_price', 'mid_price', 'low_price', 'avg_price', 'avg_weight', 'volume')
+    KEY_FIELDS = ('product_id', 'source_id', 'date')
+    STAGE_COLUMNS = ('seq', 'insertable') + KEY_FIELDS + PRICE_FIELDS
+
+    def __init__(self, update_fields=('avg_price',), logger=None, logger_extra=None, using='default'):
+        """
+        Args:
+            update_fields: 資料已存在時要更新的欄位
+            logger: logger 名稱或 Logger 物件，預設為 'aprp'
+            logger_extra: 寫入 log 時的 extra 資訊，通常為 builder 的 LOGGER_EXTRA
+            using: 資料庫別名
+        """
+
+        unknown_fields = set(update_fields) - set(self.PRICE_FIELDS)
+        if unknown_fields:
+            raise NotImplementedError(f'Update fields {unknown_fields} are not supported')
+
+        self.update_fields = list(update_fields)
+        self.LOGGER = logger if isinstance(logger, logging.Logger) else logging.getLogger(logger or 'aprp')
+        self.LOGGER_EXTRA = logger_extra or {}
+        self.using = using
+        self.__rows = []
+
+    def __len__(self):
+        return len(self.__rows)
+
+    @staticmethod
+    def _clean(value):
+        # pandas 的 NaN 視為 NULL
+        return None if value is None or value != value else value
+
+    def add(self, tran: DailyTran, insert=True):
+        """
+        加入一筆待寫入的資料，同一個 (品項, 來源, 日期) 加入多次時以最後一筆為準
+
+        Args:
+            tran: 尚未儲存的 DailyTran 物件
+            insert: 資料庫中沒有此筆資料時是否新增，False 則只更新既有資料
+        """
+
+        self.__rows.append(
+            (len(self.__rows), insert, tran.product_id, tran.source_id, tran.date)
+            + tuple(self._clean(getattr(tran, field)) for field in self.PRICE_FIELDS)
+        )
+
+    def extend(self, trans, insert=True):
+        for tran in trans:
+            self.add(tran, insert=insert)
+
+    def add_frame(self, df: pd.DataFrame, insert=True):
+        """
+        以 DataFrame 加入資料，須包含 product_id 與 date 欄位，source_id 與價格欄位可省略
+
+        Args:
+            df: 待寫入的資料
+            insert: 資料庫中沒有此筆資料時是否新增，False 則只更新既有資料
+        """
+
+        columns = [c for c in ('source_id',) + self.PRICE_FIELDS if c in df.columns]
+        for row in df[['product_id', 'date'] + columns].itertuples(index=False):
+            values = row._asdict()
+            source_id = values.pop('source_id', None)
+            self.add(
+                DailyTran(
+                    product_id=int(values.pop('product_id')),
+                    source_id=None if self._clean(source_id) is None else int(source_id),
+                    **{key: self._clean(value) for key, value in values.items()}
+                ),
+                insert=insert,
+            )
+
+    def clear(self):
+        self.__rows.clear()
+
+    def save(self, delete_scope=None) -> UpsertResult:
+        """
+        將暫存的資料寫入資料庫，寫入後清空暫存
+
+        Args:
+            delete_scope: DailyTran QuerySet，範圍內不在這批資料中的資料會被刪除；
+                          這批資料為空時不做任何刪除，避免 API 異常時誤刪資料
+
+        Returns:
+            UpsertResult: 新增、更新與刪除的筆數
+        """
+
+        if not self.__rows:
+            return UpsertResult()
+
+        connection = connections[self.using]
+        if connection.vendor != 'postgresql':
+            raise NotImplementedError('DailyTranUpserter only supports PostgreSQL')
+
+        with transaction.atomic(using=self.using), connection.cursor() as cursor:
+            self._stage(cursor)
+
+            deleted_rows = self._delete_missing(cursor, delete_scope) if delete_scope is not None else []
+            deleted = len(deleted_rows)
+            updated = self._update_only(cursor) if not all(row[1] for row in self.__rows) else 0
+
+            inserted = 0
+            for has_source in (True, False):
+                rows_inserted, rows_updated = self._upsert(cursor, has_source)
+                inserted += rows_inserted
+                updated += rows_updated
+
+            if inserted or updated or deleted:
+                self._touch_keys(cursor, deleted_rows)
+                self._refresh_profiles(cursor)
+                self._refresh_aggregates(cursor)
+
+        rows = len(self.__rows)
+        self.clear()
+        result = UpsertResult(inserted=inserted, updated=updated, deleted=deleted)
+        for callback in list(_listeners):
+            callback(rows, result)
+
+        if any(result):
+            self.LOGGER.info(
+                f'DailyTran inserted: {inserted}, updated: {updated}, deleted: {deleted}', extra=self.LOGGER_EXTRA
+            )
+
+        return result
+
+    def _stage(self, cursor):
+        """建立暫存表並以 COPY 寫入，同一個 (品項, 來源, 日期) 只保留最後加入的一筆"""
+
+        price_columns = ', '.join(f'{field} double precision' for field in self.PRICE_FIELDS)
+
+        # 在外層交易中(e.g. 測試)多次呼叫 save() 時，前一次的暫存表尚未因 commit 而被刪除
+        cursor.execute(f'DROP TABLE IF EXISTS {self.STAGE_TABLE}')
+        cursor.execute(
+            f'CREATE TEMP TABLE {self.STAGE_TABLE} (seq integer, insertable boolean, product_id integer, '
+            f'source_id integer, date date, {price_columns}) ON COMMIT DROP'
+        )
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in self.__rows:
+            writer.writerow(['' if value is None else value for value in row])
+        buffer.seek(0)
+        cursor.copy_expert(
+            f'COPY {self.STAGE_TABLE} ({", ".join(self.STAGE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)', buffer
+        )
+
+        cursor.execute(
+            f'DELETE FROM {self.STAGE_TABLE} s USING {self.STAGE_TABLE} newer '
+            f'WHERE {self._match_key("s", "newer")} AND newer.seq > s.seq'
+        )
+
+    @staticmethod
+    def _match_key(left, right):
+        return (
+            f'{left}.product_id = {right}.product_id AND {left}.date = {right}.date '
+            f'AND {left}.source_id IS NOT DISTINCT FROM {right}.source_id'
+        )
+
+    @staticmethod
+    def _match_year(left, right):
+        """left 為日交易資料，right 為 (product_id, source_id, year)"""
+
+        return (
+            f'{left}.product_id = {right}.product_id AND {left}.source_id IS NOT DISTINCT FROM {right}.source_id '
+            f'AND {left}.date >= make_date({right}.year, 1, 1) AND {left}.date < make_date({right}.year + 1, 1, 1)'
+        )
+
+    def _changed(self, left, right):
+        fields = ', '.join(f'{left}.{field}' for field in self.update_fields)
+        new_fields = ', '.join(f'{right}.{field}' for field in self.update_fields)
+
+        return f'({fields}) IS DISTINCT FROM ({new_fields})'
+
+    def _delete_missing(self, cursor, delete_scope):
+        scope_sql, scope_params = delete_scope.values('id').query.sql_with_params()
+        cursor.execute(
+            f'DELETE FROM {self.TABLE} t WHERE t.id IN ({scope_sql}) AND t.not_updated >= 0 '
+            f'AND NOT EXISTS (SELECT 1 FROM {self.STAGE_TABLE} s WHERE {self._match_key("s", "t")}) '
+            f'RETURNING t.product_id, t.source_id, t.date, t.avg_price',
+            scope_params,
+        )
+        rows = cursor.fetchall()
+
+        for product_id, source_id, date, avg_price in rows:
+            self.LOGGER.warning(
+                f'The DailyTran data of the product: {product_id} on {date.strftime("%Y-%m-%d")} '
+                f'from source: {source_id} with\navg_price: {avg_price}\n has been deleted.',
+                extra=self.LOGGER_EXTRA,
+            )
+
+        return rows
+
+    def _update_only(self, cursor):
+        assignments = ', '.join(f'{field} = s.{field}' for field in self.update_fields)
+        cursor.execute(
+            f'UPDATE {self.TABLE} t SET {assignments}, update_time = now() '
+            f'FROM {self.STAGE_TABLE} s '
+            f'WHERE NOT s.insertable AND {self._match_key("t", "s")} '
+            f'AND t.not_updated >= 0 AND {self._changed("t", "s")}'
+        )
+
+        return cursor.rowcount
+
+    def _upsert(self, cursor, has_source):
+        """
+        新增或更新資料，來源為 NULL 的資料使用 (product_id, date) 的 partial unique index 判斷衝突
+
+        分區表無法 `RETURNING xmax`，因此寫入前先計算資料庫中尚不存在的筆數作為新增筆數，
+        其餘受影響的筆數即為更新筆數
+
+        Returns:
+            Tuple[int, int]: 新增與更新的筆數
+        """
+
+        columns = ', '.join(self.KEY_FIELDS + self.PRICE_FIELDS)
+        assignments = ', '.join(f'{field} = EXCLUDED.{field}' for field in self.update_fields)
+        conflict_target = (
+            '(product_id, source_id, date)' if has_source else '(product_id, date) WHERE source_id IS NULL'
+        )
+
+        staged = f'insertable AND source_id IS {"NOT NULL" if has_source else "NULL"}'
+
+        cursor.execute(
+            f'SELECT count(*) FROM {self.STAGE_TABLE} s WHERE {staged} '
+            f'AND NOT EXISTS (SELECT 1 FROM {self.TABLE} t WHERE {self._match_key("t", "s")})'
+        )
+        inserted = cursor.fetchone()[0]
+
+        cursor.execute(
+            f'INSERT INTO {self.TABLE} AS t ({columns}, update_time, create_time, not_updated) '
+            f'SELECT {columns}, now(), now(), 0 FROM {self.STAGE_TABLE} '
+            f'WHERE {staged} '
+            f'ON CONFLICT {conflict_target} DO UPDATE SET {assignments}, update_time = EXCLUDED.update_time '
+            f'WHERE t.not_updated >= 0 AND {self._changed("t", "EXCLUDED")}'
+        )
+
+        return inserted, cursor.rowcount - inserted
+
+    def _touch_keys(self, cursor, deleted_rows):
+        """
+        以這批資料與被刪除的資料建立受影響的 (品項, 來源, 日期) 暫存表
+
+        Args:
+            deleted_rows: `_delete_missing` 回傳的 (product_id, source_id, date, avg_price)
+        """
+
+        keys = self.KEYS_TABLE
+        cursor.execute(f'DROP TABLE IF EXISTS {keys}')
+        cursor.execute(
+            f'CREATE TEMP TABLE {keys} ON COMMIT DROP AS '
+            f'SELECT product_id, source_id, date FROM {self.STAGE_TABLE}'
+        )
+        if deleted_rows:
+            cursor.execute(
+                f'INSERT INTO {keys} SELECT * FROM unnest(%s::integer[], %s::integer[], %s::date[]) '
+                f'AS d (product_id, source_id, date) '
+                f'WHERE NOT EXISTS (SELECT 1 FROM {keys} k WHERE {self._match_key("k", "d")})',
+                [[row[0] for row in deleted_rows], [row[1] for row in deleted_rows],
+                 [row[2] for row in deleted_rows]],
+            )
+
+    def _refresh_profiles(self, cursor):
+        """以日交易資料重新計算受影響的 (品項, 來源, 年度) 筆數，範圍內已沒有資料的組合會被刪除"""
+
+        years = (
+            f'(SELECT DISTINCT product_id, source_id, EXTRACT(YEAR FROM date)::integer AS year '
+            f'FROM {self.KEYS_TABLE})'
+        )
+        match = self._match_year('t', 'k')
+        for has_source in (True, False):
+            conflict_target = (
+                '(product_id, source_id, year)' if has_source else '(product_id, year) WHERE source_id IS NULL'
+            )
+            cursor.execute(
+                f'INSERT INTO {self.PROFILE_TABLE} AS p '
+                f'(product_id, source_id, year, rows, volume_rows, weight_rows, update_time) '
+                f'SELECT k.product_id, k.source_id, k.year, COUNT(*), COUNT(t.volume), COUNT(t.avg_weight), now() '
+                f'FROM {years} k JOIN {self.TABLE} t ON {match} '
+                f'WHERE k.source_id IS {"NOT NULL" if has_source else "NULL"} '
+                f'GROUP BY k.product_id, k.source_id, k.year '
+                f'ON CONFLICT {conflict_target} DO UPDATE SET rows = EXCLUDED.rows, '
+                f'volume_rows = EXCLUDED.volume_rows, weight_rows = EXCLUDED.weight_rows, update_time = now()'
+            )
+
+        cursor.execute(
+            f'DELETE FROM {self.PROFILE_TABLE} p USING {years} k '
+            f'WHERE p.product_id = k.product_id AND p.source_id IS NOT DISTINCT FROM k.source_id AND p.year = k.year '
+            f'AND NOT EXISTS (SELECT 1 FROM {self.TABLE} t WHERE {match})'
+        )
+
+    def _refresh_aggregates(self, cursor):
+        """以日交易資料重新計算受影響的 (品項, 來源, 日期) 部分合計，已沒有資料的組合會被刪除"""
+
+        columns = DailyAggregate.SQL_COLUMNS
+        assignments = ', '.join(f'{column} = EXCLUDED.{column}' for column in columns[4:])
+        for has_source in (True, False):
+            conflict_target = (
+                '(product_id, source_id, date)' if has_source else '(product_id, date) WHERE source_id IS NULL'
+            )
+            cursor.execute(
+                f'INSERT INTO {self.AGGREGATE_TABLE} ({", ".join(columns)}) '
+                f'SELECT {DailyAggregate.SQL_SELECT} FROM {self.KEYS_TABLE} k '
+                f'JOIN {self.TABLE} t ON {self._match_key("t", "k")} '
+                f'JOIN {AbstractProduct._meta.db_table} p ON p.id = t.product_id '
+                f'WHERE k.source_id IS {"NOT NULL" if has_source else "NULL"} '
+                f'ON CONFLICT {conflict_target} DO UPDATE SET type_id = EXCLUDED.type_id, {assignments}'
+            )
+
+        cursor.execute(
+            f'DELETE FROM {self.AGGREGATE_TABLE} a USING {self.KEYS_TABLE} k '
+            f'WHERE {self._match_key("a", "k")} '
+            f'AND NOT EXISTS (SELECT 1 FROM {self.TABLE} t WHERE {self._match_key("t", "k")})'
+        )
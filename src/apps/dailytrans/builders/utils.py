@@ -6,6 +6,11 @@ from functools import wraps
 
 from django.utils import timezone
 
+from apps.dailytrans.codec import format_date, parse_date
+from .archive import is_replaying, replaying
+from .fingerprint import forced, is_forced
+from .resilience import CircuitOpenError, defer
+
 
 db_logger = logging.getLogger('aprp')
 
@@ -19,55 +24,10 @@ def date_transfer(sep=None, string=None, date=None, roc_format=False, zfill=None
         if zfill is None or not isinstance(date, datetime.date):
             raise NotImplementedError
     if string:
-        if sep == '':
-
-            if roc_format:
-                if len(string) < 7:
-                    raise OverflowError
-                year = string[0:3]
-                month = string[3:5]
-                day = string[5:7]
-            else:
-                if len(string) < 8:
-                    raise OverflowError
-                year = string[0:4]
-                month = string[4:6]
-                day = string[6:8]
-
-        else:
-            year, month, day = string.split(sep)
-        try:
-            year = int(year)
-            month = int(month)
-            day = int(day)
-        except TypeError:
-            raise TypeError
-
-        if roc_format:
-            year += 1911
-
-        return datetime.date(year=year, month=month, day=day)
+        return parse_date(string, sep, roc_format=roc_format)
 
     if date:
-        year = date.year
-        month = date.month
-        day = date.day
-
-        if roc_format:
-            year = date.year - 1911
-
-        if year < 0:
-            raise OverflowError
-
-        year = str(year)
-        month = str(month)
-        day = str(day)
-
-        if zfill:
-            month = month.zfill(2)
-            day = day.zfill(2)
-
-        return sep.join((year, month, day))
+        return format_date(date, sep, roc_format=roc_format, zfill=zfill)
 
 
 def date_delta(delta):
@@ -139,7 +99,8 @@ def director(func):
     """
 
     @wraps(func)
-    def interface(start_date=None, end_date=None, format=None, delta=None, **kwargs):
+    def interface(start_date=None, end_date=None, format=None, delta=None, force=False, replay=False, plan=None,
+                  **kwargs):
         """
         於 `func` 前後做一些操作，並回傳 DirectResult
 
@@ -147,6 +108,9 @@ def director(func):
         :param end_date: 結束日期，datetime.date 或 str
         :param format: str，日期格式，前兩個參數如果為字串則做對應格式轉換('%Y-%m-%d'、'%Y.%m.%d' '%Y/%m/%d' etc.)
         :param delta: int，日期區間，計算起始點為當日，往前 delta 天
+        :param force: bool，忽略回應內容的指紋，即使回應與上一次相同也重新比對寫入(手動執行時使用)
+        :param replay: bool，不連線，以 DAILYTRAN_BUILDER_ARCHIVE 封存的原始回應重新匯入(修正品項或來源對照後回補歷史資料)
+        :param plan: FetchPlan，依計畫中的連續日期區間逐段執行 func，不可與日期參數同時傳入
         :param kwargs: code, name(產品代碼、名稱，目前很少使用，並且只有手動執行時才會傳入)
         :return: DirectResult
         """
@@ -154,6 +118,14 @@ def director(func):
         code = kwargs.get('code')
         name = kwargs.get('name')
 
+        # 依抓取計畫執行時，日期區間由計畫決定
+        if plan is not None:
+            if start_date or end_date or delta:
+                raise NotImplementedError
+            if not plan:
+                return DirectResult(None, None, success=True, msg='No dates to fetch')
+            start_date, end_date = plan.start_date, plan.end_date
+
         # 起始日期與結束日期若傳入任一，則另一個也必須傳入
         if start_date and not end_date:
             raise NotImplementedError
@@ -191,11 +163,23 @@ def director(func):
             start_time = timezone.now()
 
             # main point: 執行 func 並取得回傳值
-            data = func(start_date, end_date, **kwargs)
+            # 重播時回應必定與封存相同，需忽略指紋才會重新比對；
+            # 組合的 director(e.g. crops 的 direct)呼叫內層 director 時不會傳入旗標，沿用外層的狀態
+            replay = replay or is_replaying()
+            with forced(force or replay or is_forced()), replaying(replay):
+                if plan is not None:
+                    for window_start, window_end in plan.windows:
+                        data = func(window_start, window_end, **kwargs)
+                else:
+                    data = func(start_date, end_date, **kwargs)
 
             end_time = timezone.now()
             duration = end_time - start_time
 
+            # func 已自行彙整結果(e.g. orchestrator)
+            if isinstance(data, DirectResult):
+                return data
+
             # TODO: 針對 DailyTran 的 not_updated 欄位進行更新，目前看不出用途，並且資料庫開銷很大，若不影響其他功能，建議移除
             # if isinstance(data, DirectData):
             #     # update not_updated count
@@ -231,6 +215,18 @@ def director(func):
 
             return DirectResult(start_date, end_date, duration=duration, success=True)
 
+        except CircuitOpenError as e:
+            # API 已知無法連線，不再等待重試，將整個日期區間排入佇列，由 `RetryDeferredBuilds` 稍後重新執行
+            defer(
+                f'{func.__module__}.{func.__name__}', start_date, end_date, api_name=e.api_name,
+                **{key: value for key, value in kwargs.items() if key in ('code', 'name')}
+            )
+            db_logger.warning(
+                f'{e}, defer {func.__module__}.{func.__name__} from {start_date} to {end_date}',
+                extra={'type_code': 'LOT-dailytrans'},
+            )
+            return DirectResult(start_date, end_date, success=False, msg=e)
+
         except Exception as e:
             logging.exception('msg')
             db_logger.exception(e)
@@ -0,0 +1,152 @@
+"""
+民國/西元日期的轉換
+
+API 回傳的日期格式不一，e.g. '1130215'(eir032)、'113.02.15'(eir030)、'113/2/15'、'2024/11/5'(apis)，
+原本各 builder 以 `apply` 逐筆 strptime 轉換。此模組提供:
+    - `to_datetime`/`to_dates`: 一次轉換整個 Series，以 str.extract 拆出年月日後交由 pd.to_datetime 組合
+    - `from_datetime`: 將整個 Series 轉換回民國或西元日期字串
+    - `parse_date`/`format_date`: 單筆轉換，供 `date_transfer` 與報表使用，相同字串只解析一次
+    - `PERIOD_DAYS`/`period_day`: 旬價(上旬/中旬/下旬)對應的日期
+
+效能比較請執行 `python manage.py benchmark_date_codec`
+"""
+import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+ROC_YEAR_OFFSET = 1911
+
+# 旬價以該旬的代表日作為交易日期
+PERIOD_DAYS = {
+    '上旬': 5,
+    '中旬': 15,
+    '下旬': 25,
+}
+
+# 年份位數不定，有分隔符號時月、日可為一或兩位數，無分隔符號時月、日固定兩位數
+DATE_PATTERN = (
+    r'^(?P<year>\d+?)'
+    r'(?:[./-](?P<month>\d{1,2})[./-](?P<day>\d{1,2})|(?P<compact_month>\d{2})(?P<compact_day>\d{2}))$'
+)
+
+
+def to_datetime(values, roc_format=True):
+    """
+    將日期字串轉換為 datetime64，無法解析的值為 NaT
+
+    :param values: Series 或 list，元素為 '1130215'、'113.02.15'、'113/2/15' 等格式的字串或整數
+    :param roc_format: 年份是否為民國年
+    :return: Series[datetime64[ns]]，index 與 values 相同
+    """
+
+    values = values if isinstance(values, pd.Series) else pd.Series(values)
+    if values.empty:
+        return pd.Series([], index=values.index, dtype='datetime64[ns]')
+
+    parts = values.astype(str).str.strip().str.extract(DATE_PATTERN, expand=True)
+    year = pd.to_numeric(parts['year'], errors='coerce')
+    if roc_format:
+        year = year + ROC_YEAR_OFFSET
+
+    return pd.to_datetime(
+        pd.DataFrame({
+            'year': year,
+            'month': pd.to_numeric(parts['month'].fillna(parts['compact_month']), errors='coerce'),
+            'day': pd.to_numeric(parts['day'].fillna(parts['compact_day']), errors='coerce'),
+        }),
+        errors='coerce',
+    )
+
+
+def to_dates(values, roc_format=True):
+    """同 `to_datetime`，元素為 datetime.date(NaT 為 None)，供 DailyTran 的 date 欄位使用"""
+
+    dates = to_datetime(values, roc_format=roc_format)
+    return pd.Series(
+        np.where(dates.isna(), None, dates.dt.date),
+        index=dates.index,
+        dtype=object,
+    )
+
+
+def from_datetime(dates, sep='.', roc_format=True, zfill=True):
+    """
+    將日期轉換為字串，e.g. sep='.' 時為 '113.02.15'，zfill=False 時為 '113.2.15'，NaT 為 NaN
+
+    :param dates: Series 或 list，元素為 datetime64、datetime.date 或可由 pd.to_datetime 解析的值
+    """
+
+    dates = pd.to_datetime(dates if isinstance(dates, pd.Series) else pd.Series(dates))
+    year = dates.dt.year - ROC_YEAR_OFFSET if roc_format else dates.dt.year
+    month = dates.dt.month
+    day = dates.dt.day
+
+    def to_str(series, width=0):
+        # NaT 的欄位為 NaN，先補 0 再轉為整數，最後以 where 還原
+        series = series.fillna(0).astype(int).astype(str)
+        return series.str.zfill(width) if width else series
+
+    width = 2 if zfill else 0
+    return (to_str(year) + sep + to_str(month, width) + sep + to_str(day, width)).where(dates.notna())
+
+
+@lru_cache(maxsize=4096)
+def parse_date(string, sep, roc_format=False):
+    """
+    單筆日期字串轉換為 datetime.date，同一次回應中的日期重複率高，以 lru_cache 避免重複解析
+
+    :param sep: 分隔符號，'' 代表無分隔符號，年份為固定的 3(民國)或 4(西元)位數
+    :raise OverflowError: 無分隔符號且字串長度不足
+    """
+
+    if sep == '':
+        year_length = 3 if roc_format else 4
+        if len(string) < year_length + 4:
+            raise OverflowError
+        year = string[:year_length]
+        month = string[year_length:year_length + 2]
+        day = string[year_length + 2:year_length + 4]
+    else:
+        year, month, day = string.split(sep)
+
+    year = int(year)
+    if roc_format:
+        year += ROC_YEAR_OFFSET
+
+    return datetime.date(year=year, month=int(month), day=int(day))
+
+
+def format_date(date, sep, roc_format=False, zfill=True):
+    """
+    datetime.date 轉換為日期字串
+
+    :raise OverflowError: 民國前的日期
+    """
+
+    year = date.year - ROC_YEAR_OFFSET if roc_format else date.year
+    if year < 0:
+        raise OverflowError
+
+    month, day = str(date.month), str(date.day)
+    if zfill:
+        month, day = month.zfill(2), day.zfill(2)
+
+    return sep.join((str(year), month, day))
+
+
+def period_day(period, default=None):
+    """
+    旬價的期間名稱轉換為日，e.g. '上旬' -> 5、'11月中旬' -> 15
+
+    :param default: 無法對應時回傳的值
+    """
+
+    if period:
+        for name, day in PERIOD_DAYS.items():
+            if name in period:
+                return day
+
+    return default
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# 儀表板、報表與 builder 比對皆以 (product_id, date[, source_id]) 查詢並讀取價格、重量、交易量，
+# 建立涵蓋索引讓查詢可走 index-only scan；PostgreSQL 11 以前不支援 INCLUDE，改將欄位納入索引鍵
+COVERING_INDEX = 'dailytrans_dailytran_product_date_source_idx'
+COVERING_INDEX_SQL_INCLUDE = (
+    f'CREATE INDEX IF NOT EXISTS {COVERING_INDEX} ON dailytrans_dailytran '
+    f'(product_id, date, source_id) INCLUDE (avg_price, avg_weight, volume)'
+)
+COVERING_INDEX_SQL = (
+    f'CREATE INDEX IF NOT EXISTS {COVERING_INDEX} ON dailytrans_dailytran '
+    f'(product_id, date, source_id, avg_price, avg_weight, volume)'
+)
+
+# 資料依日期陸續寫入，date 與實體儲存順序高度相關，BRIN 索引體積極小，適合大範圍日期掃描
+BRIN_INDEX = 'dailytrans_dailytran_date_brin'
+BRIN_INDEX_SQL = f'CREATE INDEX IF NOT EXISTS {BRIN_INDEX} ON dailytrans_dailytran USING brin (date)'
+
+
+def create_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+
+    if connection.pg_version >= 110000:
+        schema_editor.execute(COVERING_INDEX_SQL_INCLUDE)
+    else:
+        schema_editor.execute(COVERING_INDEX_SQL)
+
+    schema_editor.execute(BRIN_INDEX_SQL)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(f'DROP INDEX IF EXISTS {COVERING_INDEX}')
+    schema_editor.execute(f'DROP INDEX IF EXISTS {BRIN_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dailytrans', '0009_festivalreport_file_volume_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+
+from django.db import migrations
+
+# 將 dailytrans_dailytran 轉為以 date 逐年 range partition 的資料表:
+#   1. 原資料表更名為 legacy
+#   2. 以相同欄位建立 partitioned 母表，並建立各年度子表與 default 子表
+#   3. 搬移資料，將 id sequence 改掛在新母表後刪除 legacy
+#   4. 重建 primary key (需包含分區鍵 date)、foreign key 與索引
+# 資料搬移在同一個交易中進行，資料量大時請於維護時段執行。
+# PostgreSQL 11 以前不支援 partitioned index 與 primary key，維持原本的一般資料表。
+
+TABLE = 'dailytrans_dailytran'
+LEGACY_TABLE = f'{TABLE}_legacy'
+SEQUENCE = f'{TABLE}_id_seq'
+START_YEAR = 2011
+MIN_PG_VERSION = 110000
+
+
+def add_constraints_and_indexes(schema_editor, primary_key):
+    execute = schema_editor.execute
+    execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY ({primary_key})')
+    execute(
+        f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_product_id_fk FOREIGN KEY (product_id) '
+        f'REFERENCES configs_abstractproduct (id) DEFERRABLE INITIALLY DEFERRED'
+    )
+    execute(
+        f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_source_id_fk FOREIGN KEY (source_id) '
+        f'REFERENCES configs_source (id) DEFERRABLE INITIALLY DEFERRED'
+    )
+    execute(f'CREATE INDEX {TABLE}_product_id_idx ON {TABLE} (product_id)')
+    execute(f'CREATE INDEX {TABLE}_source_id_idx ON {TABLE} (source_id)')
+    # 0010_dailytran_indexes 建立的索引
+    execute(
+        f'CREATE INDEX {TABLE}_product_date_source_idx ON {TABLE} '
+        f'(product_id, date, source_id) INCLUDE (avg_price, avg_weight, volume)'
+    )
+    execute(f'CREATE INDEX {TABLE}_date_brin ON {TABLE} USING brin (date)')
+
+
+def partition_table(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql' or connection.pg_version < MIN_PG_VERSION:
+        return
+
+    execute = schema_editor.execute
+    execute(f'ALTER TABLE {TABLE} RENAME TO {LEGACY_TABLE}')
+    execute(f'CREATE TABLE {TABLE} (LIKE {LEGACY_TABLE} INCLUDING DEFAULTS) PARTITION BY RANGE (date)')
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN(date), MAX(date) FROM {LEGACY_TABLE}')
+        min_date, max_date = cursor.fetchone()
+
+    # 建立 START_YEAR 至明年的年度子表，既有資料超出此範圍時一併涵蓋
+    next_year = datetime.date.today().year + 1
+    start_year = min(START_YEAR, min_date.year) if min_date else START_YEAR
+    end_year = max(next_year, max_date.year) if max_date else next_year
+    for year in range(start_year, end_year + 1):
+        execute(
+            f"CREATE TABLE {TABLE}_y{year} PARTITION OF {TABLE} "
+            f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+        )
+    execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+
+    execute(f'INSERT INTO {TABLE} SELECT * FROM {LEGACY_TABLE}')
+    execute(f'ALTER SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id')
+    execute(f'DROP TABLE {LEGACY_TABLE}')
+
+    add_constraints_and_indexes(schema_editor, 'id, date')
+    execute(f'ANALYZE {TABLE}')
+
+
+def unpartition_table(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql' or connection.pg_version < MIN_PG_VERSION:
+        return
+
+    execute = schema_editor.execute
+    execute(f'ALTER TABLE {TABLE} RENAME TO {LEGACY_TABLE}')
+    execute(f'CREATE TABLE {TABLE} (LIKE {LEGACY_TABLE} INCLUDING DEFAULTS)')
+    execute(f'INSERT INTO {TABLE} SELECT * FROM {LEGACY_TABLE}')
+    execute(f'ALTER SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id')
+    execute(f'DROP TABLE {LEGACY_TABLE} CASCADE')
+
+    add_constraints_and_indexes(schema_editor, 'id')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dailytrans', '0010_dailytran_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_table, unpartition_table),
+    ]
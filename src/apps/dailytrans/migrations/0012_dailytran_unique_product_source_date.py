@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# 每個 (品項, 來源, 日期) 只允許一筆日交易資料，讓 builder 可以使用 INSERT ... ON CONFLICT 批次寫入
+# 來源為 NULL 的資料(飼料、產地價等)在一般 unique index 中不會互相衝突，另以 partial unique index 限制 (品項, 日期)
+TABLE = 'dailytrans_dailytran'
+UNIQUE_INDEX = f'{TABLE}_product_source_date_uniq'
+UNIQUE_NULL_SOURCE_INDEX = f'{TABLE}_product_date_null_source_uniq'
+
+# 建立限制前先移除重複資料，保留順序: 手動修改(not_updated < 0) > 最近更新 > 最新建立
+DELETE_DUPLICATES_SQL = f"""
+    DELETE FROM {TABLE} t
+    USING (
+        SELECT id, row_number() OVER (
+            PARTITION BY product_id, source_id, date
+            ORDER BY (not_updated < 0) DESC, update_time DESC NULLS LAST, id DESC
+        ) AS rn
+        FROM {TABLE}
+    ) d
+    WHERE t.id = d.id AND d.rn > 1
+"""
+
+
+def add_unique_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(DELETE_DUPLICATES_SQL)
+    schema_editor.execute(f'CREATE UNIQUE INDEX {UNIQUE_INDEX} ON {TABLE} (product_id, source_id, date)')
+    schema_editor.execute(
+        f'CREATE UNIQUE INDEX {UNIQUE_NULL_SOURCE_INDEX} ON {TABLE} (product_id, date) WHERE source_id IS NULL'
+    )
+
+
+def drop_unique_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(f'DROP INDEX IF EXISTS {UNIQUE_INDEX}')
+    schema_editor.execute(f'DROP INDEX IF EXISTS {UNIQUE_NULL_SOURCE_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dailytrans', '0011_partition_dailytran_by_year'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_unique_indexes, drop_unique_indexes),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configs', '0012_auto_20230105_0945'),
+        ('dailytrans', '0012_dailytran_unique_product_source_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionWatermark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('api_name', models.CharField(max_length=50, verbose_name='API Name')),
+                ('complete_date', models.DateField(verbose_name='Complete Date')),
+                ('update_time', models.DateTimeField(auto_now=True, null=True, verbose_name='Updated')),
+                ('config', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='configs.Config', verbose_name='Config')),
+                ('source', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='configs.Source', verbose_name='Source')),
+                ('type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='configs.Type', verbose_name='Type')),
+            ],
+            options={
+                'verbose_name': 'Ingestion Watermark',
+                'verbose_name_plural': 'Ingestion Watermarks',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='ingestionwatermark',
+            unique_together=set([('api_name', 'config', 'type', 'source')]),
+        ),
+    ]
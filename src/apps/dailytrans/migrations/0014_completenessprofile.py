@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# 來源為 NULL 的資料在 unique_together 中不會互相衝突，另以 partial unique index 限制 (品項, 年度)，
+# 讓 DailyTranUpserter 可以使用 INSERT ... ON CONFLICT 更新筆數
+TABLE = 'dailytrans_completenessprofile'
+UNIQUE_NULL_SOURCE_INDEX = f'{TABLE}_product_year_null_source_uniq'
+
+
+def add_null_source_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(
+        f'CREATE UNIQUE INDEX {UNIQUE_NULL_SOURCE_INDEX} ON {TABLE} (product_id, year) WHERE source_id IS NULL'
+    )
+
+
+def drop_null_source_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(f'DROP INDEX IF EXISTS {UNIQUE_NULL_SOURCE_INDEX}')
+
+
+def build_profiles(apps, schema_editor):
+    """以既有的日交易資料建立每個 (品項, 來源, 年度) 的筆數，每個年度一個查詢"""
+
+    DailyTran = apps.get_model('dailytrans', 'DailyTran')
+    CompletenessProfile = apps.get_model('dailytrans', 'CompletenessProfile')
+
+    for date in DailyTran.objects.dates('date', 'year'):
+        counts = (
+            DailyTran.objects.filter(date__year=date.year)
+            .order_by()
+            .values('product_id', 'source_id')
+            .annotate(
+                rows=models.Count('id'),
+                volume_rows=models.Count('volume'),
+                weight_rows=models.Count('avg_weight'),
+            )
+        )
+        CompletenessProfile.objects.bulk_create(CompletenessProfile(year=date.year, **row) for row in counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configs', '0012_auto_20230105_0945'),
+        ('dailytrans', '0013_ingestionwatermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompletenessProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField(verbose_name='Year')),
+                ('rows', models.IntegerField(default=0, verbose_name='Rows')),
+                ('volume_rows', models.IntegerField(default=0, verbose_name='Rows With Volume')),
+                ('weight_rows', models.IntegerField(default=0, verbose_name='Rows With Weight')),
+                ('update_time', models.DateTimeField(auto_now=True, null=True, verbose_name='Updated')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='configs.AbstractProduct', verbose_name='Product')),
+                ('source', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='configs.Source', verbose_name='Source')),
+            ],
+            options={
+                'verbose_name': 'Completeness Profile',
+                'verbose_name_plural': 'Completeness Profiles',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='completenessprofile',
+            unique_together=set([('product', 'source', 'year')]),
+        ),
+        migrations.RunPython(add_null_source_index, drop_null_source_index),
+        migrations.RunPython(build_profiles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# 來源為 NULL 的資料在 unique_together 中不會互相衝突，另以 partial unique index 限制 (品項, 日期)，
+# 讓 DailyTranUpserter 可以使用 INSERT ... ON CONFLICT 更新部分合計
+TABLE = 'dailytrans_dailyaggregate'
+UNIQUE_NULL_SOURCE_INDEX = f'{TABLE}_product_date_null_source_uniq'
+
+# 同 DailyAggregate.SQL_SELECT
+BUILD_SQL = f"""
+    INSERT INTO {TABLE} (product_id, type_id, source_id, date, rows, volume_rows, weight_rows,
+                         total_price, total_weight, total_volume, sum_volume, positive, update_time)
+    SELECT t.product_id, p.type_id, t.source_id, t.date, 1,
+           (t.volume IS NOT NULL)::integer, (t.avg_weight IS NOT NULL)::integer,
+           t.avg_price * COALESCE(t.avg_weight, 1) * COALESCE(t.volume, 1),
+           COALESCE(t.avg_weight, 1) * COALESCE(t.volume, 1), COALESCE(t.volume, 1), COALESCE(t.volume, 0),
+           COALESCE(t.volume > 0 AND t.avg_weight > 0, false), now()
+    FROM dailytrans_dailytran t
+    JOIN configs_abstractproduct p ON p.id = t.product_id
+"""
+
+
+def add_null_source_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(
+        f'CREATE UNIQUE INDEX {UNIQUE_NULL_SOURCE_INDEX} ON {TABLE} (product_id, date) WHERE source_id IS NULL'
+    )
+
+
+def drop_null_source_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(f'DROP INDEX IF EXISTS {UNIQUE_NULL_SOURCE_INDEX}')
+
+
+def build_aggregates(apps, schema_editor):
+    """以既有的日交易資料建立部分合計，資料量大時請於維護時段執行"""
+
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute(BUILD_SQL)
+    schema_editor.execute(f'ANALYZE {TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('configs', '0012_auto_20230105_0945'),
+        ('dailytrans', '0014_completenessprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAggregate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('rows', models.IntegerField(default=1, verbose_name='Rows')),
+                ('volume_rows', models.IntegerField(default=0, verbose_name='Rows With Volume')),
+                ('weight_rows', models.IntegerField(default=0, verbose_name='Rows With Weight')),
+                ('total_price', models.FloatField(default=0, verbose_name='Total Price')),
+                ('total_weight', models.FloatField(default=0, verbose_name='Total Weight')),
+                ('total_volume', models.FloatField(default=0, verbose_name='Total Volume')),
+                ('sum_volume', models.FloatField(default=0, verbose_name='Sum Volume')),
+                ('positive', models.BooleanField(default=False, verbose_name='Positive Volume And Weight')),
+                ('update_time', models.DateTimeField(auto_now=True, null=True, verbose_name='Updated')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='configs.AbstractProduct', verbose_name='Product')),
+                ('source', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='configs.Source', verbose_name='Source')),
+                ('type', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='configs.Type', verbose_name='Type')),
+            ],
+            options={
+                'verbose_name': 'Daily Aggregate',
+                'verbose_name_plural': 'Daily Aggregates',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyaggregate',
+            unique_together=set([('product', 'source', 'date')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='dailyaggregate',
+            index_together=set([('product', 'date')]),
+        ),
+        migrations.RunPython(add_null_source_index, drop_null_source_index),
+        migrations.RunPython(build_aggregates, migrations.RunPython.noop),
+    ]
@@ -1,29 +1,38 @@
 import calendar
 import datetime
+import threading
+
+from contextlib import contextmanager
 
-from dateutil import rrule
 from typing import Optional, List
 from apps.configs.models import AbstractProduct, Source
 from django.db.models import (
+    BooleanField,
     CASCADE,
     CharField,
+    Count,
     DateField,
     DateTimeField,
     ForeignKey,
     FloatField,
     IntegerField,
     Model,
-    QuerySet
+    Q,
+    QuerySet,
+    SET_NULL,
+    Sum
 )
+from django.apps import apps as django_apps
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
+from apps.dailytrans.series import COMPLETE_RATIO
 
-class DailyTranQuerySet(QuerySet):
-    def update(self, *args, **kwargs):
-        kwargs['update_time'] = timezone.now()
-        super(DailyTranQuerySet, self).update(**kwargs)
-        # 父類別的 update() 只會處理 **kwargs，並不會處理 *args
+
+class MonthDayQuerySet(QuerySet):
+    """有 date 欄位的資料表共用的日期篩選，DailyTran 與 DailyAggregate 皆使用"""
 
     def between_month_day_filter(
             self,
@@ -52,40 +61,102 @@ class DailyTranQuerySet(QuerySet):
         if not start_date or not end_date:
             return self
 
-        date_ranges = []
-        start_year = start_date.year
-        end_year = end_date.year
-
-        # 每跑一次 i 就是 start_year - i 年, end_year - i 年
-        # 如果 start_date 是2月29日 且當前年份 start_year - i 年是閏年，就調整為當年的3月1日
-        # 跳過閏年是為了每年都用同樣的天數來比較
-        for i in range(start_year - 2011 + 1):
-            start_date = (
-                datetime.date(start_year - i, start_date.month + 1, 1)
-                    if (is_leap(start_year - i) and start_date.month == 2 and start_date.day == 29)
-                    else datetime.date(start_year - i, start_date.month, start_date.day)
-            )
+        date_ranges = month_day_ranges(start_date, end_date)
+        if not date_ranges:
+            return self.none()
 
-            end_date = (
-                datetime.date(end_year - i, end_date.month, end_date.day - 1)
-                    if (is_leap(end_year - i) and end_date.month == 2 and end_date.day == 29)
-                    else datetime.date(end_year - i, end_date.month, end_date.day)
-            )
-            # rrule() 會在每天各產生一個日期 ex. 2025-01-01
-            date_range = list(rrule.rrule(rrule.DAILY, dtstart=start_date, until=end_date))
-            date_ranges.extend(date_range)
-        # date__in 為 SQL 的 IN 條件，只選出 date 欄位的值
-        return self.filter(date__in=date_ranges)
+        # 每個年度以一個 BETWEEN 條件表示，再以 OR 串接，取代逐日展開的 date__in 清單
+        condition = Q()
+        for range_start, range_end in date_ranges:
+            condition |= Q(date__range=(range_start, range_end))
+
+        return self.filter(condition)
+
+
+class DailyTranQuerySet(MonthDayQuerySet):
+    def delete(self):
+        """逐筆觸發的 post_delete 延後至刪除完成，筆數與部分合計每組只更新一次，見 `deferred_refresh`"""
+
+        with deferred_refresh():
+            return super(DailyTranQuerySet, self).delete()
+
+    def update(self, *args, **kwargs):
+        kwargs['update_time'] = timezone.now()
+        super(DailyTranQuerySet, self).update(**kwargs)
+        # 父類別的 update() 只會處理 **kwargs，並不會處理 *args
 
     def filter_by_date_lte(self, days: List[datetime.datetime],
                         products: List[AbstractProduct],
-                        sources: Optional[List[Source]] = None) -> List['DailyTran']:
+                        sources: Optional[List[Source]] = None) -> List[Optional['DailyTran']]:
+        """
+        取得每一天(含)以前最近一筆的日交易資料，結果依 days 的順序排列，查無資料的日期為 None
+
+        Args:
+            days: 欲查詢的日期
+            products: 品項
+            sources: 來源，未指定則不限來源
+
+        Returns:
+            List[Optional[DailyTran]]: 與 days 等長的日交易資料
+        """
         qs = (
             self.filter(product__in=products, source__in=sources)
             if sources else self.filter(product__in=products)
         )
-        # date__lte 為 查詢 date 欄位 <= 指定日期
-        return [qs.filter(date__lte=d.date()).order_by('-date').first() for d in days]
+
+        return qs.latest_on_or_before(days)
+
+    def latest_on_or_before(self, days: List[datetime.date], product_ids: Optional[List[int]] = None):
+        """
+        以單一查詢取得 QuerySet 中每一天(含)以前最近一筆的日交易資料
+
+        PostgreSQL 以 VALUES 列出所有日期，再以 LATERAL 子查詢對每一天取 `ORDER BY date DESC LIMIT 1`，
+        可直接使用 (product_id, date) 索引；其他資料庫則逐日查詢。
+
+        Args:
+            days: 欲查詢的日期，可為 datetime 或 date
+            product_ids: 若有指定，則分別取得每個品項在每一天的最近一筆資料
+
+        Returns:
+            未指定 product_ids 時為與 days 等長的 List[Optional[DailyTran]]；
+            指定 product_ids 時為 Dict[int, List[Optional[DailyTran]]]，key 為品項 id
+        """
+        days = [d.date() if isinstance(d, datetime.datetime) else d for d in days]
+
+        if connections[self.db].vendor != 'postgresql':
+            if product_ids is None:
+                return [self.filter(date__lte=d).order_by('-date').first() for d in days]
+
+            return {
+                product_id: [self.filter(product_id=product_id, date__lte=d).order_by('-date').first() for d in days]
+                for product_id in product_ids
+            }
+
+        keys = [None] if product_ids is None else list(product_ids)
+        result = {key: [None] * len(days) for key in keys}
+        if not days or not keys:
+            return result[None] if product_ids is None else result
+
+        values = ', '.join(['(%s::date, %s)'] * len(days))
+        params = [param for i, d in enumerate(days) for param in (d, i)]
+        sql = f'SELECT t.*, v.idx AS day_index FROM (VALUES {values}) AS v(day, idx)'
+
+        # 子查詢以 v.day (與 p.id) 關聯外層，每一組只取日期最近的一筆
+        where = [f'"{self.model._meta.db_table}"."date" <= v.day']
+        if product_ids is not None:
+            sql += ' CROSS JOIN unnest(%s) AS p(id)'
+            params.append(list(product_ids))
+            where.append(f'"{self.model._meta.db_table}"."product_id" = p.id')
+
+        lateral_sql, lateral_params = self.extra(where=where).order_by('-date')[:1].query.sql_with_params()
+        sql += f' CROSS JOIN LATERAL ({lateral_sql}) AS t'
+        params.extend(lateral_params)
+
+        for tran in self.raw(sql, params, using=self.db):
+            key = tran.product_id if product_ids is not None else None
+            result[key][tran.day_index] = tran
+
+        return result[None] if product_ids is None else result
 
 
 class DailyTran(Model):
@@ -119,6 +190,7 @@ class DailyTran(Model):
     objects = DailyTranQuerySet.as_manager()
 
     class Meta:
+        # (product_id, date, source_id) 涵蓋索引與 date BRIN 索引見 migrations/0010_dailytran_indexes.py
         verbose_name = _('Daily Transition')
         verbose_name_plural = _('Daily Transitions')
 
@@ -173,5 +245,391 @@ class FestivalReport(Model):
     def __str__(self):
         return f'{self.festival_id}, {self.file_id}, {self.file_volume_id}'
 
+
+class IngestionWatermark(Model):
+    """
+    builder 每個 (API, 品項分類, 供應階段, 來源) 已確認完整的最後日期，用來計算排程的抓取計畫
+
+    api_name: eir030
+    config: 蔬菜(COG05)
+    type: 批發
+    source: 臺北一
+    complete_date: 2024-11-01
+    update_time: 2024-11-02 08:30:00.000000+00:00
+    """
+    api_name = CharField(max_length=50, verbose_name=_('API Name'))
+    config = ForeignKey('configs.Config', on_delete=CASCADE, verbose_name=_('Config'))
+    type = ForeignKey('configs.Type', on_delete=CASCADE, verbose_name=_('Type'))
+    source = ForeignKey('configs.Source', null=True, blank=True, on_delete=CASCADE, verbose_name=_('Source'))
+    complete_date = DateField(verbose_name=_('Complete Date'))
+    update_time = DateTimeField(auto_now=True, null=True, blank=True, verbose_name=_('Updated'))
+
+    class Meta:
+        unique_together = ('api_name', 'config', 'type', 'source')
+        verbose_name = _('Ingestion Watermark')
+        verbose_name_plural = _('Ingestion Watermarks')
+
+    def __str__(self):
+        return f'{self.api_name}, {self.config}, {self.type}, {self.source}, {self.complete_date}'
+
+
+def month_day_ranges(start_date, end_date):
+    """
+    將同一段月日區間展開為 2011 年起每個年度的日期區間
+
+    Args:
+        start_date: 篩選範圍的起始日期
+        end_date  : 篩選範圍的結束日期
+
+    Returns:
+        List[Tuple[datetime.date, datetime.date]]: 由新到舊每個年度的 (起始日期, 結束日期)，
+                                                    起始日期晚於結束日期的年度不列入
+    """
+    date_ranges = []
+    start_year = start_date.year
+    end_year = end_date.year
+
+    # 每跑一次 i 就是 start_year - i 年, end_year - i 年
+    # 如果 start_date 是2月29日 且當前年份 start_year - i 年是閏年，就調整為當年的3月1日
+    # 跳過閏年是為了每年都用同樣的天數來比較
+    for i in range(start_year - 2011 + 1):
+        start_date = (
+            datetime.date(start_year - i, start_date.month + 1, 1)
+                if (is_leap(start_year - i) and start_date.month == 2 and start_date.day == 29)
+                else datetime.date(start_year - i, start_date.month, start_date.day)
+        )
+
+        end_date = (
+            datetime.date(end_year - i, end_date.month, end_date.day - 1)
+                if (is_leap(end_year - i) and end_date.month == 2 and end_date.day == 29)
+                else datetime.date(end_year - i, end_date.month, end_date.day)
+        )
+
+        if start_date <= end_date:
+            date_ranges.append((start_date, end_date))
+
+    return date_ranges
+
+
 def is_leap(year):
     return calendar.isleap(year)
+
+
+class CompletenessProfileQuerySet(QuerySet):
+    def completeness(self):
+        """
+        以範圍內各 (品項, 來源, 年度) 的筆數判斷是否有交易量與重量，不需掃描日交易資料
+
+        Returns:
+            Tuple[bool, bool]: (has_volume, has_weight)，同 `get_group_by_date_query_set` 的判斷
+        """
+        totals = self.aggregate(rows=Sum('rows'), volume_rows=Sum('volume_rows'), weight_rows=Sum('weight_rows'))
+        rows = totals['rows'] or 0
+
+        return ((totals['volume_rows'] or 0) > COMPLETE_RATIO * rows,
+                (totals['weight_rows'] or 0) > COMPLETE_RATIO * rows)
+
+    def refresh(self, product_id, source_id, year):
+        """以日交易資料重新計算一組 (品項, 來源, 年度) 的筆數，沒有資料時刪除"""
+
+        trans = DailyTran.objects.filter(product_id=product_id, source_id=source_id, date__year=year)
+        counts = trans.aggregate(rows=Count('id'), volume_rows=Count('volume'), weight_rows=Count('avg_weight'))
+
+        profiles = self.filter(product_id=product_id, source_id=source_id, year=year)
+        if not counts['rows']:
+            profiles.delete()
+        elif not profiles.update(update_time=timezone.now(), **counts):
+            self.create(product_id=product_id, source_id=source_id, year=year, **counts)
+
+    def rebuild(self, years=None):
+        """
+        以日交易資料重建指定年度(預設為所有年度)的筆數，每個年度一個查詢
+
+        `DailyTranQuerySet.update()` 等不觸發 signal 的批次操作不會更新筆數，完成後請執行
+        `python manage.py rebuild_completeness_profiles`
+        """
+        if years is None:
+            years = [date.year for date in DailyTran.objects.dates('date', 'year')]
+            self.exclude(year__in=years).delete()
+
+        created = 0
+        for year in years:
+            counts = (
+                DailyTran.objects.filter(date__year=year)
+                .order_by()
+                .values('product_id', 'source_id')
+                .annotate(rows=Count('id'), volume_rows=Count('volume'), weight_rows=Count('avg_weight'))
+            )
+            with transaction.atomic(using=self.db):
+                self.filter(year=year).delete()
+                created += len(self.bulk_create(self.model(year=year, **row) for row in counts))
+
+        return created
+
+
+class CompletenessProfile(Model):
+    """
+    每個 (品項, 來源, 年度) 的日交易筆數，與有交易量、有重量的筆數，
+    用來判斷加權方式(has_volume/has_weight)而不需掃描日交易資料
+
+    由 `DailyTranUpserter.save()` 與 DailyTran 的 post_save/post_delete 更新
+
+    product: 規格豬(65公斤以上)
+    source: 高雄鳳山
+    year: 2024
+    rows: 250
+    volume_rows: 248
+    weight_rows: 248
+    update_time: 2024-11-02 08:30:00.000000+00:00
+    """
+    product = ForeignKey('configs.AbstractProduct', on_delete=CASCADE, verbose_name=_('Product'))
+    source = ForeignKey('configs.Source', null=True, blank=True, on_delete=CASCADE, verbose_name=_('Source'))
+    year = IntegerField(verbose_name=_('Year'))
+    rows = IntegerField(default=0, verbose_name=_('Rows'))
+    volume_rows = IntegerField(default=0, verbose_name=_('Rows With Volume'))
+    weight_rows = IntegerField(default=0, verbose_name=_('Rows With Weight'))
+    update_time = DateTimeField(auto_now=True, null=True, blank=True, verbose_name=_('Updated'))
+
+    objects = CompletenessProfileQuerySet.as_manager()
+
+    class Meta:
+        # 來源為 NULL 的資料另以 (product_id, year) 的 partial unique index 限制，見 migrations/0014
+        unique_together = ('product', 'source', 'year')
+        verbose_name = _('Completeness Profile')
+        verbose_name_plural = _('Completeness Profiles')
+
+    def __str__(self):
+        return f'{self.product}, {self.source}, {self.year}, {self.volume_rows}/{self.weight_rows}/{self.rows}'
+
+
+_local = threading.local()
+
+
+@contextmanager
+def deferred_refresh():
+    """
+    區塊內 DailyTran 的 post_save/post_delete 只記錄異動的 (品項, 來源, 日期)，
+    離開區塊時每組只重新計算一次，避免後台批次刪除等逐筆觸發 signal 的操作每筆都查詢；
+    巢狀使用時由最外層統一更新
+    """
+    if getattr(_local, 'refresh_keys', None) is not None:
+        yield
+        return
+
+    _local.refresh_keys = keys = set()
+    try:
+        yield
+    finally:
+        _local.refresh_keys = None
+
+    for product_id, source_id, year in {(product_id, source_id, date.year) for product_id, source_id, date in keys}:
+        CompletenessProfile.objects.refresh(product_id, source_id, year)
+    for product_id, source_id, date in keys:
+        DailyAggregate.objects.refresh(product_id, source_id, date)
+
+
+def tran_key(instance):
+    """DailyTran 的 (品項, 來源, 日期)，日期可能為尚未轉換的字串"""
+
+    date = instance.date
+    if isinstance(date, str):
+        date = datetime.datetime.strptime(date, '%Y-%m-%d').date()
+    elif isinstance(date, datetime.datetime):
+        date = date.date()
+
+    return instance.product_id, instance.source_id, date
+
+
+def refresh_completeness_profile(sender, instance, **kwargs):
+    """DailyTran 個別儲存或刪除後(e.g. 後台修改)更新筆數，builder 的批次寫入由 `DailyTranUpserter` 處理"""
+
+    product_id, source_id, date = tran_key(instance)
+    keys = getattr(_local, 'refresh_keys', None)
+    if keys is not None:
+        keys.add((product_id, source_id, date))
+        return
+
+    CompletenessProfile.objects.refresh(product_id, source_id, date.year)
+
+
+post_save.connect(refresh_completeness_profile, sender=DailyTran)
+post_delete.connect(refresh_completeness_profile, sender=DailyTran)
+
+
+class DailyAggregateQuerySet(MonthDayQuerySet):
+    def refresh(self, product_id, source_id, date):
+        """以日交易資料重新計算一組 (品項, 來源, 日期) 的部分合計，沒有資料時刪除"""
+
+        tran = (
+            DailyTran.objects.select_related('product')
+            .filter(product_id=product_id, source_id=source_id, date=date)
+            .first()
+        )
+        aggregates = self.filter(product_id=product_id, source_id=source_id, date=date)
+        if tran is None:
+            aggregates.delete()
+        elif not aggregates.update(update_time=timezone.now(), **self.model.partials_of(tran)):
+            self.create(product_id=product_id, source_id=source_id, date=date, **self.model.partials_of(tran))
+
+    def rebuild(self, start_date=None, end_date=None):
+        """
+        刪除日期區間(包含起訖日，未指定則不限)內的部分合計，再以日交易資料重新建立
+
+        PostgreSQL 以單一 INSERT ... SELECT 完成，其他資料庫逐筆計算
+
+        Returns:
+            int: 建立的筆數
+        """
+        dates, where, params = {}, [], []
+        if start_date:
+            dates['date__gte'] = start_date
+            where.append('t.date >= %s')
+            params.append(start_date)
+        if end_date:
+            dates['date__lte'] = end_date
+            where.append('t.date <= %s')
+            params.append(end_date)
+
+        connection = connections[self.db]
+        with transaction.atomic(using=self.db):
+            self.filter(**dates).delete()
+
+            if connection.vendor != 'postgresql':
+                trans = DailyTran.objects.using(self.db).select_related('product').filter(**dates)
+                return len(self.bulk_create(
+                    self.model(product_id=tran.product_id, source_id=tran.source_id, date=tran.date,
+                               **self.model.partials_of(tran))
+                    for tran in trans.iterator()
+                ))
+
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {self.model._meta.db_table} ({", ".join(self.model.SQL_COLUMNS)}) '
+                    f'SELECT {self.model.SQL_SELECT} FROM {DailyTran._meta.db_table} t '
+                    f'JOIN {AbstractProduct._meta.db_table} p ON p.id = t.product_id'
+                    + (f' WHERE {" AND ".join(where)}' if where else ''),
+                    params,
+                )
+                return cursor.rowcount
+
+
+class DailyAggregate(Model):
+    """
+    每個 (品項, 來源, 日期) 的每日加權部分合計，儀表板圖表直接加總，不需掃描日交易資料
+
+    缺失的重量與交易量以 1 代替(同 `get_group_by_date_query_set`):
+        total_price = 價格 x 重量 x 交易量, total_weight = 重量 x 交易量, total_volume = 交易量,
+        sum_volume = 交易量(缺值為 0)
+    rows, volume_rows, weight_rows 為筆數(用於 has_volume/has_weight)，
+    positive 代表交易量與重量皆大於 0(有交易量與重量時只加總這些資料)
+
+    由 `DailyTranUpserter.save()` 與 DailyTran 的 post_save/post_delete 更新，
+    以 `python manage.py rebuild_daily_aggregates` 重建並驗證與日交易資料一致
+
+    product: 規格豬(65公斤以上)
+    type: 批發
+    source: 高雄鳳山
+    date: 2024-11-01
+    total_price: 8131896.0
+    total_weight: 124032.0
+    total_volume: 1024.0
+    sum_volume: 1024.0
+    """
+    product = ForeignKey('configs.AbstractProduct', on_delete=CASCADE, verbose_name=_('Product'))
+    # 同品項的 type，查詢時不需 join 品項資料表
+    type = ForeignKey('configs.Type', null=True, on_delete=SET_NULL, verbose_name=_('Type'))
+    source = ForeignKey('configs.Source', null=True, blank=True, on_delete=CASCADE, verbose_name=_('Source'))
+    date = DateField(verbose_name=_('Date'))
+    rows = IntegerField(default=1, verbose_name=_('Rows'))
+    volume_rows = IntegerField(default=0, verbose_name=_('Rows With Volume'))
+    weight_rows = IntegerField(default=0, verbose_name=_('Rows With Weight'))
+    total_price = FloatField(default=0, verbose_name=_('Total Price'))
+    total_weight = FloatField(default=0, verbose_name=_('Total Weight'))
+    total_volume = FloatField(default=0, verbose_name=_('Total Volume'))
+    sum_volume = FloatField(default=0, verbose_name=_('Sum Volume'))
+    positive = BooleanField(default=False, verbose_name=_('Positive Volume And Weight'))
+    update_time = DateTimeField(auto_now=True, null=True, blank=True, verbose_name=_('Updated'))
+
+    objects = DailyAggregateQuerySet.as_manager()
+
+    # 由日交易資料(t)與品項(p)計算部分合計的 SQL，DailyTranUpserter 與 rebuild 共用
+    SQL_COLUMNS = ('product_id', 'type_id', 'source_id', 'date', 'rows', 'volume_rows', 'weight_rows',
+                   'total_price', 'total_weight', 'total_volume', 'sum_volume', 'positive', 'update_time')
+    SQL_SELECT = (
+        't.product_id, p.type_id, t.source_id, t.date, 1, '
+        '(t.volume IS NOT NULL)::integer, (t.avg_weight IS NOT NULL)::integer, '
+        't.avg_price * COALESCE(t.avg_weight, 1) * COALESCE(t.volume, 1), '
+        'COALESCE(t.avg_weight, 1) * COALESCE(t.volume, 1), COALESCE(t.volume, 1), COALESCE(t.volume, 0), '
+        'COALESCE(t.volume > 0 AND t.avg_weight > 0, false), now()'
+    )
+
+    class Meta:
+        # 來源為 NULL 的資料另以 (product_id, date) 的 partial unique index 限制，見 migrations/0015
+        unique_together = ('product', 'source', 'date')
+        index_together = [('product', 'date')]
+        verbose_name = _('Daily Aggregate')
+        verbose_name_plural = _('Daily Aggregates')
+
+    def __str__(self):
+        return f'{self.product}, {self.source}, {self.date}, {self.total_price}/{self.total_weight}'
+
+    @staticmethod
+    def partials_of(tran):
+        """同 SQL_SELECT，以一筆 DailyTran 計算部分合計(不含品項、來源與日期)"""
+
+        weight = 1 if tran.avg_weight is None else tran.avg_weight
+        volume = 1 if tran.volume is None else tran.volume
+
+        return {
+            'type_id': tran.product.type_id,
+            'rows': 1,
+            'volume_rows': int(tran.volume is not None),
+            'weight_rows': int(tran.avg_weight is not None),
+            'total_price': tran.avg_price * weight * volume,
+            'total_weight': weight * volume,
+            'total_volume': volume,
+            'sum_volume': tran.volume or 0,
+            'positive': bool(tran.volume and tran.volume > 0 and tran.avg_weight and tran.avg_weight > 0),
+        }
+
+
+def refresh_daily_aggregate(sender, instance, **kwargs):
+    """DailyTran 個別儲存或刪除後更新部分合計，builder 的批次寫入由 `DailyTranUpserter` 處理"""
+
+    key = tran_key(instance)
+    keys = getattr(_local, 'refresh_keys', None)
+    if keys is not None:
+        keys.add(key)
+        return
+
+    DailyAggregate.objects.refresh(*key)
+
+
+def update_daily_aggregate_type(sender, instance, created=False, **kwargs):
+    """品項(包含各子類別)的 type 異動時一併更新部分合計"""
+
+    if created:
+        return
+
+    DailyAggregate.objects.filter(product_id=instance.id).exclude(type_id=instance.type_id).update(
+        type_id=instance.type_id
+    )
+
+
+def connect_product_signals():
+    """
+    AbstractProduct 為 multi-table inheritance，post_save 的 sender 為實際儲存的類別(e.g. Crop)，
+    因此逐一連接 AbstractProduct 與各子類別；由 `DailytransConfig.ready` 呼叫，此時各品項 app 皆已載入
+    """
+
+    for model in django_apps.get_models():
+        if issubclass(model, AbstractProduct):
+            post_save.connect(
+                update_daily_aggregate_type,
+                sender=model,
+                dispatch_uid=f'update_daily_aggregate_type.{model._meta.label}',
+            )
+
+
+post_save.connect(refresh_daily_aggregate, sender=DailyTran)
+post_delete.connect(refresh_daily_aggregate, sender=DailyTran)
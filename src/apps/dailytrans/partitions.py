@@ -0,0 +1,128 @@
+"""
+日交易(DailyTran)資料表以 `date` 逐年做 range partition 的相關工具
+
+每個年度一張子表 `dailytrans_dailytran_y{year}`，範圍為 [year-01-01, year+1-01-01)，
+另有一張 default 子表接住尚未建立年度子表的資料，避免寫入失敗。
+查詢條件帶有日期時，PostgreSQL 只會掃描相關年度的子表(partition pruning)；
+舊年度則可個別 VACUUM 或 detach 後封存。
+
+Declarative partitioning 需要 PostgreSQL 11 以上(partitioned index、包含分區鍵的 primary key)。
+"""
+import datetime
+import logging
+
+from django.db import connection as default_connection, transaction
+
+PARENT_TABLE = 'dailytrans_dailytran'
+DEFAULT_PARTITION = f'{PARENT_TABLE}_default'
+# 日交易資料自 2011 年開始
+START_YEAR = 2011
+
+logger = logging.getLogger('aprp')
+
+
+def partition_name(year):
+    return f'{PARENT_TABLE}_y{year}'
+
+
+def is_partitioned(connection=default_connection):
+    if connection.vendor != 'postgresql':
+        return False
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt '
+            'JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = %s)',
+            [PARENT_TABLE],
+        )
+        return cursor.fetchone()[0]
+
+
+def get_partition_years(connection=default_connection):
+    """目前已建立的年度子表"""
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i '
+            'JOIN pg_class c ON c.oid = i.inhrelid '
+            'JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = %s',
+            [PARENT_TABLE],
+        )
+        prefix = partition_name('')
+        return sorted(int(name[len(prefix):]) for name, in cursor.fetchall() if name[len(prefix):].isdigit())
+
+
+def create_year_partition(year, connection=default_connection):
+    """
+    建立年度子表，已存在則略過
+
+    若 default 子表中已有該年度的資料(子表建立前就寫入的資料)，PostgreSQL 會拒絕建立，
+    因此在同一個交易中先將資料移出，建立子表後再寫回。
+
+    Returns:
+        bool: 是否有新建子表
+    """
+    name = partition_name(year)
+    if year in get_partition_years(connection):
+        return False
+
+    start = datetime.date(year, 1, 1)
+    end = datetime.date(year + 1, 1, 1)
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        # 在外層交易中(e.g. migration、測試)建立多個年度時，前一次的暫存表尚未因 commit 而被刪除
+        cursor.execute('DROP TABLE IF EXISTS _moved_dailytran')
+        cursor.execute(f'CREATE TEMP TABLE _moved_dailytran (LIKE {PARENT_TABLE}) ON COMMIT DROP')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE date >= %s AND date < %s RETURNING *) '
+            f'INSERT INTO _moved_dailytran SELECT * FROM moved',
+            [start, end],
+        )
+        moved = cursor.rowcount
+        # 分區範圍須為常數，不能以參數帶入
+        cursor.execute(f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} FOR VALUES FROM ('{start}') TO ('{end}')")
+        if moved:
+            cursor.execute(f'INSERT INTO {PARENT_TABLE} SELECT * FROM _moved_dailytran')
+            logger.info(f'Moved {moved} rows from {DEFAULT_PARTITION} to {name}')
+        cursor.execute('DROP TABLE _moved_dailytran')
+
+    return True
+
+
+def create_default_partition(connection=default_connection):
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT')
+
+
+def ensure_year_partitions(until_year=None, connection=default_connection):
+    """
+    建立最新年度子表之後，直到 until_year(預設為明年) 的年度子表；
+    已 detach 封存的舊年度不會被重新建立
+
+    Returns:
+        List[int]: 新建子表的年度
+    """
+    if not is_partitioned(connection):
+        return []
+
+    create_default_partition(connection)
+
+    until_year = until_year or datetime.date.today().year + 1
+    existed = get_partition_years(connection)
+    start_year = max(existed) + 1 if existed else START_YEAR
+
+    return [year for year in range(start_year, until_year + 1) if create_year_partition(year, connection)]
+
+
+def detach_year_partition(year, connection=default_connection):
+    """
+    將年度子表自母表分離，分離後成為一般資料表，可另行 pg_dump 封存或 DROP
+
+    Returns:
+        str: 被分離的子表名稱
+    """
+    name = partition_name(year)
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}')
+
+    return name
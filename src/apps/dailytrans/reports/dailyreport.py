@@ -15,7 +15,9 @@ from sqlalchemy import create_engine
 from sqlalchemy.engine import Engine
 
 from apps.configs.models import Source, AbstractProduct
+from apps.dailytrans.codec import format_date
 from apps.dailytrans.models import DailyTran, DailyTranQuerySet
+from apps.dailytrans.series import PriceSeries, drop_missing_sources, nanmean
 from apps.dailytrans.utils import get_group_by_date_query_set
 from apps.dailytrans.reports.excel_postprocessor import DailyReportPostProcessor
 from apps.flowers.models import Flower
@@ -268,16 +270,19 @@ class DailyReportFactory(object):
                     }
                 )
 
+        # 日期欄位只轉換一次
+        dates = pd.to_datetime(df["date"]).dt.date
+
         # 篩選出前一週資料
         last_week_df = df[
-            (pd.to_datetime(df["date"]).dt.date >= self.last_week_start.date())
-            & (pd.to_datetime(df["date"]).dt.date <= self.last_week_end.date())
+            (dates >= self.last_week_start.date())
+            & (dates <= self.last_week_end.date())
         ]
 
         # 篩選出當週資料
         this_week_df = df[
-            (pd.to_datetime(df["date"]).dt.date >= self.this_week_start.date())
-            & (pd.to_datetime(df["date"]).dt.date <= self.this_week_end.date())
+            (dates >= self.this_week_start.date())
+            & (dates <= self.this_week_end.date())
         ]
 
 
@@ -617,9 +622,7 @@ class DailyReportFactory(object):
 
     @staticmethod
     def roc_date_format(date, sep="."):
-        return sep.join(
-            [str(date.year - 1911), str(date.month).zfill(2), str(date.day).zfill(2)]
-        )
+        return format_date(date, sep, roc_format=True, zfill=True)
 
     def get_sheet(self):
         wb = openpyxl.load_workbook(TEMPLATE)
@@ -915,6 +918,7 @@ class DailyTranHandler:
             self.__conn = Database.get_db_connection()
 
         self.df = pd.read_sql_query(sql=sql, con=self.__conn, params=params)
+        self.__series: Optional[PriceSeries] = None
 
     @property
     def group_by_columns(self) -> List[str]:
@@ -937,15 +941,34 @@ class DailyTranHandler:
         )
 
     @property
-    def fulfilled_df(self) -> pd.DataFrame:
-        """針對日交易原始資料進行一些填充和計算，以便後續的資料處理"""
+    def valid_df(self) -> pd.DataFrame:
+        """有交易量與重量時，排除交易量或重量不大於 0 的日交易資料"""
 
-        df = (
+        return (
             self.df.query("volume > 0 and avg_weight > 0")
             if self.has_volume and self.has_weight
             else self.df
         )
 
+    @property
+    def series(self) -> PriceSeries:
+        """依日期彙總的日交易資料，與 groupby(["date", "source_id"]) 相同排除無來源的資料"""
+
+        if self.__series is None:
+            self.__series = (
+                PriceSeries.empty()
+                if self.df.empty
+                else PriceSeries.from_frame(drop_missing_sources(self.valid_df))
+            )
+
+        return self.__series
+
+    @property
+    def fulfilled_df(self) -> pd.DataFrame:
+        """針對日交易原始資料進行一些填充和計算，以便後續的資料處理"""
+
+        df = self.valid_df
+
         # 數據處理和計算:
         # 1. 將缺失值填充為 1，不用因為缺失值設定判斷式再進行計算
         # 2. 計算單日單一交易地點的總價格和總交易重量
@@ -977,37 +1000,21 @@ class DailyTranHandler:
         if self.df.empty:
             return pd.DataFrame(columns=self.group_by_columns)
 
-        # 處理流程:
-        # 1. 按日期和來源市場 ID 分組
-        # 2. 再按日期分組
-        # 3. 計算最終的平均價格(avg_price) 和 平均重量(avg_weight)
-        # 4. 處理缺失的 總交易量(sum_volume) 和 每日平均重量(avg_avg_weight)
-        df = (
-            self.fulfilled_df.groupby(["date", "source_id"])
-            .sum()
-            .assign(num_of_source=1)
-            .groupby("date")
-            .sum()
-            .assign(avg_price=lambda x: x["avg_price"] / x["wt_for_calculation"])
-            .assign(
-                avg_weight=lambda x: x["wt_for_calculation"] / x["vol_for_calculation"]
-            )
-            .reset_index()
-            .sort_values("date")
-            .rename(columns={"volume": "sum_volume", "avg_weight": "avg_avg_weight"})
-            .assign(
-                sum_volume=lambda x: np.where(
-                    self.has_volume, x["vol_for_calculation"], x["num_of_source"]
-                )
-            )
-            .assign(
-                avg_avg_weight=lambda x: np.where(
-                    self.has_weight, x["avg_avg_weight"], 1
-                )
-            )
+        # 平均價格與平均重量以每日合計計算(缺失的交易量與重量以 1 代替)，
+        # 沒有交易量時總交易量為來源數，沒有重量時平均重量為 1
+        series = self.series
+        df = pd.DataFrame(
+            {
+                "date": series.dates,
+                "avg_price": series.price,
+                "num_of_source": series.sources,
+                "sum_volume": np.where(self.has_volume, series.total_volume, series.sources),
+                "avg_avg_weight": np.where(self.has_weight, series.weight, 1),
+            },
+            columns=self.group_by_columns,
         )
 
-        return df[self.group_by_columns]
+        return df
 
     def _get_df_query_by_date(
         self,
@@ -1032,25 +1039,15 @@ class DailyTranHandler:
     ) -> Union[int, float]:
         """計算指定日期區間的平均價格"""
 
-        df = self._get_df_query_by_date(start_date, end_date)
+        series = self.series.window(start_date, end_date) if start_date and end_date else self.series
 
-        # 新增有日均重量的品項計算平均價格公式
-        if self.has_volume and self.has_weight:
-            total_price = df["avg_price"] * df["sum_volume"] * df["avg_avg_weight"]
-            total_volume_weight = df["sum_volume"] * df["avg_avg_weight"]
-            return (
-                total_price.sum() / total_volume_weight.sum()
-                if len(total_volume_weight)
-                else 0
+        # 有交易量時以每日總交易量加權，有日均重量的品項再以平均重量加權
+        if self.has_volume:
+            return series.weighted_average(
+                series.total_volume, series.weight if self.has_weight else None
             )
-
-        elif self.has_volume:
-            total_price = df["avg_price"] * df["sum_volume"]
-            total_volume = df["sum_volume"]
-
-            return total_price.sum() / total_volume.sum() if len(total_volume) else 0
         else:
-            return df["avg_price"].mean()
+            return series.weighted_average(None, None)
 
     def get_avg_volume(
         self,
@@ -1059,9 +1056,11 @@ class DailyTranHandler:
     ) -> Union[int, float]:
         """計算指定日期區間的平均交易量"""
 
-        df = self._get_df_query_by_date(start_date, end_date)
+        series = self.series.window(start_date, end_date) if start_date and end_date else self.series
+        volumes = series.total_volume if self.has_volume else series.sources
+        avg_volume = nanmean(volumes)
 
-        return 0 if pd.isna(df["sum_volume"].mean()) else df["sum_volume"].mean()
+        return 0 if pd.isna(avg_volume) else avg_volume
 
 
 class ExtraItem:
@@ -1216,9 +1215,7 @@ class ExcelHandler:
 
     @staticmethod
     def convert_to_roc_date_str(date, sep="."):
-        return sep.join(
-            [str(date.year - 1911), str(date.month).zfill(2), str(date.day).zfill(2)]
-        )
+        return format_date(date, sep, roc_format=True, zfill=True)
 
     @property
     def dict_crop_desc(self):
@@ -1739,13 +1736,13 @@ class SimplifyDailyReportFactory:
 
         this_week_date = self.this_week_date
         last_week_date = self.last_week_date
-        this_week_trans = DailyTran.objects.filter_by_date_lte(
-            this_week_date, self.monitor.product_list()
+        # 本週與前一週的日期一次查詢，再依日期數切開
+        daily_trans = DailyTran.objects.filter_by_date_lte(
+            this_week_date + last_week_date, self.monitor.product_list()
         )
+        this_week_trans = daily_trans[: len(this_week_date)]
+        last_week_trans = daily_trans[len(this_week_date):]
         this_week_avg_price = self.get_simple_avg_price(this_week_trans)
-        last_week_trans = DailyTran.objects.filter_by_date_lte(
-            last_week_date, self.monitor.product_list()
-        )
         last_week_avg_price = self.get_simple_avg_price(last_week_trans)
 
         if this_week_avg_price:
@@ -14,6 +14,7 @@ from openpyxl.utils import get_column_letter
 from pathlib import Path
 from django.conf import settings
 from apps.configs.models import FestivalItems, FestivalName, AbstractProduct
+from apps.dailytrans.series import PriceSeries
 
 #Django ORM 模式
 # from apps.dailytrans.models import DailyTran
@@ -198,41 +199,12 @@ class FestivalReportFactory(object):
         if self.oneday:
             self.result_data[str(product_id)][str(self.special_day_year)]=[]
 
-            if source_id:
-                #Pandas dataframe 模式
-                df_product_id = self.table.query(f'product_id in @product_id and (source_id in @source_id)')
+            #品項(與來源)只過濾一次，依日期彙總後計算
+            series = self.product_series(product_id, source_id)
+            has_volume, has_weight = series.completeness()
 
-                #Django ORM 模式
-                # df_product_id = self.table.filter(product__in=product_id).filter(source__in=source_id)
-            else:
-                #Pandas dataframe 模式
-                df_product_id = self.table.query(f'product_id in @product_id')
-
-                #Django ORM 模式
-                # df_product_id = self.table.filter(product__in=product_id)
-
-            #Pandas dataframe 模式
-            if df_product_id['avg_price'].any():
-                has_volume = df_product_id['volume'].notna().sum() / df_product_id['avg_price'].count() > 0.8
-                has_weight = df_product_id['avg_weight'].notna().sum() / df_product_id['avg_price'].count() > 0.8
-            else:
-                has_volume = False
-                has_weight = False
-
-            if has_volume and has_weight:
-                avgprice=(df_product_id['avg_price']*df_product_id['avg_weight']*df_product_id['volume']).sum()/(df_product_id['avg_weight']*df_product_id['volume']).sum()
-                if 80001 <= int(product_id[0]) < 80005: #羊的交易量不是重量x交易量
-                    avgvolume = (df_product_id['volume']).sum()
-                elif 70001 <= int(product_id[0]) < 70012 : #毛豬交易量為頭數
-                    avgvolume = (df_product_id['volume']).sum()
-                else:
-                    avgvolume = (df_product_id['avg_weight']*df_product_id['volume']).sum()/(df_product_id['volume']).sum()
-            elif has_volume:
-                avgprice=(df_product_id['avg_price']*df_product_id['volume']).sum()/df_product_id['volume'].sum()
-                avgvolume = (df_product_id['volume']).sum()
-            else:
-                avgprice=df_product_id['avg_price'].mean()
-                avgvolume = np.nan
+            #有交易量與重量時，羊與毛豬的交易量為合計(頭數)，其他品項為平均重量
+            avgprice, avgvolume = series.summary(has_volume, has_weight, product_id=self.first_product_id(product_id))
             
             #Django ORM 模式
             # total_price = list()
@@ -258,6 +230,9 @@ class FestivalReportFactory(object):
                 self.result_data[str(product_id)][str(y)]=[]
                 self.result_volume[str(product_id)][str(y)]=[]
 
+            #品項(與來源)只過濾一次，各日期區間以二分搜尋取出
+            series = self.product_series(product_id, source_id)
+
             for y in range(self.roc_before5years,self.roc_year+1):
                 if not self.custom_search:
                     if festival =='1':
@@ -273,36 +248,9 @@ class FestivalReportFactory(object):
                     start_date = datetime.strptime("{}".format(d.split('~')[0]), "%Y-%m-%d").date()
                     end_date = datetime.strptime("{}".format(d.split('~')[1]), "%Y-%m-%d").date()
 
-                    if source_id:
-                        df_product_id = self.table.query(f'product_id in @product_id and date >= "{start_date}" and date <= "{end_date}" and (source_id in @source_id)')
-                        # df_product_id = self.table.filter(product__in=product_id).filter(source__in=source_id).filter(date >=start_date).filter(date <= end_date)
-                        
-                    else:
-                        df_product_id = self.table.query(f'product_id in @product_id and date >= "{start_date}" and date <= "{end_date}"')
-                        # df_product_id = self.table.filter(product__in=product_id).filter(date >=start_date).filter(date <= end_date)
-
-                    if df_product_id.shape[0]:
-                        has_volume = df_product_id['volume'].count() / df_product_id.shape[0] > 0.8
-                        has_weight = df_product_id['avg_weight'].count() / df_product_id.shape[0] > 0.8
-                    else:
-                        has_volume = False
-                        has_weight = False
-                    if has_volume and has_weight:
-                        avgprice=(df_product_id['avg_price']*df_product_id['avg_weight']*df_product_id['volume']).sum()/(df_product_id['avg_weight']*df_product_id['volume']).sum()
-                        if 80001 <= int(product_id[0]) < 80005: #羊的交易量不是重量x交易量
-                            avgvolume = (df_product_id['volume']).sum()
-                        elif 70001 <= int(product_id[0]) < 70012 : #毛豬交易量為頭數
-                            avgvolume = (df_product_id['volume']).sum()
-                        else:
-                            avgvolume=(df_product_id['avg_weight']*df_product_id['volume']).sum()/(df_product_id['volume']).sum()
-                    elif has_volume:
-                        avgprice=(df_product_id['avg_price']*df_product_id['volume']).sum()/df_product_id['volume'].sum()
-                        avgvolume=df_product_id['volume'].sum()
-                    else:
-                        avgprice=df_product_id['avg_price'].mean()
-                        avgvolume=np.nan
-
-
+                    window = series.window(start_date, end_date)
+                    has_volume, has_weight = window.completeness(require_price=False)
+                    avgprice, avgvolume = window.summary(has_volume, has_weight, product_id=self.first_product_id(product_id))
 
                     # total_price = list()
                     # total_volume = list()
@@ -323,6 +271,20 @@ class FestivalReportFactory(object):
 
         return self.result_data,self.result_volume
 
+    def product_series(self, product_id, source_id=None):
+        """品項(與來源)的日交易資料依日期彙總為 PriceSeries"""
+
+        product_ids = [int(i) for i in np.atleast_1d(product_id)]
+        mask = self.table['product_id'].isin(product_ids)
+        if source_id:
+            mask &= self.table['source_id'].isin(source_id)
+
+        return PriceSeries.from_frame(self.table[mask])
+
+    @staticmethod
+    def first_product_id(product_id):
+        return int(np.atleast_1d(product_id)[0])
+
     def trimmean(self, arr):
         arr_min = arr.min()
         arr_max = arr.max()
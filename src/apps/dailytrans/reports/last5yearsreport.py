@@ -13,6 +13,7 @@ from django.conf import settings
 from sqlalchemy import create_engine
 
 from apps.configs.models import AbstractProduct
+from apps.dailytrans.series import HOG_EXCLUDED_SOURCE_ID, PriceSeries, nanmean
 
 db_logger = logging.getLogger('aprp')
 
@@ -64,8 +65,16 @@ class Last5YearsReportFactory(object):
 
         return table
 
+    def filter_source(self, table: pd.DataFrame) -> pd.DataFrame:
+        """若有來源則只保留指定來源的資料；品項為毛豬(規格豬)時排除澎湖市場"""
+
+        if self.source:
+            return table[table['source_id'].isin(self.source)]
+        if self.is_hogs:
+            return table[table['source_id'] != HOG_EXCLUDED_SOURCE_ID]
+        return table
+
     def result(self, table: pd.DataFrame):
-        source_list = self.source
         product_data_dict = {}
         avg_price_dict = {}
         avg_volume_dict = {}
@@ -73,7 +82,12 @@ class Last5YearsReportFactory(object):
         avg_volume_weight_dict = {}
         has_volume = False
         has_weight = False
-        last_5_years_one_month_table = pd.DataFrame()
+
+        # 近五年的日交易資料依日期彙總一次，各月份的合計由每月的 resample 取得
+        series = PriceSeries.from_frame(self.filter_source(table))
+        monthly = series.resample('M')
+        month_index = {(y, m): i for i, (y, m) in enumerate(zip(monthly.years, monthly.months))}
+        no_data = PriceSeries.empty()
 
         # 迭代近五年年分
         for y in range(self.last_5_years_ago, self.today_year + 1):
@@ -111,28 +125,19 @@ class Last5YearsReportFactory(object):
 
             # 迭代年分的每個月
             for m in range(1, end_month):
-                # 將單一月份的 DataFtaFrame 取出，若有來源或是品項為毛豬，則會再進一步過濾資料
-                if source_list:
-                    one_month_data = table[(pd.to_datetime(table['date']).dt.year == y) & (pd.to_datetime(table['date']).dt.month == m) ].query("source_id == @source_list")
-                else:
-                    # 毛豬(規格豬)計算需排除澎湖市場
-                    if self.is_hogs:
-                        one_month_data = table[(pd.to_datetime(table['date']).dt.year == y) & (pd.to_datetime(table['date']).dt.month == m) ].query("source_id != 40050")
-                    else:
-                        # 一般情況下，直接取出單一月份的 DataFrame
-                        one_month_data = table[(pd.to_datetime(table['date']).dt.year == y) & (pd.to_datetime(table['date']).dt.month == m) ]
+                # 單一月份的合計，沒有資料的月份為空的序列
+                i = month_index.get((y, m))
+                one_month_data = monthly[i:i + 1] if i is not None else no_data
 
-                if one_month_data['avg_price'].any():
-                    has_volume = one_month_data['volume'].notna().sum() / one_month_data['avg_price'].count() > 0.8
-                    has_weight = one_month_data['avg_weight'].notna().sum() / one_month_data['avg_price'].count() > 0.8
-                else:
-                    has_volume = False
-                    has_weight = False
+                has_volume, has_weight = one_month_data.completeness()
+
+                # 有交易的天數，每日交易量合計的平均 = 月交易量合計 / 天數
+                days = one_month_data.total('days')
 
                 if has_volume and has_weight:
-                    one_month_total_price = (one_month_data['avg_price'] * one_month_data['avg_weight'] * one_month_data['volume']).sum()
-                    one_month_total_weight = (one_month_data['avg_weight'] * one_month_data['volume']).sum()
-                    one_month_total_volume = (one_month_data['volume']).sum()
+                    one_month_total_price = one_month_data.total('sum_price_weight_volume')
+                    one_month_total_weight = one_month_data.total('sum_weight_volume')
+                    one_month_total_volume = one_month_data.total('sum_volume')
                     total_price += one_month_total_price
                     total_weight += one_month_total_weight
                     avgprice = one_month_total_price / one_month_total_weight
@@ -141,42 +146,42 @@ class Last5YearsReportFactory(object):
                     # 羊的交易量
                     if self.is_rams:
                         total_volume += one_month_total_volume
-                        avgvolume = one_month_data.groupby('date').sum()['volume'].mean()
+                        avgvolume = one_month_total_volume / days
 
                     # 毛豬交易量為頭數
                     elif self.is_hogs:
                         total_volume += one_month_total_volume / 1000
                         total_volume_weight += one_month_total_weight
-                        avgvolume = one_month_data.groupby('date').sum()['volume'].mean() / 1000
+                        avgvolume = one_month_total_volume / days / 1000
                         avgweight = avgweight
                         avgvolumeweight = (avgweight*avgvolume*1000) / 1000
 
                     # 環南市場-雞的交易量
                     else:
-                        # avgvolume = (one_month_data['avg_weight']*one_month_data['volume']).sum()/(one_month_data['volume']).sum()
                         total_volume += one_month_total_volume
-                        avgvolume = one_month_data.groupby('date').sum()['volume'].mean()
-                        avgweight = one_month_data.groupby('date').sum()['avg_weight'].mean()
+                        avgvolume = one_month_total_volume / days
+                        avgweight = one_month_data.total('sum_weight') / days
 
-                    days_with_price += (one_month_data['avg_weight'] * one_month_data['volume']).sum()
-                    days_with_weight += one_month_data['volume'].sum()
-                    days_with_volume += one_month_data.groupby('date').sum()['volume'].count()
-                    days_with_volume_weight += one_month_data.groupby('date').sum()['volume'].count()
+                    days_with_price += one_month_total_weight
+                    days_with_weight += one_month_total_volume
+                    days_with_volume += days
+                    days_with_volume_weight += days
 
                 elif has_volume:
-                    total_price += (one_month_data['avg_price'] * one_month_data['volume']).sum()
-                    total_volume += one_month_data.groupby('date').sum()['volume'].sum() / 1000
-                    avgprice = (one_month_data['avg_price'] * one_month_data['volume']).sum() / one_month_data['volume'].sum()
-                    avgvolume = one_month_data.groupby('date').sum()['volume'].mean() / 1000
-                    days_with_price += (one_month_data['volume'].sum())
-                    days_with_volume += one_month_data.groupby('date').sum()['volume'].count()
+                    total_price += one_month_data.total('sum_price_volume')
+                    total_volume += one_month_data.total('sum_volume') / 1000
+                    avgprice = one_month_data.total_ratio('sum_price_volume', 'sum_volume')
+                    avgvolume = one_month_data.total('sum_volume') / days / 1000
+                    days_with_price += one_month_data.total('sum_volume')
+                    days_with_volume += days
 
                 else:
-                    total_price += one_month_data.groupby('date').mean()['avg_price'].sum()
-                    avgprice = one_month_data.groupby('date').mean()['avg_price'].mean()
+                    # 每日平均價格的合計與平均，沒有資料的月份平均為 NaN
+                    total_price += one_month_data.total('sum_daily_price')
+                    avgprice = one_month_data.total_ratio('sum_daily_price', 'price_days')
                     avgvolume = np.nan
                     avgweight = np.nan
-                    days_with_price += one_month_data.groupby('date').mean()['avg_price'].count()
+                    days_with_price += one_month_data.total('price_days')
 
                 avg_price_month_list.append(float(Context(prec=28, rounding=ROUND_HALF_UP).create_decimal(avgprice)))
                 avg_volume_month_list.append(float(Context(prec=28, rounding=ROUND_HALF_UP).create_decimal(avgvolume)))
@@ -188,11 +193,11 @@ class Last5YearsReportFactory(object):
                     avg_weight_month_list.append(float(Context(prec=28, rounding=ROUND_HALF_UP).create_decimal(avgweight)))
 
             # insert yearly avg price, volume, weight and volume * weight to dict
-            avgprice_year = total_price / days_with_price
+            avgprice_year = np.float64(total_price) / days_with_price
             avg_price_month_list.insert(0, float(Context(prec=28, rounding=ROUND_HALF_UP).create_decimal(avgprice_year)))
 
             if [x for x in avg_volume_month_list if x == x]:
-                avgvolume_year = total_volume / days_with_volume
+                avgvolume_year = np.float64(total_volume) / days_with_volume
                 avg_volume_month_list.insert(0, float(Context(prec=28, rounding=ROUND_HALF_UP).create_decimal(avgvolume_year)))
 
             avg_price_dict[f"{y - 1911}年"] = avg_price_month_list
@@ -234,48 +239,39 @@ class Last5YearsReportFactory(object):
         avgweight_data = pd.DataFrame()
         avgvolumeweight_data = pd.DataFrame()
 
+        # 去年以前五年的每日資料，再依月份取出
+        years = series.years
+        last_5_years_series = series[(years >= self.last_5_years_ago) & (years <= self.last_year)]
+        last_5_years_months = last_5_years_series.months
+
         for m in range(1, 13):
             avgvolume_temp_list = []
 
-            if source_list:
-                last_5_years_one_month_table = table[(pd.to_datetime(table['date']).dt.year >= self.last_5_years_ago) & (pd.to_datetime(table['date']).dt.year <= self.last_year) & (pd.to_datetime(table['date']).dt.month == m)].query("source_id == @source_list")
-            else:
-                if self.is_hogs: #毛豬(規格豬)計算需排除澎湖市場
-                    last_5_years_one_month_table = table[(pd.to_datetime(table['date']).dt.year >= self.last_5_years_ago) & (pd.to_datetime(table['date']).dt.year <= self.last_year) & (pd.to_datetime(table['date']).dt.month == m)].query("source_id != 40050")
-                else:
-                    last_5_years_one_month_table = table[(pd.to_datetime(table['date']).dt.year >= self.last_5_years_ago) & (pd.to_datetime(table['date']).dt.year <= self.last_year) & (pd.to_datetime(table['date']).dt.month == m)]
-
-            if last_5_years_one_month_table['avg_price'].any():
-                has_volume = last_5_years_one_month_table['volume'].notna().sum() / last_5_years_one_month_table['avg_price'].count() > 0.8
-                has_weight = last_5_years_one_month_table['avg_weight'].notna().sum() / last_5_years_one_month_table['avg_price'].count() > 0.8
-            else:
-                has_volume = False
-                has_weight = False
+            # 近五年單一月份的每日資料
+            last_5_years_one_month = last_5_years_series[last_5_years_months == m]
+            has_volume, has_weight = last_5_years_one_month.completeness()
 
-            last_5_years_one_month_table=last_5_years_one_month_table.copy()    #此步驟為避免後續 dataframe 計算過程中出現警告訊息
+            one_month_sumvolume = last_5_years_one_month.sum_volume
 
             if has_volume and has_weight:
-                last_5_years_one_month_table['pvw'] = last_5_years_one_month_table['avg_price'] * last_5_years_one_month_table['volume'] * last_5_years_one_month_table['avg_weight']
-                last_5_years_one_month_table['vw'] = last_5_years_one_month_table['volume'] * last_5_years_one_month_table['avg_weight']
-                one_month_avgprice = last_5_years_one_month_table.groupby('date')['pvw'].sum()/last_5_years_one_month_table.groupby('date')['vw'].sum()
-                one_month_avgweight = last_5_years_one_month_table.groupby('date')['vw'].sum()/last_5_years_one_month_table.groupby('date')['volume'].sum()
-                one_month_sumvolume = last_5_years_one_month_table.groupby('date')['volume'].sum()
-                avgprice_one_month = (one_month_avgprice*one_month_sumvolume*one_month_avgweight).sum()/(one_month_sumvolume*one_month_avgweight).sum()
-                avgweight_one_month = (one_month_sumvolume*one_month_avgweight).sum()/(one_month_sumvolume).sum()
+                one_month_avgprice = last_5_years_one_month.ratio('sum_price_weight_volume', 'sum_weight_volume')
+                one_month_avgweight = last_5_years_one_month.ratio('sum_weight_volume', 'sum_volume')
+                avgprice_one_month = np.nansum(one_month_avgprice*one_month_sumvolume*one_month_avgweight)/np.nansum(one_month_sumvolume*one_month_avgweight)
+                avgweight_one_month = np.nansum(one_month_sumvolume*one_month_avgweight)/np.nansum(one_month_sumvolume)
                 last_5_years_avg_data['avgprice'][m] = float(Context(prec=28, rounding=ROUND_HALF_UP).create_decimal(avgprice_one_month))
 
                 if self.is_rams: #羊的交易量,
-                    last_5_years_avg_data['avgvolume'][m] = last_5_years_one_month_table.groupby('date').sum()['volume'].mean()
+                    last_5_years_avg_data['avgvolume'][m] = nanmean(one_month_sumvolume)
                     last_5_years_avg_data['avgweight'][m] = float(Context(prec=28, rounding=ROUND_HALF_UP).create_decimal(avgweight_one_month))
                 elif self.is_hogs: #毛豬交易量為頭數
-                    last_5_years_avg_data['avgvolume'][m] = last_5_years_one_month_table.groupby('date').sum()['volume'].mean() / 1000
+                    last_5_years_avg_data['avgvolume'][m] = nanmean(one_month_sumvolume) / 1000
                     last_5_years_avg_data['avgweight'][m] = float(Context(prec=28, rounding=ROUND_HALF_UP).create_decimal(avgweight_one_month))
-                    one_month_avgvolumeweight = (last_5_years_one_month_table.groupby('date')['vw'].sum()).mean() / 1000
+                    one_month_avgvolumeweight = nanmean(last_5_years_one_month.sum_weight_volume) / 1000
                     last_5_years_avg_data['avgvolumeweight'][m] = float(Context(prec=28, rounding=ROUND_HALF_UP).create_decimal(one_month_avgvolumeweight))
                     last_5_years_avgvolumeweight_list.append(last_5_years_avg_data['avgvolumeweight'][m])
                 else:
-                    last_5_years_avg_data['avgvolume'][m] = last_5_years_one_month_table.groupby('date').sum()['volume'].mean()
-                    last_5_years_avg_data['avgweight'][m] = last_5_years_one_month_table.groupby('date').sum()['avg_weight'].mean()
+                    last_5_years_avg_data['avgvolume'][m] = nanmean(one_month_sumvolume)
+                    last_5_years_avg_data['avgweight'][m] = nanmean(last_5_years_one_month.sum_weight)
 
                 last_5_years_avgprice_list.append(last_5_years_avg_data['avgprice'][m])
                 last_5_years_avgvolume_list.append(last_5_years_avg_data['avgvolume'][m])
@@ -284,25 +280,24 @@ class Last5YearsReportFactory(object):
 
             elif has_volume:
                 #平均價
-                last_5_years_one_month_table['pv']=last_5_years_one_month_table['avg_price'] * last_5_years_one_month_table['volume']
-                one_month_avgprice = last_5_years_one_month_table.groupby('date')['pv'].sum()/last_5_years_one_month_table.groupby('date')['volume'].sum()
-                one_month_sumvolume = last_5_years_one_month_table.groupby('date').sum()['volume'].values
-                avgprice_one_month = (one_month_avgprice*one_month_sumvolume).sum()/one_month_sumvolume.sum()
+                one_month_avgprice = last_5_years_one_month.ratio('sum_price_volume', 'sum_volume')
+                avgprice_one_month = np.nansum(one_month_avgprice*one_month_sumvolume)/one_month_sumvolume.sum()
                 last_5_years_avg_data['avgprice'][m] = float(Context(prec=28, rounding=ROUND_HALF_UP).create_decimal(avgprice_one_month))
 
                 last_5_years_avgprice_list.append(last_5_years_avg_data['avgprice'][m])
 
                 #平均量
-                last_5_years_avgvolume_month = last_5_years_one_month_table.groupby('date').sum()['volume'].values
-                for j in last_5_years_avgvolume_month:
+                for j in one_month_sumvolume:
                     avgvolume_temp_list.append(float(Context(prec=28, rounding=ROUND_HALF_UP).create_decimal(j)))
 
                 last_5_years_avg_data['avgvolume'][m] = sum(avgvolume_temp_list) / len(avgvolume_temp_list) / 1000
                 last_5_years_avgvolume_list.append(last_5_years_avg_data['avgvolume'][m])
 
             else:
-                if last_5_years_one_month_table.groupby('date').mean()['avg_price'].values.any():
-                    one_month_avgprice = last_5_years_one_month_table.groupby('date').mean()['avg_price'].values.mean()
+                # 每日平均價格，沒有價格的日期為 NaN
+                one_month_daily_price = last_5_years_one_month.mean_price
+                if one_month_daily_price.any():
+                    one_month_avgprice = one_month_daily_price.mean()
                     last_5_years_avg_data['avgprice'][m] = one_month_avgprice
                     last_5_years_avgprice_list.append(last_5_years_avg_data['avgprice'][m])
                     has_price = True
@@ -0,0 +1,472 @@
+"""
+以欄位陣列(columnar)保存的每日價格序列，供儀表板圖表與各報表共用
+
+原本每個分析流程各自以 pandas 重建相同的中間資料: `get_group_by_date_query_set` 的每日彙總、
+日報 `DailyTranHandler.df_with_group_by_date` 的兩次 groupby、節慶報表對每個日期區間重複 `.query()`，
+以及近五年報表對每個月份建立的 boolean mask。
+
+`PriceSeries` 將日交易資料依日期彙總一次，每一天一個元素，所有欄位皆為連續的 numpy 陣列:
+    - ordinal: 日期序數(同 `date.toordinal()`)，由小到大排序
+    - 加權合計(儀表板、日報): 缺失的重量與交易量以 1 代替(同 pandas 流程中的 fillna(1))
+        total_price = Σ 價格 x 重量 x 交易量, total_weight = Σ 重量 x 交易量, total_volume = Σ 交易量,
+        sum_volume = Σ 交易量(略過缺值), sources = 來源市場數
+    - 略過缺值的合計(節慶、近五年報表):
+        sum_price, sum_weight, sum_price_volume, sum_weight_volume, sum_price_weight_volume
+    - 筆數: rows, price_rows, nonzero_price_rows, volume_rows, weight_rows
+    - days, price_days, sum_daily_price: 天數、有價格的天數與每日平均價格的合計
+
+所有欄位皆可直接相加，因此 `window`(日期區間)、`resample`(月、年)只需要 searchsorted 與
+np.add.reduceat，加權平均、交易量的規則(包含羊與毛豬的例外)也都集中在此計算。
+
+效能比較請執行 `python manage.py benchmark_price_series`
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+
+
+# 交易量與重量的資料筆數超過此比例才以交易量、重量加權
+COMPLETE_RATIO = 0.8
+
+# 羊的交易量不是重量 x 交易量
+RAM_PRODUCT_IDS = range(80001, 80005)
+# 毛豬交易量為頭數
+HOG_PRODUCT_IDS = range(70001, 70012)
+# 毛豬(規格豬)計算需排除澎湖市場
+HOG_EXCLUDED_SOURCE_ID = 40050
+
+# 年度比較以閏年 2016 為基準年，平年沒有 2/29(基準年的第 60 天)
+BASE_YEAR = 2016
+LEAP_DAY_POSITION = 59
+
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+FRAME_COLUMNS = ['date', 'avg_price', 'num_of_source', 'sum_volume', 'avg_avg_weight']
+
+
+def is_rams(product_id):
+    return int(product_id) in RAM_PRODUCT_IDS
+
+
+def is_hogs(product_id):
+    return int(product_id) in HOG_PRODUCT_IDS
+
+
+def to_ordinals(dates):
+    """將 datetime.date、datetime64 或 'YYYY-MM-DD' 字串轉換為日期序數(同 `date.toordinal()`)"""
+
+    values = np.asarray(dates)
+    if not len(values):
+        return np.array([], dtype=np.int64)
+    return values.astype('datetime64[D]').astype(np.int64) + EPOCH_ORDINAL
+
+
+def to_datetime64(ordinals):
+    return (np.asarray(ordinals, dtype=np.int64) - EPOCH_ORDINAL).astype('datetime64[D]')
+
+
+def _to_float(values, size):
+    """轉換為 float 陣列，None 為 NaN"""
+
+    if values is None:
+        return np.full(size, np.nan)
+
+    values = np.asarray(values)
+    if values.dtype == object:
+        values = pd.to_numeric(values, errors='coerce')
+    return np.asarray(values, dtype=float)
+
+
+def _divide(numerator, denominator):
+    """與 pandas 相同，除以 0 時為 inf 或 NaN，不拋出例外"""
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.true_divide(numerator, denominator)
+
+
+def nanmean(values):
+    """略過 NaN 的平均，沒有資料時為 NaN；與 pandas 的 Series.mean() 相同以 0 代替 NaN 後加總"""
+
+    values = np.asarray(values, dtype=float)
+    mask = np.isnan(values)
+    count = len(values) - mask.sum()
+    return np.where(mask, 0.0, values).sum() / count if count else np.nan
+
+
+def align_years(dates, values):
+    """
+    將多年的每日資料依月日對齊至基準年(2016)，每一年為一列
+
+    Args:
+        dates: 每日資料的日期，不需連續，同一天只能有一筆
+        values (np.ndarray): 與 dates 對應的數值
+
+    Returns:
+        tuple: (np.ndarray, np.ndarray)
+            - 起訖年份之間的每一年
+            - shape 為 (年數, 366) 的數值矩陣，沒有資料的日期與平年的 2/29 為 NaN
+    """
+    index = pd.to_datetime(np.asarray(dates))
+    year = np.asarray(index.year)
+    position = np.asarray(index.dayofyear) - 1
+
+    # 平年 3/1 之後的日期往後移一天，空出 2/29
+    leap = ((year % 4 == 0) & (year % 100 != 0)) | (year % 400 == 0)
+    position = position + ((~leap) & (position >= LEAP_DAY_POSITION))
+
+    years = np.arange(year.min(), year.max() + 1)
+    matrix = np.full((len(years), 366), np.nan)
+    matrix[year - years[0], position] = values
+
+    return years, matrix
+
+
+class PriceSeries(object):
+    """
+    依日期排序的每日彙總資料，欄位請見模組說明；由日交易資料建立時每個欄位皆存在，
+    由資料庫的每日彙總(`from_daily`)建立時只有加權合計與 sources
+
+    使用方式:
+        series = PriceSeries.from_frame(df)
+        week = series.window(start_date, end_date)
+        avg_price, avg_volume = week.summary(*week.completeness(), product_id=70001)
+        monthly = series.resample('M')
+    """
+
+    def __init__(self, ordinal, **columns):
+        self.ordinal = np.asarray(ordinal, dtype=np.int64)
+        self.columns = columns
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get('columns', {})
+        if name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    def __len__(self):
+        return len(self.ordinal)
+
+    def __getitem__(self, key):
+        """以 slice 或 boolean mask 取出部分日期"""
+
+        return PriceSeries(self.ordinal[key], **{name: values[key] for name, values in self.columns.items()})
+
+    @classmethod
+    def from_rows(cls, dates, prices, volumes=None, weights=None, sources=None):
+        """
+        將日交易資料(每筆為一個品項、來源、日期)依日期彙總
+
+        來源為 NaN 的資料仍計入所有合計；若需與 groupby(['date', 'source_id']) 相同排除無來源的資料，
+        請先以 `drop_missing_sources` 過濾。
+
+        Args:
+            dates: 交易日期
+            prices: 平均價格
+            volumes: 交易量，None 代表沒有交易量
+            weights: 平均重量，None 代表沒有重量
+            sources: 來源市場 ID，None 或全部為 NaN 時，來源數視為 1
+        """
+        ordinal = to_ordinals(dates)
+        size = len(ordinal)
+        price = _to_float(prices, size)
+        volume = _to_float(volumes, size)
+        weight = _to_float(weights, size)
+
+        days, index = np.unique(ordinal, return_inverse=True)
+        n = len(days)
+
+        def total(values, mask=None):
+            if mask is not None:
+                values = np.where(mask, values, 0.0)
+            return np.bincount(index, weights=values, minlength=n)
+
+        def count(mask):
+            return np.bincount(index[mask], minlength=n)
+
+        has_price = ~np.isnan(price)
+        has_volume = ~np.isnan(volume)
+        has_weight = ~np.isnan(weight)
+
+        # 缺值以 1 代替的加權合計
+        volume_or_one = np.where(has_volume, volume, 1.0)
+        weight_or_one = np.where(has_weight, weight, 1.0)
+
+        price_rows = count(has_price)
+        sum_price = total(price, has_price)
+        daily_price = _divide(sum_price, price_rows)
+
+        return cls(
+            days,
+            rows=np.bincount(index, minlength=n),
+            price_rows=price_rows,
+            nonzero_price_rows=count(has_price & (price != 0)),
+            volume_rows=count(has_volume),
+            weight_rows=count(has_weight),
+            days=np.ones(n, dtype=np.int64),
+            price_days=(price_rows > 0).astype(np.int64),
+            total_price=total(price * weight_or_one * volume_or_one, has_price),
+            total_weight=total(weight_or_one * volume_or_one),
+            total_volume=total(volume_or_one),
+            sum_volume=total(volume, has_volume),
+            sum_price=sum_price,
+            sum_weight=total(weight, has_weight),
+            sum_price_volume=total(price * volume, has_price & has_volume),
+            sum_weight_volume=total(weight * volume, has_weight & has_volume),
+            sum_price_weight_volume=total(price * weight * volume, has_price & has_weight & has_volume),
+            sum_daily_price=np.where(price_rows > 0, daily_price, 0.0),
+            sources=cls._count_sources(index, n, sources),
+        )
+
+    @staticmethod
+    def _count_sources(index, n, sources):
+        if sources is None:
+            return np.ones(n, dtype=np.int64)
+
+        source = _to_float(sources, len(index))
+        has_source = ~np.isnan(source)
+        if not has_source.any():
+            return np.ones(n, dtype=np.int64)
+
+        # 每一天不重複的來源數: (日期, 來源) 組合去除重複後依日期計數
+        codes, source_index = np.unique(source[has_source], return_inverse=True)
+        pairs = np.unique(index[has_source] * len(codes) + source_index)
+        return np.bincount(pairs // len(codes), minlength=n)
+
+    @classmethod
+    def from_frame(cls, df):
+        """由日交易資料的 DataFrame 建立，columns 包含 'date', 'avg_price', 'volume', 'avg_weight', 'source_id'"""
+
+        if df.empty:
+            return cls.empty()
+
+        return cls.from_rows(
+            df['date'].values,
+            df['avg_price'].values,
+            volumes=df['volume'].values if 'volume' in df else None,
+            weights=df['avg_weight'].values if 'avg_weight' in df else None,
+            sources=df['source_id'].values if 'source_id' in df else None,
+        )
+
+    @classmethod
+    def from_daily(cls, df):
+        """
+        由資料庫的每日彙總(`group_by_date_values`)建立，
+        columns 包含 'date', 'total_price', 'total_weight', 'total_volume', 'sum_volume', 'num_of_source'
+        """
+
+        if df.empty:
+            return cls(np.array([], dtype=np.int64), total_price=np.array([]), total_weight=np.array([]),
+                       total_volume=np.array([]), sum_volume=np.array([]), sources=np.array([], dtype=np.int64),
+                       days=np.array([], dtype=np.int64))
+
+        df = df.sort_values('date')
+        return cls(
+            to_ordinals(df['date'].values),
+            total_price=df['total_price'].values.astype(float),
+            total_weight=df['total_weight'].values.astype(float),
+            total_volume=df['total_volume'].values.astype(float),
+            sum_volume=df['sum_volume'].values.astype(float),
+            sources=df['num_of_source'].values.astype(np.int64),
+            days=np.ones(len(df), dtype=np.int64),
+        )
+
+    @classmethod
+    def empty(cls):
+        return cls.from_rows([], [])
+
+    @property
+    def dates(self):
+        """每一天的 datetime.date"""
+
+        return to_datetime64(self.ordinal).astype(object)
+
+    @property
+    def years(self):
+        return to_datetime64(self.ordinal).astype('datetime64[Y]').astype(np.int64) + 1970
+
+    @property
+    def months(self):
+        return to_datetime64(self.ordinal).astype('datetime64[M]').astype(np.int64) % 12 + 1
+
+    @property
+    def price(self):
+        """每日加權平均價格(Σ 價格 x 重量 x 交易量 / Σ 重量 x 交易量，缺值以 1 代替)"""
+
+        return _divide(self.total_price, self.total_weight)
+
+    @property
+    def weight(self):
+        """每日平均重量(Σ 重量 x 交易量 / Σ 交易量，缺值以 1 代替)"""
+
+        return _divide(self.total_weight, self.total_volume)
+
+    @property
+    def mean_price(self):
+        """每日平均價格的平均(不加權)"""
+
+        return _divide(self.sum_daily_price, self.price_days)
+
+    def total(self, name):
+        """整段期間的合計(np.float64 或 np.int64，除以 0 時與 pandas 相同不拋出例外)"""
+
+        return self.columns[name].sum()
+
+    def total_ratio(self, numerator, denominator):
+        """整段期間兩個欄位合計的比值(np.float64)，除以 0 時為 inf 或 NaN"""
+
+        return _divide(np.float64(self.total(numerator)), np.float64(self.total(denominator)))
+
+    def ratio(self, numerator, denominator):
+        """每個元素兩個欄位的比值，e.g. ratio('sum_price_volume', 'sum_volume') 為每日以交易量加權的價格"""
+
+        return _divide(self.columns[numerator], self.columns[denominator])
+
+    def window(self, start_date=None, end_date=None):
+        """
+        取出起訖日期之間(包含起訖日)的資料，不複製陣列
+
+        Args:
+            start_date, end_date: datetime.date 或 'YYYY-MM-DD'，None 代表不限制
+        """
+        start = np.searchsorted(self.ordinal, to_ordinals([start_date])[0]) if start_date else 0
+        end = np.searchsorted(self.ordinal, to_ordinals([end_date])[0], side='right') if end_date else len(self)
+        return self[start:end]
+
+    def select_ranges(self, ranges):
+        """
+        取出落在任一 (起始日期, 結束日期) 區間內的資料，同以 OR 串接多個 BETWEEN 條件
+
+        Args:
+            ranges: e.g. `month_day_ranges` 的結果，區間可重疊
+        """
+        mask = np.zeros(len(self), dtype=bool)
+        for start_date, end_date in ranges:
+            mask[np.searchsorted(self.ordinal, to_ordinals([start_date])[0]):
+                 np.searchsorted(self.ordinal, to_ordinals([end_date])[0], side='right')] = True
+        return self[mask]
+
+    def resample(self, freq='M'):
+        """
+        依月('M')或年('A')合計，每個期間以第一天的日期序數表示；沒有資料的期間不會出現
+
+        sources 合計後為來源市場數 x 天數
+        """
+        if not len(self):
+            return self
+
+        unit = {'M': 'datetime64[M]', 'A': 'datetime64[Y]'}[freq]
+        periods = to_datetime64(self.ordinal).astype(unit)
+
+        starts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+        return PriceSeries(
+            to_ordinals(periods[starts].astype('datetime64[D]')),
+            **{name: np.add.reduceat(values, starts) for name, values in self.columns.items()}
+        )
+
+    def completeness(self, require_price=True):
+        """
+        交易量、重量的資料筆數是否超過價格筆數的 8 成
+
+        Args:
+            require_price: True 時所有價格皆為 0 或沒有資料時皆為 False(同 `avg_price.any()` 的判斷)
+
+        Returns:
+            tuple: (has_volume, has_weight)
+        """
+        price_rows = self.total('price_rows')
+        if not price_rows or (require_price and not self.total('nonzero_price_rows')):
+            return False, False
+
+        return (self.total('volume_rows') / price_rows > COMPLETE_RATIO,
+                self.total('weight_rows') / price_rows > COMPLETE_RATIO)
+
+    def summary(self, has_volume, has_weight, product_id=None):
+        """
+        整段期間的平均價格與交易量(以每一筆日交易資料計算，略過缺值)
+
+            - 有交易量與重量: 價格以重量 x 交易量加權；交易量為平均重量，羊與毛豬為交易量合計
+            - 只有交易量: 價格以交易量加權；交易量為合計
+            - 都沒有: 價格平均；交易量為 NaN
+
+        Returns:
+            tuple: (np.float64, np.float64)，沒有資料時為 NaN
+        """
+        if has_volume and has_weight:
+            avg_price = self.total_ratio('sum_price_weight_volume', 'sum_weight_volume')
+            if product_id is not None and (is_rams(product_id) or is_hogs(product_id)):
+                avg_volume = self.total('sum_volume')
+            else:
+                avg_volume = self.total_ratio('sum_weight_volume', 'sum_volume')
+        elif has_volume:
+            avg_price = self.total_ratio('sum_price_volume', 'sum_volume')
+            avg_volume = self.total('sum_volume')
+        else:
+            avg_price = self.total_ratio('sum_price', 'price_rows')
+            avg_volume = np.nan
+
+        return avg_price, avg_volume
+
+    def weighted_average(self, volumes, weights):
+        """
+        每日價格以每日交易量(與平均重量)加權的平均；沒有資料時為 0
+
+        Args:
+            volumes: 每日交易量，None 代表不加權，回傳每日價格的平均(沒有資料時為 NaN)
+            weights: 每日平均重量，None 代表只以交易量加權
+        """
+        price = self.price
+        if volumes is None:
+            return nanmean(price)
+        if not len(price):
+            return 0
+
+        # 與原本的 DataFrame 計算相同順序: 價格 x 交易量 x 重量
+        total_price = price * volumes
+        factor = volumes
+        if weights is not None:
+            total_price = total_price * weights
+            factor = volumes * weights
+        return np.nansum(total_price) / np.nansum(factor)
+
+    def quantile(self, q, values=None):
+        """
+        分位數(線性內插，同 pandas 的 quantile)，略過 NaN；沒有資料時為 NaN
+
+        Args:
+            q: 0 ~ 1 的數值或 list
+            values: 每日數值，預設為每日加權平均價格
+        """
+        values = self.price if values is None else np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        return np.percentile(values, np.multiply(q, 100))
+
+    def align_years(self, values=None):
+        """以 `align_years` 將每日數值(預設為每日加權平均價格)對齊至基準年"""
+
+        return align_years(to_datetime64(self.ordinal), self.price if values is None else values)
+
+    def to_frame(self, has_volume=True, has_weight=True):
+        """
+        儀表板格式的每日彙總: columns 為 'date', 'avg_price', 'num_of_source', 'sum_volume', 'avg_avg_weight'，
+        沒有交易量時 sum_volume 為來源數，沒有重量時 avg_avg_weight 為 1
+        """
+        df = pd.DataFrame({
+            'date': self.dates,
+            'avg_price': self.price,
+            'num_of_source': self.sources,
+            'sum_volume': self.sum_volume if has_volume else self.sources,
+            'avg_avg_weight': self.weight if has_weight else np.ones(len(self), dtype=np.int64),
+        }, columns=FRAME_COLUMNS)
+        return df
+
+
+def drop_missing_sources(df):
+    """
+    同 groupby(['date', 'source_id']): 部分資料有來源時排除無來源的資料；
+    所有資料皆無來源時全部保留(來源數視為 1)
+    """
+    has_source = df['source_id'].notna()
+    return df[has_source] if has_source.any() else df
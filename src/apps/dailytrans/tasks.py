@@ -3,8 +3,13 @@ import logging
 from datetime import datetime, timedelta
 from celery.task import task
 from django.conf import settings
+from django.utils.module_loading import import_string
 
+from apps.dailytrans.builders.orchestrator import aggregate, orchestrate, serialize_result
+from apps.dailytrans.builders.plan import advance_watermarks, build_plan
+from apps.dailytrans.builders.resilience import OPEN, CircuitBreaker, defer, pop_deferred
 from apps.dailytrans.models import DailyTran, DailyReport
+from apps.dailytrans.partitions import ensure_year_partitions
 from apps.dailytrans.reports.dailyreport import DailyReportFactory
 from google_api.backends import DefaultGoogleDriveClient
 
@@ -35,3 +40,119 @@ def update_daily_report(delta_days=-1):
     # generate file
     factory = DailyReportFactory(specify_day=date)
     file_name, file_path = factory()
+
+
+@task(name='CreateDailyTranPartition')
+def create_daily_tran_partition(until_year=None):
+    """建立日交易資料表明年度(含)以前缺少的年度子表"""
+
+    db_logger = logging.getLogger('aprp')
+    logger_extra = {
+        'type_code': 'LOT-dailytrans',
+    }
+    try:
+        years = ensure_year_partitions(until_year)
+        if years:
+            db_logger.info(f'Create dailytrans partitions for years: {years}', extra=logger_extra)
+
+    except Exception as e:
+        db_logger.exception(e, extra=logger_extra)
+
+
+@task(name='RetryDeferredBuilds')
+def retry_deferred_builds():
+    """重新執行因斷路器開啟而延後的 builder 日期區間，斷路器仍開啟的項目放回佇列"""
+
+    db_logger = logging.getLogger('aprp')
+    logger_extra = {
+        'type_code': 'LOT-dailytrans',
+    }
+    try:
+        for item in pop_deferred():
+            if item['api_name'] and CircuitBreaker(item['api_name']).state == OPEN:
+                defer(item['func'], datetime.strptime(item['start_date'], '%Y-%m-%d'),
+                      datetime.strptime(item['end_date'], '%Y-%m-%d'), api_name=item['api_name'], **item['kwargs'])
+                continue
+
+            result = import_string(item['func'])(
+                start_date=item['start_date'], end_date=item['end_date'], format='%Y-%m-%d', **item['kwargs']
+            )
+            if result.success:
+                db_logger.info(
+                    f'Successfully retry deferred {item["func"]}: {item["start_date"]} - {item["end_date"]}',
+                    extra=logger_extra,
+                )
+
+    except Exception as e:
+        db_logger.exception(e, extra=logger_extra)
+
+
+@task(name='RunBuilderNode')
+def run_builder_node(results, func, start_date, end_date, kwargs):
+    """
+    執行 orchestrator 的一個節點，結果附加於同一條 lane 先前節點的結果之後
+
+    :param results: 同一條 lane 先前節點的結果
+    :param func: `direct_*` function 的 import path
+    """
+
+    result = import_string(func)(start_date=start_date, end_date=end_date, format='%Y-%m-%d', **kwargs)
+    return results + [serialize_result(func, result)]
+
+
+@task(name='AggregateBuilderResults')
+def aggregate_builder_results(results, start_date, end_date, started_at):
+    """orchestrator chord 的 callback，彙整所有節點的結果"""
+
+    db_logger = logging.getLogger('aprp')
+    logger_extra = {
+        'type_code': 'LOT-dailytrans',
+    }
+    summary = aggregate(results, start_date, end_date, started_at)
+    if summary['success']:
+        logger_extra['duration'] = summary['duration']
+        db_logger.info(f'Successfully process trans: {start_date} - {end_date}', extra=logger_extra)
+    else:
+        db_logger.error(f'Failed to process trans: {start_date} - {end_date}, {summary["msg"]}', extra=logger_extra)
+
+    return summary
+
+
+@task(name='RefreshAllBuilders')
+def refresh_all_builders(delta=-3):
+    """以 orchestrator 同時執行 `allapi` 的所有 builder，不等待結果，由 `AggregateBuilderResults` 記錄"""
+
+    from apps.dailytrans.builders.allapi import NODES
+    from apps.dailytrans.builders.utils import date_delta
+
+    start_date, end_date = date_delta(delta)
+    orchestrate(NODES, start_date, end_date)
+
+
+@task(name='PlannedBuild')
+def planned_build(module):
+    """
+    依抓取計畫執行 `module` 中的 builder，只請求 watermark 之後、缺漏與修正期間的日期，成功後推進 watermark
+
+    :param module: builder 模組，e.g. 'apps.crops.builder'
+    """
+
+    from apps.dailytrans.builders.allapi import get_planned_nodes
+
+    db_logger = logging.getLogger('aprp')
+    logger_extra = {
+        'type_code': 'LOT-dailytrans',
+    }
+    for node in get_planned_nodes(module):
+        try:
+            plan = build_plan(node)
+            result = import_string(node.func)(plan=plan)
+            if result.success:
+                advance_watermarks(plan)
+                logger_extra['duration'] = result.duration
+                db_logger.info(
+                    f'Successfully process planned trans of {node.func}: {plan.windows}', extra=logger_extra
+                )
+
+        except Exception as e:
+            db_logger.exception(e, extra=logger_extra)
@@ -3,18 +3,24 @@ import datetime
 
 from django.db.models.expressions import RawSQL
 
+import numpy as np
 import pandas as pd
 
+from django.conf import settings
 from django.utils.translation import ugettext as _
-from django.db.models import Func, IntegerField, Q
+from django.db.models import Case, Count, F, FloatField, Func, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
 
-from apps.dailytrans.models import DailyTran, is_leap
+from apps.dailytrans.models import CompletenessProfile, DailyAggregate, DailyTran, is_leap, month_day_ranges
+from apps.dailytrans.series import (
+    BASE_YEAR, COMPLETE_RATIO, FRAME_COLUMNS, PriceSeries, align_years, drop_missing_sources, to_ordinals
+)
 from apps.configs.api.serializers import TypeSerializer
 from apps.watchlists.models import WatchlistItem
 from apps.configs.models import AbstractProduct
 
 
-def get_query_set(_type, items, sources=None):
+def get_query_set(_type, items, sources=None, model=DailyTran):
     """
     獲取符合條件的每日交易資料查詢集
 
@@ -37,9 +43,13 @@ def get_query_set(_type, items, sources=None):
             - 如果未提供，將自動從 items 中獲取相關的來源
             - 可以是 Source 對象的任何可迭代集合
 
+        model (Model, optional): 要查詢的資料表，預設為 DailyTran
+            - 以相同條件查詢 CompletenessProfile 時使用，見 `get_completeness`
+            - 以相同條件查詢 DailyAggregate 時使用，見 `get_daily_model`
+
     Returns:
         QuerySet[DailyTran]: 過濾後的每日交易資料查詢集
-            - 返回符合所有過濾條件的 DailyTran 查詢集
+            - 返回符合所有過濾條件的 DailyTran(或 model)查詢集
             - 如果 items 為空，返回空的查詢集
 
     Raises:
@@ -68,7 +78,7 @@ def get_query_set(_type, items, sources=None):
     6. 返回最終的查詢集
     """
     if not items:
-        return DailyTran.objects.none()
+        return model.objects.none()
 
     # 驗證項目類型
     if not (isinstance(items.first(), (WatchlistItem, AbstractProduct))):
@@ -78,8 +88,11 @@ def get_query_set(_type, items, sources=None):
     product_ids = {item.product_id for item in items if isinstance(item, WatchlistItem)}
     product_ids.update({item.id for item in items if isinstance(item, AbstractProduct)})
 
-    # 根據type和農產品 ID 建立基本查詢
-    query = DailyTran.objects.filter(product__type=_type, product_id__in=product_ids)
+    # 根據type和農產品 ID 建立基本查詢，DailyAggregate 已存有品項的 type，不需 join 品項資料表
+    if model is DailyAggregate:
+        query = model.objects.filter(type=_type, product_id__in=product_ids)
+    else:
+        query = model.objects.filter(product__type=_type, product_id__in=product_ids)
 
     # 處理來源過濾
     if not sources:
@@ -96,7 +109,163 @@ def get_query_set(_type, items, sources=None):
     return query
 
 
-def get_group_by_date_query_set(query_set, start_date=None, end_date=None, specific_year=True):
+def get_completeness(_type, items, sources=None, years=None):
+    """
+    以 `CompletenessProfile` 判斷 has_volume/has_weight，只查詢每個 (品項, 來源, 年度) 一筆的筆數，不掃描日交易資料
+
+    Args:
+        _type, items, sources: 同 `get_query_set`
+        years (Iterable[int], optional): 只計算這些年度
+
+    Returns:
+        tuple: (has_volume, has_weight)，可傳入 `get_group_by_date_query_set` 的 completeness
+    """
+    profiles = get_query_set(_type, items, sources, model=CompletenessProfile)
+    if years:
+        profiles = profiles.filter(year__in=years)
+
+    return profiles.completeness()
+
+
+def get_daily_model():
+    """
+    儀表板圖表要查詢的資料表
+
+    `settings.DAILYTRAN_AGGREGATES` 為 True 時查詢每日部分合計(DailyAggregate)，每個 (品項, 來源, 日期) 一筆且已完成加權，
+    否則直接查詢日交易資料(DailyTran)；兩者經 `get_group_by_date_query_set` 彙總後的結果相同
+    """
+    return DailyAggregate if getattr(settings, 'DAILYTRAN_AGGREGATES', False) else DailyTran
+
+
+GROUP_BY_DATE_COLUMNS = FRAME_COLUMNS
+
+
+def _fill_one(field):
+    """缺失值以 1 代替，與 pandas 流程中的 fillna(1) 相同"""
+    return Coalesce(F(field), Value(1.0), output_field=FloatField())
+
+
+def _when(condition, expression, output_field):
+    """只保留符合條件的資料，其餘為 NULL(不計入 SUM 與 COUNT)"""
+    if condition is None:
+        return expression
+    return Case(When(condition, then=expression), output_field=output_field)
+
+
+def daily_partials(model, condition=None):
+    """
+    每日加權彙總所需的筆數與加權合計運算式，只計算符合 condition 的資料
+
+    DailyTran 由原始資料計算(缺失的重量與交易量以 1 代替)，DailyAggregate 加總已計算好的部分合計
+
+    Returns:
+        dict: keys 為 'rows', 'volume_rows', 'weight_rows', 'total_price', 'total_weight',
+              'total_volume', 'sum_volume'
+    """
+    if model is DailyAggregate:
+        return {
+            name: Sum(_when(condition, F(name), output_field), output_field=output_field)
+            for name, output_field in (
+                ('rows', IntegerField()), ('volume_rows', IntegerField()), ('weight_rows', IntegerField()),
+                ('total_price', FloatField()), ('total_weight', FloatField()), ('total_volume', FloatField()),
+                ('sum_volume', FloatField()),
+            )
+        }
+
+    return {
+        'rows': Count(_when(condition, F('id'), IntegerField())),
+        'volume_rows': Count(_when(condition, F('volume'), FloatField())),
+        'weight_rows': Count(_when(condition, F('avg_weight'), FloatField())),
+        'total_price': Sum(_when(condition, F('avg_price') * _fill_one('avg_weight') * _fill_one('volume'),
+                                 FloatField()), output_field=FloatField()),
+        'total_weight': Sum(_when(condition, _fill_one('avg_weight') * _fill_one('volume'), FloatField()),
+                            output_field=FloatField()),
+        'total_volume': Sum(_when(condition, _fill_one('volume'), FloatField()), output_field=FloatField()),
+        'sum_volume': Sum(_when(condition, F('volume'), FloatField()), output_field=FloatField()),
+    }
+
+
+def positive_filter(model):
+    """有交易量與重量時只彙總交易量與重量皆大於 0 的資料"""
+    if model is DailyAggregate:
+        return Q(positive=True)
+    return Q(volume__gt=0) & Q(avg_weight__gt=0)
+
+
+def group_by_date_values(query_set):
+    """
+    建立每日加權彙總的查詢集，於資料庫內以單一 `GROUP BY date` 查詢完成計算
+
+    SQL 等同於:
+        SELECT date,
+               SUM(avg_price * COALESCE(avg_weight, 1) * COALESCE(volume, 1)),
+               SUM(COALESCE(avg_weight, 1) * COALESCE(volume, 1)),
+               SUM(COALESCE(volume, 1)),
+               COALESCE(SUM(volume), 0),
+               COUNT(DISTINCT source_id)
+        FROM dailytrans_dailytran WHERE ... GROUP BY date ORDER BY date
+
+    DailyAggregate 的查詢集則直接加總各欄位的部分合計，結果相同
+
+    Args:
+        query_set (QuerySet): 已完成條件過濾的 DailyTran 或 DailyAggregate 查詢集
+
+    Returns:
+        ValuesQuerySet: 每一天一筆的 dict，keys 為 'date', 'total_price', 'total_weight',
+                        'total_volume', 'sum_volume', 'num_of_source'
+    """
+    partials = daily_partials(query_set.model)
+
+    return (
+        query_set
+        .order_by()
+        .values('date')
+        .annotate(
+            total_price=partials['total_price'],
+            total_weight=partials['total_weight'],
+            total_volume=partials['total_volume'],
+            sum_volume=Coalesce(partials['sum_volume'], Value(0.0), output_field=FloatField()),
+            num_of_source=Count('source', distinct=True),
+        )
+        .order_by('date')
+    )
+
+
+def _group_by_date_in_db(query_set):
+    """
+    以 `group_by_date_values` 於資料庫完成每日加權彙總
+
+    Returns:
+        PriceSeries: 只有加權合計與來源數的每日序列
+    """
+    # pandas 流程中若所有資料皆無來源，來源數視為 1；否則無來源的資料會在 groupby 時被排除
+    has_source = query_set.filter(source__isnull=False).exists()
+    if has_source:
+        query_set = query_set.filter(source__isnull=False)
+
+    df = pd.DataFrame(list(group_by_date_values(query_set)))
+    if not df.empty and not has_source:
+        df['num_of_source'] = 1
+
+    return PriceSeries.from_daily(df)
+
+
+def _group_by_date_in_pandas(query_set):
+    """
+    將查詢結果全數取出後，以 `PriceSeries.from_frame` 進行每日加權彙總
+
+    保留此流程用於與 `_group_by_date_in_db` 比對結果
+    """
+    df = pd.DataFrame(list(query_set.values('date', 'avg_price', 'avg_weight', 'volume', 'source_id')))
+    if df.empty:
+        return PriceSeries.empty()
+
+    # 同 groupby(['date', 'source_id'])，無來源的資料只有在所有資料皆無來源時保留
+    return PriceSeries.from_frame(drop_missing_sources(df))
+
+
+def get_group_by_date_query_set(query_set, start_date=None, end_date=None, specific_year=True, aggregate_in_db=True,
+                                completeness=None):
     """
     按日期對查詢結果進行分組和聚合計算
 
@@ -112,6 +281,11 @@ def get_group_by_date_query_set(query_set, start_date=None, end_date=None, speci
         specific_year (bool): 是否按特定年份過濾
             - True: 只查詢指定年份的數據
             - False: 查詢跨年度的數據
+        aggregate_in_db (bool): 彙總方式
+            - True: 以單一 `GROUP BY date` SQL 查詢於資料庫彙總，每日只回傳一筆資料
+            - False: 取出所有原始資料後以 pandas 彙總，只支援 DailyTran 查詢集
+        completeness (tuple, optional): 已知的 (has_volume, has_weight)，e.g. `get_completeness` 的結果，
+            未提供時以單一查詢計算 query_set 的筆數
 
     Returns:
         tuple: (DataFrame, bool, bool)
@@ -127,8 +301,15 @@ def get_group_by_date_query_set(query_set, start_date=None, end_date=None, speci
     4. 對缺失值進行處理
     """
     # 檢查交易量和重量數據的完整性
-    has_volume = query_set.filter(volume__isnull=False).count() > (0.8 * query_set.count())
-    has_weight = query_set.filter(avg_weight__isnull=False).count() > (0.8 * query_set.count())
+    if completeness is None:
+        partials = daily_partials(query_set.model)
+        counts = query_set.aggregate(rows=partials['rows'], volume_rows=partials['volume_rows'],
+                                     weight_rows=partials['weight_rows'])
+        rows = counts['rows'] or 0
+        has_volume = (counts['volume_rows'] or 0) > (COMPLETE_RATIO * rows)
+        has_weight = (counts['weight_rows'] or 0) > (COMPLETE_RATIO * rows)
+    else:
+        has_volume, has_weight = completeness
 
     # 日期範圍過濾
     if isinstance(start_date, datetime.date) and isinstance(end_date, datetime.date):
@@ -137,55 +318,158 @@ def get_group_by_date_query_set(query_set, start_date=None, end_date=None, speci
         else:
             query_set = query_set.between_month_day_filter(start_date, end_date)
 
+    if has_volume and has_weight:
+        query_set = query_set.filter(positive_filter(query_set.model))
+
+    series = _group_by_date_in_db(query_set) if aggregate_in_db else _group_by_date_in_pandas(query_set)
+
     # 空數據處理
-    if not query_set:
-        return pd.DataFrame(
-            columns=['date', 'avg_price', 'num_of_source', 'sum_volume', 'avg_avg_weight']), False, False
+    if not len(series):
+        return pd.DataFrame(columns=GROUP_BY_DATE_COLUMNS), False, False
 
-    if has_volume and has_weight:
-        query_set = query_set.filter(Q(volume__gt=0) & Q(avg_weight__gt=0))
+    # 處理缺失的量和重量數據: 沒有交易量時以來源數代替，沒有重量時為 1
+    return series.to_frame(has_volume, has_weight), has_volume, has_weight
+
+
+def daily_summary_filters(model):
+    """`get_group_by_date_query_set` 依 has_volume/has_weight 與是否有來源所套用的過濾條件"""
+    positive = positive_filter(model)
+
+    return {
+        'all_': None,
+        'source_': Q(source__isnull=False),
+        'positive_': positive,
+        'positive_source_': positive & Q(source__isnull=False),
+    }
+
+
+def daily_summary_values(query_set):
+    """
+    建立每日一筆的彙總查詢集，一次查詢即可於記憶體中重現任意日期區間的 `get_group_by_date_query_set`
+
+    除了判斷 has_volume/has_weight 所需的筆數(all_rows, all_volume_rows, all_weight_rows)外，
+    每個 `daily_summary_filters` 條件各有一組 `group_by_date_values` 的加權合計，
+    欄位名稱以條件名稱為前綴，e.g. 'positive_source_total_price'；
+    前綴皆不為空，避免與 DailyAggregate 同名的欄位衝突(後續的 F('rows') 會解析為先前的 annotation)
+
+    Args:
+        query_set (QuerySet): 已完成條件過濾的 DailyTran 或 DailyAggregate 查詢集，不需先過濾日期
+
+    Returns:
+        ValuesQuerySet: 依日期排序，每一天一筆的 dict
+    """
+    filters = daily_summary_filters(query_set.model)
+    partials = daily_partials(query_set.model)
+    annotations = {
+        'all_volume_rows': partials['volume_rows'],
+        'all_weight_rows': partials['weight_rows'],
+        'num_of_source': Count('source', distinct=True),
+        'positive_num_of_source': Count(_when(filters['positive_'], F('source'), IntegerField()), distinct=True),
+    }
+    for prefix, condition in filters.items():
+        partials = daily_partials(query_set.model, condition)
+        annotations.update({
+            f'{prefix}{name}': partials[name]
+            for name in ('rows', 'total_price', 'total_weight', 'total_volume', 'sum_volume')
+        })
+
+    return query_set.order_by().values('date').annotate(**annotations).order_by('date')
 
-    # 將查詢結果轉換為 DataFrame
-    df = pd.DataFrame(list(query_set.values()))
-    df = df[['product_id', 'date', 'avg_price', 'avg_weight', 'volume', 'source_id']]
 
-    # 數據處理和計算
-    # 將缺失值填充為 1，不用因為缺失值設定判斷式再進行計算
-    df['vol_for_calculation'] = df['volume'].fillna(1)
-    df['wt_for_calculation'] = df['avg_weight'].fillna(1)
-    # 計算單日單一交易地點的總價格和總交易重量
-    df['avg_price'] = df['avg_price'] * df['wt_for_calculation'] * df['vol_for_calculation']
-    df['wt_for_calculation'] = df['wt_for_calculation'] * df['vol_for_calculation']
+def get_daily_summary(query_set):
+    """
+    執行 `daily_summary_values`，回傳以欄位名稱為 columns 的 PriceSeries
+
+    沒有符合條件的資料時 SUM 為 NULL，以 0 代替
+    """
+    df = pd.DataFrame(list(daily_summary_values(query_set)))
+    if df.empty:
+        return PriceSeries(np.array([], dtype=np.int64), all_rows=np.array([], dtype=np.int64),
+                           all_volume_rows=np.array([], dtype=np.int64),
+                           all_weight_rows=np.array([], dtype=np.int64))
 
-    # 根據來源市場 ID 分組計算
-    if all(pd.isna(df['source_id'])):
-        df['source_id'].fillna(1, inplace=True)
+    df = df.fillna(0)
+    return PriceSeries(to_ordinals(df['date'].values), **{
+        column: df[column].values for column in df.columns if column != 'date'
+    })
 
-    # 按日期和來源市場 ID 分組
-    group = df.groupby(['date', 'source_id'])
-    df_fin = group.sum()
-    df_fin['num_of_source'] = 1
 
-    # 按日期分組
-    group = df_fin.groupby('date')
-    df_fin = group.sum()
+def group_by_date_in_memory(summary, start_date=None, end_date=None, specific_year=True):
+    """
+    以 `get_daily_summary` 的結果計算 `get_group_by_date_query_set`，不再查詢資料庫
+
+    Args:
+        summary (PriceSeries): `get_daily_summary` 的結果，has_volume/has_weight 以其全部日期判斷，
+                               等同 `get_group_by_date_query_set` 的 query_set
+        start_date, end_date, specific_year: 同 `get_group_by_date_query_set`
 
-    # 計算最終的平均價格和重量
-    df_fin['avg_price'] = df_fin['avg_price'] / df_fin['wt_for_calculation']
-    df_fin['avg_weight'] = df_fin['wt_for_calculation'] / df_fin['vol_for_calculation']
-    df_fin.reset_index(inplace=True)
-    df_fin = df_fin.sort_values('date')
+    Returns:
+        tuple: (DataFrame, bool, bool)，同 `get_group_by_date_query_set`
+    """
+    rows = summary.total('all_rows')
+    has_volume = summary.total('all_volume_rows') > (COMPLETE_RATIO * rows)
+    has_weight = summary.total('all_weight_rows') > (COMPLETE_RATIO * rows)
 
-    # 重命名列
-    df_fin.rename(columns={'volume': 'sum_volume', 'avg_weight': 'avg_avg_weight'}, inplace=True)
+    if isinstance(start_date, datetime.date) and isinstance(end_date, datetime.date):
+        if specific_year:
+            summary = summary.window(start_date, end_date)
+        else:
+            summary = summary.select_ranges(month_day_ranges(start_date, end_date))
+
+    prefix = 'positive_' if has_volume and has_weight else ''
+    # 同 `_group_by_date_in_db`，部分資料有來源時排除無來源的資料
+    has_source = summary.total(f'{prefix}source_rows') > 0
+    columns = summary.columns
+    name = f'{prefix}source_' if has_source else prefix or 'all_'
+
+    summary = summary[columns[f'{name}rows'] > 0]
+    if not len(summary):
+        return pd.DataFrame(columns=GROUP_BY_DATE_COLUMNS), False, False
+
+    columns = summary.columns
+    series = PriceSeries(
+        summary.ordinal,
+        total_price=columns[f'{name}total_price'].astype(float),
+        total_weight=columns[f'{name}total_weight'].astype(float),
+        total_volume=columns[f'{name}total_volume'].astype(float),
+        sum_volume=columns[f'{name}sum_volume'].astype(float),
+        sources=columns[f'{prefix}num_of_source'].astype(np.int64) if has_source
+        else np.ones(len(summary), dtype=np.int64),
+        days=np.ones(len(summary), dtype=np.int64),
+    )
+    return series.to_frame(has_volume, has_weight), has_volume, has_weight
 
-    # 處理缺失的量和重量數據
-    if not has_volume:
-        df_fin['sum_volume'] = df_fin['num_of_source']
-    if not has_weight:
-        df_fin['avg_avg_weight'] = 1
 
-    return df_fin[['date', 'avg_price', 'num_of_source', 'sum_volume', 'avg_avg_weight']], has_volume, has_weight
+def mean_by_date_ranges(df, ranges, columns):
+    """
+    以一次 np.add.reduceat 計算 df(已依 date 排序)在每個日期區間內各欄位的平均，同 `df[mask].mean()`
+
+    Args:
+        df (pd.DataFrame): 依 'date' 排序的資料
+        ranges (list): [(起始日期, 結束日期), ...]，包含起訖日，區間可重疊
+        columns (list): 要計算平均的欄位
+
+    Returns:
+        pd.DataFrame: 每個區間一列，沒有資料的區間為 NaN
+    """
+    if not ranges:
+        return pd.DataFrame(columns=columns, dtype=float)
+
+    ordinal = to_ordinals(df['date'].values)
+    starts = np.searchsorted(ordinal, to_ordinals([start for start, _ in ranges]))
+    ends = np.searchsorted(ordinal, to_ordinals([end for _, end in ranges]), side='right')
+
+    values = df[columns].values.astype(float)
+    valid = ~np.isnan(values)
+    # 多一列 0 使 ends 可以等於資料筆數；reduceat 在 [start, end) 為空時回傳單一列，另外設為 0
+    stacked = np.vstack([np.hstack([np.where(valid, values, 0), valid]), np.zeros((1, 2 * len(columns)))])
+    indices = np.column_stack([starts, ends]).ravel()
+    sums = np.add.reduceat(stacked, indices, axis=0)[::2]
+    sums[starts >= ends] = 0
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = sums[:, :len(columns)] / sums[:, len(columns):]
+    return pd.DataFrame(np.where(sums[:, len(columns):] > 0, means, np.nan), columns=columns)
 
 
 def get_daily_price_volume(_type, items, sources=None, start_date=None, end_date=None):
@@ -232,8 +516,9 @@ def get_daily_price_volume(_type, items, sources=None, start_date=None, end_date
     4. 轉換數據格式以符合前端需求
     """
     # 獲取並處理查詢數據
-    query_set = get_query_set(_type, items, sources)
-    q, has_volume, has_weight = get_group_by_date_query_set(query_set, start_date, end_date)
+    query_set = get_query_set(_type, items, sources, model=get_daily_model())
+    q, has_volume, has_weight = get_group_by_date_query_set(query_set, start_date, end_date,
+                                                            completeness=get_completeness(_type, items, sources))
 
     # 檢查是否有數據
     if q.size == 0:
@@ -292,6 +577,76 @@ def get_daily_price_volume(_type, items, sources=None, start_date=None, end_date
     }
 
 
+def get_year_aligned_result(q, key, years):
+    """
+    為指定的數據類型生成年度比較的結果字典
+
+    以 `align_years` 一次將所有年份對齊至基準年，直接由矩陣產生 highchart 與表格資料，
+    結果與逐日 reindex 後以 iterrows 處理相同
+
+    Args:
+        q (pd.DataFrame): `get_group_by_date_query_set` 的每日彙總資料
+        key (str): 數據類型標識符 ('avg_price', 'sum_volume', 或 'avg_avg_weight')
+        years (list): 有資料的年份，用於表格的欄位定義
+
+    Returns:
+        dict: {
+            'highchart': 按年份分組的數據點,
+            'raw': 表格格式的原始數據
+        }
+    """
+    if q.size == 0:
+        return {
+            'highchart': {},
+            'raw': None
+        }
+
+    values = q[key].values
+    all_years, matrix = align_years(q['date'], values.astype(float))
+
+    # 原本逐日 reindex 後才逐筆處理，整數欄位只有在整段期間都沒有缺漏日期時才維持整數
+    span = (datetime.date(int(all_years[-1]), 12, 31) - datetime.date(int(all_years[0]), 1, 1)).days + 1
+    as_int = np.issubdtype(values.dtype, np.integer) and len(values) == span
+
+    # 生成標準年份的日期範圍 (使用2016作為基準年)
+    date_list = pd.date_range(datetime.date(BASE_YEAR, 1, 1), datetime.date(BASE_YEAR, 12, 31), freq='D')
+    timestamps = [to_unix(date) for date in date_list.date]
+
+    # 數值為 0 的資料點為 None，無資料(包含平年的 2/29)為 (timestamp, None)
+    result = {}
+    for year, row in zip(all_years, matrix):
+        cells = row.tolist()
+        if as_int:
+            cells = [cell if cell != cell else int(cell) for cell in cells]
+        result[str(year)] = [
+            None if cell == 0 else (timestamp, None if cell != cell else cell)
+            for timestamp, cell in zip(timestamps, cells)
+        ]
+
+    # 原始數據表格: 每一列為基準年的一天，每一欄為一個年份，缺值(含 0)為 ''，移除全部為空的列
+    missing = np.isnan(matrix) | (matrix == 0)
+    table = matrix.T.astype(object)
+    if as_int:
+        for i in np.flatnonzero(~missing.any(axis=1)):
+            table[:, i] = matrix[i].astype(np.int64).astype(object)
+    table[missing.T] = ''
+
+    rows = np.column_stack([np.array(list(date_list), dtype=object), table])
+    raw_data_rows_remove_empty = rows[~missing.all(axis=0)].tolist()
+
+    # 準備表格列定義
+    raw_data_columns = [{'value': _('Date'), 'format': 'date'}]
+    raw_data_columns.extend([{'value': str(year), 'format': key} for year in years])
+
+    return {
+        'highchart': result,
+        'raw': {
+            'columns': raw_data_columns,
+            'rows': raw_data_rows_remove_empty
+        }
+    }
+
+
 def get_daily_price_by_year(_type, items, sources=None):
     """
     獲取按年份分組的每日價格數據，用於年度比較分析
@@ -328,8 +683,8 @@ def get_daily_price_by_year(_type, items, sources=None):
             }
 
     Implementation Details:
-    1. 內部輔助函數:
-        - get_result(key): 處理單個數據類型(價格/交易量/重量)的結果生成
+    1. 輔助函數:
+        - get_year_aligned_result(q, key, years): 處理單個數據類型(價格/交易量/重量)的結果生成
             - 生成 highchart 和原始數據兩種格式
             - 處理閏年特殊情況
 
@@ -341,69 +696,10 @@ def get_daily_price_by_year(_type, items, sources=None):
     5. 處理特殊情況（如閏年）
     """
 
-    def get_result(key):
-        """
-        為指定的數據類型生成結果字典
-
-        Args:
-            key (str): 數據類型標識符 ('avg_price', 'sum_volume', 或 'avg_avg_weight')
-
-        Returns:
-            dict: {
-                'highchart': 按年份分組的數據點,
-                'raw': 表格格式的原始數據
-            }
-        """
-        # 初始化結果字典
-        result = {str(year): [] for year in pd.to_datetime(q['date']).dt.year.unique()}
-        if q.size == 0:
-            return {
-                'highchart': result,
-                'raw': None
-            }
-
-        # 生成標準年份的日期範圍 (使用2016作為基準年)
-        date_list = pd.date_range(datetime.date(2016, 1, 1), datetime.date(2016, 12, 31), freq='D')
-
-        # 處理每一個數據點
-        for i, dic in q.iterrows():
-            # 將數據點的日期調整到2016年
-            date = datetime.date(year=2016, month=dic['date'].month, day=dic['date'].day)
-            result[str(dic['date'].year)].append(
-                (to_unix(date), None if pd.isna(dic[key]) else dic[key]) if dic[key] else None
-            )
-
-            # 處理閏年特殊情況
-            if not ((dic['date'].year % 4 == 0 and dic['date'].year % 100 != 0) or dic['date'].year % 400 == 0) and \
-                    dic['date'].month == 2 and dic['date'].day == 28:
-                result[str(dic['date'].year)].append((to_unix(datetime.date(2016, 2, 29)), None))
-
-        # 創建和處理原始數據表格
-        df = pd.DataFrame.from_dict(result, orient='columns')
-        df = df.applymap(lambda x: x[1] if isinstance(x, tuple) else x)
-        df.insert(0, 'date', date_list)
-
-        # 移除全部為空的行
-        row_empty = df.iloc[:, 1:].isna().all(axis=1)
-        raw_data_rows_remove_empty = df[~row_empty]
-        raw_data_rows_remove_empty.fillna('', inplace=True)
-        raw_data_rows_remove_empty = raw_data_rows_remove_empty.values.tolist()
-
-        # 準備表格列定義
-        raw_data_columns = [{'value': _('Date'), 'format': 'date'}]
-        raw_data_columns.extend([{'value': str(year), 'format': key} for year in years])
-
-        return {
-            'highchart': result,
-            'raw': {
-                'columns': raw_data_columns,
-                'rows': raw_data_rows_remove_empty
-            }
-        }
-
     # 主函數邏輯開始
-    query_set = get_query_set(_type, items, sources)
-    q, has_volume, has_weight = get_group_by_date_query_set(query_set)
+    query_set = get_query_set(_type, items, sources, model=get_daily_model())
+    q, has_volume, has_weight = get_group_by_date_query_set(query_set,
+                                                            completeness=get_completeness(_type, items, sources))
 
     # 處理空數據情況
     if q.size == 0:
@@ -417,27 +713,19 @@ def get_daily_price_by_year(_type, items, sources=None):
         this_year = datetime.date.today().year
         return this_year > y >= datetime.date.today().year - 5
 
-    # 重建完整的日期範圍並填充缺失值
-    q = q.set_index('date').reindex(
-        pd.date_range(datetime.date(q['date'].min().year, 1, 1),
-                      datetime.date(q['date'].max().year, 12, 31)),
-        fill_value=None
-    )
-    q = q.reset_index().rename(columns={'index': 'date'})
-
     # 準備回傳數據
     response_data = {
         'years': [(year, selected_year(year)) for year in years],
         'type': TypeSerializer(_type).data,
-        'price': get_result('avg_price'),
+        'price': get_year_aligned_result(q, 'avg_price', years),
     }
 
     # 根據數據可用性添加交易量和重量數據
     if has_volume:
-        response_data['volume'] = get_result('sum_volume')
+        response_data['volume'] = get_year_aligned_result(q, 'sum_volume', years)
 
     if has_weight:
-        response_data['weight'] = get_result('avg_avg_weight')
+        response_data['weight'] = get_year_aligned_result(q, 'avg_avg_weight', years)
 
     response_data['no_data'] = len(response_data['price']['highchart'].keys()) == 0
 
@@ -652,15 +940,16 @@ def get_monthly_price_distribution(_type, items, sources=None, selected_years=No
         }
 
     # 主函數邏輯
-    query_set = get_query_set(_type, items, sources)
-    years = sorted({date[0].year for date in query_set.values_list('date')})
+    query_set = get_query_set(_type, items, sources, model=get_daily_model())
+    years = sorted(date.year for date in query_set.dates('date', 'year'))
 
     # 如果指定了年份，進行過濾
     if selected_years:
         query_set = query_set.filter(date__year__in=selected_years)
 
     # 獲取基本數據
-    q, has_volume, has_weight = get_group_by_date_query_set(query_set)
+    completeness = get_completeness(_type, items, sources, years=selected_years)
+    q, has_volume, has_weight = get_group_by_date_query_set(query_set, completeness=completeness)
     q['month'] = pd.to_datetime(q['date']).dt.month
 
     # 準備回傳數據
@@ -672,10 +961,10 @@ def get_monthly_price_distribution(_type, items, sources=None, selected_years=No
 
     # 添加交易量和重量數據（如果有）
     if has_volume:
-        response_data['volume'] = get_result('sum_volume')
+        response_data['volume'] = get_year_aligned_result(q, 'sum_volume', years)
 
     if has_weight:
-        response_data['weight'] = get_result('avg_avg_weight')
+        response_data['weight'] = get_year_aligned_result(q, 'avg_avg_weight', years)
 
     response_data['no_data'] = len(response_data['price']['highchart'].keys()) == 0
 
@@ -786,17 +1075,15 @@ def get_integration(_type, items, start_date, end_date, sources=None, to_init=Tr
 
         # 處理跨年度的情況
         if start_date and end_date and start_date.year != end_date.year:
-            df_list = []
-            for i in range(1, start_date.year - df['date'].iloc[0].year + 1):
-                # 計算每個年度區間的統計值
-                split_df = df[
-                    (df['date'] >= datetime.date(start_date.year - i, start_date.month, start_date.day)) \
-                    & (df['date'] <= datetime.date(end_date.year - i, end_date.month, end_date.day)) \
-                    ].mean()
-                split_df['year'] = start_date.year - i
-                split_df['end_year'] = end_date.year - i
-                df_list.append(split_df)
-            df = pd.concat(df_list, axis=1).T
+            # 以一次 reduceat 計算每個年度區間的統計值
+            years = [start_date.year - i for i in range(1, start_date.year - df['date'].iloc[0].year + 1)]
+            ranges = [(datetime.date(year, start_date.month, start_date.day),
+                       datetime.date(year + end_date.year - start_date.year, end_date.month, end_date.day))
+                      for year in years]
+            columns = [column for column in df.columns if column != 'date']
+            df = mean_by_date_ranges(df, ranges, columns)
+            df['year'] = np.array(years, dtype=float)
+            df['end_year'] = np.array([end.year for _, end in ranges], dtype=float)
         else:
             # 單年度的處理
             df['year'] = pd.to_datetime(df['date']).dt.year
@@ -815,12 +1102,12 @@ def get_integration(_type, items, start_date, end_date, sources=None, to_init=Tr
 
         return result
 
-    def generate_integration(query, start, end, specific_year, name, base, order):
+    def generate_integration(summary, start, end, specific_year, name, base, order):
         """
         生成整合數據結構
 
         Args:
-            query (QuerySet): 查詢集
+            summary (PriceSeries): `get_daily_summary` 的每日彙總
             start (datetime): 開始日期
             end (datetime): 結束日期
             specific_year (bool): 是否特定年份
@@ -834,10 +1121,10 @@ def get_integration(_type, items, start_date, end_date, sources=None, to_init=Tr
         3. 生成數據點
         4. 組織數據結構
         """
-        q, with_volume, with_weight = get_group_by_date_query_set(query,
-                                                                  start_date=start,
-                                                                  end_date=end,
-                                                                  specific_year=specific_year)
+        q, with_volume, with_weight = group_by_date_in_memory(summary,
+                                                              start_date=start,
+                                                              end_date=end,
+                                                              specific_year=specific_year)
         years = pd.to_datetime(q['date']).dt.year.unique()
         if q.empty or ('5' in name and len(years) < 5):
             return
@@ -849,17 +1136,20 @@ def get_integration(_type, items, start_date, end_date, sources=None, to_init=Tr
         integration.append(data)
 
     # 主函數邏輯開始
-    query_set = get_query_set(_type, items, sources)
+    query_set = get_query_set(_type, items, sources, model=get_daily_model())
     diff = end_date - start_date + datetime.timedelta(1)
     last_start_date = start_date - diff
     last_end_date = end_date - diff
     integration = []
 
     if to_init:
+        # 唯一的資料庫查詢: 每日彙總，各期間皆由此於記憶體中以二分搜尋取出
+        summary = get_daily_summary(query_set)
+
         # 生成本期數據
-        generate_integration(query_set, start_date, end_date, True, _('This Term'), True, 1)
+        generate_integration(summary, start_date, end_date, True, _('This Term'), True, 1)
         # 生成去年同期數據
-        generate_integration(query_set, last_start_date, last_end_date, True, _('Last Term'), False, 2)
+        generate_integration(summary, last_start_date, last_end_date, True, _('Last Term'), False, 2)
 
         # 生成五年數據
         start_date_fy = datetime.datetime(start_date.year - 5, start_date.month + 1, 1) \
@@ -868,23 +1158,30 @@ def get_integration(_type, items, start_date, end_date, sources=None, to_init=Tr
         end_date_fy = datetime.datetime(end_date.year - 1, end_date.month, end_date.day - 1) \
             if (is_leap(end_date.year) and end_date.month == 2 and end_date.day == 29) \
             else datetime.datetime(end_date.year - 1, end_date.month, end_date.day)
-        query_set_fy = query_set.filter(date__gte=start_date_fy, date__lte=end_date_fy)
-        generate_integration(query_set_fy, start_date, end_date, False, _('5 Years'), False, 3)
+        summary_fy = summary.window(start_date_fy.date(), end_date_fy.date())
+        generate_integration(summary_fy, start_date, end_date, False, _('5 Years'), False, 3)
     else:
         # 生成年度比較數據
         this_year = end_date.year
-        query_set = query_set.filter(date__year__lt=this_year)
-        q, has_volume, has_weight = get_group_by_date_query_set(query_set,
-                                                                start_date=start_date,
-                                                                end_date=end_date,
-                                                                specific_year=False)
+        summary = get_daily_summary(query_set.filter(date__year__lt=this_year))
+        q, has_volume, has_weight = group_by_date_in_memory(summary,
+                                                            start_date=start_date,
+                                                            end_date=end_date,
+                                                            specific_year=False)
         if q.size > 0:
             data_all = pandas_annotate_year(q, start_date, end_date)
+            # q 已依日期排序，各年度的資料點以二分搜尋取出
+            ordinal = to_ordinals(q['date'].values)
+
+            def slice_by_date(start, end):
+                return q.iloc[np.searchsorted(ordinal, to_ordinals([start])[0]):
+                              np.searchsorted(ordinal, to_ordinals([end])[0], side='right')]
+
             if start_date.year == end_date.year:
                 # 處理單年度數據
                 for dic in data_all:
                     year = dic['year']
-                    q_filter_by_year = q[pd.to_datetime(q['date']).dt.year == year].sort_values('date')
+                    q_filter_by_year = slice_by_date(datetime.date(int(year), 1, 1), datetime.date(int(year), 12, 31))
                     dic['name'] = '%0.0f' % year
                     dic['points'] = spark_point_maker(q_filter_by_year)
                     dic['base'] = False
@@ -894,10 +1191,8 @@ def get_integration(_type, items, start_date, end_date, sources=None, to_init=Tr
                 for dic in data_all:
                     start_year = int(dic['year'])
                     end_year = int(dic['end_year'])
-                    q_filter_by_year = q[(
-                            (q['date'] >= datetime.date(start_year, start_date.month, start_date.day)) &
-                            (q['date'] <= datetime.date(end_year, end_date.month, end_date.day))
-                    )]
+                    q_filter_by_year = slice_by_date(datetime.date(start_year, start_date.month, start_date.day),
+                                                     datetime.date(end_year, end_date.month, end_date.day))
                     dic['name'] = '{}~{}'.format(start_year, end_year)
                     dic['points'] = spark_point_maker(q_filter_by_year)
                     dic['base'] = False
@@ -33,7 +33,7 @@ def direct_wholesale_07(start_date=None, end_date=None, *args, **kwargs):
             start_date, end_date, WHOLESALE_DELTA_DAYS
         ):
             response = wholesale_api.request(date=delta_start_date)
-            wholesale_api.load(response)
+            wholesale_api.load_if_changed(response, date=delta_start_date)
 
     return data
 
@@ -54,6 +54,6 @@ def direct_wholesale_04(start_date=None, end_date=None, *args, **kwargs):
             start_date, end_date, WHOLESALE_DELTA_DAYS
         ):
             response = wholesale_api.request(date=delta_start_date)
-            wholesale_api.load(response)
+            wholesale_api.load_if_changed(response, date=delta_start_date)
 
     return data
@@ -32,15 +32,10 @@ def direct_wholesale_06(start_date=None, end_date=None, *args, **kwargs):
 
     for model in MODELS:
         wholesale_api = WholeSaleApi06(model=model, **data._asdict())
-        date_diff = end_date - start_date
 
-        for delta in range(date_diff.days + 1):
-            response = wholesale_api.request(
-                start_date=start_date + datetime.timedelta(days=delta),
-                end_date=start_date + datetime.timedelta(days=delta),
-                tc_type="N05",
-            )
-            wholesale_api.load(response)
+        # 以整個日期區間請求，回應失敗時自動切分區間
+        # tc_type=N05 -> 水果
+        wholesale_api.fetch_range_and_load(start_date, end_date, tc_type="N05")
 
     return data
 
@@ -52,19 +47,11 @@ def direct_origin(start_date=None, end_date=None, *args, **kwargs):
 
     for model in MODELS:
         origin_api = OriginApi(model=model, **data._asdict())
-        date_diff = end_date - start_date
-        for delta in range(date_diff.days + 1):
-            response = origin_api.request(
-                start_date=start_date + datetime.timedelta(days=delta),
-                end_date=start_date + datetime.timedelta(days=delta),
-                *args,
-                **kwargs,
-            )
-            origin_api.load(response)
-            # response_banana_low = origin_api.request(start_date=start_date + datetime.timedelta(days=delta),
-            #                                          end_date=start_date + datetime.timedelta(days=delta),
-            #                                          name='青香蕉下品(內銷)')
-            # origin_api.load(response_banana_low)
+        origin_api.fetch_range_and_load(start_date, end_date, **kwargs)
+        # response_banana_low = origin_api.request(start_date=start_date + datetime.timedelta(days=delta),
+        #                                          end_date=start_date + datetime.timedelta(days=delta),
+        #                                          name='青香蕉下品(內銷)')
+        # origin_api.load(response_banana_low)
     return data
 
 
@@ -79,6 +66,6 @@ def direct_wholesale_03(start_date=None, end_date=None, *args, **kwargs):
         # this api only provide one day filter
         for delta_start_date, delta_end_date in date_generator(start_date, end_date, 1):
             response = wholesale_api.request(date=delta_start_date)
-            wholesale_api.load(response)
+            wholesale_api.load_if_changed(response, date=delta_start_date)
 
     return data
@@ -29,10 +29,13 @@ def direct(start_date=None, end_date=None, *args, **kwargs):
             if not end_date:
                 end_date = date.today().strftime('%Y/%m/%d')
 
-            # 白肉雞總貨和紅羽土雞總貨是同一網頁頁面,選其中一個,兩品項會一起抓,避免花時間重複抓
+            # 白肉雞總貨和紅羽土雞總貨是同一網頁頁面,選其中一個,兩品項會一起抓,避免花時間重複抓;
+            # 環南-白肉雞和環南-土雞也是一次抓取兩個品項的頁面
             distinct_list.append(obj.id)
             if (obj.id == 150004 and 150003 in distinct_list) or (obj.id == 150003 and 150004 in distinct_list):    
                 continue
+            if (obj.id == 150002 and 150001 in distinct_list) or (obj.id == 150001 and 150002 in distinct_list):
+                continue
 
             response = api.request(start_date=start_date, end_date=end_date, id=obj.id)
             if response:
@@ -23,6 +23,6 @@ def direct(start_date=None, end_date=None, *args, **kwargs):
         api = Api(model=model, **data._asdict())
         for delta_start_date, delta_end_date in date_generator(start_date, end_date, DELTA_DAYS):
             response = api.request(date=delta_start_date)
-            api.load(response)
+            api.load_if_changed(response, date=delta_start_date)
 
     return data
@@ -2,6 +2,7 @@ import datetime
 import time
 from typing import Union
 
+from apps.dailytrans.builders.archive import is_replaying
 from apps.dailytrans.builders.efish import Api as OriginApi
 from apps.dailytrans.builders.eir032 import Api as WholeSaleApi
 from apps.dailytrans.builders.eir032 import ScrapperApi
@@ -41,8 +42,12 @@ def direct_generic_wholesale(
         scrapping_api = ScrapperApi(model=model, **data._asdict())
         date_diff = end_date - start_date
 
+        # 爬蟲失敗的日期，合併為連續的日期區間後改以 API 請求
+        fallback_windows = []
+
         for delta in range(date_diff.days + 1):
-            responses = scrapping_api.requests(start_date=start_date + datetime.timedelta(days=delta))
+            date = start_date + datetime.timedelta(days=delta)
+            responses = scrapping_api.requests(start_date=date)
 
             # if all requests failed, try to use API to fetch the data
             if all(resp.status_code != 200 for resp in responses):
@@ -50,16 +55,19 @@ def direct_generic_wholesale(
                     'All requests failed, try to use API to fetch the data', extra=scrapping_api.LOGGER_EXTRA
                 )
 
-                response = wholesale_api.request(
-                    start_date=start_date + datetime.timedelta(days=delta),
-                    end_date=start_date + datetime.timedelta(days=delta)
-                )
-                wholesale_api.load(response)
+                if fallback_windows and fallback_windows[-1][1] + datetime.timedelta(days=1) == date:
+                    fallback_windows[-1][1] = date
+                else:
+                    fallback_windows.append([date, date])
             else:
                 scrapping_api.loads(responses)
 
                 # prevent from being blocked by the server
-                time.sleep(5)
+                if not is_replaying():
+                    time.sleep(5)
+
+        for window_start, window_end in fallback_windows:
+            wholesale_api.fetch_range_and_load(window_start, window_end)
 
     return data
 
@@ -70,12 +78,7 @@ def direct_wholesale(start_date=None, end_date=None, *args, **kwargs):
 
     for model in MODELS:
         wholesale_api = WholeSaleApi(model=model, **data._asdict())
-        date_diff = end_date - start_date
-
-        for delta in range(date_diff.days + 1):
-            response = wholesale_api.request(start_date=start_date + datetime.timedelta(days=delta),
-                                             end_date=start_date + datetime.timedelta(days=delta))
-            wholesale_api.load(response)
+        wholesale_api.fetch_range_and_load(start_date, end_date)
 
     return data
 
@@ -97,7 +100,8 @@ def direct_wholesale_by_scrapping(start_date=None, end_date=None, *args, **kwarg
             wholesale_api.loads(responses)
 
             # prevent from being blocked by the server
-            time.sleep(5)
+            if not is_replaying():
+                time.sleep(5)
 
     return data
 
@@ -108,12 +112,10 @@ def direct_origin(start_date=None, end_date=None, *args, **kwargs):
 
     for model in MODELS:
         origin_api = OriginApi(model=model, **data._asdict())
+        codes = [obj.code for obj in product_generator(model, type=2, **kwargs)]
+        windows = list(date_generator(start_date, end_date, ORIGIN_DELTA_DAYS))
 
-        for obj in product_generator(model, type=2, **kwargs):
-            for delta_start_date, delta_end_date in date_generator(start_date, end_date, ORIGIN_DELTA_DAYS):
-                response = origin_api.request(start_date=delta_start_date, end_date=delta_end_date, code=obj.code)
-                origin_api.load(response)
-                # sleep for that poor api service...
-                time.sleep(10)
+        # 多個品項合併為一次請求，請求間隔由 DAILYTRAN_BUILDER_API_LIMITS['efish'] 控制
+        origin_api.fetch_batches_and_load(codes, windows)
 
     return data
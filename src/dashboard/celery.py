@@ -33,6 +33,16 @@ app.conf.beat_schedule = {
         "task": "DeleteNotUpdatedTrans",
         "schedule": crontab(minute=0, hour="*"),
     },
+    # 日交易年度子表 (每月 1 日 00:30 檢查，提前建立明年度的子表)
+    "create_daily_tran_partition": {
+        "task": "CreateDailyTranPartition",
+        "schedule": crontab(minute=30, hour=0, day_of_month=1),
+    },
+    # 重新執行因 API 斷路器開啟而延後的 builder (每 30 分鐘檢查 1 次)
+    "retry_deferred_builds": {
+        "task": "RetryDeferredBuilds",
+        "schedule": crontab(minute="15,45"),
+    },
     # 日報表 (更新時間:周一至周五，時段為 09:00-12:30，每 30 分鐘更新一次)
     # -1 為更新昨天的報表
     "update_daily_report": {
@@ -89,23 +99,25 @@ app.conf.beat_schedule = {
         "schedule": crontab(minute=20, hour="8-18", day_of_week="1-5"),
         "args": (-3,),  # direct 3 day
     },
-    # 蔬菜 (更新時間:三天前，周一到周五，08:00-18:00，每小時的 30 分)
-    "daily-crop-builder-3d": {
-        "task": "DailyCropBuilder",
+    # 蔬菜、水果與漁批發依抓取計畫執行，只請求 watermark 之後、缺漏與修正期間的日期
+    # (計畫內容可由 `manage.py builder_plan` 查詢)
+    # 蔬菜 (周一到周五，08:00-18:00，每小時的 30 分)
+    "daily-crop-builder-planned": {
+        "task": "PlannedBuild",
         "schedule": crontab(minute=30, hour="8-18", day_of_week="1-5"),
-        "args": (-3,),  # direct 3 day
+        "args": ("apps.crops.builder",),
     },
-    # 水果 (更新時間:三天前，周一到周五，08:00-18:00，每小時的 40 分)
-    "daily-fruit-builder-3d": {
-        "task": "DailyFruitBuilder",
+    # 水果 (周一到周五，08:00-18:00，每小時的 40 分)
+    "daily-fruit-builder-planned": {
+        "task": "PlannedBuild",
         "schedule": crontab(minute=40, hour="8-18", day_of_week="1-5"),
-        "args": (-3,),  # direct 3 day
+        "args": ("apps.fruits.builder",),
     },
-    # 漁批發 (更新時間:三天前，周一到周五，08:00-18:00，每小時的 50 分)
-    "daily-seafood-wholesale-builder-3d": {
-        "task": "DailyWholesaleSeafoodBuilder",
+    # 漁批發 (周一到周五，08:00-18:00，每小時的 50 分)
+    "daily-seafood-wholesale-builder-planned": {
+        "task": "PlannedBuild",
         "schedule": crontab(minute=50, hour="8-18", day_of_week="1-5"),
-        "args": (-3,),  # direct 3 day
+        "args": ("apps.seafoods.builder",),
     },
     # 漁產地 (更新時間:四天前，周一到周五，11:00 & 13:00，每小時的 15 分)
     "daily-seafood-origin-builder-3d": {
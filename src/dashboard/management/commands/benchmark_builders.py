@@ -0,0 +1,165 @@
+import datetime
+import json
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from apps.dailytrans.builders.allapi import NODES, PLANNED_NODES
+from apps.dailytrans.builders.archive import ResponseArchive
+from apps.dailytrans.builders.benchmark import StubApiServer, run_builder
+
+
+# 同 fixtures/README.md 的初始化資料
+DEFAULT_FIXTURES = ['configs', 'sources'] + [f'cog{i:02d}' for i in range(1, 15)]
+
+# 與基準比較的指標: 數值越大越好(True)或越小越好(False)
+GATED_METRICS = {
+    'requests_per_sec': True,
+    'rows_per_sec': True,
+    'queries': False,
+    'peak_rss': False,
+}
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def parse_payload(value):
+    api_name, sep, path = value.partition('=')
+    if not sep:
+        raise ValueError(value)
+    return api_name, path
+
+
+def to_dict(result):
+    duration = result.duration or 1e-9
+    return {
+        **result._asdict(),
+        'requests_per_sec': result.requests / duration,
+        'rows_per_sec': result.rows / duration,
+    }
+
+
+class Command(BaseCommand):
+    help = ('Run the builders against a local stub API server and report requests/sec, rows reconciled/sec, '
+            'SQL statement count and peak RSS for each builder. '
+            'Compare with a baseline to gate performance work on the ingestion path.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('builders', nargs='*', metavar='FUNC',
+                            help='Builder functions, e.g. apps.crops.builder.direct_wholesale_05. '
+                                 'Run every orchestrated builder by default.')
+        parser.add_argument('--start-date', type=parse_date, help='YYYY-MM-DD, default: --days before today.')
+        parser.add_argument('--end-date', type=parse_date, help='YYYY-MM-DD, default: today.')
+        parser.add_argument('--days', type=int, default=4, help='Number of days to fetch when no dates are given.')
+        parser.add_argument('--payload', type=parse_payload, action='append', default=[], metavar='API_NAME=PATH',
+                            help='Serve this file for every request of the API. Can be repeated.')
+        parser.add_argument('--archive', action='store_true',
+                            help='Serve the recorded responses in the builder response archive.')
+        parser.add_argument('--latency', type=float, default=0.0, help='Seconds of latency per request.')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Ratio of failed requests, 0 ~ 1.')
+        parser.add_argument('--failure-status', type=int, default=503, help='HTTP status of failed requests.')
+        parser.add_argument('--seed', type=int, help='Random seed of the failure injection.')
+        parser.add_argument('--retries', type=int, default=0, help='Max retries of failed requests.')
+        parser.add_argument('--rate-limit', action='store_true',
+                            help='Keep the per-second request limits of DAILYTRAN_BUILDER_API_LIMITS.')
+        parser.add_argument('--testdb', action='store_true',
+                            help='Run against a new test database seeded with --fixture.')
+        parser.add_argument('--fixture', action='append', dest='fixtures', metavar='FIXTURE',
+                            help=f'Fixtures of the test database, default: {" ".join(DEFAULT_FIXTURES)}')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database between runs.')
+        parser.add_argument('--output', help='Write the results to a JSON file.')
+        parser.add_argument('--baseline', help='Compare with the results of a previous --output.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed regression ratio compared with --baseline.')
+
+    def handle(self, *args, **kwargs):
+        end_date = kwargs['end_date'] or datetime.date.today()
+        start_date = kwargs['start_date'] or end_date - datetime.timedelta(days=kwargs['days'])
+        if start_date > end_date:
+            raise CommandError('--start-date must not be after --end-date')
+
+        builders = kwargs['builders'] or list(dict.fromkeys(node.func for node in NODES + PLANNED_NODES))
+
+        archive = None
+        if kwargs['archive']:
+            archive = ResponseArchive()
+            if not archive.enabled:
+                raise CommandError('The builder response archive is not enabled: DAILYTRAN_BUILDER_ARCHIVE_ROOT')
+
+        server = StubApiServer(
+            payloads=dict(kwargs['payload']),
+            archive=archive,
+            latency=kwargs['latency'],
+            failure_rate=kwargs['failure_rate'],
+            failure_status=kwargs['failure_status'],
+            seed=kwargs['seed'],
+        )
+
+        old_name = None
+        if kwargs['testdb']:
+            setup_test_environment()
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=kwargs['keepdb'])
+            call_command('loaddata', *(kwargs['fixtures'] or DEFAULT_FIXTURES), verbosity=0)
+
+        results = []
+        try:
+            with server, server.activate(retries=kwargs['retries'], rate_limit=kwargs['rate_limit']):
+                for func in builders:
+                    result = to_dict(run_builder(func, start_date, end_date, server))
+                    results.append(result)
+                    self.report(result)
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=kwargs['keepdb'])
+                teardown_test_environment()
+
+        blocked = server.snapshot()['external:blocked']
+        if blocked:
+            self.stderr.write(f'{blocked} requests to URLs outside DAILYTRAN_BUILDER_API were blocked')
+
+        if kwargs['output']:
+            with open(kwargs['output'], 'w', encoding='utf-8') as f:
+                json.dump({'start_date': str(start_date), 'end_date': str(end_date), 'results': results}, f, indent=2)
+
+        if kwargs['baseline']:
+            self.compare(results, kwargs['baseline'], kwargs['tolerance'])
+
+    def report(self, result):
+        self.stdout.write(
+            f'[{result["func"]}] success: {result["success"]}, duration: {result["duration"]:.2f} s, '
+            f'requests: {result["requests"]} ({result["requests_per_sec"]:.1f}/s), '
+            f'failures: {result["failures"]}, missing payloads: {result["missing"]}, '
+            f'rows: {result["rows"]} ({result["rows_per_sec"]:.1f}/s), changed: {result["changed"]}, '
+            f'queries: {result["queries"]}, peak RSS: {result["peak_rss"] / 1024 / 1024:.1f} MB'
+        )
+
+    def compare(self, results, path, tolerance):
+        with open(path, encoding='utf-8') as f:
+            baseline = {result['func']: result for result in json.load(f)['results']}
+
+        regressions = []
+        for result in results:
+            base = baseline.get(result['func'])
+            if base is None:
+                continue
+
+            for metric, higher_is_better in GATED_METRICS.items():
+                value, base_value = result[metric], base[metric]
+                if not base_value:
+                    continue
+
+                ratio = value / base_value if higher_is_better else base_value / value if value else float('inf')
+                if ratio < 1 - tolerance:
+                    regressions.append(f'[{result["func"]}] {metric}: {base_value:.1f} -> {value:.1f}')
+
+        for regression in regressions:
+            self.stderr.write(regression)
+
+        if regressions:
+            raise CommandError(f'{len(regressions)} metrics regressed more than {tolerance:.0%} from the baseline')
+
+        self.stdout.write('No regression from the baseline')
@@ -0,0 +1,83 @@
+import datetime
+import timeit
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from apps.dailytrans.codec import format_date, from_datetime, to_dates
+
+
+# builder 原本逐筆轉換日期的方式，作為比較基準
+def eir030_per_row(series):
+    return series.apply(lambda x: datetime.datetime.strptime(
+        (str(int(x.split('.')[0]) + 1911) + x[len(str(x.split('.')[0])):])
+        .replace('.', '-'), '%Y-%m-%d').date())
+
+
+def eir032_per_row(series):
+    return series.apply(lambda x: datetime.datetime.strptime(
+        f'{int(x) // 10000 + 1911}-{(int(x) // 100) % 100:02d}-{int(x) % 100:02d}', '%Y-%m-%d'
+    ).date())
+
+
+def apis_per_row(series):
+    return series.apply(lambda x: datetime.datetime.strptime(x, '%Y/%m/%d').date())
+
+
+def roc_format_per_row(series):
+    return series.apply(lambda x: format_date(x, '.', roc_format=True, zfill=True))
+
+
+class Command(BaseCommand):
+    help = 'Compare the vectorized ROC/Gregorian date codec with the per-row strptime path of the builders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Number of dates per series.')
+        parser.add_argument('--days', type=int, default=365, help='Number of distinct dates in a series.')
+        parser.add_argument('--repeat', type=int, default=3, help='Best of N runs.')
+
+    def handle(self, *args, **kwargs):
+        start_date = datetime.date(2024, 1, 1)
+        dates = pd.Series([
+            start_date + datetime.timedelta(days=i % kwargs['days']) for i in range(kwargs['rows'])
+        ])
+
+        cases = [
+            (
+                "eir030 '113.02.15'",
+                dates.apply(lambda x: format_date(x, '.', roc_format=True)),
+                eir030_per_row,
+                lambda series: to_dates(series, roc_format=True),
+            ),
+            (
+                "eir032 1130215",
+                dates.apply(lambda x: int(format_date(x, '', roc_format=True))),
+                eir032_per_row,
+                lambda series: to_dates(series, roc_format=True),
+            ),
+            (
+                "apis '2024/2/15'",
+                dates.apply(lambda x: format_date(x, '/', zfill=False)),
+                apis_per_row,
+                lambda series: to_dates(series, roc_format=False),
+            ),
+            (
+                "date -> '113.02.15'",
+                dates,
+                roc_format_per_row,
+                lambda series: from_datetime(series, sep='.', roc_format=True),
+            ),
+        ]
+
+        for name, series, per_row, vectorized in cases:
+            expected = per_row(series)
+            result = vectorized(series)
+            if not expected.equals(result.astype(object)):
+                self.stderr.write(f'[{name}] results differ from the per-row path')
+
+            per_row_time = min(timeit.repeat(lambda: per_row(series), number=1, repeat=kwargs['repeat']))
+            vectorized_time = min(timeit.repeat(lambda: vectorized(series), number=1, repeat=kwargs['repeat']))
+            self.stdout.write(
+                f'[{name}] rows: {len(series)}, per-row: {per_row_time * 1000:.1f} ms, '
+                f'vectorized: {vectorized_time * 1000:.1f} ms, speedup: {per_row_time / vectorized_time:.1f}x'
+            )
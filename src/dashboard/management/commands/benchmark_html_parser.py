@@ -0,0 +1,89 @@
+import glob
+import json
+import os
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from requests import Response
+
+from apps.dailytrans.builders.archive import ResponseArchive
+from apps.dailytrans.builders.eir032 import HTMLParser, ScrapperApi
+
+
+def make_response(text):
+    response = Response()
+    response.status_code = 200
+    response._content = text.encode('utf-8')
+    response.encoding = 'utf-8'
+    return response
+
+
+class Command(BaseCommand):
+    help = ('Compare the BeautifulSoup and streaming backends of the seafood HTMLParser over saved market pages: '
+            'the extracted columns must be identical and the elapsed time of each backend is reported.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', metavar='PATH',
+                            help='Saved HTML pages or directories of pages.')
+        parser.add_argument('--archive', action='store_true',
+                            help='Also use the market pages in the builder response archive.')
+        parser.add_argument('--repeat', type=int, default=5, help='Best of N runs.')
+
+    def handle(self, *args, **kwargs):
+        pages = [(path, make_response(self.read(path))) for path in self.iter_files(kwargs['paths'])]
+        if kwargs['archive']:
+            pages.extend(self.iter_archived_pages())
+        if not pages:
+            raise CommandError('No pages found, please provide saved pages or use --archive.')
+
+        mismatches = 0
+        for name, response in pages:
+            columns = {
+                backend: HTMLParser(response, None, backend).extract_columns() for backend in HTMLParser.BACKENDS
+            }
+            if columns['bs4'] != columns['stream']:
+                mismatches += 1
+                self.stderr.write(f'[{name}] the backends extracted different columns')
+
+        self.stdout.write(f'pages: {len(pages)}, mismatches: {mismatches}')
+
+        times = {}
+        for backend in HTMLParser.BACKENDS:
+            def parse_all():
+                for _, response in pages:
+                    HTMLParser(response, None, backend).extract_columns()
+
+            times[backend] = min(timeit.repeat(parse_all, number=1, repeat=kwargs['repeat']))
+            self.stdout.write(f'[{backend}] {times[backend] * 1000:.1f} ms, '
+                              f'{times[backend] * 1000 / len(pages):.2f} ms/page')
+
+        self.stdout.write(f'speedup: {times["bs4"] / times["stream"]:.1f}x')
+
+    @staticmethod
+    def read(path):
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+
+    @staticmethod
+    def iter_files(paths):
+        for path in paths:
+            if os.path.isdir(path):
+                for pattern in ('*.htm', '*.html', '*.txt'):
+                    yield from sorted(glob.glob(os.path.join(path, '**', pattern), recursive=True))
+            else:
+                yield path
+
+    @staticmethod
+    def iter_archived_pages():
+        archive = ResponseArchive()
+        if not archive.enabled:
+            raise CommandError('The builder response archive is not enabled: DAILYTRAN_BUILDER_ARCHIVE_ROOT')
+
+        api_name = ScrapperApi.API_NAME
+        for path in sorted(glob.glob(os.path.join(archive.root, 'index', api_name, '*', '*.json'))):
+            with open(path, encoding='utf-8') as f:
+                url = json.load(f)['url']
+            if url.startswith(ScrapperApi.URL):
+                response = archive.lookup(api_name, url)
+                if response is not None:
+                    yield url, response
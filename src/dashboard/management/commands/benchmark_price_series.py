@@ -0,0 +1,105 @@
+import datetime
+import timeit
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.dailytrans.series import PriceSeries
+
+
+def legacy_window_summary(table, product_id, start_date, end_date):
+    """原本節慶報表對每個日期區間以 `.query()` 過濾後計算的流程，作為比較基準"""
+
+    df_product_id = table.query(f'product_id in @product_id and date >= "{start_date}" and date <= "{end_date}"')
+
+    if df_product_id.shape[0]:
+        has_volume = df_product_id['volume'].count() / df_product_id.shape[0] > 0.8
+        has_weight = df_product_id['avg_weight'].count() / df_product_id.shape[0] > 0.8
+    else:
+        has_volume = False
+        has_weight = False
+
+    if has_volume and has_weight:
+        avgprice = (df_product_id['avg_price'] * df_product_id['avg_weight'] * df_product_id['volume']).sum() / \
+            (df_product_id['avg_weight'] * df_product_id['volume']).sum()
+        if 80001 <= int(product_id[0]) < 80005 or 70001 <= int(product_id[0]) < 70012:
+            avgvolume = df_product_id['volume'].sum()
+        else:
+            avgvolume = (df_product_id['avg_weight'] * df_product_id['volume']).sum() / df_product_id['volume'].sum()
+    elif has_volume:
+        avgprice = (df_product_id['avg_price'] * df_product_id['volume']).sum() / df_product_id['volume'].sum()
+        avgvolume = df_product_id['volume'].sum()
+    else:
+        avgprice = df_product_id['avg_price'].mean()
+        avgvolume = np.nan
+
+    return avgprice, avgvolume
+
+
+def make_table(days, products, sources=5, vol_missing=0.05, seed=0):
+    """節慶報表 `get_table` 格式的日交易資料(date 為字串，無來源為 0)，部分交易量與重量為缺值"""
+
+    random = np.random.RandomState(seed)
+    dates = pd.date_range(datetime.date(2024, 1, 1), periods=days).strftime('%Y-%m-%d')
+    index = pd.MultiIndex.from_product([dates, range(1, products + 1), range(sources)])
+    n = len(index)
+
+    return pd.DataFrame({
+        'product_id': index.get_level_values(1),
+        'source_id': index.get_level_values(2),
+        'avg_price': random.uniform(10, 100, n).round(2),
+        'avg_weight': np.where(random.rand(n) < 0.05, np.nan, random.uniform(1, 3, n).round(2)),
+        'volume': np.where(random.rand(n) < vol_missing, np.nan, random.randint(1, 500, n).astype(float)),
+        'date': index.get_level_values(0),
+    })
+
+
+def make_windows(days, weeks):
+    start = datetime.date(2024, 1, 1)
+    return [
+        (start + datetime.timedelta(days=i), start + datetime.timedelta(days=i + 6))
+        for i in range(0, min(days, weeks * 7), 7)
+    ]
+
+
+class Command(BaseCommand):
+    help = ('Compare the festival report windows computed by repeated DataFrame.query() with PriceSeries windows: '
+            'the results must be identical and the elapsed time of each path is reported.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365, help='Number of days in the table.')
+        parser.add_argument('--products', type=int, default=20, help='Number of products.')
+        parser.add_argument('--weeks', type=int, default=48, help='Number of one-week windows per product.')
+        parser.add_argument('--repeat', type=int, default=3, help='Best of N runs.')
+
+    def handle(self, *args, **kwargs):
+        table = make_table(kwargs['days'], kwargs['products'])
+        windows = make_windows(kwargs['days'], kwargs['weeks'])
+        products = [[i] for i in range(1, kwargs['products'] + 1)]
+
+        def run_query():
+            return [legacy_window_summary(table, product_id, start, end)
+                    for product_id in products for start, end in windows]
+
+        def run_series():
+            result = []
+            for product_id in products:
+                series = PriceSeries.from_frame(table[table['product_id'].isin(product_id)])
+                for start, end in windows:
+                    window = series.window(start, end)
+                    result.append(window.summary(*window.completeness(require_price=False), product_id=product_id[0]))
+            return result
+
+        if not np.allclose(run_query(), run_series(), equal_nan=True):
+            raise CommandError('Results are different')
+
+        self.stdout.write(f'rows: {len(table)}, products: {len(products)}, windows: {len(windows)}, '
+                          f'results are identical')
+
+        times = {}
+        for name, func in (('query', run_query), ('series', run_series)):
+            times[name] = min(timeit.repeat(func, number=1, repeat=kwargs['repeat']))
+            self.stdout.write(f'[{name}] {times[name] * 1000:.1f} ms')
+
+        self.stdout.write(f'speedup: {times["query"] / times["series"]:.1f}x')
@@ -0,0 +1,103 @@
+import datetime
+import timeit
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import ugettext as _
+
+from apps.dailytrans.utils import get_year_aligned_result, to_unix
+
+
+def legacy_year_aligned_result(q, key, years):
+    """原本 `get_daily_price_by_year` 逐日 reindex 後以 iterrows 對齊年份的流程，作為比較基準"""
+
+    q = q.set_index('date').reindex(
+        pd.date_range(datetime.date(q['date'].min().year, 1, 1),
+                      datetime.date(q['date'].max().year, 12, 31)),
+        fill_value=None
+    )
+    q = q.reset_index().rename(columns={'index': 'date'})
+
+    result = {str(year): [] for year in pd.to_datetime(q['date']).dt.year.unique()}
+    date_list = pd.date_range(datetime.date(2016, 1, 1), datetime.date(2016, 12, 31), freq='D')
+
+    for i, dic in q.iterrows():
+        date = datetime.date(year=2016, month=dic['date'].month, day=dic['date'].day)
+        result[str(dic['date'].year)].append(
+            (to_unix(date), None if pd.isna(dic[key]) else dic[key]) if dic[key] else None
+        )
+
+        if not ((dic['date'].year % 4 == 0 and dic['date'].year % 100 != 0) or dic['date'].year % 400 == 0) and \
+                dic['date'].month == 2 and dic['date'].day == 28:
+            result[str(dic['date'].year)].append((to_unix(datetime.date(2016, 2, 29)), None))
+
+    df = pd.DataFrame.from_dict(result, orient='columns')
+    df = df.applymap(lambda x: x[1] if isinstance(x, tuple) else x)
+    df.insert(0, 'date', date_list)
+
+    row_empty = df.iloc[:, 1:].isna().all(axis=1)
+    raw_data_rows_remove_empty = df[~row_empty].copy()
+    raw_data_rows_remove_empty.fillna('', inplace=True)
+    raw_data_rows_remove_empty = raw_data_rows_remove_empty.values.tolist()
+
+    raw_data_columns = [{'value': _('Date'), 'format': 'date'}]
+    raw_data_columns.extend([{'value': str(year), 'format': key} for year in years])
+
+    return {
+        'highchart': result,
+        'raw': {
+            'columns': raw_data_columns,
+            'rows': raw_data_rows_remove_empty
+        }
+    }
+
+
+def make_frame(years, missing_ratio, seed=0):
+    """`get_group_by_date_query_set` 格式的每日彙總資料，隨機移除 missing_ratio 比例的日期並將部分數值設為 0"""
+
+    random = np.random.RandomState(seed)
+    end_year = datetime.date.today().year
+    dates = pd.date_range(datetime.date(end_year - years + 1, 1, 1), datetime.date(end_year, 12, 31))
+    dates = dates[random.rand(len(dates)) >= missing_ratio]
+
+    price = random.uniform(10, 100, len(dates)).round(2)
+    price[random.rand(len(dates)) < 0.01] = 0
+
+    return pd.DataFrame({
+        'date': dates.date,
+        'avg_price': price,
+        'num_of_source': random.randint(1, 10, len(dates)),
+        'sum_volume': random.uniform(0, 5000, len(dates)).round(1),
+        'avg_avg_weight': random.uniform(1, 3, len(dates)).round(2),
+    })
+
+
+class Command(BaseCommand):
+    help = ('Compare the vectorized year alignment of get_daily_price_by_year with the per-row iterrows path: '
+            'the results must be identical and the elapsed time of each path is reported.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', type=int, default=15, help='Number of years in the series.')
+        parser.add_argument('--missing', type=float, default=0.1, help='Ratio of dates without data.')
+        parser.add_argument('--repeat', type=int, default=3, help='Best of N runs.')
+
+    def handle(self, *args, **kwargs):
+        q = make_frame(kwargs['years'], kwargs['missing'])
+        years = sorted({date.year for date in q['date']})
+        keys = ['avg_price', 'sum_volume', 'avg_avg_weight']
+
+        for key in keys:
+            if get_year_aligned_result(q, key, years) != legacy_year_aligned_result(q, key, years):
+                raise CommandError(f'Results of {key} are different')
+
+        self.stdout.write(f'rows: {len(q)}, years: {len(years)}, results are identical')
+
+        times = {}
+        for name, func in (('iterrows', legacy_year_aligned_result), ('vectorized', get_year_aligned_result)):
+            times[name] = min(timeit.repeat(
+                lambda: [func(q, key, years) for key in keys], number=1, repeat=kwargs['repeat']
+            ))
+            self.stdout.write(f'[{name}] {times[name] * 1000:.1f} ms')
+
+        self.stdout.write(f'speedup: {times["iterrows"] / times["vectorized"]:.1f}x')
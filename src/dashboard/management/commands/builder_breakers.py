@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.dailytrans.builders.resilience import CircuitBreaker, get_metrics
+
+
+class Command(BaseCommand):
+    help = 'Show circuit breaker state and request/retry counts of the builder APIs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', nargs='*', metavar='API_NAME',
+                            help='Close the circuit breakers of the given APIs.')
+
+    def handle(self, *args, **kwargs):
+        api_names = list(settings.DAILYTRAN_BUILDER_API)
+
+        for api_name in kwargs['reset'] or []:
+            if api_name not in api_names:
+                raise CommandError(f'Unknown API name: {api_name}')
+
+            breaker = CircuitBreaker(api_name)
+            breaker.redis.delete(breaker.open_key)
+            breaker.record_success()
+            self.stdout.write(f'Circuit breaker of {api_name} has been closed.')
+
+        for api_name in api_names:
+            breaker = CircuitBreaker(api_name)
+            metrics = get_metrics(api_name)
+            self.stdout.write(
+                f'[{api_name}] state: {breaker.state}, retry in: {breaker.retry_in()}s, '
+                f'requests: {metrics.get("requests", 0)}, retries: {metrics.get("retries", 0)}, '
+                f'failures: {metrics.get("failures", 0)}, short circuits: {metrics.get("short_circuits", 0)}, '
+                f'opened: {metrics.get("opened", 0)}'
+            )
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from apps.dailytrans.builders.allapi import get_planned_nodes
+from apps.dailytrans.builders.plan import build_plan
+
+
+class Command(BaseCommand):
+    help = 'Show the dates the planned builders will fetch: open dates after the watermark, gaps and revisions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('modules', nargs='*', metavar='MODULE',
+                            help='Builder modules, e.g. apps.crops.builder. Show all planned builders by default.')
+        parser.add_argument('--gaps', action='store_true', help='List the missing product/source/date cells.')
+
+    def handle(self, *args, **kwargs):
+        nodes = [node for module in kwargs['modules'] for node in get_planned_nodes(module)]
+
+        for node in nodes or get_planned_nodes():
+            plan = build_plan(node)
+            info = plan.as_dict()
+            windows = ', '.join(f'{start} - {end}' for start, end in info['windows']) or 'nothing to fetch'
+            self.stdout.write(
+                f'[{info["func"]}] api: {info["api_name"]}, config: {info["config_code"]}, type: {info["type_id"]}, '
+                f'watermark: {info["watermark"]}, open days: {info["open_days"]}, '
+                f'revision days: {info["revision_days"]}, gap days: {info["gap_days"]}, '
+                f'gap cells: {info["gap_cells"]}, windows: {windows}'
+            )
+
+            if kwargs['gaps']:
+                for gap in plan.gaps:
+                    self.stdout.write(f'    product: {gap.product_id}, source: {gap.source_id}, date: {gap.date}')
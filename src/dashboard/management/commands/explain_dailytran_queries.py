@@ -0,0 +1,189 @@
+import datetime
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from apps.configs.models import AbstractProduct, Source
+from apps.dailytrans.models import DailyTran, month_day_ranges
+from apps.dailytrans.reports.dailyreport import QueryString
+from apps.dailytrans.utils import group_by_date_values
+
+
+logger = logging.getLogger('factory')
+
+# 以 generate_series 產生「產品 x 來源 x 日期」的合成日交易資料，日期由新到舊往前推算；
+# 已存在的 (品項, 來源, 日期) 保留原資料
+SYNTHETIC_INSERT_SQL = """
+    INSERT INTO dailytrans_dailytran
+        (product_id, source_id, avg_price, avg_weight, volume, date, update_time, not_updated, create_time)
+    SELECT p.id,
+           s.id,
+           round((50 + random() * 100)::numeric, 1),
+           round((100 + random() * 30)::numeric, 1),
+           round((500 + random() * 1000)::numeric, 0),
+           d::date,
+           now(),
+           0,
+           now()
+    FROM unnest(%(product_ids)s) AS p(id)
+    CROSS JOIN unnest(%(source_ids)s) AS s(id)
+    CROSS JOIN generate_series(%(start_date)s::date, %(end_date)s::date, interval '1 day') AS d
+    ON CONFLICT DO NOTHING
+"""
+
+LAST_5_YEARS_SQL = (
+    "select product_id, source_id, avg_price, avg_weight, volume, date from dailytrans_dailytran "
+    "INNER JOIN unnest(%(all_product_id_list)s) as pid ON pid=dailytrans_dailytran.product_id "
+    "where ((date between %(start_date)s and %(end_date)s))"
+)
+
+FESTIVAL_SQL = (
+    "select product_id, source_id, avg_price, avg_weight, volume, date from dailytrans_dailytran "
+    "INNER JOIN unnest(%(all_product_id_list)s) as pid ON pid=dailytrans_dailytran.product_id "
+    "where ({})"
+)
+
+COMPARE_SQL = """
+    SELECT "dailytrans_dailytran"."id", "dailytrans_dailytran"."avg_price", "dailytrans_dailytran"."date",
+           "configs_abstractproduct"."code", "configs_source"."name"
+    FROM "dailytrans_dailytran"
+    INNER JOIN "configs_abstractproduct" ON "dailytrans_dailytran"."product_id" = "configs_abstractproduct"."id"
+    LEFT OUTER JOIN "configs_source" ON "dailytrans_dailytran"."source_id" = "configs_source"."id"
+    WHERE "dailytrans_dailytran"."date" = %(date)s
+      AND "configs_abstractproduct"."type_id" = %(type_id)s
+      AND "configs_abstractproduct"."config_id" = %(config_id)s
+"""
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Run EXPLAIN ANALYZE on the canonical dashboard/report/builder queries of DailyTran. '
+            'Synthetic rows are generated inside a transaction and rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=20, help='Number of products for synthetic data.')
+        parser.add_argument('--sources', type=int, default=10, help='Number of sources for synthetic data.')
+        parser.add_argument('--years', type=int, default=5, help='Years of synthetic daily data.')
+        parser.add_argument('--no-synthetic', action='store_true', help='Explain against existing data only.')
+
+    def handle(self, *args, **kwargs):
+        if connection.vendor != 'postgresql':
+            raise CommandError('EXPLAIN ANALYZE is only supported on PostgreSQL.')
+
+        product_ids = list(AbstractProduct.objects.values_list('id', flat=True)[:kwargs['products']])
+        source_ids = list(Source.objects.values_list('id', flat=True)[:kwargs['sources']])
+        if not product_ids:
+            raise CommandError('No products found, please load the configs fixtures first.')
+
+        end_date = datetime.date.today()
+        start_date = end_date.replace(year=end_date.year - kwargs['years'])
+
+        # 合成資料不會更新 CompletenessProfile 與 DailyAggregate，一律 rollback
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    if not kwargs['no_synthetic']:
+                        self.insert_synthetic_data(cursor, product_ids, source_ids, start_date, end_date)
+
+                    for name, sql, params in self.canonical_queries(product_ids, end_date):
+                        self.explain(cursor, name, sql, params)
+
+                raise Rollback
+        except Rollback:
+            logger.info('Synthetic data has been rolled back.')
+
+    def insert_synthetic_data(self, cursor, product_ids, source_ids, start_date, end_date):
+        cursor.execute(SYNTHETIC_INSERT_SQL, {
+            'product_ids': product_ids,
+            'source_ids': source_ids,
+            'start_date': start_date,
+            'end_date': end_date,
+        })
+        logger.info(f'Inserted {cursor.rowcount} synthetic rows from {start_date} to {end_date}.')
+
+        # 更新統計資訊，讓 planner 依實際資料量選擇執行計畫
+        cursor.execute('ANALYZE dailytrans_dailytran')
+
+    @staticmethod
+    def canonical_queries(product_ids, end_date):
+        product = AbstractProduct.objects.get(id=product_ids[0])
+        two_weeks_ago = end_date - datetime.timedelta(days=13)
+
+        # 儀表板圖表: 單一品項近一年的每日加權彙總
+        dashboard_qs = group_by_date_values(DailyTran.objects.filter(
+            product__in=product.children_all() or [product],
+            date__range=(end_date - datetime.timedelta(days=365), end_date),
+        ))
+        sql, params = dashboard_qs.query.sql_with_params()
+        yield 'dashboard group by date', sql, params
+
+        # 日報表: 近兩週所有監控品項
+        query = (
+            QueryString()
+            .add_where()
+            .add_where_by_product_in([product], has_and=False)
+            .add_where_by_date_between(two_weeks_ago, end_date)
+        )
+        yield 'daily report two weeks', query.build().rstrip(';'), query.dict_query
+
+        # 近五年報表: unnest 產品清單後以單一日期區間過濾
+        yield 'last 5 years report', LAST_5_YEARS_SQL, {
+            'all_product_id_list': product_ids,
+            'start_date': end_date.replace(year=end_date.year - 5),
+            'end_date': end_date,
+        }
+
+        # 節慶報表: 六個年度各自的日期區間以 OR 串接
+        ranges, params = [], {'all_product_id_list': product_ids}
+        for i in range(6):
+            params[f'start_{i}'] = two_weeks_ago.replace(year=two_weeks_ago.year - i)
+            params[f'end_{i}'] = end_date.replace(year=end_date.year - i)
+            ranges.append(f'(date between %(start_{i})s and %(end_{i})s)')
+        yield 'festival report', FESTIVAL_SQL.format(' or '.join(ranges)), params
+
+        # 歷年同期比較: 近一年的月日區間展開至 2011 年起的每個年度
+        # 舊版以逐日展開的 date IN 清單過濾，新版以每年一個 BETWEEN 條件 OR 串接
+        month_day_qs = DailyTran.objects.filter(product_id__in=product_ids)
+        year_ago = end_date - datetime.timedelta(days=364)
+        days = [
+            start + datetime.timedelta(days=i)
+            for start, end in month_day_ranges(year_ago, end_date)
+            for i in range((end - start).days + 1)
+        ]
+        sql, params = month_day_qs.filter(date__in=days).query.sql_with_params()
+        yield f'month day filter with date IN ({len(days)} dates)', sql, params
+        sql, params = month_day_qs.between_month_day_filter(year_ago, end_date).query.sql_with_params()
+        yield 'month day filter with BETWEEN ranges', sql, params
+
+        # builder 比對: 單日單一 config/type 的既有資料
+        yield 'builder compare with db', COMPARE_SQL, {
+            'date': end_date,
+            'type_id': product.type_id,
+            'config_id': product.config_id,
+        }
+
+    def explain(self, cursor, name, sql, params):
+        cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}', params)
+        result = cursor.fetchone()[0]
+        plan = result[0] if isinstance(result, list) else json.loads(result)[0]
+
+        indexes = sorted(set(self.find_indexes(plan['Plan'])))
+        self.stdout.write(
+            f'[{name}]\n'
+            f'    planning time: {plan["Planning Time"]:.3f} ms\n'
+            f'    execution time: {plan["Execution Time"]:.3f} ms\n'
+            f'    top node: {plan["Plan"]["Node Type"]}, rows: {plan["Plan"]["Actual Rows"]}\n'
+            f'    indexes: {", ".join(indexes) or "-"}'
+        )
+
+    def find_indexes(self, node):
+        if 'Index Name' in node:
+            yield node['Index Name']
+
+        for child in node.get('Plans', []):
+            yield from self.find_indexes(child)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from apps.dailytrans.models import CompletenessProfile
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the per (product, source, year) row counts used to decide has_volume/has_weight. '
+            'Run after bulk DailyTran updates or deletes that bypass DailyTranUpserter and the model signals.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('years', nargs='*', type=int, metavar='YEAR',
+                            help='Years to rebuild. Rebuild every year with DailyTran data by default.')
+
+    def handle(self, *args, **kwargs):
+        created = CompletenessProfile.objects.rebuild(years=kwargs['years'] or None)
+        self.stdout.write(f'{created} completeness profiles rebuilt')
@@ -0,0 +1,90 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+
+from apps.dailytrans.models import DailyAggregate, DailyTran
+from apps.dailytrans.utils import daily_partials, positive_filter
+
+
+# 品項的 type 也列入比對，type 已過期的部分合計會被視為不一致
+KEY_COLUMNS = ('product_id', 'type_id', 'source_id', 'date')
+PARITY_COLUMNS = ('rows', 'volume_rows', 'weight_rows', 'positive_rows',
+                  'total_price', 'total_weight', 'total_volume', 'sum_volume')
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def partial_sums(model, start_date=None, end_date=None):
+    """以 `daily_partials` 計算日期區間內每個 (品項, 來源, 日期) 的部分合計"""
+
+    query_set = model.objects.all()
+    if model is DailyTran:
+        query_set = query_set.annotate(type_id=F('product__type_id'))
+    if start_date:
+        query_set = query_set.filter(date__gte=start_date)
+    if end_date:
+        query_set = query_set.filter(date__lte=end_date)
+
+    partials = daily_partials(model)
+    partials['positive_rows'] = daily_partials(model, positive_filter(model))['rows']
+
+    df = pd.DataFrame(list(
+        query_set.order_by().values(*KEY_COLUMNS).annotate(**partials)
+    ), columns=list(KEY_COLUMNS + PARITY_COLUMNS))
+
+    # 無來源或無 type 以 0 代替，使兩邊的索引可以比對
+    for column in ('type_id', 'source_id'):
+        df[column] = df[column].fillna(0).astype(int)
+
+    return df.set_index(list(KEY_COLUMNS)).fillna(0).sort_index()
+
+
+def find_mismatches(start_date=None, end_date=None):
+    """
+    比對日交易資料與部分合計
+
+    Returns:
+        list: 不一致的 (product_id, type_id, source_id, date)，無來源或無 type 時為 0
+    """
+
+    expected = partial_sums(DailyTran, start_date, end_date)
+    actual = partial_sums(DailyAggregate, start_date, end_date)
+
+    keys = expected.index.union(actual.index)
+    expected = expected.reindex(keys, fill_value=0)
+    actual = actual.reindex(keys, fill_value=0)
+
+    same = np.isclose(expected.values.astype(float), actual.values.astype(float)).all(axis=1)
+
+    return list(keys[~same])
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the per (product, source, date) partial sums read by the dashboard charts, '
+            'then verify they match DailyTran. Run after bulk DailyTran updates or deletes that bypass '
+            'DailyTranUpserter and the model signals.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', type=parse_date, help='YYYY-MM-DD, default: no lower bound.')
+        parser.add_argument('--end-date', type=parse_date, help='YYYY-MM-DD, default: no upper bound.')
+        parser.add_argument('--no-verify', action='store_true', help='Skip the parity check with DailyTran.')
+
+    def handle(self, *args, **kwargs):
+        start_date, end_date = kwargs['start_date'], kwargs['end_date']
+
+        created = DailyAggregate.objects.rebuild(start_date, end_date)
+        self.stdout.write(f'{created} daily aggregates rebuilt')
+
+        if kwargs['no_verify']:
+            return
+
+        mismatches = find_mismatches(start_date, end_date)
+        if mismatches:
+            raise CommandError(f'{len(mismatches)} daily aggregates differ from DailyTran: {mismatches[:10]}')
+
+        self.stdout.write('daily aggregates match DailyTran')
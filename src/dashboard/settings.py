@@ -388,6 +388,83 @@ DAILYTRAN_BUILDER_API = {
     'naifchickens': 'https://www.naif.org.tw/memberLogin.aspx?frontTitleMenuID=105',   #飼料和環南市場雞隻等數據是從中央畜產會登入帳號爬蟲取得
 }
 
+# Builder API 同時請求數(concurrency)與每秒請求數(rate, None 為不限制)上限
+# key 可為 DAILYTRAN_BUILDER_API 的 API 名稱或 host，依序比對，皆未設定時使用 'default'
+DAILYTRAN_BUILDER_API_LIMITS = {
+    'default': {'concurrency': 4, 'rate': None},
+    'data.moa.gov.tw': {'concurrency': 6, 'rate': 5},
+    'apis': {'concurrency': 2, 'rate': 2},
+    'efish': {'concurrency': 1, 'rate': 0.1},
+    'naifchickens': {'concurrency': 4, 'rate': 2},
+}
+
+# orchestrator(allapi.direct)同時執行的 builder 數，key 為 host，未設定時使用 'default'；
+# 同一個 host 的 builder 分配到最多此數量的 lane，lane 內依序執行
+DAILYTRAN_BUILDER_HOST_TASKS = {
+    'default': 1,
+    'data.moa.gov.tw': 3,
+}
+
+# Builder 抓取計畫: 除了 watermark 之後與缺漏的日期，近 revision_days 天一律重新請求；
+# watermark 與缺漏只檢查近 lookback_days 天
+DAILYTRAN_BUILDER_PLAN = {
+    'revision_days': 1,
+    'lookback_days': 30,
+}
+
+# Builder 逐筆解析 JSON 回應: 每次解碼的 bytes 數、每個 DataFrame batch 的筆數
+DAILYTRAN_BUILDER_STREAM = {
+    'chunk_size': 64 * 1024,
+    'batch_size': 5000,
+}
+
+# 中央畜產會爬蟲: 已登入 session 的 cookies 保存秒數、解析頁面的 process 數(1 代表不使用 process pool)
+DAILYTRAN_BUILDER_NAIF = {
+    'session_ttl': 30 * 60,
+    'parse_workers': 2,
+}
+
+# 漁產產地價格(efish): 每次請求的品項數(0 代表不指定品項，一次取得日期區間內所有魚種)與單次執行的請求數上限
+DAILYTRAN_BUILDER_EFISH = {
+    'batch_size': env.int('DAILYTRAN_BUILDER_EFISH_BATCH_SIZE', default=0),
+    'request_budget': env.int('DAILYTRAN_BUILDER_EFISH_REQUEST_BUDGET', default=12),
+}
+
+# 漁產批發市場交易行情站頁面的解析方式: 'stream'(只擷取目標 table)或 'bs4'(BeautifulSoup)
+DAILYTRAN_BUILDER_HTML_BACKEND = env.str('DAILYTRAN_BUILDER_HTML_BACKEND', default='stream')
+
+# Builder API 重試策略: 最多重試次數、第一次重試的等待秒數(之後每次加倍並加上隨機抖動)、單次等待秒數上限
+DAILYTRAN_BUILDER_RETRY = {
+    'max_retries': 5,
+    'base_delay': 2,
+    'max_delay': 60,
+}
+
+# Builder API 斷路器(狀態存放於 Redis，所有 worker 共用): window 秒內失敗 failure_threshold 次後，
+# cooldown 秒內的請求直接失敗，延後的日期區間由 RetryDeferredBuilds 重新執行
+DAILYTRAN_BUILDER_BREAKER = {
+    'failure_threshold': 3,
+    'window': 300,
+    'cooldown': 600,
+}
+
+# Builder 回應內容的指紋: 回應與上一次相同請求的回應相同時略過資料比對，指紋保留 ttl 秒；
+# 手動執行時以 direct(..., force=True) 忽略指紋
+DAILYTRAN_BUILDER_FINGERPRINT = {
+    'ttl': 6 * 60 * 60,
+}
+
+# Builder 原始回應的封存目錄(gzip，以內容雜湊值存放)，未設定時不封存；
+# direct(..., replay=True) 以封存的回應重新匯入，不連線，replay_concurrency 為重播時的同時請求數
+DAILYTRAN_BUILDER_ARCHIVE = {
+    'root': env.str('DAILYTRAN_BUILDER_ARCHIVE_ROOT', default='') or None,
+    'replay_concurrency': 8,
+}
+
+# 儀表板圖表是否由每日部分合計(DailyAggregate)計算，False 時直接掃描日交易資料
+# 開啟前請先重建部分合計: python manage.py rebuild_daily_aggregates
+DAILYTRAN_AGGREGATES = env.bool('DAILYTRAN_AGGREGATES', default=False)
+
 # Hide login
 DJANGO_ADMIN_PATH = env.str('DJANGO_ADMIN_PATH', default='admin')
 
@@ -0,0 +1,47 @@
+import datetime
+from unittest.mock import patch
+
+import pytest
+
+from apps.crops.builder import direct
+from apps.dailytrans.builders.archive import is_replaying
+from apps.dailytrans.builders.fingerprint import is_forced
+from apps.dailytrans.builders.utils import director
+
+# 內層 director 執行時的 (is_forced(), is_replaying())
+DIRECTED = []
+
+
+@director
+def direct_inner(start_date, end_date, *args, **kwargs):
+    DIRECTED.append((is_forced(), is_replaying()))
+
+
+@director
+def direct_outer(*args, **kwargs):
+    direct_inner(*args, **kwargs)
+
+
+def test_inner_director_inherits_flags():
+    # Act
+    DIRECTED.clear()
+    direct_outer(delta=1, force=True)
+    direct_outer(delta=1, replay=True)
+    direct_outer(delta=1)
+
+    # Assert
+    assert DIRECTED == [(True, False), (True, True), (False, False)]
+
+
+@pytest.mark.django_db
+def test_direct_replay_without_request(settings, tmp_path, load_crops_wholesale_fixtures, load_crops_origin_fixtures):
+    # Arrange
+    settings.DAILYTRAN_BUILDER_ARCHIVE = {'root': str(tmp_path), 'replay_concurrency': 1}
+    date = datetime.date(2024, 11, 1)
+
+    # Act
+    with patch('requests.Session.request') as mock_request:
+        direct(start_date=date, end_date=date, replay=True)
+
+    # Assert
+    assert not mock_request.called
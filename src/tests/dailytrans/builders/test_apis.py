@@ -1,11 +1,10 @@
 import datetime as dt
 from datetime import datetime
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 from urllib.parse import urlparse, parse_qs
 
 import pandas as pd
 import pytest
-from pandas import Series
 from requests import Response, Request
 
 from apps.configs.models import Config, Source, AbstractProduct, Type
@@ -15,18 +14,7 @@ from apps.dailytrans.builders.utils import DirectData
 from apps.dailytrans.models import DailyTran
 from apps.fruits.models import Fruit
 from apps.logs.models import Log, LogType
-
-
-@pytest.fixture
-def mock_daily_trans_data_frame():
-    return pd.DataFrame(
-        [{'avg_price_x': 50.0,
-          'source__name': '竹崎地區農會',
-          'date': dt.date(2024, 10, 31),
-          'product__code': '椪柑',
-          'avg_price_y': 50.0,
-          'id': 15755202}]
-    )
+from tests.dailytrans.factories import DailyTranFactory
 
 
 @pytest.mark.django_db
@@ -70,7 +58,7 @@ class TestOriginApis:
         sources = mock_crops_origin_api.sources
 
         # Assert
-        assert sources.count() == orig_sources.count()
+        assert sources == set(orig_sources.values_list('name', flat=True))
 
     def test_products_property(self, mock_crops_origin_api: OriginApi):
         # Arrange
@@ -80,7 +68,7 @@ class TestOriginApis:
         products = mock_crops_origin_api.products
 
         # Assert
-        assert products.count() == orig_products.count()
+        assert products == set(orig_products.values_list('code', flat=True))
 
     def test_get_formatted_url(self, mock_crops_origin_api: OriginApi):
         # Arrange
@@ -224,6 +212,12 @@ class TestOriginApis:
 
         return data_list
 
+    @staticmethod
+    def get_raw_data_frame(product, source_name: str, avg_price: float, period: str = '2024/10/31'):
+        return pd.DataFrame(
+            [{'AVGPRICE': avg_price, 'ORGNAME': source_name, 'PERIOD': period, 'PRODUCTNAME': product.code}]
+        )
+
     @patch('requests.Response')
     def test_convert_to_data_frame(
             self,
@@ -256,7 +250,7 @@ class TestOriginApis:
         assert set(result.isna().all().tolist()) == {False}
 
     @patch('requests.Response')
-    def test_compare_data_from_api_and_db_with_db_data_not_exist(
+    def test_prepare_data_from_api(
             self,
             mock_response,
             crops_origin_api,
@@ -267,212 +261,104 @@ class TestOriginApis:
         df = mock_crops_origin_api._convert_to_data_frame(data_list)
 
         # Act
-        result = mock_crops_origin_api._compare_data_from_api_and_db(df)
+        result = mock_crops_origin_api._prepare_data_from_api(df)
 
         # Assert
-        assert {'avg_price_x', 'source__name', 'date', 'product__code'}.issubset(set(result.columns.tolist()))
+        assert {'avg_price', 'source__name', 'date', 'product__code', 'product_id', 'source_id'}.issubset(
+            set(result.columns.tolist())
+        )
         assert type(result.date[0]) == dt.date
-        assert result.avg_price_x.isna().all() == False
-        assert result.id.isna().all() == True
-        assert result.avg_price_y.isna().all() == True
+        assert result.product_id.isna().any() == False
+        assert result.source_id.isna().any() == False
 
-    @patch('requests.Response')
-    def test_compare_data_from_api_and_db_with_db_data_existed(
-            self,
-            mock_response,
-            crops_origin_api,
-            mock_crops_origin_api: OriginApi,
-            mock_fruits_origin_api: OriginApi,
-            load_daily_trans_origin_crops_fixtures
-    ):
+    def test_prepare_data_from_api_with_unknown_source(self, mock_fruits_origin_api: OriginApi):
         # Arrange
-        data_list = self.get_data_set(mock_response, mock_fruits_origin_api, crops_origin_api, '20241031')
-        df = mock_fruits_origin_api._convert_to_data_frame(data_list)
+        product = mock_fruits_origin_api.PRODUCT_QS.first()
+        df = self.get_raw_data_frame(product, '不存在的來源', 50.0)
 
         # Act
-        result = mock_fruits_origin_api._compare_data_from_api_and_db(df)
+        result = mock_fruits_origin_api._prepare_data_from_api(df)
 
         # Assert
-        assert result.empty == False
-        assert result.id.any() == True
-        assert result.avg_price_y.any() == True
+        assert result.empty
 
-    def test_update_data(
-            self,
-            mock_crops_origin_api: OriginApi,
-            mock_fruits_origin_api: OriginApi,
-            load_daily_trans_origin_crops_fixtures,
-            mock_daily_trans_data_frame
-    ):
+    def test_access_data_from_api_with_new_data(self, mock_fruits_origin_api: OriginApi):
         # Arrange
-        series: Series = mock_daily_trans_data_frame.iloc[0]
-        series.avg_price_x = 999.5
-        daily_trans = DailyTran.objects.get(id=series.id)
+        product = mock_fruits_origin_api.PRODUCT_QS.first()
+        source = mock_fruits_origin_api.SOURCE_QS.first()
+        df = self.get_raw_data_frame(product, source.name, 50.0)
 
         # Act
-        mock_fruits_origin_api._update_data(series, daily_trans)
+        mock_fruits_origin_api._access_data_from_api(df)
+        daily_trans = DailyTran.objects.get(product=product, source=source, date=dt.date(2024, 10, 31))
 
         # Assert
-        assert daily_trans.update_time is not None
-        assert daily_trans.avg_price == series.avg_price_x
+        assert daily_trans.avg_price == 50.0
+        assert daily_trans.not_updated == 0
 
-    def test_save_new_data(
-            self,
-            mock_crops_origin_api: OriginApi,
-            mock_fruits_origin_api: OriginApi,
-            mock_daily_trans_data_frame
-    ):
+    def test_access_data_from_api_with_data_changed(self, mock_fruits_origin_api: OriginApi):
         # Arrange
-        series: Series = mock_daily_trans_data_frame.iloc[0]
+        product = mock_fruits_origin_api.PRODUCT_QS.first()
+        source = mock_fruits_origin_api.SOURCE_QS.first()
+        tran = DailyTranFactory(product=product, source=source, avg_price=50.0, date=dt.date(2024, 10, 31))
+        df = self.get_raw_data_frame(product, source.name, 999.5)
 
         # Act
-        mock_fruits_origin_api._save_new_data(series)
-        daily_trans = DailyTran.objects.filter(date=series.date)
-        daily_trans_obj: DailyTran = daily_trans[0]
+        mock_fruits_origin_api._access_data_from_api(df)
+        tran.refresh_from_db()
 
         # Assert
-        assert len(daily_trans) > 0
-        assert daily_trans_obj.avg_price == series.avg_price_x
-        assert daily_trans_obj.product.code == series.product__code
-        assert daily_trans_obj.source.name == series.source__name
-        assert daily_trans_obj.date == series.date
-
-    @patch('apps.dailytrans.builders.apis.Api._update_data')
-    @patch('apps.dailytrans.builders.apis.Api._save_new_data')
-    @patch(
-        'apps.dailytrans.builders.apis.DailyTran',
-        new_callable=MagicMock,
-        spec=DailyTran
-    )
-    def test_access_data_from_api_with_no_data_change(
-            self,
-            mock_daily_trans,
-            mock_save_new_data,
-            mock_update_data,
-            mock_crops_origin_api: OriginApi,
-            mock_fruits_origin_api: OriginApi,
-            mock_daily_trans_data_frame
-    ):
-        # Arrange
-        df = mock_daily_trans_data_frame
-        data = DirectData('COG06', 2, 'LOT-fruits')
-        api = OriginApi(model=Fruit, **data._asdict())
-        api._compare_data_from_api_and_db = MagicMock()
-        api._compare_data_from_api_and_db.return_value = df
-
-        # Act
-        api._access_data_from_api(df)
+        assert tran.avg_price == 999.5
+        assert DailyTran.objects.filter(product=product, source=source).count() == 1
 
-        # Assert
-        api._compare_data_from_api_and_db.assert_called_once_with(df)
-        mock_daily_trans.objects.get.assert_not_called()
-        mock_save_new_data.assert_not_called()
-        mock_update_data.assert_not_called()
-
-    @patch('apps.dailytrans.builders.apis.Api._update_data')
-    @patch('apps.dailytrans.builders.apis.Api._save_new_data')
-    @patch(
-        'apps.dailytrans.builders.apis.DailyTran',
-        new_callable=MagicMock,
-        spec=DailyTran
-    )
-    def test_access_data_from_api_with_data_changed(
-            self,
-            mock_daily_trans,
-            mock_save_new_data,
-            mock_update_data,
-            mock_crops_origin_api: OriginApi,
-            mock_fruits_origin_api: OriginApi,
-            load_daily_trans_origin_crops_fixtures,
-            mock_daily_trans_data_frame
-    ):
+    def test_access_data_from_api_with_no_data_change(self, mock_fruits_origin_api: OriginApi):
         # Arrange
-        df = mock_daily_trans_data_frame.assign(avg_price_x=999.5)
-        data = DirectData('COG06', 2, 'LOT-fruits')
-        api = OriginApi(model=Fruit, **data._asdict())
-        api._compare_data_from_api_and_db = MagicMock()
-        api._compare_data_from_api_and_db.return_value = df
-        daily_trans = DailyTran.objects.get(id=df.iloc[0].id)
-        mock_daily_trans.objects.get.return_value = daily_trans
+        product = mock_fruits_origin_api.PRODUCT_QS.first()
+        source = mock_fruits_origin_api.SOURCE_QS.first()
+        tran = DailyTranFactory(product=product, source=source, avg_price=50.0, date=dt.date(2024, 10, 31))
+        update_time = DailyTran.objects.get(id=tran.id).update_time
+        df = self.get_raw_data_frame(product, source.name, 50.0)
 
         # Act
-        api._access_data_from_api(df)
+        mock_fruits_origin_api._access_data_from_api(df)
+        tran.refresh_from_db()
 
         # Assert
-        api._compare_data_from_api_and_db.assert_called_once_with(df)
-        mock_daily_trans.objects.get.assert_called_once_with(id=df.iloc[0].id)
-        mock_update_data.assert_called_once()
-        mock_save_new_data.assert_not_called()
-
-    @patch('apps.dailytrans.builders.apis.Api._update_data')
-    @patch('apps.dailytrans.builders.apis.Api._save_new_data')
-    @patch(
-        'apps.dailytrans.builders.apis.DailyTran',
-        new_callable=MagicMock,
-        spec=DailyTran
-    )
-    def test_access_data_from_api_with_new_data(
-            self,
-            mock_daily_trans,
-            mock_save_new_data,
-            mock_update_data,
-            mock_crops_origin_api: OriginApi,
-            mock_fruits_origin_api: OriginApi,
-            mock_daily_trans_data_frame
-    ):
+        assert tran.avg_price == 50.0
+        assert tran.update_time == update_time
+
+    def test_access_data_from_api_with_data_to_delete(self, mock_fruits_origin_api: OriginApi):
         # Arrange
-        df = mock_daily_trans_data_frame.assign(avg_price_x=999.5)
-        data = DirectData('COG06', 2, 'LOT-fruits')
-        api = OriginApi(model=Fruit, **data._asdict())
-        api._compare_data_from_api_and_db = MagicMock()
-        api._compare_data_from_api_and_db.return_value = df
-        mock_daily_trans.objects.get.side_effect = DailyTran.DoesNotExist
+        product = mock_fruits_origin_api.PRODUCT_QS.first()
+        source, other_source, manual_source = mock_fruits_origin_api.SOURCE_QS[:3]
+        date = dt.date(2024, 10, 31)
+        removed = DailyTranFactory(product=product, source=other_source, avg_price=30.0, date=date)
+        manual = DailyTranFactory(product=product, source=manual_source, avg_price=30.0, date=date, not_updated=-1)
+        df = self.get_raw_data_frame(product, source.name, 50.0)
 
         # Act
-        api._access_data_from_api(df)
+        mock_fruits_origin_api._access_data_from_api(df)
 
         # Assert
-        api._compare_data_from_api_and_db.assert_called_once_with(df)
-        mock_daily_trans.objects.get.assert_called_once()
-        mock_update_data.assert_not_called()
-        mock_save_new_data.assert_called_once()
-
-    @patch('apps.dailytrans.builders.apis.Api._update_data')
-    @patch('apps.dailytrans.builders.apis.Api._save_new_data')
-    @patch(
-        'apps.dailytrans.builders.apis.DailyTran',
-        new_callable=MagicMock,
-        spec=DailyTran
-    )
-    def test_access_data_from_api_with_data_to_delete(
-            self,
-            mock_daily_trans,
-            mock_save_new_data,
-            mock_update_data,
-            mock_crops_origin_api: OriginApi,
-            mock_fruits_origin_api: OriginApi,
-            load_daily_trans_origin_crops_fixtures,
-            mock_daily_trans_data_frame
-    ):
+        assert not DailyTran.objects.filter(id=removed.id).exists()
+        assert DailyTran.objects.filter(id=manual.id).exists()
+        assert DailyTran.objects.filter(product=product, source=source, date=date).exists()
+
+    def test_access_data_from_api_with_manual_data(self, mock_fruits_origin_api: OriginApi):
         # Arrange
-        df = mock_daily_trans_data_frame.assign(avg_price_x='')
-        data = DirectData('COG06', 2, 'LOT-fruits')
-        api = OriginApi(model=Fruit, **data._asdict())
-        api._compare_data_from_api_and_db = MagicMock()
-        api._compare_data_from_api_and_db.return_value = df
-        daily_trans = DailyTran.objects.get(id=df.iloc[0].id)
-        daily_trans.delete = MagicMock()
-        mock_daily_trans.objects.get.return_value = daily_trans
+        product = mock_fruits_origin_api.PRODUCT_QS.first()
+        source = mock_fruits_origin_api.SOURCE_QS.first()
+        tran = DailyTranFactory(
+            product=product, source=source, avg_price=50.0, date=dt.date(2024, 10, 31), not_updated=-1
+        )
+        df = self.get_raw_data_frame(product, source.name, 999.5)
 
         # Act
-        api._access_data_from_api(df)
+        mock_fruits_origin_api._access_data_from_api(df)
+        tran.refresh_from_db()
 
         # Assert
-        api._compare_data_from_api_and_db.assert_called_once_with(df)
-        mock_daily_trans.objects.get.assert_called_once_with(id=df.iloc[0].id)
-        mock_update_data.assert_not_called()
-        daily_trans.delete.assert_called_once()
-        mock_save_new_data.assert_not_called()
+        assert tran.avg_price == 50.0
 
     @patch('requests.Response')
     def test_access_data_from_api_with_real_data(
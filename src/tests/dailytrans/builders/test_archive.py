@@ -0,0 +1,101 @@
+import os
+from datetime import date
+from unittest.mock import patch
+
+import pytest
+from requests import Request, Response
+
+from apps.crops.builder import WholeSaleApi05
+from apps.dailytrans.builders.archive import ResponseArchive, get_request_url, is_replaying, replaying
+
+
+def make_response(content, status_code=200):
+    response = Response()
+    response.status_code = status_code
+    response._content = content
+    response.encoding = 'utf-8'
+    response.headers['Content-Type'] = 'application/json'
+    response.request = Request('GET', 'https://example.com/api?').prepare()
+    return response
+
+
+class TestResponseArchive:
+    @pytest.fixture
+    def archive(self, tmp_path):
+        return ResponseArchive(str(tmp_path))
+
+    def test_store_and_lookup(self, archive: ResponseArchive):
+        # Arrange
+        url = get_request_url('https://example.com/api?', {'StartDate': '113.11.01'})
+
+        # Act
+        sha = archive.store('eir030', url, make_response('[{"作物代號": "FA0"}]'.encode()))
+        response = archive.lookup('eir030', url)
+
+        # Assert
+        assert os.path.exists(archive.object_path(sha))
+        assert response.status_code == 200
+        assert response.json() == [{'作物代號': 'FA0'}]
+        assert response.request.url == url
+        assert response.headers['Content-Type'] == 'application/json'
+
+    def test_store_same_content_once(self, archive: ResponseArchive):
+        # Act
+        sha1 = archive.store('eir030', 'https://example.com/api?day=1', make_response(b'[]'))
+        sha2 = archive.store('eir030', 'https://example.com/api?day=2', make_response(b'[]'))
+
+        # Assert
+        assert sha1 == sha2
+        assert len(os.listdir(os.path.dirname(archive.object_path(sha1)))) == 1
+        assert archive.lookup('eir030', 'https://example.com/api?day=2').content == b'[]'
+
+    def test_lookup_not_archived(self, archive: ResponseArchive):
+        # Assert
+        assert archive.lookup('eir030', 'https://example.com/api?day=1') is None
+        assert archive.lookup('eir032', 'https://example.com/api?day=1') is None
+
+    def test_replaying(self):
+        # Assert
+        with replaying():
+            assert is_replaying()
+        assert not is_replaying()
+
+
+@pytest.mark.django_db
+class TestReplay:
+    def test_replay_archived_response(self, mock_wholesale_api05: WholeSaleApi05, tmp_path):
+        # Arrange
+        mock_wholesale_api05.archive = ResponseArchive(str(tmp_path))
+        params = {'start_date': date(2024, 11, 1), 'end_date': date(2024, 11, 3), 'tc_type': 'N04'}
+
+        with patch.object(mock_wholesale_api05.session, 'get', return_value=make_response(b'[]')) as mock_get:
+            mock_wholesale_api05.request(**params)
+
+        # Act
+        mock_wholesale_api05.replay = True
+        with patch.object(mock_wholesale_api05.session, 'get') as mock_replay_get:
+            response = mock_wholesale_api05.request(**params)
+            missing = mock_wholesale_api05.request(**{**params, 'tc_type': 'N05'})
+
+        # Assert
+        assert mock_get.call_count == 1
+        assert not mock_replay_get.called
+        assert response.status_code == 200
+        assert response.content == b'[]'
+        assert missing.status_code == 404
+
+    def test_log_request_url_per_call(self, mock_wholesale_api05: WholeSaleApi05, tmp_path):
+        # Arrange
+        mock_wholesale_api05.archive = ResponseArchive(str(tmp_path))
+        mock_wholesale_api05.replay = True
+        params = {'start_date': date(2024, 11, 1), 'end_date': date(2024, 11, 3), 'tc_type': 'N04'}
+
+        # Act
+        with patch.object(mock_wholesale_api05, 'LOGGER') as mock_logger:
+            missing = mock_wholesale_api05.request(**params)
+
+        # Assert
+        _, kwargs = mock_logger.warning.call_args
+        assert kwargs['extra']['request_url'] == missing.url
+        # 並行的 worker 共用 LOGGER_EXTRA，不應被個別請求修改
+        assert mock_wholesale_api05.LOGGER_EXTRA['request_url'] is None
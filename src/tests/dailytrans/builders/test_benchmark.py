@@ -0,0 +1,80 @@
+import pytest
+import requests
+
+from apps.dailytrans.builders.benchmark import RssSampler, StubApiServer
+
+
+APIS = {
+    'eir030': 'https://data.moa.gov.tw/Service/OpenData/FromM/FarmTransData.aspx?',
+    'efish': '',
+}
+
+
+@pytest.fixture
+def payload(tmp_path):
+    path = tmp_path / 'eir030.json'
+    path.write_text('[{"CropCode": "LA1"}]')
+    return str(path)
+
+
+class TestStubApiServer:
+    def test_urls(self, payload):
+        with StubApiServer(apis=APIS) as server:
+            # Assert
+            assert server.url_for('eir030') == f'{server.base_url}/eir030/Service/OpenData/FromM/FarmTransData.aspx?'
+            assert server.url_for('efish') == f'{server.base_url}/efish/?'
+            assert server.original_url('eir030', '/Service/OpenData/FromM/FarmTransData.aspx', 'a=1') == (
+                'https://data.moa.gov.tw/Service/OpenData/FromM/FarmTransData.aspx?a=1'
+            )
+            assert server.original_url('efish', '/', 'a=1') is None
+
+    def test_payload(self, payload):
+        with StubApiServer(payloads={'eir030': payload}, apis=APIS) as server:
+            # Act
+            response = requests.get('&'.join((server.url_for('eir030'), 'StartDate=113.01.01')))
+            missing = requests.get('&'.join((server.url_for('efish'), 'ds=113.01.01')))
+
+            # Assert
+            assert response.status_code == 200
+            assert response.json() == [{'CropCode': 'LA1'}]
+            assert missing.status_code == 200
+            assert missing.content == b''
+            assert server.snapshot()['requests'] == 2
+            assert server.snapshot()['efish:missing'] == 1
+
+    def test_failure_injection(self, payload):
+        with StubApiServer(payloads={'eir030': payload}, failure_rate=1, failure_status=429, apis=APIS) as server:
+            # Act
+            response = requests.get(server.url_for('eir030'))
+
+            # Assert
+            assert response.status_code == 429
+            assert server.snapshot()['eir030:failures'] == 1
+
+    def test_activate(self, settings):
+        # Arrange
+        settings.DAILYTRAN_BUILDER_API = APIS
+        settings.DAILYTRAN_BUILDER_API_LIMITS = {'efish': {'concurrency': 1, 'rate': 0.1}}
+
+        with StubApiServer() as server, server.activate():
+            # Assert
+            from django.conf import settings as active_settings
+            assert active_settings.DAILYTRAN_BUILDER_API == server.urls
+            assert active_settings.DAILYTRAN_BUILDER_API_LIMITS['efish'] == {'concurrency': 1, 'rate': None}
+            assert active_settings.DAILYTRAN_BUILDER_RETRY['max_retries'] == 0
+
+            with pytest.raises(requests.exceptions.ConnectionError):
+                requests.get('https://data.moa.gov.tw/Service/OpenData/FromM/FarmTransData.aspx?')
+
+            assert server.snapshot()['external:blocked'] == 1
+
+        assert settings.DAILYTRAN_BUILDER_API == APIS
+
+
+class TestRssSampler:
+    def test_peak(self):
+        with RssSampler(interval=0.01) as sampler:
+            data = bytearray(8 * 1024 * 1024)
+
+        # Assert
+        assert sampler.peak > len(data)
@@ -0,0 +1,43 @@
+from datetime import date
+
+from apps.dailytrans.builders.efish import plan_batches
+
+
+WINDOWS = [(date(2024, 1, 1), date(2024, 12, 31)), (date(2025, 1, 1), date(2025, 1, 10))]
+
+
+class TestPlanBatches:
+    def test_whole_window(self):
+        # Act
+        jobs = plan_batches(['1011', '1011D', '1171'], WINDOWS)
+
+        # Assert
+        assert jobs == [
+            {'start_date': date(2024, 1, 1), 'end_date': date(2024, 12, 31), 'code': None},
+            {'start_date': date(2025, 1, 1), 'end_date': date(2025, 1, 10), 'code': None},
+        ]
+
+    def test_batch_size(self):
+        # Act
+        jobs = plan_batches(['1171', '1011', '1011D', '1011'], WINDOWS[:1], batch_size=2)
+
+        # Assert
+        assert [job['code'] for job in jobs] == ['1011,1011D', '1171']
+
+    def test_request_budget(self):
+        # Arrange
+        codes = [str(code) for code in range(1000, 1010)]
+
+        # Act
+        jobs = plan_batches(codes, WINDOWS, batch_size=2, request_budget=4)
+        minimum = plan_batches(codes, WINDOWS, batch_size=2, request_budget=1)
+
+        # Assert
+        assert len(jobs) == 4
+        assert [job['code'].count(',') + 1 for job in jobs] == [5, 5, 5, 5]
+        assert len(minimum) == len(WINDOWS)
+
+    def test_empty(self):
+        # Assert
+        assert plan_batches([], WINDOWS) == []
+        assert plan_batches(['1011'], []) == []
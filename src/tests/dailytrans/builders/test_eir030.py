@@ -1,7 +1,10 @@
+from datetime import date, timedelta
+from unittest.mock import patch
+
 import pandas as pd
 import pytest
+from requests import Response
 
-from datetime import date
 from apps.configs.models import Config, Source, AbstractProduct
 from apps.crops.models import Crop
 from apps.dailytrans.models import DailyTran
@@ -27,7 +30,7 @@ class TestCropsEir030:
             ],
         )
         data = data[data['作物代號'].isin(mock_wholesale_api05.target_items)]
-        return mock_wholesale_api05._compare_data_from_api_and_db(data)
+        return data
 
     def test_instance(self, mock_wholesale_api05):
         # Arrange
@@ -41,26 +44,62 @@ class TestCropsEir030:
         assert mock_wholesale_api05.SOURCE_QS.count() == sources.count()
         assert mock_wholesale_api05.PRODUCT_QS.count() == products.count()
 
-    def test_compare_data_from_api_and_db_with_daily_trans_existed(
+    def test_prepare_data_from_api(
             self, mock_wholesale_api05: WholeSaleApi05, crops_wholesale05_api
     ):
         # Act
-        df_result = self._get_result(crops_wholesale05_api, mock_wholesale_api05)
+        df_result = mock_wholesale_api05._prepare_data_from_api(
+            self._get_result(crops_wholesale05_api, mock_wholesale_api05)
+        )
 
         # Assert
         assert type(df_result.date[0]) == date
         assert df_result.date[0].isoformat() == '2024-11-25'
-        assert df_result.query('id.notnull()').shape[0] == DailyTran.objects.filter(date=df_result.date[0]).count()
+        assert df_result.product_id.isna().any() == False
+        assert df_result.source_id.isna().any() == False
 
-    def test_compare_data_from_api_and_db_with_daily_trans_not_exist(
+    def test_access_data_from_api(
             self, mock_wholesale_api05: WholeSaleApi05, crops_wholesale05_api
     ):
         # Arrange
-        DailyTran.objects.filter(date='2024-11-25').delete()
+        data = self._get_result(crops_wholesale05_api, mock_wholesale_api05)
+        prepared = mock_wholesale_api05._prepare_data_from_api(data)
+        keys = prepared[['product_id', 'source_id']].drop_duplicates()
+
+        # Act
+        mock_wholesale_api05._access_data_from_api(data)
+        # 重複執行不會產生重複資料
+        mock_wholesale_api05._access_data_from_api(data)
+
+        # Assert
+        assert DailyTran.objects.filter(
+            date=date(2024, 11, 25),
+            product__type=mock_wholesale_api05.TYPE,
+            product__config=mock_wholesale_api05.CONFIG,
+        ).count() == len(keys)
+
+    def test_fetch_range_and_load(self, mock_wholesale_api05: WholeSaleApi05):
+        # Arrange
+        requested = []
+
+        def request(start_date, end_date, tc_type=None):
+            requested.append((start_date, end_date))
+            response = Response()
+            # 模擬區間超過 10 天時回應失敗
+            response.status_code = 500 if (end_date - start_date).days >= 10 else 200
+            return response
 
         # Act
-        df_result = self._get_result(crops_wholesale05_api, mock_wholesale_api05)
+        with patch.object(mock_wholesale_api05, 'request', side_effect=request), \
+                patch.object(mock_wholesale_api05, 'load') as mock_load:
+            request_count = mock_wholesale_api05.fetch_range_and_load(
+                date(2024, 11, 1), date(2024, 11, 30), tc_type='N04'
+            )
 
         # Assert
-        assert df_result.query('id.notnull()').shape[0] == 0
-        assert df_result.query('date.notnull()').shape[0] == len(crops_wholesale05_api)
+        assert request_count == len(requested) == 7
+        assert mock_load.call_count == 4
+        windows = sorted(window for window in requested if (window[1] - window[0]).days < 10)
+        assert windows[0][0] == date(2024, 11, 1)
+        assert windows[-1][1] == date(2024, 11, 30)
+        assert all(prev[1] + timedelta(days=1) == nxt[0] for prev, nxt in zip(windows, windows[1:]))
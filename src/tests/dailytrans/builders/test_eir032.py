@@ -351,6 +351,48 @@ class TestHTMLParser:
         # Assert
         assert data is None
 
+    @pytest.mark.parametrize('page', ['mock_html_page', 'mock_no_data_html_page'])
+    def test_backends_parity(self, mock_instances, page: str, request):
+        # Arrange
+        mock_response, api = mock_instances
+        mock_response.text = request.getfixturevalue(page)
+
+        # Act
+        columns = {
+            backend: HTMLParser(mock_response, api, backend=backend).extract_columns()
+            for backend in HTMLParser.BACKENDS
+        }
+        data = {
+            backend: HTMLParser(mock_response, api, backend=backend).parse_table()
+            for backend in HTMLParser.BACKENDS
+        }
+
+        # Assert
+        assert columns['stream'] == columns['bs4']
+        assert data['stream'] == data['bs4']
+
+    def test_stream_backend_columns(self, mock_instances, mock_html_page: str):
+        # Arrange
+        mock_response, api = mock_instances
+        mock_response.text = mock_html_page
+        parser = HTMLParser(mock_response, api, backend='stream')
+
+        # Act
+        columns = parser.extract_columns()
+
+        # Assert
+        assert columns['品種代碼'][:2] == ['1071', '1041']
+        assert columns['魚貨名稱'][0] == '金目鱸'
+        assert len(set(map(len, columns.values()))) == 1
+
+    def test_unknown_backend(self, mock_instances):
+        # Arrange
+        mock_response, api = mock_instances
+
+        # Assert
+        with pytest.raises(ValueError):
+            HTMLParser(mock_response, api, backend='lxml')
+
 
 @pytest.mark.django_db
 class TestScrapperApi:
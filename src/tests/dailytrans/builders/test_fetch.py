@@ -0,0 +1,99 @@
+import threading
+import time
+
+from apps.dailytrans.builders.fetch import AsyncFetcher, HostLimit, RateThrottle, get_limit
+
+
+class TestGetLimit:
+    def test_get_limit_by_api_name_and_host(self, settings):
+        # Arrange
+        settings.DAILYTRAN_BUILDER_API_LIMITS = {
+            'default': {'concurrency': 3, 'rate': None},
+            'example.com': {'rate': 5},
+            'apis': {'concurrency': 1, 'rate': 2},
+        }
+
+        # Assert
+        assert get_limit('apis', 'https://example.com/api?') == HostLimit(concurrency=1, rate=2)
+        assert get_limit('eir030', 'https://example.com/api?') == HostLimit(concurrency=3, rate=5)
+        assert get_limit('eir030', 'https://other.com/api?') == HostLimit(concurrency=3, rate=None)
+
+
+class TestRateThrottle:
+    def test_reserve(self):
+        # Arrange
+        throttle = RateThrottle(rate=10)
+
+        # Act
+        delays = [throttle.reserve() for _ in range(3)]
+
+        # Assert
+        assert delays[0] == 0
+        assert 0.09 < delays[1] <= 0.1
+        assert 0.19 < delays[2] <= 0.2
+
+    def test_reserve_without_rate(self):
+        assert RateThrottle(rate=None).reserve() == 0
+
+    def test_for_host(self):
+        assert RateThrottle.for_host('example.com', 5) is RateThrottle.for_host('example.com', 5)
+        assert RateThrottle.for_host('example.com', 5) is not RateThrottle.for_host('other.com', 5)
+
+
+class TestAsyncFetcher:
+    def test_fetch_in_completed_order(self):
+        # Arrange
+        def request(delay):
+            time.sleep(delay)
+            return delay
+
+        fetcher = AsyncFetcher(request, concurrency=3)
+
+        # Act
+        results = [response for kwargs, response, exc in fetcher.fetch([{'delay': d} for d in (0.3, 0.1, 0.2)])]
+
+        # Assert
+        assert results == [0.1, 0.2, 0.3]
+
+    def test_fetch_with_concurrency_limit(self):
+        # Arrange
+        running, max_running = [0], [0]
+        lock = threading.Lock()
+
+        def request(i):
+            with lock:
+                running[0] += 1
+                max_running[0] = max(max_running[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return i
+
+        fetcher = AsyncFetcher(request, concurrency=2)
+
+        # Act
+        results = list(fetcher.fetch([{'i': i} for i in range(6)]))
+
+        # Assert
+        assert len(results) == 6
+        assert max_running[0] == 2
+
+    def test_fetch_with_exception(self):
+        # Arrange
+        def request(i):
+            if i == 1:
+                raise ValueError('mock error')
+            return i
+
+        fetcher = AsyncFetcher(request, concurrency=2)
+
+        # Act
+        results = {kwargs['i']: (response, exc) for kwargs, response, exc in fetcher.fetch([{'i': 0}, {'i': 1}])}
+
+        # Assert
+        assert results[0] == (0, None)
+        assert results[1][0] is None
+        assert isinstance(results[1][1], ValueError)
+
+    def test_fetch_without_jobs(self):
+        assert list(AsyncFetcher(lambda: None).fetch([])) == []
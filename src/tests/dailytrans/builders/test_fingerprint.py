@@ -0,0 +1,105 @@
+from datetime import date
+from unittest.mock import patch
+
+import pytest
+from requests import Response
+
+from apps.crops.builder import WholeSaleApi05
+from apps.dailytrans.builders.fingerprint import PayloadFingerprint, digest, forced, is_forced
+from tests.dailytrans.builders.test_resilience import FakeRedis
+
+
+def make_response(content, status_code=200):
+    response = Response()
+    response.status_code = status_code
+    response._content = content
+    return response
+
+
+class TestDigest:
+    def test_digest(self):
+        # Assert
+        assert digest(make_response(b'[1]')) == digest(make_response(b'[1]'))
+        assert digest(make_response(b'[1]')) != digest(make_response(b'[2]'))
+        assert digest([make_response(b'[1]'), make_response(b'[2]')]) != digest([make_response(b'[1][2]')])
+
+    def test_digest_without_content(self):
+        # Assert
+        assert digest(make_response(b'[1]', status_code=500)) is None
+        assert digest([make_response(b'[1]'), make_response(b'', status_code=404)]) is None
+        assert digest([]) is None
+        assert digest(object()) is None
+
+
+class TestPayloadFingerprint:
+    @pytest.fixture
+    def fingerprint(self):
+        return PayloadFingerprint('eir030', 'COG05', 1, 'crops.Crop', ttl=60, redis=FakeRedis())
+
+    def test_is_unchanged(self, fingerprint: PayloadFingerprint):
+        # Arrange
+        params = {'start_date': date(2024, 11, 1), 'end_date': date(2024, 11, 3), 'tc_type': 'N04'}
+
+        # Act
+        unchanged_before_save = fingerprint.is_unchanged(params, 'abc')
+        fingerprint.save(params, 'abc')
+
+        # Assert
+        assert not unchanged_before_save
+        assert fingerprint.is_unchanged(params, 'abc')
+        assert not fingerprint.is_unchanged(params, 'def')
+        assert not fingerprint.is_unchanged({**params, 'tc_type': 'N05'}, 'abc')
+        assert not fingerprint.is_unchanged(params, None)
+        assert fingerprint.redis.ttl(fingerprint.key(params)) == 60
+
+    def test_key(self, fingerprint: PayloadFingerprint):
+        # Assert
+        assert fingerprint.key({'end_date': date(2024, 11, 3), 'start_date': date(2024, 11, 1)}) == (
+            'builder:fingerprint:eir030:COG05:1:crops.Crop:{"end_date": "2024-11-03", "start_date": "2024-11-01"}'
+        )
+
+    def test_forced(self, fingerprint: PayloadFingerprint):
+        # Arrange
+        fingerprint.save({'date': date(2024, 11, 1)}, 'abc')
+
+        # Assert
+        with forced():
+            assert is_forced()
+            assert not fingerprint.is_unchanged({'date': date(2024, 11, 1)}, 'abc')
+        assert not is_forced()
+        assert fingerprint.is_unchanged({'date': date(2024, 11, 1)}, 'abc')
+
+
+@pytest.mark.django_db
+class TestLoadIfChanged:
+    def test_skip_unchanged_response(self, mock_wholesale_api05: WholeSaleApi05):
+        # Arrange
+        mock_wholesale_api05.fingerprint._redis = FakeRedis()
+        params = {'start_date': date(2024, 11, 1), 'end_date': date(2024, 11, 3), 'tc_type': 'N04'}
+
+        # Act
+        with patch.object(mock_wholesale_api05, 'load') as mock_load:
+            results = [
+                mock_wholesale_api05.load_if_changed(make_response(b'[]'), **params),
+                mock_wholesale_api05.load_if_changed(make_response(b'[]'), **params),
+                mock_wholesale_api05.load_if_changed(make_response(b'[{}]'), **params),
+            ]
+            with forced():
+                results.append(mock_wholesale_api05.load_if_changed(make_response(b'[{}]'), **params))
+
+        # Assert
+        assert results == [True, False, True, True]
+        assert mock_load.call_count == 3
+
+    def test_reload_after_failed_load(self, mock_wholesale_api05: WholeSaleApi05):
+        # Arrange
+        mock_wholesale_api05.fingerprint._redis = FakeRedis()
+        params = {'start_date': date(2024, 11, 1), 'end_date': date(2024, 11, 3), 'tc_type': 'N04'}
+
+        # Act
+        with patch.object(mock_wholesale_api05, 'load', side_effect=[False, True, True]) as mock_load:
+            results = [mock_wholesale_api05.load_if_changed(make_response(b'[{}]'), **params) for _ in range(3)]
+
+        # Assert
+        assert results == [False, True, False]
+        assert mock_load.call_count == 2
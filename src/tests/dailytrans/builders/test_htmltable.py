@@ -0,0 +1,32 @@
+from apps.dailytrans.builders.htmltable import extract_table, to_columns
+
+
+class TestExtractTable:
+    def test_extract_table(self):
+        # Arrange
+        html = (
+            '<table id="other"><tbody><tr><td>x</td></tr></tbody></table>'
+            '<table id="target"><thead><tr><th>代碼</th><th>名稱<br>(魚貨)</th></tr></thead>'
+            '<tbody><tr><td>1071</td><td>金目<b>鱸</b><!-- comment -->&nbsp;</td></tr>'
+            '<tr><td>1041<td>虱目魚</tbody>'
+            '<tbody><tr><td>合計</td></tr></tbody></table>'
+        )
+
+        # Act
+        headers, rows = extract_table(html, 'target', chunk_size=7)
+
+        # Assert
+        assert headers == ['代碼', '名稱(魚貨)']
+        assert rows == [['1071', '金目鱸\xa0'], ['1041', '虱目魚']]
+
+    def test_table_not_found(self):
+        # Assert
+        assert extract_table('<html></html>', 'target') == ([], [])
+
+    def test_to_columns(self):
+        # Act
+        columns = to_columns(['代碼', '名稱'], [['1071', '金目鱸'], ['合計']])
+
+        # Assert
+        assert list(columns) == ['代碼', '名稱']
+        assert columns['名稱'] == ['金目鱸', None]
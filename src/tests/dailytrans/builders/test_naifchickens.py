@@ -0,0 +1,122 @@
+from datetime import date
+
+import requests
+
+from apps.dailytrans.builders.naifchickens import (
+    iter_months,
+    parse_market_page,
+    parse_pages,
+    parse_total_page,
+)
+from apps.dailytrans.builders.session import SessionCache
+from tests.dailytrans.builders.test_resilience import FakeRedis
+
+
+MARKET_HTML = """
+<html><body>
+<table cellspacing="1">
+    <tr><th>日</th><td></td></tr>
+    <tr><th>01</th><td></td><td></td><td></td><td></td><td>45.5</td><td></td><td>1,200</td><td>2.1</td></tr>
+    <tr><th>02</th><td></td><td></td><td></td><td></td><td>abc</td><td></td><td>1,000</td><td>2.0</td></tr>
+    <tr><th>03</th><td></td><td></td><td></td><td></td><td></td><td></td><td></td><td></td></tr>
+</table>
+</body></html>
+"""
+
+LOGIN_REQUIRED_HTML = "<html><script>alert('請先登入會員!!');</script></html>"
+
+TOTAL_HTML = """
+<table cellspacing="0">
+    <tr><td></td></tr><tr><td></td></tr><tr><td></td></tr><tr><td>本期</td></tr><tr><td></td></tr>
+    <tr><td>白肉雞</td><td>總貨</td><td>38.5</td><td></td><td></td><td>5000</td><td></td><td></td><td>2.5</td></tr>
+    <tr><td>紅羽土雞</td><td>總貨</td><td>-</td><td></td><td></td><td>-</td><td></td><td></td><td>-</td></tr>
+</table>
+"""
+
+
+class TestParsers:
+    def test_iter_months(self):
+        # Assert
+        assert list(iter_months(date(2023, 11, 20), date(2024, 2, 1))) == [
+            (2023, '11'), (2023, '12'), (2024, '01'), (2024, '02')
+        ]
+
+    def test_parse_market_page(self):
+        # Act
+        result = parse_market_page(MARKET_HTML, '環南-白肉雞', 2024, '11')
+
+        # Assert
+        assert result.records == [{
+            'date': '2024/11/01',
+            'item': '環南-白肉雞',
+            'price': 45.5,
+            'weight': 2.1,
+            'volume': 1200.0,
+            'priceUnit': '元/公斤',
+        }]
+        assert result.warnings == ['2024/11/02 環南-白肉雞 price Value Error : abc']
+        assert not result.login_required
+
+    def test_parse_market_page_login_required(self):
+        # Act
+        result = parse_market_page(LOGIN_REQUIRED_HTML, '環南-白肉雞', 2024, '11')
+
+        # Assert
+        assert result.login_required
+        assert result.records == []
+
+    def test_parse_total_page(self):
+        # Act
+        result = parse_total_page(TOTAL_HTML, '2024-11-01')
+        error = parse_total_page('<html></html>', '2024-11-02')
+
+        # Assert
+        assert [(record['item'], record['date'], record['price']) for record in result.records] == [
+            ('白肉雞總貨', '2024/11/01', 38.5)
+        ]
+        assert result.warnings == ['2024-11-01 紅羽土雞總貨 無交易數據']
+        assert error.records == []
+        assert error.warnings == ['2024-11-02 網站發生異常！']
+
+    def test_parse_pages_in_order(self):
+        # Arrange
+        pages = [(MARKET_HTML, '環南-白肉雞', 2024, '11'), (LOGIN_REQUIRED_HTML, '環南-土雞', 2024, '11')]
+
+        # Act
+        results = parse_pages(parse_market_page, pages, workers=1)
+
+        # Assert
+        assert [result.login_required for result in results] == [False, True]
+        assert parse_pages(parse_market_page, [], workers=2) == []
+
+
+class TestSessionCache:
+    def test_save_and_restore(self):
+        # Arrange
+        cache = SessionCache('naifchickens', ttl=60, redis=FakeRedis())
+        session = requests.Session()
+        session.cookies.set('ASP.NET_SessionId', 'abc')
+
+        # Act
+        missing = cache.restore(requests.Session())
+        cache.save(session)
+        restored = requests.Session()
+        found = cache.restore(restored)
+
+        # Assert
+        assert not missing
+        assert found
+        assert restored.cookies.get('ASP.NET_SessionId') == 'abc'
+
+    def test_clear(self):
+        # Arrange
+        cache = SessionCache('naifchickens', ttl=60, redis=FakeRedis())
+        session = requests.Session()
+        session.cookies.set('ASP.NET_SessionId', 'abc')
+        cache.save(session)
+
+        # Act
+        cache.clear()
+
+        # Assert
+        assert not cache.restore(requests.Session())
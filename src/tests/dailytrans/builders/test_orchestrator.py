@@ -0,0 +1,75 @@
+import time
+from datetime import date, timedelta
+
+from apps.dailytrans.builders.orchestrator import (
+    BuildNode,
+    aggregate,
+    plan_lanes,
+    serialize_result,
+    to_direct_result,
+)
+from apps.dailytrans.builders.utils import DirectResult
+
+
+class TestPlanLanes:
+    def test_plan_lanes_by_host(self, settings):
+        # Arrange
+        settings.DAILYTRAN_BUILDER_API = {
+            'eir030': 'https://data.moa.gov.tw/eir030?',
+            'eir019': 'https://data.moa.gov.tw/eir019?',
+            'eir107': 'https://data.moa.gov.tw/eir107?',
+            'amis': 'https://amis.example.com/api?',
+            'efish': '',
+        }
+        settings.DAILYTRAN_BUILDER_HOST_TASKS = {'default': 1, 'data.moa.gov.tw': 2}
+        nodes = [
+            BuildNode('a', 'eir030'),
+            BuildNode('b', 'amis'),
+            BuildNode('c', 'eir019'),
+            BuildNode('d', 'eir107'),
+            BuildNode('e', 'amis'),
+            BuildNode('f', 'efish'),
+        ]
+
+        # Act
+        lanes = plan_lanes(nodes)
+
+        # Assert
+        assert [[node.func for node in lane] for lane in lanes] == [['a', 'd'], ['c'], ['b', 'e'], ['f']]
+
+    def test_plan_lanes_without_nodes(self):
+        assert plan_lanes([]) == []
+
+
+class TestAggregate:
+    def test_aggregate(self):
+        # Arrange
+        success = serialize_result(
+            'apps.hogs.builder.direct',
+            DirectResult(date(2024, 11, 1), date(2024, 11, 3), duration=timedelta(seconds=3), success=True),
+        )
+        failure = serialize_result(
+            'apps.rams.builder.direct',
+            DirectResult(date(2024, 11, 1), date(2024, 11, 3), success=False, msg=ValueError('mock error')),
+        )
+
+        # Act
+        summary = aggregate([[success], [success, failure]], '2024-11-01', '2024-11-03', time.time() - 5)
+        result = to_direct_result(summary)
+
+        # Assert
+        assert success['duration'] == 3
+        assert failure['msg'] == 'mock error'
+        assert len(summary['results']) == 3
+        assert not result.success
+        assert result.msg == 'apps.rams.builder.direct: mock error'
+        assert result.start_date.date() == date(2024, 11, 1)
+        assert 5 <= result.duration.total_seconds() < 6
+
+    def test_aggregate_success(self):
+        # Act
+        result = to_direct_result(aggregate([], '2024-11-01', '2024-11-03', time.time()))
+
+        # Assert
+        assert result.success
+        assert result.msg == ''
@@ -0,0 +1,122 @@
+import datetime
+
+import pytest
+from django.db import connection
+
+from apps.dailytrans.builders.orchestrator import BuildNode
+from apps.dailytrans.builders.plan import (
+    FetchPlan,
+    GapCell,
+    advance_watermarks,
+    build_plan,
+    find_gaps,
+    to_windows,
+)
+from apps.dailytrans.models import IngestionWatermark
+from tests.dailytrans.factories import DailyTranFactory
+
+
+def days(start, end):
+    return [datetime.date(2024, 11, day) for day in range(start, end + 1)]
+
+
+class TestFetchPlan:
+    def test_to_windows(self):
+        # Assert
+        assert to_windows([]) == []
+        assert to_windows(days(5, 6) + days(1, 3) + days(2, 2) + days(9, 9)) == [
+            (datetime.date(2024, 11, 1), datetime.date(2024, 11, 3)),
+            (datetime.date(2024, 11, 5), datetime.date(2024, 11, 6)),
+            (datetime.date(2024, 11, 9), datetime.date(2024, 11, 9)),
+        ]
+
+    def test_as_dict(self):
+        # Arrange
+        node = BuildNode('apps.crops.builder.direct_wholesale_05', 'eir030', 'COG05', 1)
+        gaps = [GapCell(1, 1, datetime.date(2024, 11, 1)), GapCell(2, 1, datetime.date(2024, 11, 1))]
+        plan = FetchPlan(node, days(1, 1) + days(4, 5), open_dates=days(4, 5), revision_dates=days(5, 5), gaps=gaps)
+
+        # Assert
+        assert plan
+        assert not FetchPlan(node, [])
+        assert plan.start_date == datetime.date(2024, 11, 1)
+        assert plan.end_date == datetime.date(2024, 11, 5)
+        assert plan.as_dict()['windows'] == [
+            (datetime.date(2024, 11, 1), datetime.date(2024, 11, 1)),
+            (datetime.date(2024, 11, 4), datetime.date(2024, 11, 5)),
+        ]
+        assert plan.as_dict()['gap_days'] == 1
+        assert plan.as_dict()['gap_cells'] == 2
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != 'postgresql', reason='generate_series requires PostgreSQL')
+class TestGapsAndWatermarks:
+    today = datetime.date(2024, 11, 10)
+
+    @pytest.fixture
+    def node(self, product_of_pig):
+        return BuildNode('apps.hogs.builder.direct', 'eir019', product_of_pig.config.code, product_of_pig.type.id)
+
+    def test_find_gaps(self, product_of_pig, sources_for_pig, node):
+        # Arrange
+        source, other_source = sources_for_pig[:2]
+        for date in days(1, 5):
+            DailyTranFactory(product=product_of_pig, source=source, avg_price=50.0, date=date)
+        # other_source 缺少 11/2、11/4 的資料，11/6 之後兩個來源皆無資料(視為休市)
+        for date in (days(1, 1) + days(3, 3) + days(5, 5)):
+            DailyTranFactory(product=product_of_pig, source=other_source, avg_price=50.0, date=date)
+
+        # Act
+        gaps = find_gaps(node.config_code, node.type_id, datetime.date(2024, 11, 1), self.today)
+
+        # Assert
+        assert gaps == [
+            GapCell(product_of_pig.id, other_source.id, datetime.date(2024, 11, 2)),
+            GapCell(product_of_pig.id, other_source.id, datetime.date(2024, 11, 4)),
+        ]
+
+    def test_build_plan_and_advance_watermarks(self, product_of_pig, sources_for_pig, node):
+        # Arrange
+        source, other_source = sources_for_pig[:2]
+        for date in days(1, 8):
+            DailyTranFactory(product=product_of_pig, source=source, avg_price=50.0, date=date)
+        for date in days(1, 3) + days(5, 6):
+            DailyTranFactory(product=product_of_pig, source=other_source, avg_price=50.0, date=date)
+
+        # Act
+        first_plan = build_plan(node, today=self.today, revision_days=1, lookback_days=9)
+        advance_watermarks(first_plan)
+        plan = build_plan(node, today=self.today, revision_days=1, lookback_days=9)
+
+        # Assert
+        # 尚無 watermark 時涵蓋整個回溯期間
+        assert first_plan.watermark is None
+        assert first_plan.windows == [(datetime.date(2024, 11, 1), self.today)]
+        assert IngestionWatermark.objects.get(source=source).complete_date == datetime.date(2024, 11, 8)
+        assert IngestionWatermark.objects.get(source=other_source).complete_date == datetime.date(2024, 11, 6)
+        # watermark(11/6)之後的日期、缺漏(11/4、11/7、11/8)與修正期間(11/9、11/10)
+        assert plan.watermark == datetime.date(2024, 11, 6)
+        assert plan.windows == [
+            (datetime.date(2024, 11, 4), datetime.date(2024, 11, 4)),
+            (datetime.date(2024, 11, 7), self.today),
+        ]
+
+    def test_advance_watermarks_forward_only(self, product_of_pig, sources_for_pig, node):
+        # Arrange
+        source = sources_for_pig[0]
+        DailyTranFactory(product=product_of_pig, source=source, avg_price=50.0, date=datetime.date(2024, 11, 3))
+        IngestionWatermark.objects.create(
+            api_name=node.api_name,
+            config=product_of_pig.config,
+            type=product_of_pig.type,
+            source=source,
+            complete_date=datetime.date(2024, 11, 5),
+        )
+        plan = FetchPlan(node, days(1, 5))
+
+        # Act
+        advance_watermarks(plan)
+
+        # Assert
+        assert IngestionWatermark.objects.get(source=source).complete_date == datetime.date(2024, 11, 5)
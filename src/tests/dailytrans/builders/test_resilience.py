@@ -0,0 +1,188 @@
+import datetime
+from unittest.mock import patch
+
+import pytest
+from requests import Response
+
+from apps.dailytrans.builders.resilience import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryPolicy,
+    defer,
+    get_metrics,
+    pop_deferred,
+)
+
+
+class FakeRedis:
+    """只實作斷路器用到的指令，不處理過期時間"""
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    def exists(self, key):
+        return key in self.data
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        self.ttls[key] = ex if ex is not None else -1
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+            self.ttls.pop(key, None)
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key, 0)) + 1
+        self.ttls.setdefault(key, -1)
+        return self.data[key]
+
+    def ttl(self, key):
+        return self.ttls.get(key, -2)
+
+    def expire(self, key, seconds):
+        self.ttls[key] = seconds
+
+    def hincrby(self, key, field, amount=1):
+        self.data.setdefault(key, {})
+        self.data[key][field] = self.data[key].get(field, 0) + amount
+
+    def hgetall(self, key):
+        return self.data.get(key, {})
+
+    def rpush(self, key, value):
+        self.data.setdefault(key, []).append(value)
+
+    def lpop(self, key):
+        values = self.data.get(key)
+        return values.pop(0) if values else None
+
+
+def make_response(status_code, retry_after=None):
+    response = Response()
+    response.status_code = status_code
+    if retry_after is not None:
+        response.headers['Retry-After'] = retry_after
+    return response
+
+
+class TestRetryPolicy:
+    def test_backoff_with_jitter(self):
+        # Arrange
+        policy = RetryPolicy(max_retries=5, base_delay=2, max_delay=10)
+
+        # Assert
+        for retry_count, upper in ((1, 2), (2, 4), (3, 8), (4, 10), (5, 10)):
+            assert all(0 <= policy.backoff(retry_count) <= upper for _ in range(20))
+
+    def test_get_delay(self):
+        # Arrange
+        policy = RetryPolicy(max_retries=2, base_delay=2, max_delay=10)
+
+        # Assert
+        assert policy.get_delay(1, make_response(None)) is not None
+        assert policy.get_delay(1, make_response(503)) is not None
+        assert policy.get_delay(1, make_response(404)) is None
+        assert policy.get_delay(3, make_response(503)) is None
+
+    def test_get_delay_with_retry_after(self):
+        # Arrange
+        policy = RetryPolicy(max_retries=2, base_delay=2, max_delay=10)
+        retry_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=5)
+
+        # Assert
+        assert policy.get_delay(1, make_response(429, '7')) == 7
+        assert 0 < policy.get_delay(1, make_response(503, retry_at.strftime('%a, %d %b %Y %H:%M:%S GMT'))) <= 5
+        # Retry-After 超過等待上限時不再重試
+        assert policy.get_delay(1, make_response(429, '120')) is None
+
+
+class TestCircuitBreaker:
+    @pytest.fixture
+    def breaker(self):
+        # 斷路器開啟時以 aprp logger 記錄，其 handler 會寫入資料庫
+        with patch('apps.dailytrans.builders.resilience.logger'):
+            yield CircuitBreaker('eir030', failure_threshold=2, window=60, cooldown=300, redis=FakeRedis())
+
+    def test_open_after_failures(self, breaker):
+        # Act
+        breaker.allow()
+        breaker.record_failure()
+        state_after_first_failure = breaker.state
+        breaker.record_failure()
+
+        # Assert
+        assert state_after_first_failure == CLOSED
+        assert breaker.state == OPEN
+        assert breaker.retry_in() == 300
+        with pytest.raises(CircuitOpenError):
+            breaker.allow()
+        assert get_metrics('eir030', redis=breaker.redis) == {'opened': 1, 'short_circuits': 1}
+
+    def test_half_open_after_cooldown(self, breaker):
+        # Arrange
+        breaker.record_failure()
+        breaker.record_failure()
+        # 模擬冷卻時間結束
+        breaker.redis.delete(breaker.open_key)
+
+        # Act
+        probe_allowed = breaker.allow()
+
+        # Assert
+        assert probe_allowed
+        assert breaker.state == HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.allow()
+
+        breaker.record_success()
+        assert breaker.state == CLOSED
+        assert breaker.allow()
+
+    def test_probe_can_retry(self, breaker):
+        # Arrange
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.redis.delete(breaker.open_key)
+        breaker.allow()
+
+        # Act
+        retry_allowed = breaker.allow(retry=True)
+        breaker.redis.set(breaker.open_key, 1, ex=300)
+
+        # Assert
+        assert retry_allowed
+        with pytest.raises(CircuitOpenError):
+            breaker.allow(retry=True)
+
+
+class TestDeferred:
+    def test_defer_and_pop(self):
+        # Arrange
+        redis = FakeRedis()
+        start_date, end_date = datetime.date(2024, 11, 1), datetime.date(2024, 11, 30)
+
+        # Act
+        defer('apps.crops.builder.direct_wholesale_05', start_date, end_date, api_name='eir030', redis=redis)
+        defer('apps.crops.builder.direct_wholesale_05', start_date, end_date, api_name='eir030', redis=redis)
+        items = pop_deferred(redis=redis)
+
+        # Assert
+        assert items == [{
+            'func': 'apps.crops.builder.direct_wholesale_05',
+            'start_date': '2024-11-01',
+            'end_date': '2024-11-30',
+            'api_name': 'eir030',
+            'kwargs': {},
+        }]
+        assert pop_deferred(redis=redis) == []
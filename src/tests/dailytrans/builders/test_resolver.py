@@ -0,0 +1,60 @@
+import pytest
+
+from apps.configs.models import AbstractProduct, Source
+from apps.dailytrans.builders.resolver import Resolver
+from tests.configs.factories import AbstractProductFactory, SourceFactory
+
+
+@pytest.mark.django_db
+class TestResolver:
+    @pytest.fixture
+    def resolver(self):
+        products = [
+            AbstractProductFactory(code='FA0'),
+            AbstractProductFactory(code='FA0'),
+            AbstractProductFactory(code='LA1'),
+        ]
+        sources = [
+            SourceFactory(name='臺北一', alias='台北第一果菜市場', code='104'),
+            SourceFactory(name='三重區', alias='三重,Sanchong', code='241'),
+        ]
+
+        return Resolver(
+            AbstractProduct.objects.filter(id__in=[p.id for p in products]),
+            Source.objects.filter(id__in=[s.id for s in sources]),
+        )
+
+    def test_products(self, resolver: Resolver):
+        # Assert
+        assert resolver.codes == {'FA0', 'LA1'}
+        assert len(resolver.products('FA0')) == 2
+        assert resolver.product('FA0') == resolver.products('FA0')[0]
+        assert resolver.product('XXX') is None
+        assert len(resolver.all_products) == 3
+
+    def test_sources(self, resolver: Resolver):
+        # Assert
+        assert resolver.source('臺北一').code == '104'
+        assert resolver.source('台北一') is None
+        assert resolver.source_by_code('241').name == '三重區'
+        assert resolver.source_by_code('999') is None
+
+    def test_source_by_name_same_as_filter_by_name(self, resolver: Resolver):
+        # Arrange
+        qs = Source.objects.filter(id__in=[s.id for s in resolver.all_sources])
+
+        # Assert
+        for name in ('臺北一', '台北一', '台北第一', 'sanchong', '三重', '不存在'):
+            assert resolver.source_by_name(name) == qs.filter_by_name(name).first()
+
+    def test_source_by_name_with_type(self, resolver: Resolver):
+        # Arrange
+        source = resolver.source('臺北一')
+
+        # Assert
+        assert resolver.source_by_name('台北一', type_id=source.type_id) == source
+        assert resolver.source_by_name('台北一', type_id=-1) is None
+
+    def test_source_by_name_with_invalid_name(self, resolver: Resolver):
+        with pytest.raises(TypeError):
+            resolver.source_by_name(None)
@@ -0,0 +1,155 @@
+import json
+
+import pytest
+from requests import Response
+
+from apps.crops.builder import WholeSaleApi02, WholeSaleApi05
+from apps.crops.models import Crop
+from apps.dailytrans.builders.stream import RecordStream, iter_json_items, iter_text
+from apps.dailytrans.models import DailyTran
+
+
+COLUMNS = ['平均價', '交易日期', '作物代號', '作物名稱', '市場名稱']
+
+
+def make_response(data, encoding='utf-8'):
+    response = Response()
+    response.status_code = 200
+    response._content = json.dumps(data, ensure_ascii=False).encode(encoding)
+    response.encoding = encoding
+    return response
+
+
+def make_raw_response(content, status_code=200):
+    response = Response()
+    response.status_code = status_code
+    response._content = content
+    response.encoding = 'utf-8'
+    return response
+
+
+def split(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class TestIterJsonItems:
+    @pytest.mark.parametrize('size', [1, 3, 7, 1000])
+    def test_iter_json_items(self, size):
+        # Arrange
+        data = [{'作物代號': 'FA0', '平均價': 12.5}, [1, 2], 12345, 'REST', None, {'巢狀': {'a': [1, {}]}}]
+
+        # Act
+        items = list(iter_json_items(split(json.dumps(data, ensure_ascii=False), size)))
+
+        # Assert
+        assert items == data
+
+    @pytest.mark.parametrize('size', [1, 5, 1000])
+    def test_iter_json_items_with_key(self, size):
+        # Arrange
+        data = {'RS': 'OK', 'DayTransInfo': [{'MarketNo': '109'}, {'MarketNo': '104'}], 'Total': 2}
+
+        # Act
+        items = list(iter_json_items(split(json.dumps(data), size), key='DayTransInfo'))
+
+        # Assert
+        assert items == data['DayTransInfo']
+
+    def test_empty(self):
+        # Assert
+        assert list(iter_json_items([])) == []
+        assert list(iter_json_items(['  [ ] '])) == []
+
+    def test_invalid(self):
+        # Assert
+        with pytest.raises(ValueError):
+            list(iter_json_items(['{"message": "error"}']))
+        with pytest.raises(ValueError):
+            list(iter_json_items(['[{"a": 1}, {"b"']))
+        with pytest.raises(ValueError):
+            list(iter_json_items(['{"RS": "OK"}'], key='DayTransInfo'))
+
+    def test_iter_text_multibyte(self):
+        # Arrange
+        response = make_response([{'市場名稱': '台北一'}])
+
+        # Act
+        chunks = list(iter_text(response, chunk_size=1))
+
+        # Assert
+        assert ''.join(chunks) == response.text
+
+
+class TestRecordStream:
+    @pytest.fixture
+    def records(self):
+        return [
+            {'平均價': 12.5, '交易日期': '113.11.25', '作物代號': 'FA0', '作物名稱': '大蒜-蒜頭', '市場名稱': '台北一'},
+            {'平均價': 30.0, '交易日期': '113.11.25', '作物代號': 'ZZ9', '作物名稱': '新品項', '市場名稱': '台北一'},
+            {'平均價': 0, '交易日期': '113.11.25', '作物代號': 'REST', '作物名稱': '休市', '市場名稱': '台北二'},
+            {'平均價': 15.0, '交易日期': '113.11.26', '作物代號': 'FA0', '作物名稱': '大蒜-蒜頭', '市場名稱': '台北二'},
+            {'平均價': 18.0, '交易日期': '113.11.26', '作物代號': 'ZZ9', '作物名稱': '新品項', '市場名稱': '台北二'},
+        ]
+
+    def test_iter_batches(self, records):
+        # Arrange
+        stream = RecordStream(COLUMNS, code_field='作物代號', codes={'FA0'}, name_field='作物名稱', batch_size=1)
+
+        # Act
+        batches = list(stream.iter_batches(make_response(records)))
+
+        # Assert
+        assert len(batches) == 2
+        assert [batch['平均價'][0] for batch in batches] == [12.5, 15.0]
+        assert list(batches[0].columns) == COLUMNS
+        assert stream.total == 5
+        assert stream.kept == 2
+        # 休市不列入未追蹤品項
+        assert stream.dropped == {'ZZ9': '新品項'}
+        assert stream.dropped_frame()[['作物代號', '作物名稱']].values.tolist() == [['ZZ9', '新品項']]
+
+    def test_read_frame(self, records):
+        # Act
+        data = RecordStream(COLUMNS, code_field='作物代號', codes={'FA0'}, batch_size=1).read_frame(
+            make_response(records)
+        )
+        empty = RecordStream(COLUMNS, code_field='作物代號', codes={'FA0'}).read_frame(make_response([]))
+
+        # Assert
+        assert data.index.tolist() == [0, 1]
+        assert data['市場名稱'].tolist() == ['台北一', '台北二']
+        assert empty.empty
+        assert list(empty.columns) == COLUMNS
+
+
+@pytest.mark.django_db
+class TestLoad:
+    def test_load_untracked_only(self, mock_wholesale_api05: WholeSaleApi05):
+        # Arrange
+        records = [
+            {'交易日期': '113.11.25', '作物代號': 'REST', '作物名稱': '休市', '市場名稱': '台北一', '種類代碼': 'N04'},
+        ]
+
+        # Act
+        mock_wholesale_api05.load(make_response(records))
+
+        # Assert
+        assert not DailyTran.objects.exists()
+
+    def test_amis_load_without_data(self, load_crops_wholesale_fixtures):
+        # Arrange
+        api = WholeSaleApi02(model=Crop, config_code='COG05', type_id=1, logger_type_code='LOT-crops',
+                             market_type='V')
+
+        # Act
+        results = [
+            api.load(make_raw_response(b'')),
+            api.load(make_raw_response(b'<html>error</html>')),
+            api.load(make_raw_response(b'{"Other": []}')),
+            # 重播時找不到封存的回應
+            api.load(make_raw_response(b'', status_code=404)),
+        ]
+
+        # Assert
+        assert results == [True, False, False, False]
+        assert not DailyTran.objects.exists()
@@ -0,0 +1,187 @@
+import datetime
+
+import pandas as pd
+import pytest
+from django.db import connection
+
+from apps.dailytrans.builders.upsert import DailyTranUpserter, UpsertResult
+from apps.dailytrans.models import CompletenessProfile, DailyAggregate, DailyTran
+from apps.dailytrans.partitions import is_partitioned
+from tests.dailytrans.factories import DailyTranFactory
+
+pytestmark = pytest.mark.skipif(
+    connection.vendor != 'postgresql',
+    reason='INSERT ... ON CONFLICT and COPY require PostgreSQL',
+)
+
+
+@pytest.mark.django_db
+class TestDailyTranUpserter:
+    date = datetime.date(2024, 10, 31)
+
+    def test_table_is_partitioned(self):
+        # 其餘測試皆在分區表上執行(分區表不支援 RETURNING 系統欄位)
+        if connection.pg_version < 110000:
+            pytest.skip('dailytrans_dailytran is partitioned by year on PostgreSQL >= 11 only')
+
+        assert is_partitioned()
+
+    def test_save_without_data(self):
+        # Act
+        result = DailyTranUpserter().save()
+
+        # Assert
+        assert result == UpsertResult(0, 0, 0)
+
+    def test_insert_and_update(self, product_of_pig, sources_for_pig):
+        # Arrange
+        source, new_source = sources_for_pig[:2]
+        tran = DailyTranFactory(product=product_of_pig, source=source, avg_price=50.0, date=self.date)
+        upserter = DailyTranUpserter(update_fields=['avg_price', 'volume'])
+        upserter.add(DailyTran(product=product_of_pig, source=source, avg_price=60.0, volume=10, date=self.date))
+        upserter.add(DailyTran(product=product_of_pig, source=new_source, avg_price=70.0, date=self.date))
+
+        # Act
+        result = upserter.save()
+        tran.refresh_from_db()
+
+        # Assert
+        assert result == UpsertResult(inserted=1, updated=1, deleted=0)
+        assert tran.avg_price == 60.0
+        assert tran.volume == 10
+        assert DailyTran.objects.get(product=product_of_pig, source=new_source, date=self.date).avg_price == 70.0
+        assert len(upserter) == 0
+
+    def test_skip_unchanged_and_duplicated_rows(self, product_of_pig, sources_for_pig):
+        # Arrange
+        source = sources_for_pig[0]
+        DailyTranFactory(product=product_of_pig, source=source, avg_price=50.0, date=self.date)
+        upserter = DailyTranUpserter()
+        # 同一個 (品項, 來源, 日期) 以最後加入的一筆為準
+        upserter.add(DailyTran(product=product_of_pig, source=source, avg_price=40.0, date=self.date))
+        upserter.add(DailyTran(product=product_of_pig, source=source, avg_price=50.0, date=self.date))
+
+        # Act
+        result = upserter.save()
+
+        # Assert
+        assert result == UpsertResult(0, 0, 0)
+        assert DailyTran.objects.filter(product=product_of_pig, source=source, date=self.date).count() == 1
+
+    def test_manual_data_is_not_updated_or_deleted(self, product_of_pig, sources_for_pig):
+        # Arrange
+        source, other_source = sources_for_pig[:2]
+        manual = DailyTranFactory(
+            product=product_of_pig, source=source, avg_price=50.0, date=self.date, not_updated=-1
+        )
+        other_manual = DailyTranFactory(
+            product=product_of_pig, source=other_source, avg_price=50.0, date=self.date, not_updated=-1
+        )
+        upserter = DailyTranUpserter()
+        upserter.add(DailyTran(product=product_of_pig, source=source, avg_price=99.0, date=self.date))
+
+        # Act
+        result = upserter.save(delete_scope=DailyTran.objects.filter(date=self.date))
+        manual.refresh_from_db()
+
+        # Assert
+        assert result == UpsertResult(0, 0, 0)
+        assert manual.avg_price == 50.0
+        assert DailyTran.objects.filter(id=other_manual.id).exists()
+
+    def test_delete_missing_rows_in_scope(self, product_of_pig, sources_for_pig):
+        # Arrange
+        source, missing_source = sources_for_pig[:2]
+        missing = DailyTranFactory(product=product_of_pig, source=missing_source, date=self.date)
+        out_of_scope = DailyTranFactory(
+            product=product_of_pig, source=missing_source, date=self.date - datetime.timedelta(days=1)
+        )
+        upserter = DailyTranUpserter()
+        upserter.add(DailyTran(product=product_of_pig, source=source, avg_price=99.0, date=self.date))
+
+        # Act
+        result = upserter.save(delete_scope=DailyTran.objects.filter(date=self.date))
+
+        # Assert
+        assert result == UpsertResult(inserted=1, updated=0, deleted=1)
+        assert not DailyTran.objects.filter(id=missing.id).exists()
+        assert DailyTran.objects.filter(id=out_of_scope.id).exists()
+
+    def test_update_only_rows(self, product_of_pig, sources_for_pig):
+        # Arrange
+        source, new_source = sources_for_pig[:2]
+        tran = DailyTranFactory(product=product_of_pig, source=source, avg_price=50.0, date=self.date)
+        upserter = DailyTranUpserter()
+        upserter.add(DailyTran(product=product_of_pig, source=source, avg_price=0, date=self.date), insert=False)
+        upserter.add(DailyTran(product=product_of_pig, source=new_source, avg_price=0, date=self.date), insert=False)
+
+        # Act
+        result = upserter.save()
+        tran.refresh_from_db()
+
+        # Assert
+        assert result == UpsertResult(inserted=0, updated=1, deleted=0)
+        assert tran.avg_price == 0
+        assert not DailyTran.objects.filter(product=product_of_pig, source=new_source).exists()
+
+    def test_rows_without_source(self, product_of_pig):
+        # Arrange
+        df = pd.DataFrame([{'product_id': product_of_pig.id, 'date': self.date, 'avg_price': 50.0}])
+        upserter = DailyTranUpserter()
+
+        # Act
+        upserter.add_frame(df)
+        first = upserter.save()
+        upserter.add_frame(df.assign(avg_price=60.0))
+        second = upserter.save()
+
+        # Assert
+        assert first == UpsertResult(inserted=1, updated=0, deleted=0)
+        assert second == UpsertResult(inserted=0, updated=1, deleted=0)
+        assert DailyTran.objects.get(product=product_of_pig, source__isnull=True, date=self.date).avg_price == 60.0
+
+    def test_refresh_completeness_profiles(self, product_of_pig, sources_for_pig):
+        # Arrange
+        source, missing_source = sources_for_pig[:2]
+        DailyTranFactory(product=product_of_pig, source=missing_source, date=self.date)
+        upserter = DailyTranUpserter(update_fields=['avg_price', 'volume'])
+        upserter.add(DailyTran(product=product_of_pig, source=source, avg_price=60.0, volume=10, date=self.date))
+        upserter.add(DailyTran(product=product_of_pig, avg_price=50.0, date=self.date))
+        upserter.add(DailyTran(product=product_of_pig, source=source, avg_price=60.0,
+                               date=self.date - datetime.timedelta(days=365)))
+
+        # Act
+        upserter.save(delete_scope=DailyTran.objects.filter(date=self.date))
+        profiles = {
+            (profile.source_id, profile.year): (profile.rows, profile.volume_rows)
+            for profile in CompletenessProfile.objects.filter(product=product_of_pig)
+        }
+
+        # Assert
+        assert profiles == {
+            (source.id, self.date.year): (1, 1),
+            (None, self.date.year): (1, 0),
+            (source.id, self.date.year - 1): (1, 0),
+        }
+
+    def test_refresh_daily_aggregates(self, product_of_pig, sources_for_pig):
+        # Arrange
+        source, missing_source = sources_for_pig[:2]
+        DailyTranFactory(product=product_of_pig, source=missing_source, date=self.date)
+        upserter = DailyTranUpserter(update_fields=['avg_price', 'volume'])
+        upserter.add(DailyTran(product=product_of_pig, source=source, avg_price=60.0, volume=10,
+                               avg_weight=2.0, date=self.date))
+        upserter.add(DailyTran(product=product_of_pig, avg_price=50.0, date=self.date))
+
+        # Act
+        upserter.save(delete_scope=DailyTran.objects.filter(date=self.date))
+        aggregates = {
+            aggregate.source_id: (aggregate.total_price, aggregate.total_weight, aggregate.sum_volume)
+            for aggregate in DailyAggregate.objects.filter(product=product_of_pig, date=self.date)
+        }
+
+        # Assert
+        assert aggregates == {
+            source.id: (60.0 * 2.0 * 10, 2.0 * 10, 10.0),
+            None: (50.0, 1.0, 0.0),
+        }
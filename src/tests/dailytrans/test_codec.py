@@ -0,0 +1,95 @@
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from apps.dailytrans.codec import (
+    format_date,
+    from_datetime,
+    parse_date,
+    period_day,
+    to_dates,
+    to_datetime,
+)
+
+
+class TestToDatetime:
+    def test_roc_formats(self):
+        # Act
+        result = to_dates(pd.Series(['1130215', '113.02.15', '113/2/15', '113-2-5', 1131101, '99.12.31']))
+
+        # Assert
+        assert result.tolist() == [
+            date(2024, 2, 15),
+            date(2024, 2, 15),
+            date(2024, 2, 15),
+            date(2024, 2, 5),
+            date(2024, 11, 1),
+            date(2010, 12, 31),
+        ]
+
+    def test_gregorian_formats(self):
+        # Act
+        result = to_dates(['2024/11/5', '20241115', '2024.11.25'], roc_format=False)
+
+        # Assert
+        assert result.tolist() == [date(2024, 11, 5), date(2024, 11, 15), date(2024, 11, 25)]
+
+    def test_invalid_values(self):
+        # Act
+        result = to_datetime(pd.Series(['113.13.01', 'abc', None, '113.02.30'], index=[3, 4, 5, 6]))
+
+        # Assert
+        assert result.isna().all()
+        assert result.index.tolist() == [3, 4, 5, 6]
+        assert to_dates(['abc']).tolist() == [None]
+
+    def test_empty(self):
+        # Assert
+        assert to_datetime(pd.Series([])).empty
+        assert to_dates([]).empty
+
+
+class TestFromDatetime:
+    def test_from_datetime(self):
+        # Arrange
+        dates = pd.Series([date(2024, 2, 5), date(2024, 11, 15), None])
+
+        # Act
+        roc = from_datetime(dates)
+        gregorian = from_datetime(dates, sep='/', roc_format=False, zfill=False)
+
+        # Assert
+        assert roc.tolist()[:2] == ['113.02.05', '113.11.15']
+        assert gregorian.tolist()[:2] == ['2024/2/5', '2024/11/15']
+        assert pd.isna(roc[2])
+
+    def test_round_trip(self):
+        # Arrange
+        dates = pd.Series(pd.date_range('2023-12-25', '2024-03-05'))
+
+        # Assert
+        assert (to_datetime(from_datetime(dates, sep='')) == dates).all()
+
+
+class TestScalar:
+    def test_parse_date(self):
+        # Assert
+        assert parse_date('1130215', '', roc_format=True) == date(2024, 2, 15)
+        assert parse_date('20240215', '', roc_format=False) == date(2024, 2, 15)
+        assert parse_date('113.2.15', '.', roc_format=True) == date(2024, 2, 15)
+        with pytest.raises(OverflowError):
+            parse_date('113021', '', roc_format=True)
+
+    def test_format_date(self):
+        # Assert
+        assert format_date(date(2024, 2, 5), '.', roc_format=True) == '113.02.05'
+        assert format_date(date(2024, 2, 5), '/', zfill=False) == '2024/2/5'
+        with pytest.raises(OverflowError):
+            format_date(date(1900, 1, 1), '.', roc_format=True)
+
+    def test_period_day(self):
+        # Assert
+        assert [period_day(period) for period in ('上旬', '中旬', '11月下旬')] == [5, 15, 25]
+        assert period_day(None) is None
+        assert period_day('月', default=25) == 25
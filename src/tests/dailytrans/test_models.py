@@ -1,10 +1,18 @@
 import datetime as dt
 from datetime import datetime
+from unittest.mock import patch
 
 import pytest
 
 from apps.configs.models import AbstractProduct, Source
-from apps.dailytrans.models import DailyTran
+from apps.dailytrans.models import (
+    CompletenessProfile,
+    CompletenessProfileQuerySet,
+    DailyAggregate,
+    DailyAggregateQuerySet,
+    DailyTran,
+    month_day_ranges,
+)
 from tests.dailytrans.factories import (
     DailyTranFactory,
 )
@@ -65,3 +73,180 @@ class TestDailyTranModel:
         result = DailyTran.objects.between_month_day_filter(start_date=date, end_date=date)
 
         assert result.count() == 0
+
+    def test_between_month_day_filter_with_leap_day(self, product_of_pig, sources_for_pig):
+        # Arrange
+        for date in [dt.date(2020, 2, 28), dt.date(2020, 2, 29), dt.date(2020, 3, 1), dt.date(2019, 3, 1)]:
+            DailyTranFactory(product=product_of_pig, source=sources_for_pig[0], date=date)
+
+        # Act
+        result = DailyTran.objects.between_month_day_filter(
+            start_date=dt.date(2024, 2, 29), end_date=dt.date(2024, 3, 1)
+        )
+
+        # Assert: 閏日起始調整為 3/1，每年皆只比較 3/1
+        assert sorted(result.values_list('date', flat=True)) == [dt.date(2019, 3, 1), dt.date(2020, 3, 1)]
+
+
+def test_month_day_ranges():
+    # 閏年結束日期為 2/29 時調整為 2/28，之後的年度沿用 2/28
+    assert month_day_ranges(dt.date(2024, 2, 1), dt.date(2024, 2, 29))[:2] == [
+        (dt.date(2024, 2, 1), dt.date(2024, 2, 28)),
+        (dt.date(2023, 2, 1), dt.date(2023, 2, 28)),
+    ]
+    # 跨年度的區間
+    assert month_day_ranges(dt.date(2023, 12, 1), dt.date(2024, 1, 31))[-1] == (
+        dt.date(2011, 12, 1), dt.date(2012, 1, 31)
+    )
+    assert len(month_day_ranges(dt.date(2023, 12, 1), dt.date(2024, 1, 31))) == 2023 - 2011 + 1
+
+
+@pytest.mark.django_db
+class TestFilterByDateLte:
+    def test_latest_trans_on_or_before_each_day(self, product_of_pig, sources_for_pig):
+        # Arrange
+        first = DailyTranFactory(product=product_of_pig, source=sources_for_pig[0], date=dt.date(2024, 1, 2))
+        second = DailyTranFactory(product=product_of_pig, source=sources_for_pig[0], date=dt.date(2024, 1, 5))
+        days = [datetime(2024, 1, d) for d in (1, 2, 3, 5, 8)]
+
+        # Act
+        result = DailyTran.objects.filter_by_date_lte(days, [product_of_pig], sources_for_pig)
+
+        # Assert
+        assert result == [None, first, first, second, second]
+        assert result[1].avg_price == first.avg_price
+
+    def test_latest_on_or_before_by_product(self, product_of_pig, sources_for_pig):
+        # Arrange
+        other = DailyTranFactory(date=dt.date(2024, 1, 1)).product
+        tran = DailyTranFactory(product=product_of_pig, source=sources_for_pig[0], date=dt.date(2024, 1, 2))
+        days = [dt.date(2024, 1, 1), dt.date(2024, 1, 3)]
+
+        # Act
+        result = DailyTran.objects.latest_on_or_before(days, product_ids=[product_of_pig.id, other.id])
+
+        # Assert
+        assert result[product_of_pig.id] == [None, tran]
+        assert [d.date for d in result[other.id]] == [dt.date(2024, 1, 1), dt.date(2024, 1, 1)]
+
+
+@pytest.mark.django_db
+class TestCompletenessProfile:
+    def test_maintained_by_save_and_delete(self, product_of_pig, sources_for_pig):
+        # Arrange
+        source = sources_for_pig[0]
+        trans = [
+            DailyTranFactory(product=product_of_pig, source=source, volume=volume, avg_weight=None,
+                             date=dt.date(2024, 1, i + 1))
+            for i, volume in enumerate([10.0, 20.0, None])
+        ]
+        DailyTranFactory(product=product_of_pig, source=source, volume=None, date=dt.date(2023, 12, 31))
+
+        # Act
+        trans[0].delete()
+        profile = CompletenessProfile.objects.get(product=product_of_pig, source=source, year=2024)
+
+        # Assert
+        assert (profile.rows, profile.volume_rows, profile.weight_rows) == (2, 1, 0)
+        assert CompletenessProfile.objects.get(product=product_of_pig, source=source, year=2023).rows == 1
+        assert CompletenessProfile.objects.filter(year=2024).completeness() == (False, False)
+
+    def test_bulk_delete_refreshes_once(self, product_of_pig, sources_for_pig):
+        # Arrange
+        source = sources_for_pig[0]
+        for i in range(3):
+            DailyTranFactory(product=product_of_pig, source=source, volume=10.0, date=dt.date(2024, 1, i + 1))
+
+        # Act
+        with patch.object(CompletenessProfileQuerySet, 'refresh', autospec=True,
+                          side_effect=CompletenessProfileQuerySet.refresh) as mock_refresh:
+            DailyTran.objects.filter(date__lte=dt.date(2024, 1, 2)).delete()
+        profile = CompletenessProfile.objects.get(product=product_of_pig, source=source, year=2024)
+
+        # Assert
+        assert mock_refresh.call_count == 1
+        assert (profile.rows, profile.volume_rows) == (1, 1)
+
+    def test_rebuild(self, product_of_pig, sources_for_pig):
+        # Arrange
+        for i, source in enumerate(sources_for_pig):
+            DailyTranFactory(product=product_of_pig, source=source, volume=10.0, date=dt.date(2024, 1, i + 1))
+        DailyTranFactory(product=product_of_pig, source=None, volume=None, date=dt.date(2024, 1, 1))
+        # 批次操作不會觸發 signal
+        DailyTran.objects.filter(source__isnull=False).update(volume=None)
+
+        # Act
+        created = CompletenessProfile.objects.rebuild()
+
+        # Assert
+        assert created == len(sources_for_pig) + 1
+        assert CompletenessProfile.objects.filter(source__isnull=True).get().rows == 1
+        assert not CompletenessProfile.objects.filter(volume_rows__gt=0).exists()
+
+
+@pytest.mark.django_db
+class TestDailyAggregate:
+    def test_maintained_by_save_and_delete(self, product_of_pig, sources_for_pig):
+        # Arrange
+        source = sources_for_pig[0]
+        tran = DailyTranFactory(product=product_of_pig, source=source, avg_price=70.0, avg_weight=120.0,
+                                volume=None, date=dt.date(2024, 1, 1))
+        removed = DailyTranFactory(product=product_of_pig, source=source, date=dt.date(2024, 1, 2))
+
+        # Act
+        tran.volume = 10.0
+        tran.save()
+        removed.delete()
+        aggregate = DailyAggregate.objects.get()
+
+        # Assert
+        assert aggregate.type_id == product_of_pig.type_id
+        assert (aggregate.rows, aggregate.volume_rows, aggregate.weight_rows) == (1, 1, 1)
+        assert aggregate.total_price == 70.0 * 120.0 * 10.0
+        assert aggregate.total_weight == 120.0 * 10.0
+        assert aggregate.sum_volume == 10.0
+        assert aggregate.positive
+
+    def test_bulk_delete_refreshes_once(self, product_of_pig, sources_for_pig):
+        # Arrange
+        for source in sources_for_pig[:2]:
+            DailyTranFactory(product=product_of_pig, source=source, volume=10.0, date=dt.date(2024, 1, 1))
+        kept = DailyTranFactory(product=product_of_pig, source=sources_for_pig[0], date=dt.date(2024, 1, 2))
+
+        # Act
+        with patch.object(DailyAggregateQuerySet, 'refresh', autospec=True,
+                          side_effect=DailyAggregateQuerySet.refresh) as mock_refresh:
+            DailyTran.objects.filter(date=dt.date(2024, 1, 1)).delete()
+
+        # Assert
+        assert mock_refresh.call_count == 2
+        assert list(DailyAggregate.objects.values_list('date', flat=True)) == [kept.date]
+
+    def test_rebuild(self, product_of_pig, sources_for_pig):
+        # Arrange
+        for i, source in enumerate(sources_for_pig):
+            DailyTranFactory(product=product_of_pig, source=source, volume=10.0, date=dt.date(2024, 1, i + 1))
+        DailyTranFactory(product=product_of_pig, source=None, volume=None, avg_weight=None,
+                         date=dt.date(2024, 1, 1))
+        # 批次操作不會觸發 signal
+        DailyTran.objects.filter(source__isnull=False).update(volume=None)
+
+        # Act
+        created = DailyAggregate.objects.rebuild(start_date=dt.date(2024, 1, 1))
+
+        # Assert
+        assert created == len(sources_for_pig) + 1
+        assert not DailyAggregate.objects.filter(volume_rows__gt=0).exists()
+        assert DailyAggregate.objects.filter(source__isnull=True).get().total_volume == 1.0
+
+    def test_type_follows_product(self, product_of_pig, sources_for_pig):
+        # Arrange
+        DailyTranFactory(product=product_of_pig, source=sources_for_pig[0], date=dt.date(2024, 1, 1))
+        product = AbstractProduct.objects.get(id=product_of_pig.id)
+        product.type = None
+
+        # Act
+        product.save()
+
+        # Assert
+        assert DailyAggregate.objects.get().type_id is None
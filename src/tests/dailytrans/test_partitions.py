@@ -0,0 +1,75 @@
+import datetime
+
+import pytest
+from django.db import connection
+
+from apps.dailytrans.models import DailyTran
+from apps.dailytrans.partitions import (
+    DEFAULT_PARTITION,
+    START_YEAR,
+    create_year_partition,
+    ensure_year_partitions,
+    get_partition_years,
+    is_partitioned,
+    partition_name,
+)
+from tests.dailytrans.factories import DailyTranFactory
+
+pytestmark = pytest.mark.skipif(
+    connection.vendor != 'postgresql',
+    reason='Declarative partitioning requires PostgreSQL',
+)
+
+
+def count_rows_in(table):
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM {table}')
+        return cursor.fetchone()[0]
+
+
+@pytest.mark.django_db
+class TestDailyTranPartitions:
+    def test_table_is_partitioned_by_year(self):
+        years = get_partition_years()
+
+        assert is_partitioned()
+        assert years[0] == START_YEAR
+        assert years[-1] >= datetime.date.today().year + 1
+
+    def test_row_is_routed_to_year_partition(self, product_of_pig, sources_for_pig):
+        # Arrange
+        date = datetime.date(2020, 2, 29)
+
+        # Act
+        tran = DailyTranFactory(product=product_of_pig, source=sources_for_pig[0], date=date)
+
+        # Assert
+        assert count_rows_in(partition_name(2020)) == 1
+        assert DailyTran.objects.get(id=tran.id).date == date
+
+    def test_create_year_partition_moves_rows_from_default(self, product_of_pig, sources_for_pig):
+        # Arrange
+        year = max(get_partition_years()) + 3
+        tran = DailyTranFactory(product=product_of_pig, source=sources_for_pig[0], date=datetime.date(year, 6, 1))
+        assert count_rows_in(DEFAULT_PARTITION) == 1
+
+        # Act
+        created = create_year_partition(year)
+
+        # Assert
+        assert created
+        assert count_rows_in(DEFAULT_PARTITION) == 0
+        assert count_rows_in(partition_name(year)) == 1
+        assert DailyTran.objects.filter(id=tran.id).exists()
+        assert not create_year_partition(year)
+
+    def test_ensure_year_partitions(self):
+        # Arrange
+        last_year = max(get_partition_years())
+
+        # Act
+        created = ensure_year_partitions(until_year=last_year + 2)
+
+        # Assert
+        assert created == [last_year + 1, last_year + 2]
+        assert ensure_year_partitions(until_year=last_year + 2) == []
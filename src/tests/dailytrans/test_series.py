@@ -0,0 +1,146 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from apps.dailytrans.series import PriceSeries, drop_missing_sources, nanmean
+from dashboard.management.commands.benchmark_price_series import legacy_window_summary, make_table
+
+
+@pytest.fixture
+def daily_trans_df():
+    return pd.DataFrame({
+        'date': [datetime.date(2024, 1, 1)] * 3 + [datetime.date(2024, 1, 2)] * 2 + [datetime.date(2024, 2, 1)],
+        'avg_price': [10.0, 20.0, 30.0, 40.0, 50.0, 60.0],
+        'volume': [100.0, 200.0, None, 300.0, 100.0, 50.0],
+        'avg_weight': [2.0, None, 1.0, 1.5, 2.0, 1.0],
+        'source_id': [1.0, 2.0, 2.0, 1.0, None, 1.0],
+    })
+
+
+class TestPriceSeries:
+    def test_from_frame(self, daily_trans_df):
+        # Act
+        series = PriceSeries.from_frame(daily_trans_df)
+
+        # Assert
+        assert list(series.dates) == [datetime.date(2024, 1, 1), datetime.date(2024, 1, 2), datetime.date(2024, 2, 1)]
+        assert list(series.rows) == [3, 2, 1]
+        assert list(series.volume_rows) == [2, 2, 1]
+        assert list(series.sources) == [2, 1, 1]
+        # 缺值以 1 代替: 10*2*100 + 20*1*200 + 30*1*1
+        assert series.total_price[0] == 6030.0
+        assert series.total_weight[0] == 401.0
+        assert series.total_volume[0] == 301.0
+        # 略過缺值
+        assert series.sum_volume[0] == 300.0
+        assert series.sum_price_weight_volume[0] == 2000.0
+        assert series.sum_weight_volume[0] == 200.0
+
+    def test_drop_missing_sources(self, daily_trans_df):
+        # Act
+        series = PriceSeries.from_frame(drop_missing_sources(daily_trans_df))
+
+        # Assert
+        assert list(series.rows) == [3, 1, 1]
+
+    def test_window_and_resample(self, daily_trans_df):
+        # Arrange
+        series = PriceSeries.from_frame(daily_trans_df)
+
+        # Act
+        window = series.window(datetime.date(2024, 1, 2), '2024-02-01')
+        monthly = series.resample('M')
+
+        # Assert
+        assert list(window.dates) == [datetime.date(2024, 1, 2), datetime.date(2024, 2, 1)]
+        assert len(series.window(datetime.date(2024, 3, 1), datetime.date(2024, 3, 31))) == 0
+        assert list(monthly.dates) == [datetime.date(2024, 1, 1), datetime.date(2024, 2, 1)]
+        assert list(monthly.days) == [2, 1]
+        assert list(monthly.rows) == [5, 1]
+        assert monthly.total('sum_volume') == series.total('sum_volume')
+
+    def test_completeness_and_summary(self, daily_trans_df):
+        # Arrange
+        series = PriceSeries.from_frame(daily_trans_df)
+        df = daily_trans_df
+
+        # Act
+        has_volume, has_weight = series.completeness()
+        avg_price, avg_volume = series.summary(True, True)
+        _, hog_volume = series.summary(True, True, product_id=70001)
+        mean_price, no_volume = series.summary(False, False)
+
+        # Assert
+        assert has_volume
+        assert has_weight
+        assert avg_price == pytest.approx(
+            (df.avg_price * df.avg_weight * df.volume).sum() / (df.avg_weight * df.volume).sum()
+        )
+        assert avg_volume == pytest.approx((df.avg_weight * df.volume).sum() / df.volume.sum())
+        assert hog_volume == df.volume.sum()
+        assert mean_price == df.avg_price.mean()
+        assert np.isnan(no_volume)
+
+    def test_completeness_without_price(self):
+        # Arrange
+        series = PriceSeries.from_frame(pd.DataFrame({
+            'date': [datetime.date(2024, 1, 1)],
+            'avg_price': [0.0],
+            'volume': [10.0],
+            'avg_weight': [1.0],
+        }))
+
+        # Assert
+        assert series.completeness() == (False, False)
+        assert series.completeness(require_price=False) == (True, True)
+
+    def test_weighted_average(self, daily_trans_df):
+        # Arrange
+        series = PriceSeries.from_frame(daily_trans_df)
+        price = series.total_price / series.total_weight
+
+        # Assert
+        assert series.weighted_average(series.total_volume, series.weight) == pytest.approx(
+            (price * series.total_volume * series.weight).sum() / (series.total_volume * series.weight).sum()
+        )
+        assert series.weighted_average(None, None) == pytest.approx(price.mean())
+        assert series.window('2030-01-01', '2030-01-31').weighted_average(np.array([]), None) == 0
+        assert np.isnan(nanmean([]))
+
+    def test_quantile_and_align_years(self, daily_trans_df):
+        # Arrange
+        series = PriceSeries.from_frame(daily_trans_df)
+
+        # Act
+        years, matrix = series.align_years()
+
+        # Assert
+        assert series.quantile(0.5) == pytest.approx(pd.Series(series.price).quantile(0.5))
+        assert list(years) == [2024]
+        assert matrix[0, 31] == pytest.approx(series.price[2])
+
+    def test_to_frame(self, daily_trans_df):
+        # Act
+        df = PriceSeries.from_frame(daily_trans_df).to_frame(has_volume=False, has_weight=False)
+
+        # Assert
+        assert list(df.columns) == ['date', 'avg_price', 'num_of_source', 'sum_volume', 'avg_avg_weight']
+        assert list(df.sum_volume) == list(df.num_of_source)
+        assert list(df.avg_avg_weight) == [1, 1, 1]
+
+    @pytest.mark.parametrize('vol_missing', [0, 0.5, 1])
+    def test_same_as_query(self, vol_missing):
+        # Arrange
+        table = make_table(days=60, products=3, vol_missing=vol_missing)
+        series = PriceSeries.from_frame(table[table.product_id == 1])
+        start_date, end_date = datetime.date(2024, 1, 8), datetime.date(2024, 1, 14)
+
+        # Act
+        window = series.window(start_date, end_date)
+        result = window.summary(*window.completeness(require_price=False), product_id=1)
+
+        # Assert
+        expected = legacy_window_summary(table, [1], start_date, end_date)
+        np.testing.assert_allclose(result, expected)
@@ -0,0 +1,258 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from apps.configs.models import AbstractProduct
+from apps.dailytrans.models import DailyAggregate, DailyTran
+from apps.dailytrans.utils import (
+    align_years, get_completeness, get_daily_model, get_daily_summary, get_group_by_date_query_set, get_integration,
+    get_year_aligned_result, group_by_date_in_memory, mean_by_date_ranges, to_unix
+)
+from dashboard.management.commands.benchmark_year_alignment import legacy_year_aligned_result, make_frame
+from tests.dailytrans.factories import DailyTranFactory
+
+
+@pytest.fixture
+def daily_trans_of_pig(product_of_pig, sources_for_pig):
+    start = datetime.date(2024, 1, 1)
+    trans = []
+
+    for i in range(10):
+        for j, source in enumerate(sources_for_pig):
+            trans.append(DailyTranFactory(
+                product=product_of_pig,
+                source=source,
+                avg_price=70.0 + i + j * 1.5,
+                avg_weight=120.0 + j,
+                volume=None if (i == 3 and j == 1) else 1000.0 + i * 10 + j,
+                date=start + datetime.timedelta(days=i),
+            ))
+
+    return trans
+
+
+@pytest.mark.django_db
+class TestGetGroupByDateQuerySet:
+    @staticmethod
+    def assert_same_frame(df_db, df_pandas):
+        assert list(df_db.columns) == list(df_pandas.columns)
+        assert len(df_db) == len(df_pandas)
+
+        for row_db, row_pandas in zip(df_db.itertuples(index=False), df_pandas.itertuples(index=False)):
+            assert row_db.date == row_pandas.date
+            assert row_db.num_of_source == row_pandas.num_of_source
+            assert row_db.avg_price == pytest.approx(row_pandas.avg_price)
+            assert row_db.sum_volume == pytest.approx(row_pandas.sum_volume)
+            assert row_db.avg_avg_weight == pytest.approx(row_pandas.avg_avg_weight)
+
+    def test_aggregate_in_db_is_same_as_pandas(self, daily_trans_of_pig):
+        # Arrange
+        qs = DailyTran.objects.all()
+
+        # Act
+        df_db, has_volume_db, has_weight_db = get_group_by_date_query_set(qs)
+        df_pandas, has_volume, has_weight = get_group_by_date_query_set(qs, aggregate_in_db=False)
+
+        # Assert
+        assert (has_volume_db, has_weight_db) == (has_volume, has_weight)
+        assert len(df_db) == 10
+        self.assert_same_frame(df_db, df_pandas)
+
+    def test_aggregate_in_db_with_date_range(self, daily_trans_of_pig):
+        # Arrange
+        qs = DailyTran.objects.all()
+        start_date = datetime.date(2024, 1, 3)
+        end_date = datetime.date(2024, 1, 6)
+
+        # Act
+        df_db, _, _ = get_group_by_date_query_set(qs, start_date, end_date)
+        df_pandas, _, _ = get_group_by_date_query_set(qs, start_date, end_date, aggregate_in_db=False)
+
+        # Assert
+        assert len(df_db) == 4
+        self.assert_same_frame(df_db, df_pandas)
+
+    def test_aggregate_in_db_without_source(self, product_of_pig):
+        # Arrange
+        for i in range(3):
+            DailyTranFactory(
+                product=product_of_pig,
+                source=None,
+                avg_price=10.0 + i,
+                avg_weight=None,
+                volume=None,
+                date=datetime.date(2024, 1, 1) + datetime.timedelta(days=i),
+            )
+        qs = DailyTran.objects.all()
+
+        # Act
+        df_db, has_volume, has_weight = get_group_by_date_query_set(qs)
+        df_pandas, _, _ = get_group_by_date_query_set(qs, aggregate_in_db=False)
+
+        # Assert
+        assert not has_volume
+        assert not has_weight
+        assert list(df_db['num_of_source']) == [1, 1, 1]
+        self.assert_same_frame(df_db, df_pandas)
+
+    def test_completeness_profile(self, daily_trans_of_pig, product_of_pig, sources_for_pig):
+        # Arrange
+        items = AbstractProduct.objects.filter(id=product_of_pig.id)
+        qs = DailyTran.objects.all()
+
+        # Act
+        completeness = get_completeness(product_of_pig.type, items, sources_for_pig)
+        df, has_volume, has_weight = get_group_by_date_query_set(qs, completeness=completeness)
+        expected, expected_volume, expected_weight = get_group_by_date_query_set(qs)
+
+        # Assert
+        assert completeness == (expected_volume, expected_weight) == (True, True)
+        assert (has_volume, has_weight) == completeness
+        self.assert_same_frame(df, expected)
+        assert get_completeness(product_of_pig.type, items, sources_for_pig, years=[2023]) == (False, False)
+
+    @pytest.mark.parametrize('start_date, end_date, specific_year', [
+        (None, None, True),
+        (datetime.date(2024, 1, 3), datetime.date(2024, 1, 6), True),
+        (datetime.date(2023, 12, 30), datetime.date(2024, 1, 2), False),
+    ])
+    def test_daily_aggregate(self, daily_trans_of_pig, start_date, end_date, specific_year):
+        # Arrange
+        qs = DailyAggregate.objects.all()
+
+        # Act
+        df, has_volume, has_weight = get_group_by_date_query_set(qs, start_date, end_date, specific_year)
+        df_summary, _, _ = group_by_date_in_memory(get_daily_summary(qs), start_date, end_date, specific_year)
+        expected, expected_volume, expected_weight = get_group_by_date_query_set(DailyTran.objects.all(), start_date,
+                                                                                 end_date, specific_year)
+
+        # Assert
+        assert (has_volume, has_weight) == (expected_volume, expected_weight)
+        self.assert_same_frame(df, expected)
+        self.assert_same_frame(df_summary, expected)
+
+    def test_empty_query_set(self):
+        # Act
+        df, has_volume, has_weight = get_group_by_date_query_set(DailyTran.objects.none())
+
+        # Assert
+        assert df.empty
+        assert not has_volume
+        assert not has_weight
+
+
+@pytest.mark.django_db
+class TestIntegration:
+    @pytest.mark.parametrize('start_date, end_date, specific_year', [
+        (None, None, True),
+        (datetime.date(2024, 1, 3), datetime.date(2024, 1, 6), True),
+        (datetime.date(2023, 12, 30), datetime.date(2024, 1, 2), False),
+        (datetime.date(2025, 1, 1), datetime.date(2025, 1, 31), True),
+    ])
+    def test_group_by_date_in_memory(self, daily_trans_of_pig, start_date, end_date, specific_year):
+        # Arrange
+        qs = DailyTran.objects.all()
+        summary = get_daily_summary(qs)
+
+        # Act
+        df, has_volume, has_weight = group_by_date_in_memory(summary, start_date, end_date, specific_year)
+        expected, expected_volume, expected_weight = get_group_by_date_query_set(qs, start_date, end_date,
+                                                                                 specific_year)
+
+        # Assert
+        assert (has_volume, has_weight) == (expected_volume, expected_weight)
+        TestGetGroupByDateQuerySet.assert_same_frame(df, expected)
+
+    @pytest.mark.parametrize('aggregates', [False, True])
+    def test_one_query(self, settings, daily_trans_of_pig, product_of_pig, sources_for_pig, aggregates):
+        # Arrange
+        settings.DAILYTRAN_AGGREGATES = aggregates
+        items = AbstractProduct.objects.filter(id=product_of_pig.id)
+        start_date = datetime.date(2024, 1, 6)
+        end_date = datetime.date(2024, 1, 10)
+
+        # Act
+        with CaptureQueriesContext(connection) as queries:
+            result = get_integration(product_of_pig.type, items, start_date, end_date, sources=sources_for_pig)
+
+        # Assert
+        table = get_daily_model()._meta.db_table
+        assert sum(table in query['sql'] for query in queries.captured_queries) == 1
+        this_term, last_term = result['integration']
+        assert len(this_term['points']) == 5
+        assert len(last_term['points']) == 5
+        assert result['has_volume']
+
+    def test_mean_by_date_ranges(self):
+        # Arrange
+        df = make_frame(years=3, missing_ratio=0.2)
+        df.loc[df.index[::5], 'avg_price'] = np.nan
+        columns = ['avg_price', 'num_of_source', 'sum_volume']
+        year = df['date'].iloc[-1].year
+        ranges = [(datetime.date(y, 12, 1), datetime.date(y + 1, 1, 31)) for y in range(year - 1, year - 5, -1)]
+        ranges.append((datetime.date(year - 2, 1, 1), datetime.date(year, 12, 31)))
+
+        # Act
+        result = mean_by_date_ranges(df, ranges, columns)
+
+        # Assert
+        for i, (start, end) in enumerate(ranges):
+            expected = df[(df['date'] >= start) & (df['date'] <= end)][columns].mean()
+            np.testing.assert_allclose(result.iloc[i].values, expected.values)
+        assert result.iloc[3].isna().all()
+
+
+class TestYearAlignment:
+    def test_align_years(self):
+        # Arrange
+        dates = [datetime.date(2019, 3, 1), datetime.date(2020, 2, 29), datetime.date(2021, 1, 1)]
+
+        # Act
+        years, matrix = align_years(dates, np.array([1.0, 2.0, 3.0]))
+
+        # Assert
+        assert list(years) == [2019, 2020, 2021]
+        assert matrix.shape == (3, 366)
+        assert matrix[0, 60] == 1.0
+        assert np.isnan(matrix[0, 59])
+        assert matrix[1, 59] == 2.0
+        assert matrix[2, 0] == 3.0
+        assert np.isnan(matrix).sum() == 3 * 366 - 3
+
+    def test_year_aligned_result(self):
+        # Arrange
+        q = pd.DataFrame({
+            'date': [datetime.date(2019, 2, 28), datetime.date(2019, 3, 1), datetime.date(2020, 2, 29)],
+            'avg_price': [10.0, 0.0, 12.5],
+        })
+
+        # Act
+        result = get_year_aligned_result(q, 'avg_price', [2019, 2020])
+
+        # Assert
+        highchart = result['highchart']
+        assert list(highchart) == ['2019', '2020']
+        assert [len(points) for points in highchart.values()] == [366, 366]
+        assert highchart['2019'][58] == (to_unix(datetime.date(2016, 2, 28)), 10.0)
+        assert highchart['2019'][59] == (to_unix(datetime.date(2016, 2, 29)), None)
+        assert highchart['2019'][60] is None
+        assert highchart['2020'][59] == (to_unix(datetime.date(2016, 2, 29)), 12.5)
+        assert result['raw']['rows'] == [
+            [pd.Timestamp('2016-02-28'), 10.0, ''],
+            [pd.Timestamp('2016-02-29'), '', 12.5],
+        ]
+
+    @pytest.mark.parametrize('missing_ratio', [0, 0.3])
+    def test_same_as_iterrows(self, missing_ratio):
+        # Arrange
+        q = make_frame(years=3, missing_ratio=missing_ratio)
+        years = sorted({date.year for date in q['date']})
+
+        # Assert
+        for key in ['avg_price', 'num_of_source', 'sum_volume']:
+            assert get_year_aligned_result(q, key, years) == legacy_year_aligned_result(q, key, years)
@@ -50,7 +50,7 @@ def test_direct_generic_wholesale(api: MagicMock, scrapper_api: MagicMock, mock_
     # Assert
     assert mock_scrapper_api.requests.call_count == 4
     mock_scrapper_api.requests.assert_called_with(start_date=dt)
-    mock_api.request.assert_not_called()
+    mock_api.fetch_range_and_load.assert_not_called()
 
     # Case 2: all failed requests
     mock_api.reset_mock()
@@ -66,6 +66,6 @@ def test_direct_generic_wholesale(api: MagicMock, scrapper_api: MagicMock, mock_
     mock_scrapper_api.LOGGER.warning.assert_called_with(
         'All requests failed, try to use API to fetch the data', extra=mock_scrapper_api.LOGGER_EXTRA
     )
-    assert mock_api.request.call_count == 4
-    assert mock_api.load.call_count == 4
+    # 連續失敗的日期合併為一個區間，只請求一次 API
+    mock_api.fetch_range_and_load.assert_called_once_with(dt - datetime.timedelta(days=3), dt)
     mock_scrapper_api.loads.assert_not_called()